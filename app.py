@@ -32,10 +32,6 @@ import urllib.parse
 import bcrypt
 import datetime
 import jwt
-import math
-import pandas as pd
-import matplotlib.pyplot as plt
-import yaml
 from streamlit_option_menu import option_menu
 import streamlit.components.v1 as components
 
@@ -50,50 +46,15 @@ cookies = EncryptedCookieManager(
 if not cookies.ready():
     st.stop()
 
-from classifiers.aml_risk_classifier import eln2022_intensive_risk, eln2024_non_intensive_risk
-from parsers.aml_eln_parser import parse_eln_report
-from utils.forms import build_manual_eln_data
-from parsers.aml_parser import parse_genetics_report_aml
-from parsers.mds_parser import parse_genetics_report_mds
-from parsers.mds_ipss_parser import parse_ipss_report
+from parsers.unified_parser import parse_report_once, store_unified_results, get_unified_result
 from classifiers.aml_mds_combined import classify_combined_WHO2022, classify_combined_ICC2022
-from classifiers.aml_risk_classifier import eln2022_intensive_risk, eln2024_non_intensive_risk
-from classifiers.mds_risk_classifier import RESIDUAL_GENES, get_ipssm_survival_data
-from reviewers.aml_reviewer import (
-    get_gpt4_review_aml_classification,
-    get_gpt4_review_aml_genes,
-    get_gpt4_review_aml_additional_comments,
-    get_gpt4_review_aml_differentiation
-)
-from reviewers.mds_reviewer import (
-    get_gpt4_review_mds_classification,
-    get_gpt4_review_mds_genes,
-    get_gpt4_review_mds_additional_comments
-)
-from utils.pdf import (
-    clean_text,
-    write_line_with_keywords,
-    output_review_text,
-    PDF,
-    add_section_title,
-    add_classification_section,
-    add_risk_section,
-    add_diagnostic_section,
-    create_base_pdf
-)
 from utils.forms import (
     build_manual_aml_data,
-    build_manual_mds_data_compact,
-    build_manual_aml_response_data,
     build_manual_ipss_data,
     build_manual_eln_data
 )
-from utils.displayers import (
-    display_aml_classification_results,
-    display_mds_classification_results,
-    display_aml_response_results,
-    display_ipss_classification_results
-)
+from utils.job_queue import run_in_background, report_progress
+from reviewers.prefetch import prefetch_reviews, review_in_background
 
 ##################################
 # COOKIE & SESSION INITIALIZATION
@@ -135,6 +96,11 @@ def authenticate_user(username: str, password: str) -> bool:
             return verify_password(user["hashed_password"], password)
     return False
 
+def is_admin_user(username: str) -> bool:
+    """True when the user's entry in ``[auth] users`` has ``admin = true``."""
+    users = st.secrets["auth"]["users"]
+    return any(user["username"] == username and user.get("admin", False) for user in users)
+
 ##################################
 # LOGIN PAGE
 ##################################
@@ -634,7 +600,11 @@ def data_entry_page():
                         full_text_combined = opt_text + "\n" + full_report_text
 
                         with st.spinner("Parsing report..."):
-                            parsed_data = parse_genetics_report_aml(full_text_combined)
+                            # Extract classification, ELN and treatment data in one round so
+                            # the risk and treatment tabs can reuse it without new prompts.
+                            unified_results = parse_report_once(full_text_combined)
+                            store_unified_results(full_text_combined, unified_results)
+                            parsed_data = unified_results.get("classification", {})
                             if (parsed_data.get("blasts_percentage") == "Unknown" or 
                                 parsed_data.get("AML_differentiation") is None or 
                                 (parsed_data.get("AML_differentiation") or "").lower() == "ambiguous"):
@@ -1189,6 +1159,9 @@ def results_page():
         }
     }
     
+    # Start all AI reviews now, so each tab can render its review without waiting
+    prefetch_reviews(classification_dict, res["parsed_data"], free_text_input=free_text_input_value)
+    
     # Get disease types from the classification results
     who_disease_type = res.get("who_disease_type", "Unknown")
     icc_disease_type = res.get("icc_disease_type", "Unknown")
@@ -1301,25 +1274,20 @@ def results_page():
                 has_pending_forms = True
         
         # Only generate and display the classification review if there are no pending forms
-        if not has_pending_forms and "aml_class_review" not in st.session_state:
-            with st.spinner("Generating Classification Review..."):
-                st.session_state["aml_class_review"] = get_gpt4_review_aml_classification(
-                    classification_dict,
-                    res["parsed_data"],
-                    free_text_input=free_text_input_value
-                )
-            st.markdown("### Classification Review")
-            st.markdown(st.session_state["aml_class_review"])
-        elif not has_pending_forms:
+        if not has_pending_forms:
             st.markdown("### Classification Review")
-            st.markdown(st.session_state["aml_class_review"])
+            class_review = review_in_background(
+                "aml_class_review",
+                classification_dict,
+                res["parsed_data"],
+                free_text_input=free_text_input_value
+            )
+            if class_review is not None:
+                st.markdown(class_review)
         else:
             st.info("Please complete all required forms before the classification review is generated.")
 
     elif sub_tab == "ELN Risk (AML)":
-        # Import necessary functions for risk assessment
-        from classifiers.aml_risk_classifier import eln2022_intensive_risk, eln2024_non_intensive_risk
-        from parsers.aml_eln_parser import parse_eln_report
         
 
         
@@ -1365,9 +1333,6 @@ def results_page():
         show_eln_risk_assessment(res, free_text_input_value)
     
     elif sub_tab == "IPSS Risk (MDS)":
-        # Import necessary functions for risk assessment
-        from classifiers.mds_risk_classifier import calculate_ipssm, calculate_ipssr, get_ipssm_survival_data
-        from parsers.mds_ipss_parser import parse_ipss_report
         
 
         # Style for risk boxes - needed for risk assessments
@@ -1412,9 +1377,6 @@ def results_page():
         show_ipss_risk_assessment(res, free_text_input_value)
 
     elif sub_tab == "Risk":
-        # Import necessary functions for risk assessment
-        from classifiers.mds_risk_classifier import calculate_ipssm, calculate_ipssr, get_ipssm_survival_data
-        from parsers.mds_ipss_parser import parse_ipss_report
 
         # Display the appropriate risk assessment based on the disease type
         if show_eln and show_ipss:
@@ -1436,169 +1398,7 @@ def results_page():
             st.warning("No risk assessment models are applicable for this classification.")
 
     elif sub_tab == "Treatment":
-        # Import treatment recommendation functions
-        from utils.aml_treatment_recommendations import display_treatment_recommendations
-        from classifiers.aml_risk_classifier import eln2022_intensive_risk
-        from parsers.treatment_parser import parse_treatment_data, display_treatment_parsing_results
-        
-        # Check if this is an AML case
-        if not show_eln:
-            st.warning("🔬 **Treatment recommendations are only available for AML diagnoses.**")
-            st.info("This case appears to be classified as MDS. Please refer to the Risk tab for IPSS-M/R risk stratification.")
-        else:
-            # Simple header
-            st.markdown("### 💊 AML Treatment Recommendations")
-            
-            # Get the original report text for treatment parsing
-            original_report = ""
-            if res.get("free_text_input"):
-                original_report = res["free_text_input"]
-            elif st.session_state.get("free_text_input"):
-                original_report = st.session_state["free_text_input"]
-            
-            if not original_report.strip():
-                st.error("❌ **No original report text available**")
-                st.markdown("""
-                **Next Steps:**
-                1. Return to the **Data Entry** page
-                2. Re-enter your report in free-text mode
-                3. Navigate back to this Treatment tab
-                
-                *Treatment recommendations require the original report text for optimal accuracy.*
-                """)
-                
-                if mode == "manual":
-                    st.info("💡 **Tip:** This appears to be manual entry mode. For best treatment recommendations, use the free-text report entry mode.")
-                return
-            
-            # Simple data collection
-            # Get patient age
-            patient_age = st.session_state.get("treatment_age")
-            if "age" in res["parsed_data"]:
-                try:
-                    extracted_age = int(res["parsed_data"]["age"])
-                    if patient_age is None:
-                        patient_age = extracted_age
-                except (ValueError, TypeError):
-                    pass
-            
-            # Age input
-            age_input = st.number_input(
-                "Patient Age:", 
-                min_value=18, 
-                max_value=100, 
-                value=patient_age if patient_age else 65, 
-                step=1
-            )
-            
-            if age_input != patient_age:
-                st.session_state["treatment_age"] = age_input
-                patient_age = age_input
-            
-            # Optional CD33 data
-            additional_flow_data = {}
-            cd33_percentage = st.number_input(
-                "CD33 percentage (optional):",
-                min_value=0.0,
-                max_value=100.0,
-                value=0.0,
-                step=0.1,
-                help="Leave at 0 if unknown. CD33 ≥20% may qualify for gemtuzumab ozogamicin."
-            )
-            
-            if cd33_percentage > 0:
-                additional_flow_data["cd33_percentage"] = cd33_percentage
-                additional_flow_data["cd33_positive"] = cd33_percentage >= 20
-            
-            # Proceed button
-            if st.button("Get Treatment Recommendations", type="primary", use_container_width=True):
-                if patient_age is None:
-                    st.error("Please enter patient age to continue.")
-                else:
-                    # Store the flow data for use in parsing
-                    if additional_flow_data:
-                        st.session_state["additional_flow_data"] = additional_flow_data
-                    
-                    # Process treatment data (always use specialized parser)
-                    treatment_data = None
-                    patient_data_for_treatment = None
-                    
-                    # Create cache key that includes additional data
-                    cache_components = [original_report]
-                    if additional_flow_data:
-                        cache_components.append(str(additional_flow_data))
-                    cache_key = f"treatment_data_{hash(''.join(cache_components))}"
-                    
-                    if cache_key in st.session_state:
-                        treatment_data = st.session_state[cache_key]
-                        st.info("✅ Using cached treatment analysis")
-                    else:
-                        with st.spinner("🔄 Analyzing report for treatment-specific factors..."):
-                            treatment_data = parse_treatment_data(original_report)
-                            
-                            # Override with additional flow data if provided
-                            if treatment_data and additional_flow_data:
-                                treatment_data.update(additional_flow_data)
-                            
-                            if treatment_data:
-                                st.session_state[cache_key] = treatment_data
-                    
-                    if not treatment_data:
-                        st.error("❌ Failed to extract treatment data. Falling back to classification data.")
-                        from utils.transformation_utils import transform_main_parser_to_treatment_format
-                        patient_data_for_treatment = transform_main_parser_to_treatment_format(res["parsed_data"])
-                        
-                        # Add additional flow data to fallback data
-                        if additional_flow_data:
-                            patient_data_for_treatment.update(additional_flow_data)
-                    else:
-                        patient_data_for_treatment = treatment_data
-                    
-                    # Get ELN risk classification
-                    try:
-                        source_data = treatment_data if treatment_data else res["parsed_data"]
-                        eln_risk, _, _ = eln2022_intensive_risk(source_data)
-                    except Exception as e:
-                        eln_risk = "Unknown"
-                    
-                    # Store results for display
-                    st.session_state["treatment_results"] = {
-                        "patient_data": patient_data_for_treatment,
-                        "eln_risk": eln_risk,
-                        "patient_age": patient_age,
-                        "additional_flow_data": additional_flow_data
-                    }
-                    
-                    st.success("✅ Treatment analysis complete!")
-                    st.rerun()
-            
-            # Display results if available
-            if "treatment_results" in st.session_state:
-                results = st.session_state["treatment_results"]
-                patient_data_for_treatment = results["patient_data"]
-                eln_risk = results["eln_risk"]
-                patient_age = results["patient_age"]
-                additional_flow_data = results.get("additional_flow_data", {})
-                
-                # Show CD33 data if provided
-                if additional_flow_data and "cd33_percentage" in additional_flow_data:
-                    st.info(f"ℹ️ Using provided CD33 data: {additional_flow_data['cd33_percentage']}%")
-            else:
-                st.info("Please enter patient age and click 'Get Treatment Recommendations' to proceed.")
-                return
-            
-            # Add data explorer panel
-            with st.expander("🔍 Data Explorer - View Parsed Treatment Data", expanded=False):
-                if patient_data_for_treatment:
-                    display_treatment_data_explorer(patient_data_for_treatment)
-                else:
-                    st.warning("No treatment data available to explore.")
-            
-            # Display treatment recommendations with clean separator
-            st.markdown("---")
-            
-            # Create a custom treatment display that doesn't have button conflicts
-            display_streamlined_treatment_recommendations(patient_data_for_treatment, eln_risk, patient_age)
+        show_treatment_tab(res, show_eln, mode)
 
     elif sub_tab == "Clinical Trials":
         # Import clinical trial matching functions
@@ -1607,6 +1407,7 @@ def results_page():
             run_clinical_trial_matching, 
             display_trial_matches
         )
+        from parsers.trial_index import build_patient_profile
         
         st.markdown("### 🔬 Clinical Trial Matching")
         st.markdown("Find relevant clinical trials based on the patient's molecular profile and clinical characteristics.")
@@ -1715,21 +1516,34 @@ def results_page():
             
             # Store the formatted data for debugging
             st.session_state["formatted_patient_data"] = patient_data_text
+
+            # Structured profile for the local eligibility prefilter; the disease
+            # type is only used when WHO and ICC agree on it.
+            known_types = {who_disease_type, icc_disease_type} - {"Unknown"}
+            patient_profile = build_patient_profile(
+                res["parsed_data"],
+                additional_info,
+                disease_type=known_types.pop() if len(known_types) == 1 else None,
+                report_text=original_report,
+            )
             
-            # Run trial matching
-            with st.spinner("🔄 Analyzing patient profile and matching to clinical trials..."):
-                try:
-                    matched_trials = run_clinical_trial_matching(patient_data_text)
-                    st.session_state["matched_trials"] = matched_trials
-                    st.success(f"✅ Found {len(matched_trials)} clinical trials to evaluate!")
-                except Exception as e:
-                    st.error(f"❌ Error during trial matching: {e}")
-                    st.session_state["matched_trials"] = []
+            # Queue trial matching as a background job; batches of scored trials
+            # are shown by the job's status box as they arrive
+            st.session_state.pop("matched_trials", None)
+            st.session_state["trial_match_request"] = (patient_data_text, patient_profile)
         
-        # Display results if available
-        if "matched_trials" in st.session_state:
-            matched_trials = st.session_state["matched_trials"]
-            display_trial_matches(matched_trials)
+        # Collect (or keep polling) the trial matching job, then display the results
+        if "trial_match_request" in st.session_state:
+            matched_trials = run_in_background(
+                "matched_trials",
+                "Analyzing patient profile and matching to clinical trials",
+                run_clinical_trial_matching,
+                *st.session_state["trial_match_request"],
+                on_progress=report_progress,
+                render_progress=lambda progress: display_trial_matches(progress["trials"], progress=progress),
+            )
+            if matched_trials is not None:
+                display_trial_matches(matched_trials)
         
         # Debug section
         if st.checkbox("🔧 Show Debug Information", value=False):
@@ -1937,37 +1751,37 @@ def results_page():
             """)
 
     elif sub_tab == "Gene Review":
-        if "aml_gene_review" not in st.session_state:
-            with st.spinner("Generating Gene Review..."):
-                st.session_state["aml_gene_review"] = get_gpt4_review_aml_genes(
-                    classification_dict,
-                    res["parsed_data"],
-                    free_text_input=free_text_input_value
-                )
-        with st.expander("Gene Review", expanded=True):
-            st.markdown(st.session_state["aml_gene_review"])
+        review = review_in_background(
+            "aml_gene_review",
+            classification_dict,
+            res["parsed_data"],
+            free_text_input=free_text_input_value
+        )
+        if review is not None:
+            with st.expander("Gene Review", expanded=True):
+                st.markdown(review)
 
     elif sub_tab == "AI Comments":
-        if "aml_additional_comments" not in st.session_state:
-            with st.spinner("Generating Additional Comments..."):
-                st.session_state["aml_additional_comments"] = get_gpt4_review_aml_additional_comments(
-                    classification_dict,
-                    res["parsed_data"],
-                    free_text_input=free_text_input_value
-                )
-        with st.expander("Additional Comments", expanded=True):
-            st.markdown(st.session_state["aml_additional_comments"])
+        review = review_in_background(
+            "aml_additional_comments",
+            classification_dict,
+            res["parsed_data"],
+            free_text_input=free_text_input_value
+        )
+        if review is not None:
+            with st.expander("Additional Comments", expanded=True):
+                st.markdown(review)
 
     elif sub_tab == "Differentiation":
-        if "differentiation" not in st.session_state:
-            with st.spinner("Generating Differentiation Review..."):
-                st.session_state["differentiation"] = get_gpt4_review_aml_differentiation(
-                    classification_dict,
-                    res["parsed_data"],
-                    free_text_input=free_text_input_value
-                )
-        with st.expander("Differentiation", expanded=True):
-            st.markdown(st.session_state["differentiation"])
+        review = review_in_background(
+            "differentiation",
+            classification_dict,
+            res["parsed_data"],
+            free_text_input=free_text_input_value
+        )
+        if review is not None:
+            with st.expander("Differentiation", expanded=True):
+                st.markdown(review)
 
     # Bottom Controls
     st.markdown(
@@ -1999,10 +1813,15 @@ def results_page():
         "mrd_test_result",
         "aml_gene_review",
         "aml_additional_comments",
+        "differentiation",
         "initial_parsed_data",
         "free_text_input",
         "erythroid_form_submitted",
         "matched_trials",
+        "trial_match_request",
+        "treatment_request",
+        "report_cache",
+        "report_overview_cache",
         "formatted_patient_data"
     ]
 
@@ -2041,6 +1860,7 @@ def results_page():
                     st.error("Date of birth must be in dd/mm/yyyy format.")
                     return
                 
+                from utils.pdf import create_base_pdf
                 base_pdf_bytes = create_base_pdf(user_comments=user_comments)
                 base_pdf_b64 = base64.b64encode(base_pdf_bytes).decode("utf-8")
                 js_code = f"""
@@ -2087,6 +1907,7 @@ def results_page():
     if st.session_state.get("show_report_incorrect"):
         incorrect_comment = st.text_area("Please explain why the report is incorrect:")
         if st.button("Generate Email Link"):
+            from utils.pdf import create_base_pdf
             report_pdf_bytes = create_base_pdf(user_comments="")
             base_pdf_b64 = base64.b64encode(report_pdf_bytes).decode("utf-8")
             js_code = f"""
@@ -2117,6 +1938,194 @@ def results_page():
 
 
 
+# Function to display the Treatment tab for AML
+def show_treatment_tab(res, show_eln, mode):
+    # Import treatment recommendation functions
+    from utils.aml_treatment_recommendations import display_treatment_recommendations
+    from classifiers.aml_risk_classifier import eln2022_intensive_risk
+    from parsers.treatment_parser import parse_treatment_data, display_treatment_parsing_results
+    
+    # Check if this is an AML case
+    if not show_eln:
+        st.warning("🔬 **Treatment recommendations are only available for AML diagnoses.**")
+        st.info("This case appears to be classified as MDS. Please refer to the Risk tab for IPSS-M/R risk stratification.")
+    else:
+        # Simple header
+        st.markdown("### 💊 AML Treatment Recommendations")
+        
+        # Get the original report text for treatment parsing
+        original_report = ""
+        if res.get("free_text_input"):
+            original_report = res["free_text_input"]
+        elif st.session_state.get("free_text_input"):
+            original_report = st.session_state["free_text_input"]
+        
+        if not original_report.strip():
+            st.error("❌ **No original report text available**")
+            st.markdown("""
+            **Next Steps:**
+            1. Return to the **Data Entry** page
+            2. Re-enter your report in free-text mode
+            3. Navigate back to this Treatment tab
+            
+            *Treatment recommendations require the original report text for optimal accuracy.*
+            """)
+            
+            if mode == "manual":
+                st.info("💡 **Tip:** This appears to be manual entry mode. For best treatment recommendations, use the free-text report entry mode.")
+            return
+        
+        # Simple data collection
+        # Get patient age
+        patient_age = st.session_state.get("treatment_age")
+        if "age" in res["parsed_data"]:
+            try:
+                extracted_age = int(res["parsed_data"]["age"])
+                if patient_age is None:
+                    patient_age = extracted_age
+            except (ValueError, TypeError):
+                pass
+        
+        # Age input
+        age_input = st.number_input(
+            "Patient Age:", 
+            min_value=18, 
+            max_value=100, 
+            value=patient_age if patient_age else 65, 
+            step=1
+        )
+        
+        if age_input != patient_age:
+            st.session_state["treatment_age"] = age_input
+            patient_age = age_input
+        
+        # Optional CD33 data
+        additional_flow_data = {}
+        cd33_percentage = st.number_input(
+            "CD33 percentage (optional):",
+            min_value=0.0,
+            max_value=100.0,
+            value=0.0,
+            step=0.1,
+            help="Leave at 0 if unknown. CD33 ≥20% may qualify for gemtuzumab ozogamicin."
+        )
+        
+        if cd33_percentage > 0:
+            additional_flow_data["cd33_percentage"] = cd33_percentage
+            additional_flow_data["cd33_positive"] = cd33_percentage >= 20
+        
+        # Proceed button
+        if st.button("Get Treatment Recommendations", type="primary", use_container_width=True):
+            if patient_age is None:
+                st.error("Please enter patient age to continue.")
+            else:
+                # Store the flow data for use in parsing
+                if additional_flow_data:
+                    st.session_state["additional_flow_data"] = additional_flow_data
+                
+                # The report is analysed by a background job below
+                st.session_state.pop("treatment_results", None)
+                st.session_state["treatment_request"] = {
+                    "patient_age": patient_age,
+                    "additional_flow_data": additional_flow_data
+                }
+        
+        if "treatment_request" in st.session_state:
+            request = st.session_state["treatment_request"]
+            patient_age = request["patient_age"]
+            additional_flow_data = request["additional_flow_data"]
+            
+            # Process treatment data (always use specialized parser)
+            treatment_data = None
+            patient_data_for_treatment = None
+            
+            # Create cache key that includes additional data
+            cache_components = [original_report]
+            if additional_flow_data:
+                cache_components.append(str(additional_flow_data))
+            cache_key = f"treatment_data_{hash(''.join(cache_components))}"
+            
+            if cache_key in st.session_state:
+                treatment_data = st.session_state[cache_key]
+            else:
+                treatment_data = get_unified_result("treatment", original_report)
+                if treatment_data is None:
+                    treatment_data = run_in_background(
+                        f"treatment_report_{hash(original_report)}",
+                        "Analyzing report for treatment-specific factors",
+                        parse_treatment_data,
+                        original_report
+                    )
+                    if treatment_data is None:
+                        # Still running (the status box reruns the page when it is done) or
+                        # failed (the error and a Retry button are shown); the rest of the
+                        # results page is unaffected
+                        return
+                treatment_data = dict(treatment_data)
+                
+                # Override with additional flow data if provided
+                if treatment_data and additional_flow_data:
+                    treatment_data.update(additional_flow_data)
+                
+                if treatment_data:
+                    st.session_state[cache_key] = treatment_data
+            
+            if not treatment_data:
+                st.error("❌ Failed to extract treatment data. Falling back to classification data.")
+                from utils.transformation_utils import transform_main_parser_to_treatment_format
+                patient_data_for_treatment = transform_main_parser_to_treatment_format(res["parsed_data"])
+                
+                # Add additional flow data to fallback data
+                if additional_flow_data:
+                    patient_data_for_treatment.update(additional_flow_data)
+            else:
+                patient_data_for_treatment = treatment_data
+            
+            # Get ELN risk classification
+            try:
+                source_data = treatment_data if treatment_data else res["parsed_data"]
+                eln_risk, _, _ = eln2022_intensive_risk(source_data)
+            except Exception as e:
+                eln_risk = "Unknown"
+            
+            # Store results for display
+            st.session_state["treatment_results"] = {
+                "patient_data": patient_data_for_treatment,
+                "eln_risk": eln_risk,
+                "patient_age": patient_age,
+                "additional_flow_data": additional_flow_data
+            }
+            del st.session_state["treatment_request"]
+        
+        # Display results if available
+        if "treatment_results" in st.session_state:
+            results = st.session_state["treatment_results"]
+            patient_data_for_treatment = results["patient_data"]
+            eln_risk = results["eln_risk"]
+            patient_age = results["patient_age"]
+            additional_flow_data = results.get("additional_flow_data", {})
+            
+            # Show CD33 data if provided
+            if additional_flow_data and "cd33_percentage" in additional_flow_data:
+                st.info(f"ℹ️ Using provided CD33 data: {additional_flow_data['cd33_percentage']}%")
+        else:
+            st.info("Please enter patient age and click 'Get Treatment Recommendations' to proceed.")
+            return
+        
+        # Add data explorer panel
+        with st.expander("🔍 Data Explorer - View Parsed Treatment Data", expanded=False):
+            if patient_data_for_treatment:
+                display_treatment_data_explorer(patient_data_for_treatment)
+            else:
+                st.warning("No treatment data available to explore.")
+        
+        # Display treatment recommendations with clean separator
+        st.markdown("---")
+        
+        # Create a custom treatment display that doesn't have button conflicts
+        display_streamlined_treatment_recommendations(patient_data_for_treatment, eln_risk, patient_age)
+
+
 # Function to display ELN risk assessment for AML
 def show_eln_risk_assessment(res, free_text_input_value):
     from classifiers.aml_risk_classifier import eln2022_intensive_risk, eln2024_non_intensive_risk
@@ -2130,8 +2139,10 @@ def show_eln_risk_assessment(res, free_text_input_value):
     # Process free text through ELN parser (if available)
     if free_text_input_value:
         with st.spinner("Processing ELN risk assessment..."):
-            # Parse the report to extract ELN markers
-            parsed_eln_data = parse_eln_report(free_text_input_value)
+            # Reuse the markers extracted alongside the classification when available
+            parsed_eln_data = get_unified_result("eln", free_text_input_value)
+            if parsed_eln_data is None:
+                parsed_eln_data = parse_eln_report(free_text_input_value)
             
             if parsed_eln_data:
                 # Prepare data for ELN 2024 non-intensive classification
@@ -2251,11 +2262,10 @@ def show_ipss_risk_assessment(res, free_text_input_value):
     parameter to prepopulate the text area.
     """
     # Import necessary functions
-    from classifiers.mds_risk_classifier import calculate_ipssm, calculate_ipssr, get_ipssm_survival_data
+    from classifiers.mds_risk_classifier import calculate_ipssm, calculate_ipssr
     from parsers.mds_ipss_parser import parse_ipss_report
     import pandas as pd
     import matplotlib.pyplot as plt
-    import plotly.graph_objects as go
     from streamlit_option_menu import option_menu
     
 
@@ -2952,6 +2962,8 @@ def eln_risk_calculator_page():
     Standalone calculator for ELN 2022 and ELN 2024 risk assessment for AML,
     with enhanced Streamlit presentation and integrated instructions.
     """
+    from classifiers.aml_risk_classifier import eln2022_intensive_risk, eln2024_non_intensive_risk
+    from parsers.aml_eln_parser import parse_eln_report
 
     # --- Page Configuration & Styling ---
     st.markdown(
@@ -3261,6 +3273,7 @@ def ipss_risk_calculator_page():
     
     # Import the calculator functions
     from classifiers.mds_risk_classifier import calculate_ipssm, calculate_ipssr
+    from parsers.mds_ipss_parser import parse_ipss_report
     import pandas as pd
     import matplotlib.pyplot as plt
     
@@ -3932,6 +3945,106 @@ def ipss_risk_calculator_page():
                 st.table(df_params)
 
 
+##################################
+# LLM METRICS PAGE (ADMIN)
+##################################
+def llm_metrics_page():
+    """
+    Admin view of the per-prompt LLM metrics (see utils/llm_metrics.py) for all
+    sessions of this server process: latency percentiles, queue wait, tokens,
+    retries, cache hits and estimated cost, plus the per-route figures of the
+    model router, with JSON and Prometheus exports.
+    """
+    import json
+    from utils.llm_metrics import get_llm_metrics
+    from utils.model_router import get_model_router
+
+    if not is_admin_user(st.session_state["username"]):
+        st.error("❌ The LLM metrics page is only available to admin users.")
+        return
+
+    metrics = get_llm_metrics()
+    router = get_model_router()
+    snapshot = metrics.snapshot()
+    snapshot["routing"] = router.snapshot()
+    prompts = snapshot["prompts"]
+
+    st.title("LLM Metrics")
+    since = datetime.datetime.fromtimestamp(snapshot["since"]).strftime("%Y-%m-%d %H:%M:%S")
+    st.caption(f"All sessions since {since}. Prompts are sorted by p95 wall time; "
+               "cache hits are counted but excluded from the latency figures.")
+
+    if not prompts:
+        st.info("No LLM calls recorded yet.")
+    else:
+        calls = sum(p["calls"] for p in prompts.values())
+        cache_hits = sum(p["cache_hits"] for p in prompts.values())
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Calls", calls)
+        col2.metric("Cache hit rate", f"{cache_hits / calls:.0%}")
+        col3.metric("Tokens", sum(p["prompt_tokens"] + p["completion_tokens"] for p in prompts.values()))
+        col4.metric("Estimated cost", f"${sum(p['cost_usd'] for p in prompts.values()):.2f}")
+
+        def seconds(value):
+            return None if value is None else round(value, 2)
+
+        st.dataframe([
+            {
+                "Prompt": name,
+                "Calls": p["calls"],
+                "Cache hits": p["cache_hits"],
+                "Errors": p["errors"],
+                "Retries": p["retries"],
+                "Re-asks": p["reasks"],
+                "p50 (s)": seconds(p["wall_p50"]),
+                "p95 (s)": seconds(p["wall_p95"]),
+                "Max (s)": seconds(p["wall_max"]),
+                "Queue wait (s)": seconds(p["queue_wait_mean"]),
+                "Prompt tokens": p["prompt_tokens"],
+                "Cached prompt tokens": p["cached_prompt_tokens"],
+                "Completion tokens": p["completion_tokens"],
+                "Cost ($)": round(p["cost_usd"], 4),
+            }
+            for name, p in prompts.items()
+        ], use_container_width=True, hide_index=True)
+
+        selected = st.selectbox("Wall time histogram", list(prompts))
+        cumulative = prompts[selected]["wall_histogram"]
+        counts = [count - (cumulative[i - 1][1] if i else 0) for i, (_, count) in enumerate(cumulative)]
+        st.bar_chart({"calls": {f"≤ {bound}s": count for (bound, _), count in zip(cumulative, counts)}})
+
+        routing = snapshot["routing"]
+        st.subheader("Model routing")
+        if not routing["enabled"]:
+            st.caption("Routing is off; every section uses its usual model.")
+        else:
+            st.caption(f"Simple sections go to {routing['fast_model']} first and are escalated on a "
+                       f"failed schema check, confidence below {routing['min_confidence']:.2f} "
+                       "or a conflict with another section.")
+        st.dataframe([
+            {
+                "Route": route,
+                "Calls": r["calls"],
+                "Cache hits": r["cache_hits"],
+                "p50 (s)": seconds(r["wall_p50"]),
+                "p95 (s)": seconds(r["wall_p95"]),
+                "Mean (s)": seconds(r["wall_mean"]),
+                "Escalation reasons": ", ".join(f"{k}: {v}" for k, v in r["escalation_reasons"].items()),
+            }
+            for route, r in routing["routes"].items()
+        ], use_container_width=True, hide_index=True)
+
+    col1, col2, col3 = st.columns(3)
+    col1.download_button("Download JSON", json.dumps(snapshot, indent=2),
+                         file_name="llm_metrics.json", mime="application/json")
+    col2.download_button("Download Prometheus text", metrics.prometheus_text(),
+                         file_name="llm_metrics.prom", mime="text/plain")
+    if col3.button("Reset metrics"):
+        metrics.reset()
+        router.reset()
+        st.rerun()
+
+
 ##################################
 # APP MAIN
 ##################################
@@ -3951,11 +4064,17 @@ def app_main():
     # sidebar_ipss_calculator()
 
     # Add sidebar navigation options
+    options = ["AML/MDS Classifier", "IPSS-M/R Risk Tool", "ELN Risk Calculator"]
+    icons = ["clipboard-data", "calculator", "graph-up"]
+    if is_admin_user(st.session_state["username"]):
+        options.append("LLM Metrics")
+        icons.append("speedometer2")
+
     with st.sidebar:
         selected = option_menu(
             menu_title="Haem.io",
-            options=["AML/MDS Classifier", "IPSS-M/R Risk Tool", "ELN Risk Calculator"],
-            icons=["clipboard-data", "calculator", "graph-up"],
+            options=options,
+            icons=icons,
             menu_icon=None,
             default_index=0,
         )
@@ -3978,6 +4097,8 @@ def app_main():
         st.session_state["page"] = "ipss_risk_calculator"
     elif selected == "ELN Risk Calculator":
         st.session_state["page"] = "eln_risk_calculator"
+    elif selected == "LLM Metrics":
+        st.session_state["page"] = "llm_metrics"
     elif selected == "AML/MDS Classifier" and st.session_state["page"] != "results":
         st.session_state["page"] = "data_entry"
 
@@ -3989,6 +4110,8 @@ def app_main():
         ipss_risk_calculator_page()
     elif st.session_state["page"] == "eln_risk_calculator":
         eln_risk_calculator_page()
+    elif st.session_state["page"] == "llm_metrics":
+        llm_metrics_page()
 
 
 if __name__ == "__main__":
@@ -4,7 +4,7 @@ import json
 ##############################
 # CLASSIFY AML WHO 2022
 ##############################
-def classify_AML_WHO2022(parsed_data: dict, not_erythroid: bool = False) -> tuple:
+def classify_AML_WHO2022(parsed_data: dict, not_erythroid: bool = False, explain: bool = True) -> tuple:
     """
     Classifies AML subtypes based on WHO 2022 criteria, including qualifiers.
     If the final classification is "Acute myeloid leukaemia, [define by differentiation]",
@@ -25,6 +25,7 @@ def classify_AML_WHO2022(parsed_data: dict, not_erythroid: bool = False) -> tupl
     Args:
         parsed_data (dict): Extracted report data.
         not_erythroid (bool): If True, prevents overriding classification with an erythroid subtype.
+        explain (bool): If False, the derivation steps are not written and the list stays empty.
 
     Returns:
         tuple: (classification (str), derivation (list of str))
@@ -33,18 +34,22 @@ def classify_AML_WHO2022(parsed_data: dict, not_erythroid: bool = False) -> tupl
     
     # Validate blasts_percentage
     blasts_percentage = parsed_data.get("blasts_percentage")
-    derivation.append(f"Retrieved blasts_percentage: {blasts_percentage}")
+    if explain:
+        derivation.append(f"Retrieved blasts_percentage: {blasts_percentage}")
     if blasts_percentage is None:
         msg = "Error: blasts_percentage is missing. Classification cannot proceed."
-        derivation.append(msg)
+        if explain:
+            derivation.append(msg)
         return (msg, derivation)
     if not isinstance(blasts_percentage, (int, float)) or not (0.0 <= blasts_percentage <= 100.0):
         msg = "Error: blasts_percentage must be a number between 0 and 100."
-        derivation.append(msg)
+        if explain:
+            derivation.append(msg)
         return (msg, derivation)
 
     classification = "Acute myeloid leukaemia, [define by differentiation]"
-    derivation.append(f"Default classification set to: {classification}")
+    if explain:
+        derivation.append(f"Default classification set to: {classification}")
 
     # STEP 1: AML-Defining Recurrent Genetic Abnormalities (WHO)
     aml_def_map = {
@@ -67,12 +72,15 @@ def classify_AML_WHO2022(parsed_data: dict, not_erythroid: bool = False) -> tupl
     true_aml_genes = [gene for gene, val in aml_gen_abn.items() if val]
 
     if not true_aml_genes:
-        derivation.append("All AML-defining recurrent genetic abnormality flags are false.")
+        if explain:
+            derivation.append("All AML-defining recurrent genetic abnormality flags are false.")
         if blasts_percentage < 20:
             classification = "Not AML, consider MDS classification"
-            derivation.append("No AML-defining abnormalities and blasts <20 => consider reclassification as MDS.")
+            if explain:
+                derivation.append("No AML-defining abnormalities and blasts <20 => consider reclassification as MDS.")
     else:
-        derivation.append(f"Detected AML-defining abnormality flags: {', '.join(true_aml_genes)}")
+        if explain:
+            derivation.append(f"Detected AML-defining abnormality flags: {', '.join(true_aml_genes)}")
         updated = False
         for gene, final_label in aml_def_map.items():
             if aml_gen_abn.get(gene, False):
@@ -80,19 +88,23 @@ def classify_AML_WHO2022(parsed_data: dict, not_erythroid: bool = False) -> tupl
                 if gene in ["CEBPA", "bZIP", "BCR::ABL1"]:
                     if blasts_percentage >= 20:
                         classification = final_label
-                        derivation.append(f"{gene} with blasts >=20 => {classification}")
+                        if explain:
+                            derivation.append(f"{gene} with blasts >=20 => {classification}")
                         updated = True
                         break
                     else:
-                        derivation.append(f"{gene} found but blasts <20 => not AML by this route")
+                        if explain:
+                            derivation.append(f"{gene} found but blasts <20 => not AML by this route")
                 else:
                     classification = final_label
-                    derivation.append(f"{gene} => {classification}")
+                    if explain:
+                        derivation.append(f"{gene} => {classification}")
                     updated = True
                     break
         if not updated and blasts_percentage < 20:
             classification = "Not AML, consider MDS classification"
-            derivation.append("No AML-defining abnormality fully matched, blasts <20 => consider MDS.")
+            if explain:
+                derivation.append("No AML-defining abnormality fully matched, blasts <20 => consider MDS.")
 
     # STEP 2: MDS-Related Mutations
     if classification == "Acute myeloid leukaemia, [define by differentiation]":
@@ -100,9 +112,11 @@ def classify_AML_WHO2022(parsed_data: dict, not_erythroid: bool = False) -> tupl
         found = [g for g, val in mds_mut.items() if val]
         if found:
             classification = "AML, myelodysplasia related"
-            derivation.append(f"MDS-related mutation(s): {', '.join(found)} => {classification}")
+            if explain:
+                derivation.append(f"MDS-related mutation(s): {', '.join(found)} => {classification}")
         else:
-            derivation.append("No MDS-related mutations found.")
+            if explain:
+                derivation.append("No MDS-related mutations found.")
 
     # STEP 3: MDS-Related Cytogenetics
     if classification == "Acute myeloid leukaemia, [define by differentiation]":
@@ -110,16 +124,20 @@ def classify_AML_WHO2022(parsed_data: dict, not_erythroid: bool = False) -> tupl
         found_cyto = [abn for abn, val in mds_cyto.items() if val]
         if found_cyto:
             classification = "AML, myelodysplasia related"
-            derivation.append(f"MDS-related cytogenetic(s): {', '.join(found_cyto)} => {classification}")
+            if explain:
+                derivation.append(f"MDS-related cytogenetic(s): {', '.join(found_cyto)} => {classification}")
         else:
-            derivation.append("No MDS-related cytogenetic flags found.")
+            if explain:
+                derivation.append("No MDS-related cytogenetic flags found.")
 
     # STEP 4: AML_differentiation override
     aml_diff = parsed_data.get("AML_differentiation")
     if aml_diff: 
-        derivation.append(f"AML_differentiation: {aml_diff}")
+        if explain:
+            derivation.append(f"AML_differentiation: {aml_diff}")
     else:
-        derivation.append("No AML_differentiation provided.")
+        if explain:
+            derivation.append("No AML_differentiation provided.")
 
     FAB_TO_WHO = {
         "M0": "Acute myeloid leukaemia with minimal differentiation",
@@ -139,15 +157,19 @@ def classify_AML_WHO2022(parsed_data: dict, not_erythroid: bool = False) -> tupl
         if aml_diff in ["M6a", "M6b"]:
             if not not_erythroid:
                 classification = "Acute Erythroid leukaemia"
-                derivation.append(f"Erythroid subtype => {classification}")
+                if explain:
+                    derivation.append(f"Erythroid subtype => {classification}")
             else:
-                derivation.append("not_erythroid flag => skipping erythroid override")
+                if explain:
+                    derivation.append("not_erythroid flag => skipping erythroid override")
         elif classification == "Acute myeloid leukaemia, [define by differentiation]" and aml_diff in FAB_TO_WHO:
             classification = FAB_TO_WHO[aml_diff]
-            derivation.append(f"FAB mapping => {classification}")
+            if explain:
+                derivation.append(f"FAB mapping => {classification}")
         elif classification == "Acute myeloid leukaemia, [define by differentiation]":
             classification = "Acute myeloid leukaemia, unknown differentiation"
-            derivation.append("No valid AML_differentiation => unknown differentiation")
+            if explain:
+                derivation.append("No valid AML_differentiation => unknown differentiation")
 
     # STEP 5: Append Qualifiers
     qualifier_list = []
@@ -158,7 +180,8 @@ def classify_AML_WHO2022(parsed_data: dict, not_erythroid: bool = False) -> tupl
     who_accepted = ["Ionising radiation", "Cytotoxic chemotherapy", "Any combination"]
     if therapy_type in who_accepted:
         qualifier_list.append("previous cytotoxic therapy")
-        derivation.append(f"Detected WHO therapy => previous cytotoxic therapy: {therapy_type}")
+        if explain:
+            derivation.append(f"Detected WHO therapy => previous cytotoxic therapy: {therapy_type}")
 
     # Germline predisposition: WHO uses "associated with"
     germline_var = q.get("predisposing_germline_variant", "").strip()
@@ -169,9 +192,11 @@ def classify_AML_WHO2022(parsed_data: dict, not_erythroid: bool = False) -> tupl
         final_germ = [x for x in no_brackets if x.lower() != "diamond-blackfan anemia"]
         if final_germ:
             qualifier_list.append("associated with " + ", ".join(final_germ))
-            derivation.append("Detected germline predisposition => associated with " + ", ".join(final_germ))
+            if explain:
+                derivation.append("Detected germline predisposition => associated with " + ", ".join(final_germ))
     else:
-        derivation.append("No germline predisposition indicated (review at MDT)")
+        if explain:
+            derivation.append("No germline predisposition indicated (review at MDT)")
 
     # NEW: check if "previous_MDS_diagnosed_over_3_months_ago" or "previous_MDS/MPN_diagnosed_over_3_months_ago" or "previous_MPN_diagnosed_over_3_months_ago" is True
     progressed_from_mds = (
@@ -181,15 +206,18 @@ def classify_AML_WHO2022(parsed_data: dict, not_erythroid: bool = False) -> tupl
     )
     if progressed_from_mds:
         qualifier_list.append("progressed from MDS")
-        derivation.append("Either previous_MDS, previous_MDS/MPN, or previous_MPN is True => 'progressed from MDS'")
+        if explain:
+            derivation.append("Either previous_MDS, previous_MDS/MPN, or previous_MPN is True => 'progressed from MDS'")
 
     if qualifier_list:
         classification += ", " + ", ".join(qualifier_list)
-        derivation.append("Classification with qualifiers => " + classification)
+        if explain:
+            derivation.append("Classification with qualifiers => " + classification)
 
     if "Not AML" not in classification:
         classification += " (WHO 2022)"
-    derivation.append("Final classification => " + classification)
+    if explain:
+        derivation.append("Final classification => " + classification)
     return classification, derivation
 
 
@@ -198,7 +226,7 @@ def classify_AML_WHO2022(parsed_data: dict, not_erythroid: bool = False) -> tupl
 ##############################
 # CLASSIFY AML ICC 2022
 ##############################
-def classify_AML_ICC2022(parsed_data: dict) -> tuple:
+def classify_AML_ICC2022(parsed_data: dict, explain: bool = True) -> tuple:
     """
     Classifies AML subtypes based on ICC 2022 criteria, including qualifiers.
 
@@ -217,25 +245,30 @@ def classify_AML_ICC2022(parsed_data: dict) -> tuple:
 
     Args:
         parsed_data (dict): Extracted report data.
+        explain (bool): If False, the derivation steps are not written and the list stays empty.
 
     Returns:
         tuple: (classification (str), derivation (list of str))
     """
     derivation = []
     blasts_percentage = parsed_data.get("blasts_percentage")
-    derivation.append(f"Retrieved blasts_percentage: {blasts_percentage}")
+    if explain:
+        derivation.append(f"Retrieved blasts_percentage: {blasts_percentage}")
 
     if blasts_percentage is None:
         msg = "Error: blasts_percentage is missing. Classification cannot proceed."
-        derivation.append(msg)
+        if explain:
+            derivation.append(msg)
         return (msg, derivation)
     if not isinstance(blasts_percentage, (int, float)) or not (0.0 <= blasts_percentage <= 100.0):
         msg = "Error: blasts_percentage must be a number between 0 and 100."
-        derivation.append(msg)
+        if explain:
+            derivation.append(msg)
         return (msg, derivation)
 
     classification = "AML, NOS"
-    derivation.append(f"Default classification set to: {classification}")
+    if explain:
+        derivation.append(f"Default classification set to: {classification}")
 
     aml_def_gen = parsed_data.get("AML_defining_recurrent_genetic_abnormalities", {})
     biallelic_tp53 = parsed_data.get("Biallelic_TP53_mutation", {})
@@ -291,21 +324,26 @@ def classify_AML_ICC2022(parsed_data: dict) -> tuple:
     }
     true_flags = [g for g, val in aml_def_gen.items() if val]
     if true_flags:
-        derivation.append("ICC AML-defining flags => " + ", ".join(true_flags))
+        if explain:
+            derivation.append("ICC AML-defining flags => " + ", ".join(true_flags))
         updated = False
         for gene, label in icc_map.items():
             if aml_def_gen.get(gene, False):
                 if blasts_percentage >= 10:
                     classification = label
-                    derivation.append(f"{gene} => {classification}")
+                    if explain:
+                        derivation.append(f"{gene} => {classification}")
                     updated = True
                     break
                 else:
-                    derivation.append(f"{gene} but blasts <10 => cannot label AML here")
+                    if explain:
+                        derivation.append(f"{gene} but blasts <10 => cannot label AML here")
         if not updated:
-            derivation.append("No single ICC AML-def abnormality triggered classification.")
+            if explain:
+                derivation.append("No single ICC AML-def abnormality triggered classification.")
     else:
-        derivation.append("No ICC AML-defining abnormality is True.")
+        if explain:
+            derivation.append("No ICC AML-defining abnormality is True.")
 
     # STEP 2: Biallelic TP53
     conds = [
@@ -317,18 +355,22 @@ def classify_AML_ICC2022(parsed_data: dict) -> tuple:
     if classification == "AML, NOS":
         if any(conds):
             classification = "AML with mutated TP53"
-            derivation.append("Biallelic TP53 => AML with mutated TP53")
+            if explain:
+                derivation.append("Biallelic TP53 => AML with mutated TP53")
         else:
-            derivation.append("No biallelic TP53 conditions met.")
+            if explain:
+                derivation.append("No biallelic TP53 conditions met.")
 
     # STEP 3: MDS-related Mutations
     if classification == "AML, NOS":
         found_mds = [m for m, val in mds_mutations.items() if val]
         if found_mds:
             classification = "AML with myelodysplasia related gene mutation"
-            derivation.append("MDS-related genes => " + classification)
+            if explain:
+                derivation.append("MDS-related genes => " + classification)
         else:
-            derivation.append("No MDS-related genes set to True.")
+            if explain:
+                derivation.append("No MDS-related genes set to True.")
 
     # STEP 4: MDS-related Cytogenetics
     if classification == "AML, NOS":
@@ -341,9 +383,11 @@ def classify_AML_ICC2022(parsed_data: dict) -> tuple:
         found_cyts = [c for c, val in mds_cyto.items() if val and c in all_cyts]
         if found_cyts:
             classification = "AML with myelodysplasia related cytogenetic abnormality"
-            derivation.append("MDS-related cyto => " + classification)
+            if explain:
+                derivation.append("MDS-related cyto => " + classification)
         else:
-            derivation.append("No MDS-related cytogenetics triggered classification.")
+            if explain:
+                derivation.append("No MDS-related cytogenetics triggered classification.")
 
     # STEP 5: Final Blast-Count check
     convertible = {
@@ -355,17 +399,21 @@ def classify_AML_ICC2022(parsed_data: dict) -> tuple:
     if classification in convertible:
         if blasts_percentage < 10:
             classification = "Not AML, consider MDS classification"
-            derivation.append("Blasts <10 => final classification: Not AML, consider MDS classification")
+            if explain:
+                derivation.append("Blasts <10 => final classification: Not AML, consider MDS classification")
         elif 10 <= blasts_percentage < 20:
             new_class = classification.replace("AML", "MDS/AML", 1)
-            derivation.append("Blasts 10–19 => replaced 'AML' with 'MDS/AML'. Final classification: " + new_class)
+            if explain:
+                derivation.append("Blasts 10–19 => replaced 'AML' with 'MDS/AML'. Final classification: " + new_class)
             classification = new_class
         else:
-            derivation.append("Blasts >=20 => remain AML")
+            if explain:
+                derivation.append("Blasts >=20 => remain AML")
     else:
         if blasts_percentage < 10:
             classification = "Not AML, consider MDS classification"
-            derivation.append("Blasts <10 => final classification: Not AML, consider MDS classification")
+            if explain:
+                derivation.append("Blasts <10 => final classification: Not AML, consider MDS classification")
 
     # STEP 6: Append Qualifiers
     q_list = []
@@ -374,7 +422,8 @@ def classify_AML_ICC2022(parsed_data: dict) -> tuple:
     icc_accepted = ["Ionising radiation", "Cytotoxic chemotherapy", "Immune interventions", "Any combination"]
     if therapy in icc_accepted:
         q_list.append("therapy related")
-        derivation.append(f"Detected ICC therapy => therapy related: {therapy}")
+        if explain:
+            derivation.append(f"Detected ICC therapy => therapy related: {therapy}")
 
     # Germline predisposition => "in the setting of"
     germ_v = qualifiers.get("predisposing_germline_variant", "").strip()
@@ -386,9 +435,11 @@ def classify_AML_ICC2022(parsed_data: dict) -> tuple:
         if no_blm:
             phrase = "in the setting of " + ", ".join(no_blm)
             q_list.append(phrase)
-            derivation.append("Qualifier => " + phrase)
+            if explain:
+                derivation.append("Qualifier => " + phrase)
     else:
-        derivation.append("No germline predisposition indicated (review at MDT)")
+        if explain:
+            derivation.append("No germline predisposition indicated (review at MDT)")
 
     # NEW: check if "previous_MDS_diagnosed_over_3_months_ago" or "previous_MDS/MPN_diagnosed_over_3_months_ago" or "previous_MPN_diagnosed_over_3_months_ago" is True
     progressed_from_mds = (
@@ -398,15 +449,18 @@ def classify_AML_ICC2022(parsed_data: dict) -> tuple:
     )
     if progressed_from_mds:
         q_list.append("arising post MDS")
-        derivation.append("Either previous_MDS, previous_MDS/MPN, or previous_MPN => 'arising post MDS'")
+        if explain:
+            derivation.append("Either previous_MDS, previous_MDS/MPN, or previous_MPN => 'arising post MDS'")
 
     if q_list and "Not AML" not in classification:
         classification += ", " + ", ".join(q_list) + " (ICC 2022)"
-        derivation.append("Qualifiers appended => " + classification)
+        if explain:
+            derivation.append("Qualifiers appended => " + classification)
     else:
         if "Not AML" not in classification:
             classification += " (ICC 2022)"
-        derivation.append("Final => " + classification)
+        if explain:
+            derivation.append("Final => " + classification)
 
     return classification, derivation
 
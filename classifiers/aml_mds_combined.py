@@ -5,7 +5,7 @@ from classifiers.mds_classifier import classify_MDS_WHO2022, classify_MDS_ICC202
 ##############################
 # COMBINED CLASSIFIER ICC 2022
 ##############################
-def classify_combined_ICC2022(parsed_data: dict) -> tuple:
+def classify_combined_ICC2022(parsed_data: dict, explain: bool = True) -> tuple:
     """
     First attempts AML classification using ICC 2022 criteria.
     If the AML ICC classifier indicates the case is "Not AML, consider MDS classification",
@@ -13,18 +13,21 @@ def classify_combined_ICC2022(parsed_data: dict) -> tuple:
     
     Args:
         parsed_data (dict): A dictionary containing extracted haematological report data.
+        explain (bool): If False, no derivation text is built and the derivation list is empty.
     
     Returns:
         tuple: (classification (str), derivation (list of str), disease_type (str))
               where disease_type is either "AML" or "MDS"
     """
     # Call the AML ICC classifier first.
-    aml_icc_classification, aml_icc_derivation = classify_AML_ICC2022(parsed_data)
+    aml_icc_classification, aml_icc_derivation = classify_AML_ICC2022(parsed_data, explain=explain)
     
     # If the AML ICC classification suggests that the case is not AML,
     # then call the MDS ICC classifier.
     if "Not AML" in aml_icc_classification:
-        mds_icc_classification, mds_icc_derivation = classify_MDS_ICC2022(parsed_data)
+        mds_icc_classification, mds_icc_derivation = classify_MDS_ICC2022(parsed_data, explain=explain)
+        if not explain:
+            return mds_icc_classification, [], "MDS"
         combined_derivation = (
             aml_icc_derivation +
             ["AML ICC classifier indicated that the case is not AML. Switching to MDS ICC classification..."] +
@@ -39,7 +42,7 @@ def classify_combined_ICC2022(parsed_data: dict) -> tuple:
 ##############################
 # COMBINED CLASSIFIER WHO 2022
 ##############################
-def classify_combined_WHO2022(parsed_data: dict, not_erythroid: bool) -> tuple:
+def classify_combined_WHO2022(parsed_data: dict, not_erythroid: bool, explain: bool = True) -> tuple:
     """
     Attempts AML classification using WHO 2022 criteria.
     If the AML classifier indicates the case is "Not AML, consider MDS classification",
@@ -50,17 +53,22 @@ def classify_combined_WHO2022(parsed_data: dict, not_erythroid: bool) -> tuple:
         not_erythroid (bool, optional): If provided, this flag is passed to the AML classifier 
                                         to bypass the erythroid override. If not provided,
                                         the AML classifier is called without this parameter.
+        explain (bool): If False, no derivation text is built and the derivation list is empty.
 
     Returns:
         tuple: A tuple containing (classification (str), derivation (list of str), disease_type (str))
                where disease_type is either "AML" or "MDS"
     """
 
-    aml_classification, aml_derivation = classify_AML_WHO2022(parsed_data, not_erythroid=not_erythroid)
+    aml_classification, aml_derivation = classify_AML_WHO2022(
+        parsed_data, not_erythroid=not_erythroid, explain=explain
+    )
 
     # If the AML classifier suggests it's not AML, then call the MDS classifier.
     if "Not AML" in aml_classification:
-        mds_classification, mds_derivation = classify_MDS_WHO2022(parsed_data)
+        mds_classification, mds_derivation = classify_MDS_WHO2022(parsed_data, explain=explain)
+        if not explain:
+            return mds_classification, [], "MDS"
         combined_derivation = (
             aml_derivation +
             ["AML classifier indicated that the case is not AML. Switching to MDS classification..."] +
@@ -0,0 +1,190 @@
+"""
+Batch WHO/ICC classification for many parsed cases at once.
+
+``classify_combined_WHO2022`` and ``classify_combined_ICC2022`` work on one
+parsed dict at a time. ``classify_batch()`` runs both over a list of dicts, a
+pandas DataFrame or a pyarrow Table and returns one row per input case:
+
+    who_classification, who_derivation, who_disease_type,
+    icc_classification, icc_derivation, icc_disease_type, error
+
+Registry data is full of identical parsed records, so each distinct record is
+classified only once and the result is fanned back out to its duplicates.
+``include_derivations=False`` tells the classifiers not to build the derivation
+text at all; the derivation columns are then None.
+``workers`` spreads the distinct records over a process pool. Records and
+results are pickled to and from the workers, so measure before using it
+(scripts/benchmark_batch_classifier.py); it is off by default.
+"""
+
+import json
+import math
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import pandas as pd
+
+from classifiers.aml_mds_combined import classify_combined_ICC2022, classify_combined_WHO2022
+
+##############################
+# BATCH CONFIG
+##############################
+RESULT_COLUMNS = [
+    "who_classification",
+    "who_derivation",
+    "who_disease_type",
+    "icc_classification",
+    "icc_derivation",
+    "icc_disease_type",
+    "error",
+]
+DEFAULT_CHUNK_SIZE = 500
+
+
+##############################
+# INPUT NORMALISATION
+##############################
+def _is_missing(value: Any) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def _clean_record(value: Any) -> Any:
+    """
+    Drops missing values that tables add for absent fields (None / NaN), so the
+    classifiers' ``.get(key, default)`` lookups behave as they do for parsed dicts.
+    """
+    if isinstance(value, dict):
+        return {k: _clean_record(v) for k, v in value.items() if not _is_missing(v)}
+    if isinstance(value, list):
+        return [_clean_record(v) for v in value]
+    return value
+
+
+def _rows_from_input(cases, record_column: Optional[str] = None) -> Tuple[list, Optional[pd.Index], bool]:
+    """
+    Pulls the raw rows out of the supported inputs.
+
+    Args:
+        cases: list of dicts, pandas DataFrame or pyarrow Table.
+        record_column: optional column holding each case's parsed dict (or its JSON
+                       string). When omitted, each table row is the parsed dict.
+
+    Returns:
+        tuple: (raw rows, DataFrame index to reuse for the output or None,
+                whether rows came from a table and may carry None/NaN fillers)
+    """
+    if isinstance(cases, pd.DataFrame):
+        rows = cases[record_column].tolist() if record_column else cases.to_dict("records")
+        return rows, cases.index, True
+    if hasattr(cases, "to_pylist") and hasattr(cases, "column_names"):
+        # pyarrow.Table: avoid importing pyarrow just for an isinstance check.
+        rows = cases.column(record_column).to_pylist() if record_column else cases.to_pylist()
+        return rows, None, True
+    return list(cases), None, False
+
+
+def _normalise_row(row: Any, from_table: bool) -> dict:
+    """Turns one raw row into the parsed dict the classifiers expect."""
+    if isinstance(row, str):
+        return json.loads(row)
+    if not isinstance(row, dict):
+        raise TypeError(f"Each case must be a dict or a JSON object string, got {type(row).__name__}")
+    return _clean_record(row) if from_table else row
+
+
+def _row_key(row: Any) -> str:
+    """
+    Key used to classify identical rows only once. ``repr`` is much cheaper than a
+    canonical JSON dump; rows that differ only in key order simply are not merged.
+    """
+    return row if isinstance(row, str) else repr(row)
+
+
+##############################
+# CLASSIFICATION
+##############################
+def _classify_one(record: dict, not_erythroid: bool, include_derivations: bool) -> Dict[str, Any]:
+    """Classifies one parsed record with both combined classifiers."""
+    try:
+        who_classification, who_derivation, who_disease_type = classify_combined_WHO2022(
+            record, not_erythroid=not_erythroid, explain=include_derivations
+        )
+        icc_classification, icc_derivation, icc_disease_type = classify_combined_ICC2022(
+            record, explain=include_derivations
+        )
+    except Exception as e:
+        result = {column: None for column in RESULT_COLUMNS}
+        result["error"] = str(e)
+        return result
+
+    return {
+        "who_classification": who_classification,
+        "who_derivation": who_derivation if include_derivations else None,
+        "who_disease_type": who_disease_type,
+        "icc_classification": icc_classification,
+        "icc_derivation": icc_derivation if include_derivations else None,
+        "icc_disease_type": icc_disease_type,
+        "error": None,
+    }
+
+
+def _classify_chunk(records: List[dict], not_erythroid: bool, include_derivations: bool) -> List[Dict[str, Any]]:
+    """Process-pool entry point: classifies a chunk of records in a worker."""
+    return [_classify_one(record, not_erythroid, include_derivations) for record in records]
+
+
+def _chunks(items: List[dict], size: int) -> Iterable[List[dict]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def classify_batch(cases: Union[List[dict], "pd.DataFrame", Any],
+                   not_erythroid: bool = False,
+                   include_derivations: bool = True,
+                   record_column: Optional[str] = None,
+                   workers: int = 1,
+                   chunk_size: int = DEFAULT_CHUNK_SIZE) -> pd.DataFrame:
+    """
+    Classifies many parsed cases with the combined WHO 2022 and ICC 2022 classifiers.
+
+    Args:
+        cases: list of parsed dicts, pandas DataFrame or pyarrow Table.
+        not_erythroid (bool): passed to the WHO classifier for every case.
+        include_derivations (bool): if False, the derivation text is never built and
+                                    the derivation columns are None.
+        record_column (str, optional): column holding each parsed dict or JSON string.
+        workers (int): number of worker processes; 1 (the default) classifies in this process.
+        chunk_size (int): records sent to a worker at a time.
+
+    Returns:
+        pd.DataFrame: one row per input case, in input order (and with the input's
+                      index when a DataFrame was given). Cases that raise have their
+                      message in the ``error`` column instead of stopping the batch.
+    """
+    rows, index, from_table = _rows_from_input(cases, record_column)
+
+    # Classify each distinct row once; only distinct rows are parsed and cleaned.
+    unique_positions: Dict[str, int] = {}
+    unique_records: List[dict] = []
+    positions = []
+    for row in rows:
+        key = _row_key(row)
+        position = unique_positions.get(key)
+        if position is None:
+            position = unique_positions[key] = len(unique_records)
+            unique_records.append(_normalise_row(row, from_table))
+        positions.append(position)
+
+    if workers > 1 and len(unique_records) > chunk_size:
+        unique_results = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_classify_chunk, chunk, not_erythroid, include_derivations)
+                for chunk in _chunks(unique_records, chunk_size)
+            ]
+            for future in futures:
+                unique_results.extend(future.result())
+    else:
+        unique_results = _classify_chunk(unique_records, not_erythroid, include_derivations)
+
+    return pd.DataFrame([unique_results[p] for p in positions], columns=RESULT_COLUMNS, index=index)
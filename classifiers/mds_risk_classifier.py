@@ -21,8 +21,8 @@ import sys
 import json
 import math
 import argparse
+from itertools import product
 from typing import Dict, Any, List, Union, Tuple, Optional
-import concurrent.futures
 import streamlit as st
 
 
@@ -133,19 +133,13 @@ def find_category_index(value: float, breaks: List[float], right: bool = True) -
     return -1  # Default value for error cases
 
 
-def calculate_residual_genes(
-    patient_data: Dict[str, Any], 
-    n_ref: float = 0.388
-) -> Dict[str, float]:
+def _residual_gene_counts(patient_data: Dict[str, Any]) -> Tuple[int, int, int]:
     """
-    Calculate the residual genes weight contribution to the IPSS-M score.
+    Count the residual genes that are mutated, sequenced and missing ("NA").
+    Genes absent from patient_data are not counted at all.
     
-    Args:
-        patient_data: Dictionary with patient data
-        n_ref: Reference number of residual mutated genes
-        
     Returns:
-        Dictionary with mean, worst, and best case scenarios
+        Tuple of (mutated, sequenced, missing)
     """
     # Extract residual gene data and handle NA values
     residual_genes_data = {}
@@ -167,6 +161,24 @@ def calculate_residual_genes(
     mutated_genes = sum(
         int(value) for value in residual_genes_data.values() if value != "NA"
     )
+    return mutated_genes, sequenced_genes, missing_genes
+
+
+def calculate_residual_genes(
+    patient_data: Dict[str, Any], 
+    n_ref: float = 0.388
+) -> Dict[str, float]:
+    """
+    Calculate the residual genes weight contribution to the IPSS-M score.
+    
+    Args:
+        patient_data: Dictionary with patient data
+        n_ref: Reference number of residual mutated genes
+        
+    Returns:
+        Dictionary with mean, worst, and best case scenarios
+    """
+    mutated_genes, sequenced_genes, missing_genes = _residual_gene_counts(patient_data)
     
     # Worst scenario: all missing are mutated
     n_res_worst = min(mutated_genes + missing_genes, 2)
@@ -202,6 +214,40 @@ def _safe_number(value: Any) -> Optional[int]:
 # Preprocessing functions
 ###########################################
 
+# Raw inputs the SF3B1_5q and SF3B1_alpha features are derived from
+SF3B1_INPUTS = ["SF3B1", "del5q", "del7_7q", "complex", "SRSF2", "STAG2", "BCOR", "BCORL1", "RUNX1", "NRAS"]
+
+
+def _sf3b1_features(inputs: Dict[str, Optional[int]]) -> Tuple[str, str]:
+    """
+    Derive SF3B1_5q and SF3B1_alpha ("0", "1" or "NA") from the SF3B1_INPUTS values
+    (0, 1 or None when unknown).
+    """
+    sf3b1 = inputs["SF3B1"]
+    
+    # If any of these conditions are met, SF3B1_5q is 0
+    sf3b1_5q = "NA"
+    if (sf3b1 == 0 or inputs["del5q"] == 0 or inputs["del7_7q"] == 1 or inputs["complex"] == 1):
+        sf3b1_5q = "0"
+        
+    # If all these conditions are met, SF3B1_5q is 1
+    if (sf3b1 == 1 and inputs["del5q"] == 1 and inputs["del7_7q"] == 0 and inputs["complex"] == 0):
+        sf3b1_5q = "1"
+    
+    co_mutations = [inputs[gene] for gene in ("SRSF2", "STAG2", "BCOR", "BCORL1", "RUNX1", "NRAS")]
+    
+    # If any of these conditions are met, SF3B1_alpha is 0
+    sf3b1_alpha = "NA"
+    if sf3b1 == 0 or sf3b1_5q == "1" or 1 in co_mutations:
+        sf3b1_alpha = "0"
+        
+    # If all these conditions are met, SF3B1_alpha is 1
+    if sf3b1 == 1 and sf3b1_5q == "0" and all(value == 0 for value in co_mutations):
+        sf3b1_alpha = "1"
+    
+    return sf3b1_5q, sf3b1_alpha
+
+
 def preprocess_patient_data(patient_data: Dict[str, Any]) -> Dict[str, Any]:
     """
     Preprocess patient input data for IPSS-M calculation.
@@ -216,42 +262,11 @@ def preprocess_patient_data(patient_data: Dict[str, Any]) -> Dict[str, Any]:
     processed = {**patient_data}
     
     # Construction of SF3B1 features
-    processed["SF3B1_5q"] = "NA"
-    
-    # If any of these conditions are met, SF3B1_5q is 0
-    sf3b1 = _safe_number(processed.get("SF3B1", "NA"))
-    del5q = _safe_number(processed.get("del5q", "NA"))
-    del7_7q = _safe_number(processed.get("del7_7q", "NA"))
-    complex_karyo = _safe_number(processed.get("complex", "NA"))
-    
-    if (sf3b1 == 0 or del5q == 0 or del7_7q == 1 or complex_karyo == 1):
-        processed["SF3B1_5q"] = "0"
-        
-    # If all these conditions are met, SF3B1_5q is 1
-    if (sf3b1 == 1 and del5q == 1 and del7_7q == 0 and complex_karyo == 0):
-        processed["SF3B1_5q"] = "1"
-    
-    # Construction of SF3B1_alpha feature
-    processed["SF3B1_alpha"] = "NA"
-    
-    # Extract values with safety checks
-    sf3b1_5q = _safe_number(processed.get("SF3B1_5q", "NA"))
-    srsf2 = _safe_number(processed.get("SRSF2", "NA"))
-    stag2 = _safe_number(processed.get("STAG2", "NA"))
-    bcor = _safe_number(processed.get("BCOR", "NA"))
-    bcorl1 = _safe_number(processed.get("BCORL1", "NA"))
-    runx1 = _safe_number(processed.get("RUNX1", "NA"))
-    nras = _safe_number(processed.get("NRAS", "NA"))
-    
-    # If any of these conditions are met, SF3B1_alpha is 0
-    if (sf3b1 == 0 or sf3b1_5q == 1 or srsf2 == 1 or stag2 == 1 or 
-        bcor == 1 or bcorl1 == 1 or runx1 == 1 or nras == 1):
-        processed["SF3B1_alpha"] = "0"
-        
-    # If all these conditions are met, SF3B1_alpha is 1
-    if (sf3b1 == 1 and sf3b1_5q == 0 and srsf2 == 0 and stag2 == 0 and
-        bcor == 0 and bcorl1 == 0 and runx1 == 0 and nras == 0):
-        processed["SF3B1_alpha"] = "1"
+    sf3b1_5q, sf3b1_alpha = _sf3b1_features(
+        {name: _safe_number(processed.get(name, "NA")) for name in SF3B1_INPUTS}
+    )
+    processed["SF3B1_5q"] = sf3b1_5q
+    processed["SF3B1_alpha"] = sf3b1_alpha
     
     # Construction of TP53multi feature
     try:
@@ -339,7 +354,8 @@ def calculate_ipssm(
     rounding: bool = True,
     rounding_digits: int = 2,
     include_contributions: bool = False,
-    include_detailed_calculations: bool = False
+    include_detailed_calculations: bool = False,
+    include_missing_distribution: bool = False
 ) -> Dict[str, Any]:
     """
     Calculate IPSS-M risk score and categories.
@@ -350,6 +366,9 @@ def calculate_ipssm(
         rounding_digits: Number of digits to round to
         include_contributions: Whether to include variable contributions in output
         include_detailed_calculations: Whether to include detailed calculation steps with explanations
+        include_missing_distribution: Whether to include the exact distribution of risk
+            categories over every combination of missing genes (see
+            calculate_ipssm_missing_distribution)
         
     Returns:
         Dictionary with IPSS-M scores
@@ -475,9 +494,256 @@ def calculate_ipssm(
             "risk_interpretation": "Positive contributions increase risk, negative contributions decrease risk."
         }
     
+    # Add the exact missing-data distribution if requested
+    if include_missing_distribution:
+        scores["missing_distribution"] = _missing_distribution(
+            patient_data, processed_data, scores["means"]["risk_cat"], rounding, rounding_digits
+        )
+    
     return scores
 
 
+###########################################
+# Exact missing-data distribution
+###########################################
+
+# Per-gene mutation prevalence for residual genes: the reference number of
+# mutated residual genes spread evenly over the residual gene list.
+RESIDUAL_GENE_PREVALENCE = 0.388 / len(RESIDUAL_GENES)
+
+# Approximate frequency in MDS of the SF3B1_INPUTS that are not IPSS-M features
+# themselves (the gene features use their BETAS means).
+RAW_INPUT_PREVALENCE = {"SF3B1": 0.2, "del5q": 0.1, "del7_7q": 0.08, "complex": 0.1}
+
+# Features preprocess_patient_data derives from other inputs rather than reads directly
+DERIVED_FEATURES = {"SF3B1_alpha", "SF3B1_5q", "Nres2"}
+
+
+def _known_feature_value(processed_data: Dict[str, Any], var_name: str) -> Optional[float]:
+    """
+    Return the value calculate_ipssm would use for a feature, or None when it
+    would fall back to the scenario value (missing, "NA" or not a number).
+    """
+    value = processed_data.get(var_name)
+    if value == "NA" or value is None:
+        return None
+    if var_name == "TP53multi" and isinstance(value, str) and value not in ["0", "1"]:
+        return None
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def _raw_input_prevalence(name: str) -> float:
+    if name in RAW_INPUT_PREVALENCE:
+        return RAW_INPUT_PREVALENCE[name]
+    if name in RESIDUAL_GENES:
+        return RESIDUAL_GENE_PREVALENCE
+    return next(beta["means"] for beta in BETAS if beta["name"] == name)
+
+
+def _missing_distribution(
+    patient_data: Dict[str, Any],
+    processed_data: Dict[str, Any],
+    means_category: str,
+    rounding: bool = True,
+    rounding_digits: int = 2
+) -> Dict[str, Any]:
+    """Exact category distribution for the patient data and its preprocessed form."""
+    log2 = math.log(2)
+    extended_cutpoints = [-float('inf')] + IPSSM_CUTPOINTS + [float('inf')]
+    betas = {beta["name"]: beta for beta in BETAS}
+
+    def contribution(var_name: str, value: float) -> float:
+        return ((value - betas[var_name]["means"]) * betas[var_name]["coeff"]) / log2
+
+    # While SF3B1_5q or SF3B1_alpha is unknown, their missing raw inputs are enumerated
+    # together, so each branch derives both features with the preprocess_patient_data
+    # rules and impossible pairs (alpha=1 with 5q=1) never occur.
+    sf3b1_known = {name: _safe_number(patient_data.get(name, "NA")) for name in SF3B1_INPUTS}
+    block_inputs = []
+    if "NA" in (processed_data["SF3B1_5q"], processed_data["SF3B1_alpha"]):
+        block_inputs = [name for name in SF3B1_INPUTS if sf3b1_known[name] is None]
+
+    # Known features give a fixed partial score.
+    base_score = 0.0
+    missing_features = []
+    # Each missing variable is a list of options: (contribution, combinations, probability).
+    variables = []
+    for beta in BETAS:
+        var_name = beta["name"]
+        if var_name in DERIVED_FEATURES:
+            continue
+        if var_name in block_inputs:
+            missing_features.append(var_name)
+            continue
+        value = _known_feature_value(processed_data, var_name)
+        if value is not None:
+            base_score += contribution(var_name, value)
+            continue
+        missing_features.append(var_name)
+        # Missing binary feature: mutated with probability equal to its cohort mean.
+        prevalence = min(max(beta["means"], 0.0), 1.0)
+        variables.append([
+            (contribution(var_name, 0), 1, 1 - prevalence),
+            (contribution(var_name, 1), 1, prevalence),
+        ])
+    missing_features += [name for name in block_inputs
+                         if name not in betas and name not in RESIDUAL_GENES]
+    if not block_inputs:
+        for var_name in ("SF3B1_alpha", "SF3B1_5q"):
+            base_score += contribution(var_name, float(processed_data[var_name]))
+
+    # Residual genes: only min(Nres, 2) matters, so the 2^m combinations of the m
+    # missing genes outside the SF3B1 block collapse into at most three Nres2 values.
+    mutated, missing_residual = 0, 0
+    for gene in RESIDUAL_GENES:
+        if gene in block_inputs or gene not in patient_data:
+            continue
+        value = _safe_number(patient_data[gene])
+        if value is None:
+            missing_residual += 1
+        else:
+            mutated += value
+    residual_options: Dict[int, List[float]] = {}
+    for extra in range(missing_residual + 1):
+        combinations = math.comb(missing_residual, extra)
+        probability = (
+            combinations
+            * RESIDUAL_GENE_PREVALENCE ** extra
+            * (1 - RESIDUAL_GENE_PREVALENCE) ** (missing_residual - extra)
+        )
+        option = residual_options.setdefault(min(extra, 2), [0, 0.0])
+        option[0] += combinations
+        option[1] += probability
+
+    # The SF3B1 block and the residual genes share STAG2, BCOR and BCORL1, so they form
+    # one variable whose options are keyed by the feature values they produce.
+    joint_options: Dict[tuple, List[float]] = {}
+    for values in product([0, 1], repeat=len(block_inputs)):
+        completed = dict(sf3b1_known, **dict(zip(block_inputs, values)))
+        probability = 1.0
+        for name, value in zip(block_inputs, values):
+            prevalence = _raw_input_prevalence(name)
+            probability *= prevalence if value else 1 - prevalence
+        sf3b1_5q, sf3b1_alpha = _sf3b1_features(completed)
+        block_residual = sum(completed[gene] for gene in block_inputs if gene in RESIDUAL_GENES)
+        direct = tuple(completed[name] for name in block_inputs if name in betas)
+        for extra, (combinations, residual_probability) in residual_options.items():
+            key = (sf3b1_5q, sf3b1_alpha, direct, min(mutated + block_residual + extra, 2))
+            option = joint_options.setdefault(key, [0, 0.0])
+            option[0] += combinations
+            option[1] += probability * residual_probability
+    direct_names = [name for name in block_inputs if name in betas]
+    joint_variable = []
+    for (sf3b1_5q, sf3b1_alpha, direct, nres2), (combinations, probability) in joint_options.items():
+        score = contribution("Nres2", nres2) + sum(
+            contribution(name, value) for name, value in zip(direct_names, direct)
+        )
+        if block_inputs:
+            score += contribution("SF3B1_5q", int(sf3b1_5q)) + contribution("SF3B1_alpha", int(sf3b1_alpha))
+        joint_variable.append((score, combinations, probability))
+    variables.append(joint_variable)
+
+    # Widest variables first, so the remaining ones are small and subtrees collapse early.
+    variables.sort(key=lambda options: -(max(o[0] for o in options) - min(o[0] for o in options)))
+
+    # Suffix bounds and combination counts for pruning.
+    n_vars = len(variables)
+    suffix_min = [0.0] * (n_vars + 1)
+    suffix_max = [0.0] * (n_vars + 1)
+    suffix_count = [1] * (n_vars + 1)
+    for i in range(n_vars - 1, -1, -1):
+        suffix_min[i] = suffix_min[i + 1] + min(o[0] for o in variables[i])
+        suffix_max[i] = suffix_max[i + 1] + max(o[0] for o in variables[i])
+        suffix_count[i] = suffix_count[i + 1] * sum(o[1] for o in variables[i])
+
+    counts = [0] * len(IPSSM_CATEGORIES)
+    probabilities = [0.0] * len(IPSSM_CATEGORIES)
+    nodes_visited = 0
+
+    def visit(index: int, partial: float, combinations: int, probability: float) -> None:
+        nonlocal nodes_visited
+        nodes_visited += 1
+        low = find_category_index(partial + suffix_min[index], extended_cutpoints, right=False)
+        high = find_category_index(partial + suffix_max[index], extended_cutpoints, right=False)
+        if low == high:
+            # Every completion of this partial assignment lands in the same category.
+            counts[low] += combinations * suffix_count[index]
+            probabilities[low] += probability
+            return
+        for contribution, option_combinations, option_probability in variables[index]:
+            visit(index + 1, partial + contribution,
+                  combinations * option_combinations, probability * option_probability)
+
+    visit(0, base_score, 1, 1.0)
+
+    expected_score = base_score + sum(
+        sum(o[0] * o[2] for o in options) for options in variables
+    )
+    score_range = (base_score + suffix_min[0], base_score + suffix_max[0])
+    category_change = 1 - probabilities[IPSSM_CATEGORIES.index(means_category)] \
+        if means_category in IPSSM_CATEGORIES else 1.0
+    if rounding:
+        expected_score = round_number(expected_score, rounding_digits)
+        score_range = tuple(round_number(v, rounding_digits) for v in score_range)
+        probabilities = [round_number(p, 6) for p in probabilities]
+        category_change = round_number(category_change, 6)
+
+    distribution = {
+        category: {"count": counts[i], "probability": probabilities[i]}
+        for i, category in enumerate(IPSSM_CATEGORIES)
+        if counts[i] > 0
+    }
+    most_likely = max(distribution, key=lambda c: distribution[c]["probability"])
+    return {
+        "distribution": distribution,
+        "missing_features": missing_features,
+        "missing_residual_genes": missing_residual + sum(gene in RESIDUAL_GENES for gene in block_inputs),
+        "total_combinations": suffix_count[0],
+        "nodes_visited": nodes_visited,
+        "expected_score": expected_score,
+        "score_range": score_range,
+        "most_likely_category": most_likely,
+        "probability_category_change": category_change,
+    }
+
+
+def calculate_ipssm_missing_distribution(
+    patient_data: Dict[str, Any],
+    rounding: bool = True,
+    rounding_digits: int = 2
+) -> Dict[str, Any]:
+    """
+    Exact distribution of IPSS-M risk categories over every combination of the
+    missing ("NA") inputs, instead of only the best/worst/means scenarios.
+    
+    Each missing binary feature is mutated with probability equal to its cohort
+    mean in BETAS, each missing residual gene with RESIDUAL_GENE_PREVALENCE and
+    the other raw SF3B1_INPUTS with RAW_INPUT_PREVALENCE, all independently.
+    Derived features are never enumerated themselves: SF3B1_5q and SF3B1_alpha
+    are re-derived from their raw inputs in every branch, exactly as
+    preprocess_patient_data does, and TP53multi is the preprocessed value. The enumeration is a depth-first search that carries the
+    partial score down the tree and collapses any subtree whose lowest and
+    highest reachable scores fall in the same category, so the cost grows with
+    the number of category boundaries crossed rather than with 2^k.
+    
+    Args:
+        patient_data: Dictionary with patient data
+        rounding: Whether to round scores (2 digits) and probabilities (6 digits)
+        rounding_digits: Number of digits to round scores to
+        
+    Returns:
+        Dictionary with the per-category combination counts and probabilities,
+        the missing inputs, the score range, the expected score and the
+        probability that the category differs from the means scenario.
+    """
+    processed_data = preprocess_patient_data(patient_data)
+    means_category = calculate_ipssm(patient_data, rounding=False)["means"]["risk_cat"]
+    return _missing_distribution(patient_data, processed_data, means_category, rounding, rounding_digits)
+
+
 def get_variable_explanation(var_name: str) -> str:
     """
     Get an explanation of what each variable in the IPSS-M model represents.
@@ -902,23 +1168,12 @@ def demo():
     print(f"IPSS-R Category: {ipssr_result['IPSSR_CAT']}")
 
 
-def parse_for_ipssm(report_text: str) -> dict:
+def _build_ipssm_prompts(report_text: str):
     """
-    Sends the free-text haematological report to OpenAI to extract data needed for IPSS-M and IPSS-R calculators.
-    Uses multiple concurrent prompts to extract different categories of information:
-      1) Clinical blood counts (HB, PLT, ANC)
-      2) Cytogenetic details and karyotype complexity
-      3) TP53 details (VAF, allelic state)
-      4) Additional molecular mutations relevant for IPSS-M
-      5) Residual gene mutations
-
-    Returns:
-        dict: A dictionary containing all fields needed for IPSS-M and IPSS-R calculation
+    Builds the required JSON structure and the named extraction prompts for one report.
+    The prompts are returned in merge order.
     """
-    # Safety check: if user typed nothing, return empty.
-    if not report_text.strip():
-        st.warning("Empty report text received.")
-        return {}
+    from utils.prompt_layout import report_first_prompt
 
     # The required JSON structure for IPSS-M and IPSS-R
     required_json_structure = {
@@ -996,37 +1251,32 @@ def parse_for_ipssm(report_text: str) -> dict:
     # -------------------------------------------------------
     # Prompt #1: Clinical blood counts
     # -------------------------------------------------------
-    clinical_prompt = f"""
-The user has pasted a free-text haematological report.
-Please extract the following clinical values from the text and format them into a valid JSON object.
+    clinical_prompt = report_first_prompt(report_text, """
+Please extract the following clinical values from the report and format them into a valid JSON object.
 For numerical fields, provide the value with appropriate units as indicated.
 If a value is not found, set it to null.
 
 Extract these fields:
-"clinical_values": {{
+"clinical_values": {
     "HB": null,  // Hemoglobin in g/dL
     "PLT": null,  // Platelets in 10^9/L
     "ANC": null,  // Absolute neutrophil count in 10^9/L
     "Age": null   // Patient age in years
-}}
+}
 
 Return valid JSON with only these keys and no extra text.
-
-Here is the free-text haematological report to parse:
-{report_text}
-    """
+""")
 
     # -------------------------------------------------------
     # Prompt #2: Cytogenetic details and karyotype complexity
     # -------------------------------------------------------
-    cytogenetics_prompt = f"""
-The user has pasted a free-text haematological report.
-Please extract cytogenetic abnormalities and karyotype complexity from the text and format them into a valid JSON object.
+    cytogenetics_prompt = report_first_prompt(report_text, """
+Please extract cytogenetic abnormalities and karyotype complexity from the report and format them into a valid JSON object.
 For boolean fields, use true/false. For karyotype_complexity, choose the most appropriate category based on the report.
 If an abnormality is not mentioned, set it to false.
 
 Extract these fields:
-"cytogenetics": {{
+"cytogenetics": {
     "karyotype_complexity": "Normal (no abnormalities)",  // Choose one: "Normal (no abnormalities)", "Single abnormality", "Double abnormality", "Complex (3 abnormalities)", "Very complex (>3 abnormalities)"
     "del5q": false,  // del(5q) or 5q-
     "del7q": false,  // del(7q)
@@ -1040,20 +1290,16 @@ Extract these fields:
     "i17q": false,  // i(17q)
     "inv3_t3q_del3q": false,  // inv(3) or t(3q) or del(3q)
     "minusY": false  // -Y
-}}
+}
 
 Return valid JSON with only these keys and no extra text.
-
-Here is the free-text haematological report to parse:
-{report_text}
-    """
+""")
 
     # -------------------------------------------------------
     # Prompt #3: TP53 details
     # -------------------------------------------------------
-    tp53_prompt = f"""
-The user has pasted a free-text haematological report.
-Please extract detailed information about TP53 mutations from the text and format it into a valid JSON object.
+    tp53_prompt = report_first_prompt(report_text, """
+Please extract detailed information about TP53 mutations from the report and format it into a valid JSON object.
 
 For "TP53mut", select from:
 - "0" (no TP53 mutations)
@@ -1064,28 +1310,24 @@ For "TP53maxvaf", provide the maximum variant allele frequency as a percentage (
 For "TP53loh", set to true if there is evidence of loss of heterozygosity or false if not mentioned.
 
 Extract these fields:
-"tp53_details": {{
+"tp53_details": {
     "TP53mut": "0",  // "0", "1", or "2 or more"
     "TP53maxvaf": 0,  // Maximum VAF as percentage
     "TP53loh": false  // Loss of heterozygosity
-}}
+}
 
 Return valid JSON with only these keys and no extra text.
-
-Here is the free-text haematological report to parse:
-{report_text}
-    """
+""")
 
     # -------------------------------------------------------
     # Prompt #4: Additional gene mutations for IPSS-M
     # -------------------------------------------------------
-    mutations_prompt = f"""
-The user has pasted a free-text haematological report.
+    mutations_prompt = report_first_prompt(report_text, """
 Please extract information about the following gene mutations and format it into a valid JSON object.
-For each gene, set the value to true if the text indicates the gene is mutated; otherwise false.
+For each gene, set the value to true if the report indicates the gene is mutated; otherwise false.
 
 Extract these fields:
-"gene_mutations": {{
+"gene_mutations": {
     "ASXL1": false,
     "RUNX1": false,
     "SF3B1": false,
@@ -1101,25 +1343,21 @@ Extract these fields:
     "IDH2": false,
     "NPM1": false,
     "ETV6": false
-}}
+}
 
 Return valid JSON with only these keys and no extra text.
-
-Here is the free-text haematological report to parse:
-{report_text}
-    """
+""")
 
     # -------------------------------------------------------
     # Prompt #5: Residual genes for Nres2 calculation
     # -------------------------------------------------------
-    residual_prompt = f"""
-The user has pasted a free-text haematological report.
+    residual_prompt = report_first_prompt(report_text, """
 Please extract information about the following "residual" gene mutations and format it into a valid JSON object.
-For each gene, set the value to true if the text indicates the gene is mutated; otherwise false.
+For each gene, set the value to true if the report indicates the gene is mutated; otherwise false.
 These genes contribute to the Nres2 score in the IPSS-M calculator.
 
 Extract these fields:
-"residual_genes": {{
+"residual_genes": {
     "BCOR": false,
     "BCORL1": false,
     "CEBPA": false,
@@ -1135,52 +1373,107 @@ Extract these fields:
     "SETBP1": false,
     "STAG2": false,
     "WT1": false
-}}
+}
 
 Return valid JSON with only these keys and no extra text.
+""")
+
+    prompts = {
+        "clinical_prompt": clinical_prompt,
+        "cytogenetics_prompt": cytogenetics_prompt,
+        "tp53_prompt": tp53_prompt,
+        "mutations_prompt": mutations_prompt,
+        "residual_prompt": residual_prompt,
+    }
+    return required_json_structure, prompts
+
+
+# Top-level keys of the required JSON structure that each prompt returns
+IPSSM_PROMPT_FIELDS = {
+    "clinical_prompt": ("clinical_values",),
+    "cytogenetics_prompt": ("cytogenetics",),
+    "tp53_prompt": ("tp53_details",),
+    "mutations_prompt": ("gene_mutations",),
+    "residual_prompt": ("residual_genes",),
+}
+IPSSM_KARYOTYPE_COMPLEXITY = [
+    "Normal (no abnormalities)", "Single abnormality", "Double abnormality",
+    "Complex (3 abnormalities)", "Very complex (>3 abnormalities)",
+]
+
+
+def _build_ipssm_schemas(required_json_structure: dict) -> dict:
+    """JSON Schema for each prompt's reply, generated from the required JSON structure."""
+    from utils.structured_output import NUMBER_OR_NULL, json_schema_for, section_schemas
+
+    clinical = json_schema_for(required_json_structure["clinical_values"])
+    for key in clinical["properties"]:
+        clinical["properties"][key] = dict(NUMBER_OR_NULL)
+    cytogenetics = json_schema_for(required_json_structure["cytogenetics"])
+    cytogenetics["properties"]["karyotype_complexity"] = {"enum": IPSSM_KARYOTYPE_COMPLEXITY}
+    tp53 = json_schema_for(required_json_structure["tp53_details"])
+    tp53["properties"]["TP53mut"] = {"type": ["string", "integer", "null"]}
+
+    return section_schemas(required_json_structure, IPSSM_PROMPT_FIELDS, overrides={
+        "clinical_values": clinical, "cytogenetics": cytogenetics, "tp53_details": tp53,
+    })
+
+
+def _merge_ipssm_results(results: dict, required_json_structure: dict) -> dict:
+    """Merges the per-prompt JSON results (in prompt order) and fills missing keys."""
+    # Merge all data into one dictionary
+    parsed_data = {}
+    for prompt_result in results.values():
+        parsed_data.update(prompt_result)
 
-Here is the free-text haematological report to parse:
-{report_text}
+    # Fill missing keys from required structure
+    for key, val in required_json_structure.items():
+        if key not in parsed_data:
+            parsed_data[key] = val
+        elif isinstance(val, dict):
+            for sub_key, sub_val in val.items():
+                if sub_key not in parsed_data[key]:
+                    parsed_data[key][sub_key] = sub_val
+
+    # Debug print
+    print("Parsed IPSS-M/R Data JSON:")
+    print(json.dumps(parsed_data, indent=2))
+    return parsed_data
+
+
+def parse_for_ipssm(report_text: str) -> dict:
     """
+    Sends the free-text haematological report to OpenAI to extract data needed for IPSS-M and IPSS-R calculators.
+    Uses multiple concurrent prompts to extract different categories of information:
+      1) Clinical blood counts (HB, PLT, ANC)
+      2) Cytogenetic details and karyotype complexity
+      3) TP53 details (VAF, allelic state)
+      4) Additional molecular mutations relevant for IPSS-M
+      5) Residual gene mutations
+
+    Returns:
+        dict: A dictionary containing all fields needed for IPSS-M and IPSS-R calculation
+    """
+    # Safety check: if user typed nothing, return empty.
+    if not report_text.strip():
+        st.warning("Empty report text received.")
+        return {}
+
+    # Imported here so the calculators above stay usable as a standalone script.
+    from utils.extraction_engine import ExtractionCancelled, extract_prompts, run_sync
+    from utils.prompt_layout import EXTRACTION_SYSTEM_MESSAGE
+
+    required_json_structure, prompts = _build_ipssm_prompts(report_text)
 
     try:
-        # Parallelize the prompt calls
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            future_clinical = executor.submit(get_json_from_prompt, clinical_prompt)
-            future_cytogenetics = executor.submit(get_json_from_prompt, cytogenetics_prompt)
-            future_tp53 = executor.submit(get_json_from_prompt, tp53_prompt)
-            future_mutations = executor.submit(get_json_from_prompt, mutations_prompt)
-            future_residual = executor.submit(get_json_from_prompt, residual_prompt)
-
-            # Gather results when all are complete
-            clinical_data = future_clinical.result()
-            cytogenetics_data = future_cytogenetics.result()
-            tp53_data = future_tp53.result()
-            mutations_data = future_mutations.result()
-            residual_data = future_residual.result()
-
-        # Merge all data into one dictionary
-        parsed_data = {}
-        parsed_data.update(clinical_data)
-        parsed_data.update(cytogenetics_data)
-        parsed_data.update(tp53_data)
-        parsed_data.update(mutations_data)
-        parsed_data.update(residual_data)
-
-        # Fill missing keys from required structure
-        for key, val in required_json_structure.items():
-            if key not in parsed_data:
-                parsed_data[key] = val
-            elif isinstance(val, dict):
-                for sub_key, sub_val in val.items():
-                    if sub_key not in parsed_data[key]:
-                        parsed_data[key][sub_key] = sub_val
-
-        # Debug print
-        print("Parsed IPSS-M/R Data JSON:")
-        print(json.dumps(parsed_data, indent=2))
-        return parsed_data
+        # Run all prompts concurrently on the shared extraction engine.
+        schemas = _build_ipssm_schemas(required_json_structure)
+        results = run_sync(extract_prompts(prompts, EXTRACTION_SYSTEM_MESSAGE, group="parse_for_ipssm", schemas=schemas), job_name="parse_for_ipssm")
+        return _merge_ipssm_results(results, required_json_structure)
 
+    except ExtractionCancelled:
+        print("⚠️ IPSS-M/R data parsing cancelled.")
+        return {}
     except json.JSONDecodeError:
         st.error("❌ Failed to parse AI response into JSON for IPSS-M/R data.")
         print("❌ JSONDecodeError: Could not parse AI JSON response for IPSS-M/R data.")
@@ -1190,6 +1483,22 @@ Here is the free-text haematological report to parse:
         print(f"❌ Exception in IPSS-M/R data parsing: {str(e)}")
         return {}
 
+
+async def parse_for_ipssm_async(report_text: str) -> dict:
+    """
+    Awaitable version of parse_for_ipssm for callers already running an
+    event loop. Errors are raised to the caller instead of being shown in the UI.
+    """
+    from utils.extraction_engine import extract_prompts
+    from utils.prompt_layout import EXTRACTION_SYSTEM_MESSAGE
+
+    if not report_text.strip():
+        return {}
+    required_json_structure, prompts = _build_ipssm_prompts(report_text)
+    results = await extract_prompts(prompts, EXTRACTION_SYSTEM_MESSAGE, group="parse_for_ipssm",
+                                    schemas=_build_ipssm_schemas(required_json_structure))
+    return _merge_ipssm_results(results, required_json_structure)
+
 # Function to prepare the combined data for IPSS-M calculation
 def prepare_ipssm_input(aml_data: dict, ipssm_data: dict) -> dict:
     """
@@ -9,29 +9,21 @@ import streamlit as st
 import json
 import re
 from typing import Dict, Any
-from openai import OpenAI
+from utils.llm_client import LazyOpenAIClient
+from utils.llm_cache import cached_json_completion
+from utils.prompt_layout import EXTRACTION_SYSTEM_MESSAGE, report_first_prompt
+from utils.structured_output import PERCENTAGE_OR_NULL, section_schema
 
 ##############################
 # OPENAI API CONFIG
 ##############################
-client = OpenAI(api_key=st.secrets["openai"]["api_key"])
+client = LazyOpenAIClient()
 
-def parse_eln_report(report_text: str) -> Dict[str, Any]:
-    """
-    Extracts relevant cytogenetic and molecular markers from clinical reports
-    for ELN 2022 risk stratification using OpenAI's language model.
-    
-    Args:
-        report_text (str): Raw text from clinical report
-        
-    Returns:
-        Dict[str, Any]: Dictionary of extracted markers with boolean values
-    """
-    # Safety check for empty report
-    if not report_text.strip():
-        st.warning("Empty report text received.")
-        return {}
-    
+ELN_SYSTEM_MESSAGE = EXTRACTION_SYSTEM_MESSAGE
+
+
+def _build_eln_prompt(report_text: str):
+    """Builds the default marker structure and the ELN extraction prompt for one report."""
     # Initialize the default structure
     default_structure = {
         # Cytogenetic abnormalities
@@ -109,15 +101,15 @@ def parse_eln_report(report_text: str) -> Dict[str, Any]:
     }
     
     # Build the OpenAI prompt
-    prompt = f"""
+    prompt = report_first_prompt(report_text, """
     You are a specialized haematology AI assistant with expertise in AML and MDS genetics. 
-    Please analyse the clinical report provided below and extract information relevant 
+    Please analyse the clinical report above and extract information relevant 
     for ELN 2022 and ELN 2024 risk stratification.
     
     Return your analysis as a valid JSON object with exactly the following structure. 
     For each marker, indicate true if present or false if absent/not mentioned:
     
-    {{
+    {
         "t_8_21": false,              # t(8;21)(q22;q22.1) / RUNX1-RUNX1T1
         "inv_16": false,              # inv(16)(p13.1q22) / CBFB-MYH11
         "t_16_16": false,             # t(16;16)(p13.1;q22) / CBFB-MYH11
@@ -185,7 +177,7 @@ def parse_eln_report(report_text: str) -> Dict[str, Any]:
         "mpo_positive": false,        # Myeloperoxidase positivity
         "lysozyme_positive": false,   # Lysozyme positivity (monocytic)
         "nse_positive": false         # Non-specific esterase (monocytic)
-    }}
+    }
     
     **IMPORTANT**:
     - Return ONLY valid JSON, no other text.
@@ -201,55 +193,77 @@ def parse_eln_report(report_text: str) -> Dict[str, Any]:
       * Look for various notations: "CD33+", "CD33 positive", "90% CD33+", etc.
       * If a specific percentage is given (e.g., "85% CD33+"), record both positive status and percentage
     
-    Here is the clinical report:
+""")
+    return default_structure, prompt
+
+
+def _build_eln_schema(default_structure: dict) -> dict:
+    """JSON Schema for the marker reply; missing markers are filled by _merge_eln_result."""
+    return section_schema(default_structure, default_structure, required=False,
+                          overrides={"cd33_percentage": PERCENTAGE_OR_NULL})
+
+
+def _merge_eln_result(extracted_data: dict, default_structure: dict) -> Dict[str, Any]:
+    """Fills missing markers and derives the combined/alias fields the ELN classifiers expect."""
+    # Ensure all required keys are present
+    for key in default_structure:
+        if key not in extracted_data:
+            extracted_data[key] = default_structure[key]
+    
+    # Post-process to populate combined fields for classifier compatibility
+    extracted_data["inv_16_or_t_16_16"] = extracted_data.get("inv_16", False) or extracted_data.get("t_16_16", False)
+    extracted_data["inv3_or_t3"] = extracted_data.get("inv_3", False) or extracted_data.get("t_3_3", False)
+    extracted_data["minus5_or_del5q"] = extracted_data.get("minus_5", False) or extracted_data.get("del_5q", False)
+    extracted_data["minus7"] = extracted_data.get("minus_7", False)
+    extracted_data["abnormal17p"] = extracted_data.get("del_17p", False)
+    extracted_data["kmt2a_rearranged"] = extracted_data.get("t_v_11q23", False)
+    extracted_data["cebpa_bzip"] = extracted_data.get("biallelic_cebpa", False)
+    extracted_data["t_9_22"] = extracted_data.get("bcr_abl1", False)
     
-    {report_text}
+    # Post-process to populate uppercase field names for ELN 2024 non-intensive classifier
+    extracted_data["TP53"] = extracted_data.get("tp53_mutation", False)
+    extracted_data["KRAS"] = extracted_data.get("kras", False)
+    extracted_data["PTPN11"] = extracted_data.get("ptpn11", False)
+    extracted_data["NRAS"] = extracted_data.get("nras", False)
+    extracted_data["FLT3_ITD"] = extracted_data.get("flt3_itd", False)
+    extracted_data["NPM1"] = extracted_data.get("npm1_mutation", False)
+    extracted_data["IDH1"] = extracted_data.get("idh1", False)
+    extracted_data["IDH2"] = extracted_data.get("idh2", False)
+    extracted_data["DDX41"] = extracted_data.get("ddx41", False)
+    
+    return extracted_data
+
+
+def parse_eln_report(report_text: str) -> Dict[str, Any]:
     """
+    Extracts relevant cytogenetic and molecular markers from clinical reports
+    for ELN 2022 risk stratification using OpenAI's language model.
     
-    try:
-        # Make the API call to OpenAI
-        response = client.chat.completions.create(
-            model="o3-mini",  
-            messages=[
-                {"role": "system", "content": "You are a specialized haematology AI that returns valid JSON."},
-                {"role": "user", "content": prompt}
-            ],
-        )
-        
-        # Extract the content
-        response_content = response.choices[0].message.content.strip()
+    Args:
+        report_text (str): Raw text from clinical report
         
-        # Parse the JSON response
+    Returns:
+        Dict[str, Any]: Dictionary of extracted markers with boolean values
+    """
+    # Safety check for empty report
+    if not report_text.strip():
+        st.warning("Empty report text received.")
+        return {}
+    
+    default_structure, prompt = _build_eln_prompt(report_text)
+    
+    try:
+        # Parse the JSON response (served from the shared cache when the report was seen before)
         try:
-            extracted_data = json.loads(response_content)
-            
-            # Ensure all required keys are present
-            for key in default_structure:
-                if key not in extracted_data:
-                    extracted_data[key] = default_structure[key]
-            
-            # Post-process to populate combined fields for classifier compatibility
-            extracted_data["inv_16_or_t_16_16"] = extracted_data.get("inv_16", False) or extracted_data.get("t_16_16", False)
-            extracted_data["inv3_or_t3"] = extracted_data.get("inv_3", False) or extracted_data.get("t_3_3", False)
-            extracted_data["minus5_or_del5q"] = extracted_data.get("minus_5", False) or extracted_data.get("del_5q", False)
-            extracted_data["minus7"] = extracted_data.get("minus_7", False)
-            extracted_data["abnormal17p"] = extracted_data.get("del_17p", False)
-            extracted_data["kmt2a_rearranged"] = extracted_data.get("t_v_11q23", False)
-            extracted_data["cebpa_bzip"] = extracted_data.get("biallelic_cebpa", False)
-            extracted_data["t_9_22"] = extracted_data.get("bcr_abl1", False)
-            
-            # Post-process to populate uppercase field names for ELN 2024 non-intensive classifier
-            extracted_data["TP53"] = extracted_data.get("tp53_mutation", False)
-            extracted_data["KRAS"] = extracted_data.get("kras", False)
-            extracted_data["PTPN11"] = extracted_data.get("ptpn11", False)
-            extracted_data["NRAS"] = extracted_data.get("nras", False)
-            extracted_data["FLT3_ITD"] = extracted_data.get("flt3_itd", False)
-            extracted_data["NPM1"] = extracted_data.get("npm1_mutation", False)
-            extracted_data["IDH1"] = extracted_data.get("idh1", False)
-            extracted_data["IDH2"] = extracted_data.get("idh2", False)
-            extracted_data["DDX41"] = extracted_data.get("ddx41", False)
-            
-            return extracted_data
+            extracted_data = cached_json_completion(
+                client,
+                model="o3-mini",
+                system_message=ELN_SYSTEM_MESSAGE,
+                prompt=prompt,
+                metrics_name="aml_eln_parser.markers",
+                schema=_build_eln_schema(default_structure)
+            )
+            return _merge_eln_result(extracted_data, default_structure)
             
         except json.JSONDecodeError:
             st.error("Failed to parse the AI response into JSON.")
@@ -1,50 +1,48 @@
 import streamlit as st
 import json
-import concurrent.futures
-from openai import OpenAI
+from utils.llm_client import LazyOpenAIClient
+from utils.llm_cache import cached_json_completion
+from utils.extraction_engine import ExtractionCancelled, extract_unresolved_prompts, run_sync
+from parsers.pre_extractor import pre_extract_aml_sections
+from utils.prompt_layout import EXTRACTION_SYSTEM_MESSAGE, report_first_prompt
+from utils.structured_output import (
+    DYSPLASTIC_LINEAGES_OR_NULL, PERCENTAGE_OR_NULL, StructuredOutputError, section_schemas
+)
 
 ##############################
 # OPENAI API CONFIG
 ##############################
-client = OpenAI(api_key=st.secrets["openai"]["api_key"])
+client = LazyOpenAIClient()
+
+SYSTEM_MESSAGE = EXTRACTION_SYSTEM_MESSAGE
+
+# Top-level keys of the required JSON structure that each prompt returns
+AML_PROMPT_FIELDS = {
+    "first_prompt_1": ("blasts_percentage", "fibrotic", "hypoplasia", "number_of_dysplastic_lineages"),
+    "first_prompt_2a": ("AML_defining_recurrent_genetic_abnormalities",),
+    "first_prompt_2b": ("Biallelic_TP53_mutation",),
+    "first_prompt_2c": ("MDS_related_mutation", "MDS_related_cytogenetics"),
+    "first_prompt_3": ("qualifiers",),
+    "second_prompt": ("AML_differentiation",),
+    "eln2024_prompt": ("ELN2024_risk_genes",),
+    "cytogenetics_check_prompt": ("no_cytogenetics_data",),
+}
 
 def get_json_from_prompt(prompt: str) -> dict:
-    """Helper function to call OpenAI and return the JSON-parsed response."""
-    response = client.chat.completions.create(
+    """Helper function to call OpenAI and return the JSON-parsed response (served from the shared cache when possible)."""
+    return cached_json_completion(
+        client,
         model="o3-mini",
-        messages=[
-            {"role": "system", "content": "You are a knowledgeable haematologist who returns valid JSON."},
-            {"role": "user", "content": prompt}
-        ]
+        system_message=SYSTEM_MESSAGE,
+        prompt=prompt,
+        metrics_name="aml_parser.get_json_from_prompt"
     )
-    raw = response.choices[0].message.content.strip()
-    return json.loads(raw)
 
-def parse_genetics_report_aml(report_text: str) -> dict:
+def _build_aml_prompts(report_text: str):
     """
-    Sends the free-text haematological report to OpenAI using separate prompts:
-      1) Basic clinical numeric/boolean values,
-      2a) AML-defining recurrent genetic abnormalities,
-      2b) Biallelic TP53 mutation,
-      2c) MDS-related mutations and MDS-related cytogenetics,
-      3) Qualifiers,
-      4) AML differentiation,
-      5) Revised ELN24 genes (added prompt),
-      6) Check for missing cytogenetic data.
-
-    Then merges all JSON objects into one dictionary. 
-    No second pass is performed—each section's data is returned from its dedicated prompt.
-
-    Returns:
-        dict: A dictionary containing all fields needed for classification, 
-              including 'AML_differentiation', 'differentiation_reasoning', and 'no_cytogenetics_data'.
-              The 'no_cytogenetics_data' field is true if no cytogenetic information was found in the report.
+    Builds the required JSON structure and the named extraction prompts for one report.
+    The prompts are returned in merge order.
     """
-    # Safety check: if user typed nothing, return empty.
-    if not report_text.strip():
-        st.warning("Empty report text received.")
-        return {}
-
     # The original required JSON structure (including differentiation_reasoning).
     required_json_structure = {
         "blasts_percentage": None,  # if unknown, set to None => "Unknown"
@@ -168,9 +166,8 @@ def parse_genetics_report_aml(report_text: str) -> dict:
     # -------------------------------------------------------
     # Prompt #1: Basic clinical numeric & boolean values.
     # -------------------------------------------------------
-    first_prompt_1 = f"""
-The user has pasted a free-text haematological report.
-Please extract the following fields from the text and format them into a valid JSON object exactly as specified below.
+    first_prompt_1 = report_first_prompt(report_text, """
+Please extract the following fields from the report and format them into a valid JSON object exactly as specified below.
 For boolean fields, use true/false. For numerical fields, provide the value.
 If a field is not found or unclear, set it to false (for booleans) or null (for numerical values).
 
@@ -181,24 +178,15 @@ Extract these fields:
 - "number_of_dysplastic_lineages": (an integer, or null if not found)
 
 Return valid JSON only with these keys and no extra text.
-
-Here is the free-text haematological report to parse:
-
-[START OF REPORT]
-
-{report_text}
-
-[END OF REPORT]   
-    """
+""")
 
     # Prompt #2a: AML_defining_recurrent_genetic_abnormalities
-    first_prompt_2a = f"""
-The user has pasted a free-text haematological report.
-Please extract the following information from the text and format it into a valid JSON object exactly as specified below.
+    first_prompt_2a = report_first_prompt(report_text, """
+Please extract the following information from the report and format it into a valid JSON object exactly as specified below.
 For boolean fields, use true/false.
 
 Extract this nested field:
-"AML_defining_recurrent_genetic_abnormalities": {{
+"AML_defining_recurrent_genetic_abnormalities": {
     "PML::RARA": false,
     "NPM1": false,
     "RUNX1::RUNX1T1": false,
@@ -245,54 +233,36 @@ Extract this nested field:
     "ETV6::SYK": false,
     "FGR1": false,
     "FLT3": false
-}}
+}
 
 Return valid JSON only with these keys and no extra text.
-
-Here is the free-text haematological report to parse:
-
-[START OF REPORT]
-
-{report_text}
-
-[END OF REPORT]   
-    """
+""")
 
     # Prompt #2b: Biallelic_TP53_mutation
-    first_prompt_2b = f"""
-The user has pasted a free-text haematological report.
-Please extract the following information about TP53 mutations from the text and format it into a valid JSON object.
+    first_prompt_2b = report_first_prompt(report_text, """
+Please extract the following information about TP53 mutations from the report and format it into a valid JSON object.
 For boolean fields, use true/false.
 
 Extract this nested field:
-"Biallelic_TP53_mutation": {{
+"Biallelic_TP53_mutation": {
     "tp53_mentioned": false,                      # TRUE if TP53 is mentioned ANYWHERE in the report (even just "TP53 normal" or "TP53 tested")
     "2_x_TP53_mutations": false,                  # TRUE if TWO SEPARATE TP53 mutations are mentioned
     "1_x_TP53_mutation_del_17p": false,           # TRUE if ONE TP53 mutation AND deletion of 17p (where TP53 is located)
     "1_x_TP53_mutation_LOH": false,               # TRUE if ONE TP53 mutation WITH loss of heterozygosity (LOH)
     "1_x_TP53_mutation_10_percent_vaf": false,    # TRUE if ONE TP53 mutation with VAF (variant allele frequency) ≥ 10%
     "1_x_TP53_mutation_50_percent_vaf": false     # TRUE if ONE TP53 mutation with VAF (variant allele frequency) ≥ 50%
-}}
+}
 
 Return valid JSON only with these keys and no extra text.
-
-Here is the free-text haematological report to parse:
-
-[START OF REPORT]
-
-{report_text}
-
-[END OF REPORT]   
-    """
+""")
 
     # Prompt #2c: MDS_related_mutation and MDS_related_cytogenetics
-    first_prompt_2c = f"""
-The user has pasted a free-text haematological report.
-Please extract the following information from the text and format them into a valid JSON object exactly as specified below.
+    first_prompt_2c = report_first_prompt(report_text, """
+Please extract the following information from the report and format them into a valid JSON object exactly as specified below.
 For boolean fields, use true/false.
 
 Extract these nested fields:
-"MDS_related_mutation": {{
+"MDS_related_mutation": {
     "ASXL1": false,
     "BCOR": false,
     "EZH2": false,
@@ -304,8 +274,8 @@ Extract these nested fields:
     "ZRSR2": false,
     "UBA1": false,
     "JAK2": false
-}},
-"MDS_related_cytogenetics": {{
+},
+"MDS_related_cytogenetics": {
     "Complex_karyotype": false,
     "del_5q": false,
     "t_5q": false,
@@ -325,49 +295,32 @@ Extract these nested fields:
     "del_20q": false,
     "idic_X_q13": false,
     "inv3_t33": false
-}}
+}
 
 Return valid JSON only with these keys and no extra text.
-
-Here is the free-text haematological report to parse:
-
-[START OF REPORT]
-
-{report_text}
-
-[END OF REPORT]   
-    """
+""")
 
     # Prompt #3: Qualifiers
-    first_prompt_3 = f"""
-The user has pasted a free-text haematological report.
-Please extract the following information from the text and format it into a valid JSON object exactly as specified below.
+    first_prompt_3 = report_first_prompt(report_text, """
+Please extract the following information from the report and format it into a valid JSON object exactly as specified below.
 For boolean fields, use true/false and for text fields, output the value exactly. If a field is not found or unclear, set it to false or "None" as appropriate.
 Assume MDS is over 3 months ago unless stated otherwise.
 
 Extract these fields:
-"qualifiers": {{
+"qualifiers": {
     "previous_MDS_diagnosed_over_3_months_ago": false,
     "previous_MDS/MPN_diagnosed_over_3_months_ago": false,
     "previous_MPN_diagnosed_over_3_months_ago": false,
     "previous_cytotoxic_therapy": None,
     "predisposing_germline_variant": "None"
-}}
+}
 
 Return valid JSON only with these keys and no extra text.
-
-Here is the free-text haematological report to parse:
-
-[START OF REPORT]
-
-{report_text}
-
-[END OF REPORT]
-    """
+""")
 
     # Prompt #4: AML differentiation
-    second_prompt = f"""
-The previous haematological report needs to be evaluated for AML differentiation.
+    second_prompt = report_first_prompt(report_text, """
+The report above needs to be evaluated for AML differentiation.
 Using only data from morphology, histology, and flow cytometry (ignore any genetic or cytogenetic data),
 suggest the most appropriate category of AML differentiation and convert that suggestion to the corresponding FAB classification code according to the mapping below:
 
@@ -386,21 +339,14 @@ suggest the most appropriate category of AML differentiation and convert that su
 
 Return a JSON object with the key "AML_differentiation".
 You may also provide a "differentiation_reasoning" key with bullet point logic.
-
-[START OF REPORT]
-
-{report_text}
-
-[END OF REPORT]   
-    """
+""")
 
     # Prompt #5: Revised ELN24 genes
-    eln2024_prompt = f"""
-The user has pasted a free-text haematological report.
+    eln2024_prompt = report_first_prompt(report_text, """
 Please extract whether the following genes are mutated (true/false) or not mentioned (false).
-For each gene, set the value to true if the text indicates that gene is mutated; otherwise false.
+For each gene, set the value to true if the report indicates that gene is mutated; otherwise false.
 
-"ELN2024_risk_genes": {{
+"ELN2024_risk_genes": {
     "TP53": false,
     "KRAS": false,
     "PTPN11": false,
@@ -410,22 +356,13 @@ For each gene, set the value to true if the text indicates that gene is mutated;
     "IDH1": false,
     "IDH2": false,
     "DDX41": false
-}}
+}
 
 Return valid JSON only with these keys and no extra text.
-
-Here is the free-text haematological report to parse:
-
-[START OF REPORT]
-
-{report_text}
-
-[END OF REPORT]   
-    """
+""")
 
     # Prompt #6: Check if cytogenetic data is missing
-    cytogenetics_check_prompt = f"""
-The user has pasted a free-text haematological report.
+    cytogenetics_check_prompt = report_first_prompt(report_text, """
 Analyze whether the report contains any cytogenetic data or analysis. 
 
 Cytogenetic data is PRESENT if the report mentions:
@@ -446,91 +383,136 @@ Return a JSON object with a single key "no_cytogenetics_data" set to:
 - false if the report contains any form of cytogenetic data (including normal results)
 
 Return valid JSON only with this key and no extra text.
+""")
+
+    prompts = {
+        "first_prompt_1": first_prompt_1,
+        "first_prompt_2a": first_prompt_2a,
+        "first_prompt_2b": first_prompt_2b,
+        "first_prompt_2c": first_prompt_2c,
+        "first_prompt_3": first_prompt_3,
+        "second_prompt": second_prompt,
+        "eln2024_prompt": eln2024_prompt,
+        "cytogenetics_check_prompt": cytogenetics_check_prompt,
+    }
+    return required_json_structure, prompts
+
+
+def _build_aml_schemas(required_json_structure: dict) -> dict:
+    """JSON Schema for each prompt's reply, generated from the required JSON structure."""
+    return section_schemas(required_json_structure, AML_PROMPT_FIELDS, overrides={
+        "blasts_percentage": PERCENTAGE_OR_NULL,
+        "number_of_dysplastic_lineages": DYSPLASTIC_LINEAGES_OR_NULL,
+    })
+
+
+def _merge_aml_results(results: dict, required_json_structure: dict) -> dict:
+    """Merges the per-prompt JSON results (in prompt order) into one dictionary and validates it."""
+    # Merge all data into one dictionary.
+    parsed_data = {}
+    for prompt_result in results.values():
+        parsed_data.update(prompt_result)
+
+    # Ensure keys for AML_differentiation and reasoning exist.
+    if "AML_differentiation" not in parsed_data:
+        parsed_data["AML_differentiation"] = None
+    if "differentiation_reasoning" not in parsed_data:
+        parsed_data["differentiation_reasoning"] = None
+    
+    # Ensure no_cytogenetics_data field exists
+    if "no_cytogenetics_data" not in parsed_data:
+        parsed_data["no_cytogenetics_data"] = False
+
+    # Fill missing keys from required structure.
+    for key, val in required_json_structure.items():
+        if key not in parsed_data:
+            parsed_data[key] = val
+        elif isinstance(val, dict):
+            for sub_key, sub_val in val.items():
+                if sub_key not in parsed_data[key]:
+                    parsed_data[key][sub_key] = sub_val
+
+    # Validate blasts_percentage.
+    blasts = parsed_data.get("blasts_percentage")
+    if blasts is None:
+        parsed_data["blasts_percentage"] = "Unknown"
+    elif blasts != "Unknown":
+        if not isinstance(blasts, (int, float)) or not (0 <= blasts <= 100):
+            st.error("❌ Invalid blasts_percentage value. Must be a number between 0 and 100.")
+            return {}
+    
+    # Note: We rely primarily on the dedicated OpenAI prompt for detecting missing cytogenetic data
+    # The prompt is specifically designed to identify when cytogenetic information is absent from reports
+    # This approach is more accurate than trying to infer missing data from negative results
+
+    # Debug print
+    print("Parsed Haematology Report JSON:")
+    print(json.dumps(parsed_data, indent=2))
+    return parsed_data
 
-Here is the free-text haematological report to parse:
 
-[START OF REPORT]
+def parse_genetics_report_aml(report_text: str) -> dict:
+    """
+    Sends the free-text haematological report to OpenAI using separate prompts:
+      1) Basic clinical numeric/boolean values,
+      2a) AML-defining recurrent genetic abnormalities,
+      2b) Biallelic TP53 mutation,
+      2c) MDS-related mutations and MDS-related cytogenetics,
+      3) Qualifiers,
+      4) AML differentiation,
+      5) Revised ELN24 genes (added prompt),
+      6) Check for missing cytogenetic data.
 
-{report_text}
+    Then merges all JSON objects into one dictionary. 
+    No second pass is performed—each section's data is returned from its dedicated prompt.
 
-[END OF REPORT]   
+    Returns:
+        dict: A dictionary containing all fields needed for classification, 
+              including 'AML_differentiation', 'differentiation_reasoning', and 'no_cytogenetics_data'.
+              The 'no_cytogenetics_data' field is true if no cytogenetic information was found in the report.
     """
+    # Safety check: if user typed nothing, return empty.
+    if not report_text.strip():
+        st.warning("Empty report text received.")
+        return {}
 
-    try:
-        # Parallelize the prompt calls
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            future1   = executor.submit(get_json_from_prompt, first_prompt_1)
-            future2a  = executor.submit(get_json_from_prompt, first_prompt_2a)
-            future2b  = executor.submit(get_json_from_prompt, first_prompt_2b)
-            future2c  = executor.submit(get_json_from_prompt, first_prompt_2c)
-            future3   = executor.submit(get_json_from_prompt, first_prompt_3)
-            future4   = executor.submit(get_json_from_prompt, second_prompt)
-            future_eln2024 = executor.submit(get_json_from_prompt, eln2024_prompt)
-            future_cyto_check = executor.submit(get_json_from_prompt, cytogenetics_check_prompt)
-
-            # Gather results when all are complete
-            first_raw_1  = future1.result()
-            first_raw_2a = future2a.result()
-            first_raw_2b = future2b.result()
-            first_raw_2c = future2c.result()
-            first_raw_3  = future3.result()
-            diff_data     = future4.result()
-            eln2024_data  = future_eln2024.result()
-            cyto_check_data = future_cyto_check.result()
-
-        # Merge all data into one dictionary.
-        parsed_data = {}
-        parsed_data.update(first_raw_1)
-        parsed_data.update(first_raw_2a)
-        parsed_data.update(first_raw_2b)
-        parsed_data.update(first_raw_2c)
-        parsed_data.update(first_raw_3)
-        parsed_data.update(diff_data)
-        parsed_data.update(eln2024_data)
-        parsed_data.update(cyto_check_data)
-
-        # Ensure keys for AML_differentiation and reasoning exist.
-        if "AML_differentiation" not in parsed_data:
-            parsed_data["AML_differentiation"] = None
-        if "differentiation_reasoning" not in parsed_data:
-            parsed_data["differentiation_reasoning"] = None
-        
-        # Ensure no_cytogenetics_data field exists
-        if "no_cytogenetics_data" not in parsed_data:
-            parsed_data["no_cytogenetics_data"] = False
-
-        # Fill missing keys from required structure.
-        for key, val in required_json_structure.items():
-            if key not in parsed_data:
-                parsed_data[key] = val
-            elif isinstance(val, dict):
-                for sub_key, sub_val in val.items():
-                    if sub_key not in parsed_data[key]:
-                        parsed_data[key][sub_key] = sub_val
-
-        # Validate blasts_percentage.
-        blasts = parsed_data.get("blasts_percentage")
-        if blasts is None:
-            parsed_data["blasts_percentage"] = "Unknown"
-        elif blasts != "Unknown":
-            if not isinstance(blasts, (int, float)) or not (0 <= blasts <= 100):
-                st.error("❌ Invalid blasts_percentage value. Must be a number between 0 and 100.")
-                return {}
-        
-        # Note: We rely primarily on the dedicated OpenAI prompt for detecting missing cytogenetic data
-        # The prompt is specifically designed to identify when cytogenetic information is absent from reports
-        # This approach is more accurate than trying to infer missing data from negative results
-
-        # Debug print
-        print("Parsed Haematology Report JSON:")
-        print(json.dumps(parsed_data, indent=2))
-        return parsed_data
+    required_json_structure, prompts = _build_aml_prompts(report_text)
 
+    try:
+        # Structured karyotype/NGS data is read locally; the remaining prompts run
+        # concurrently on the shared extraction engine.
+        results = run_sync(extract_unresolved_prompts(
+            prompts, pre_extract_aml_sections(report_text), SYSTEM_MESSAGE, group="aml_parser",
+            schemas=_build_aml_schemas(required_json_structure),
+        ), job_name="parse_genetics_report_aml")
+        return _merge_aml_results(results, required_json_structure)
+
+    except ExtractionCancelled:
+        print("⚠️ AML report parsing cancelled.")
+        return {}
     except json.JSONDecodeError:
         st.error("❌ Failed to parse AI response into JSON. Ensure the report is well-formatted.")
         print("❌ JSONDecodeError: Could not parse AI JSON response.")
         return {}
+    except StructuredOutputError as e:
+        st.error(f"❌ The AI response for '{e.name}' did not match the expected structure. "
+                 "The other sections are cached, so re-running only repeats this one.")
+        print(f"❌ {e}")
+        return {}
     except Exception as e:
         st.error(f"❌ Error communicating with OpenAI: {str(e)}")
         print(f"❌ Exception: {str(e)}")
         return {}
+
+
+async def parse_genetics_report_aml_async(report_text: str) -> dict:
+    """
+    Awaitable version of parse_genetics_report_aml for callers already running an
+    event loop. Errors are raised to the caller instead of being shown in the UI.
+    """
+    if not report_text.strip():
+        return {}
+    required_json_structure, prompts = _build_aml_prompts(report_text)
+    results = await extract_unresolved_prompts(prompts, pre_extract_aml_sections(report_text), SYSTEM_MESSAGE,
+                                               group="aml_parser", schemas=_build_aml_schemas(required_json_structure))
+    return _merge_aml_results(results, required_json_structure)
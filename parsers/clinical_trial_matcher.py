@@ -1,14 +1,26 @@
 import asyncio
 import json
 import streamlit as st
-from openai import AsyncOpenAI
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 from datetime import datetime
 
+from parsers.trial_index import TRIALS_FILE, PatientProfile, get_trial_index
+from utils.llm_client import build_async_openai_client
+from utils.llm_metrics import tracked_completion_async
+from utils.trial_match_cache import get_trial_match_cache, patient_fingerprint, trial_id
+
+MATCH_MODEL = "gpt-4o"
+MATCH_PROMPT_VERSION = "batch-v1"  # bump when the batch matching prompt changes
+# Trials sent to the LLM after BM25 ranking (recall 1.0 at K=20 in scripts/benchmark_trial_ranker.py)
+MATCH_TOP_K = 20
+
+# Index object whose older cached match results were last purged.
+_purged_index = None
+
 class ClinicalTrialMatcher:
     def __init__(self, max_concurrent_requests: int = 3):
         """Initialize the clinical trial matcher with OpenAI API"""
-        self.client = AsyncOpenAI(api_key=st.secrets["openai"]["api_key"])
+        self.client = build_async_openai_client()
         self.semaphore = asyncio.Semaphore(max_concurrent_requests)
         
     async def match_patient_to_trial_batch(self, patient_data: str, trial_batch: List[Dict]) -> List[Dict]:
@@ -75,8 +87,8 @@ Be conservative in your recommendations - only recommend trials where the patien
 """
 
             try:
-                response = await self.client.chat.completions.create(
-                    model="gpt-4o",
+                response = await tracked_completion_async(self.client, "trial_matcher.batch",
+                    model=MATCH_MODEL,
                     messages=[
                         {"role": "system", "content": "You are a clinical oncologist expert in blood cancer clinical trials. Provide accurate, conservative eligibility assessments."},
                         {"role": "user", "content": prompt}
@@ -182,7 +194,7 @@ Write as if you're explaining to both the patient and their oncologist. Be thoro
 """
 
         try:
-            response = await self.client.chat.completions.create(
+            response = await tracked_completion_async(self.client, "trial_matcher.recommendations",
                 model="gpt-4o",
                 messages=[
                     {"role": "system", "content": "You are a senior clinical oncologist providing detailed, thoughtful clinical trial recommendations. Write comprehensive but accessible explanations."},
@@ -233,70 +245,151 @@ Write as if you're explaining to both the patient and their oncologist. Be thoro
             st.warning(f"Error generating detailed recommendations: {e}")
             return top_trials
     
-    async def find_matching_trials(self, patient_data: str, trials_file: str = "trials-aggregator/clinical_trials.json") -> List[Dict]:
+    async def stream_matching_trials(self, patient_data: str, trials_file: str = TRIALS_FILE,
+                                     patient_profile: Optional[PatientProfile] = None,
+                                     top_k: Optional[int] = MATCH_TOP_K):
         """
-        Find matching clinical trials for a patient by processing in batches
+        Async generator version of ``find_matching_trials``.
+
+        Yields a progress update as soon as cached / prefiltered results are known
+        and again as each LLM batch completes, then once more after the detailed
+        recommendation pass. Each update is a dict with the cumulative, sorted
+        ``trials`` list, the ``new`` trials since the last update, ``completed_batches``,
+        ``total_batches`` and ``stage`` ("scoring", "detailing" or "done").
+        
+        Plausible trials are ranked with BM25 against ``patient_data`` and only the
+        ``top_k`` best go to the LLM (None sends every plausible trial).
         """
-        # Load clinical trials
+        # Load clinical trials (indexed once per file version)
         try:
-            with open(trials_file, 'r', encoding='utf-8') as f:
-                all_trials = json.load(f)
+            index = get_trial_index(trials_file)
         except Exception as e:
             st.error(f"Failed to load clinical trials: {e}")
-            return []
-        
-        # Filter to only open trials
-        open_trials = [trial for trial in all_trials if trial.get('status', '').lower() == 'open']
+            return
+        
+        # Structured eligibility prefilter over the open trials
+        open_trials, excluded = index.shortlist(patient_profile)
+        if excluded:
+            print(f"🔎 Prefilter excluded {len(excluded)} of {len(index.trials)} trials before LLM matching")
+        
+        # Lexical first stage: only the top-K plausible trials are scored by the LLM
+        not_evaluated = []
+        if top_k is not None and len(open_trials) > top_k:
+            ranked = [trial for trial, _ in index.rank(patient_data, open_trials)]
+            open_trials, not_evaluated = ranked[:top_k], ranked[top_k:]
+            print(f"📑 BM25 ranking kept the top {top_k} of {len(ranked)} plausible trials for LLM matching")
+        
+        # Reuse per-trial results for this patient; only new or changed trials are re-scored
+        global _purged_index
+        match_cache = get_trial_match_cache()
+        if _purged_index is not index:
+            match_cache.invalidate_changed_trials(index.trials)
+            _purged_index = index
+        patient_hash = patient_fingerprint(patient_data, MATCH_MODEL, MATCH_PROMPT_VERSION)
+        cached_results = match_cache.get_many(patient_hash, open_trials)
+        all_matched_trials = [
+            {**trial, **cached_results[trial_id(trial)]}
+            for trial in open_trials if trial_id(trial) in cached_results
+        ]
+        trials_to_score = [trial for trial in open_trials if trial_id(trial) not in cached_results]
+        if cached_results:
+            print(f"💾 Reusing {len(cached_results)} cached trial matches, scoring {len(trials_to_score)}")
+        
+        # Trials excluded by the prefilter are reported, never sent to the LLM
+        all_matched_trials.extend(
+            {
+                **trial,
+                "relevance_score": 0,
+                "explanation": "Excluded by structured eligibility criteria: " + "; ".join(reasons),
+                "matching_factors": [],
+                "exclusion_factors": reasons,
+                "recommendation": "not_suitable",
+            }
+            for trial, reasons in excluded
+        )
+        all_matched_trials.extend(
+            {
+                **trial,
+                "relevance_score": 0,
+                "explanation": "Not sent for AI review: low text relevance to the patient profile",
+                "matching_factors": [],
+                "exclusion_factors": [],
+                "recommendation": "not_evaluated",
+            }
+            for trial in not_evaluated
+        )
         
         # Process trials in batches of 5
         batch_size = 5
-        all_matched_trials = []
-        
-        # Create batches
-        trial_batches = [open_trials[i:i + batch_size] for i in range(0, len(open_trials), batch_size)]
-        
-        # Process batches concurrently (but limited by semaphore)
-        tasks = []
-        for batch in trial_batches:
-            if len(batch) > 0:  # Only process non-empty batches
-                task = self.match_patient_to_trial_batch(patient_data, batch)
-                tasks.append(task)
-        
-        # Execute all tasks
-        batch_results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # Combine results
-        for result in batch_results:
-            if isinstance(result, list):
+        trial_batches = [trials_to_score[i:i + batch_size] for i in range(0, len(trials_to_score), batch_size)]
+        
+        def update(new, completed, stage):
+            # Sort by relevance score (highest first)
+            all_matched_trials.sort(key=lambda x: x.get('relevance_score', 0), reverse=True)
+            return {
+                "trials": list(all_matched_trials),
+                "new": new,
+                "completed_batches": completed,
+                "total_batches": len(trial_batches),
+                "stage": stage,
+            }
+        
+        if all_matched_trials:
+            yield update(list(all_matched_trials), 0, "scoring")
+        
+        # Process batches concurrently (limited by semaphore) and report each as it finishes
+        tasks = [asyncio.ensure_future(self.match_patient_to_trial_batch(patient_data, batch))
+                 for batch in trial_batches]
+        try:
+            for completed, next_result in enumerate(asyncio.as_completed(tasks), 1):
+                try:
+                    result = await next_result
+                except Exception as e:
+                    st.warning(f"Error processing batch: {e}")
+                    result = []
+                # Only successfully parsed assessments are cached
                 all_matched_trials.extend(result)
-            elif isinstance(result, Exception):
-                st.warning(f"Error processing batch: {result}")
-        
-        # Sort by relevance score (highest first)
-        all_matched_trials.sort(key=lambda x: x.get('relevance_score', 0), reverse=True)
+                match_cache.set_many(patient_hash, result)
+                yield update(result, completed, "scoring")
+        finally:
+            # The consumer may stop early (e.g. a Streamlit rerun); don't leave batches running
+            for task in tasks:
+                task.cancel()
         
         # Generate detailed recommendations for top trials (score >= 60)
         top_trials = [t for t in all_matched_trials if t.get('relevance_score', 0) >= 60][:5]  # Top 5 high-scoring trials
         
         if top_trials:
+            yield update([], len(trial_batches), "detailing")
             st.info("Generating detailed recommendations for top matching trials...")
             enhanced_top_trials = await self.generate_detailed_recommendations(patient_data, top_trials)
             
             # Replace the top trials with enhanced versions
-            enhanced_trials = []
             top_trial_titles = {t.get('title', '') for t in top_trials}
-            
-            for trial in all_matched_trials:
+            for i, trial in enumerate(all_matched_trials):
                 if trial.get('title', '') in top_trial_titles:
                     # Find the enhanced version
-                    enhanced_version = next((et for et in enhanced_top_trials if et.get('title') == trial.get('title')), trial)
-                    enhanced_trials.append(enhanced_version)
-                else:
-                    enhanced_trials.append(trial)
+                    all_matched_trials[i] = next((et for et in enhanced_top_trials if et.get('title') == trial.get('title')), trial)
             
-            return enhanced_trials
+            yield update(enhanced_top_trials, len(trial_batches), "done")
+            return
         
-        return all_matched_trials
+        yield update([], len(trial_batches), "done")
+    
+    async def find_matching_trials(self, patient_data: str, trials_file: str = TRIALS_FILE,
+                                   patient_profile: Optional[PatientProfile] = None,
+                                   top_k: Optional[int] = MATCH_TOP_K) -> List[Dict]:
+        """
+        Find matching clinical trials for a patient by processing in batches.
+
+        Trials come from the cached trial index. When a patient profile is given,
+        trials whose structured eligibility the patient clearly fails are excluded
+        locally, and only the ``top_k`` best BM25-ranked plausible trials are sent to the LLM.
+        """
+        matched_trials = []
+        async for progress in self.stream_matching_trials(patient_data, trials_file, patient_profile, top_k):
+            matched_trials = progress["trials"]
+        return matched_trials
 
 def format_patient_data_for_matching(parsed_data: Dict, free_text_input: str = None, additional_info: Dict = None) -> str:
     """
@@ -442,27 +535,60 @@ def format_patient_data_for_matching(parsed_data: Dict, free_text_input: str = N
     
     return patient_description
 
-def run_clinical_trial_matching(patient_data: str) -> List[Dict]:
+def stream_clinical_trial_matching(patient_data: str, patient_profile: Optional[PatientProfile] = None):
     """
-    Synchronous wrapper for the async clinical trial matching
+    Synchronous generator over ``ClinicalTrialMatcher.stream_matching_trials`` updates,
+    so the Streamlit script can render results while later batches are still scoring.
     """
     matcher = ClinicalTrialMatcher()
     
-    # Run the async function
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
+    updates = matcher.stream_matching_trials(patient_data, patient_profile=patient_profile)
     try:
-        results = loop.run_until_complete(matcher.find_matching_trials(patient_data))
-        return results
+        while True:
+            try:
+                yield loop.run_until_complete(updates.__anext__())
+            except StopAsyncIteration:
+                break
     finally:
+        loop.run_until_complete(updates.aclose())
         loop.close()
 
-def display_trial_matches(matched_trials: List[Dict]):
+def run_clinical_trial_matching(patient_data: str, patient_profile: Optional[PatientProfile] = None,
+                                on_progress: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
     """
-    Display the matched clinical trials in a user-friendly format
+    Synchronous wrapper for the async clinical trial matching.
+    ``patient_profile`` (see parsers.trial_index.build_patient_profile) enables the eligibility prefilter.
+    ``on_progress`` receives every streamed update, e.g. ``utils.job_queue.report_progress``.
     """
+    results = []
+    for progress in stream_clinical_trial_matching(patient_data, patient_profile):
+        results = progress["trials"]
+        if on_progress is not None:
+            on_progress(progress)
+    return results
+
+def display_trial_matches(matched_trials: List[Dict], progress: Optional[Dict] = None):
+    """
+    Display the matched clinical trials in a user-friendly format.
+
+    While matching is still running, pass the latest ``stream_clinical_trial_matching``
+    update as ``progress``: a progress bar is shown and widgets that must only be
+    rendered once per script run (the results table toggle) are skipped.
+    """
+    if progress is not None and progress.get("stage") != "done":
+        total = progress.get("total_batches", 0)
+        completed = progress.get("completed_batches", 0)
+        if progress.get("stage") == "detailing":
+            st.progress(1.0, text="Generating detailed recommendations for top matching trials...")
+        else:
+            st.progress(completed / total if total else 1.0,
+                        text=f"Scored {completed} of {total} trial batches...")
+    
     if not matched_trials:
-        st.warning("No clinical trials found matching the patient criteria.")
+        if progress is None:
+            st.warning("No clinical trials found matching the patient criteria.")
         return
     
     # Filter trials by recommendation level
@@ -478,7 +604,8 @@ def display_trial_matches(matched_trials: List[Dict]):
     with col2:
         st.metric("Consider", len(consider_trials), help="Score 40-69")
     with col3:
-        st.metric("Total Evaluated", len(matched_trials))
+        evaluated = [t for t in matched_trials if t.get('recommendation') != 'not_evaluated']
+        st.metric("Total Evaluated", len(evaluated), help="Trials reviewed by AI or excluded by eligibility rules")
     
     # Display highly recommended trials with detailed recommendations
     if recommended_trials:
@@ -499,7 +626,7 @@ def display_trial_matches(matched_trials: List[Dict]):
                 display_single_trial(trial)
     
     # Show all results in a table
-    if st.checkbox("Show all trial results", value=False):
+    if progress is None and st.checkbox("Show all trial results", value=False):
         st.markdown("### All Trial Results")
         
         # Create a summary table
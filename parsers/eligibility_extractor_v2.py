@@ -1,4 +1,5 @@
 import asyncio
+import hashlib
 import json
 import os
 import streamlit as st
@@ -8,6 +9,7 @@ from datetime import datetime
 class EligibilityExtractorV2:
     def __init__(self, max_concurrent_requests: int = 10):
         self.client = AsyncOpenAI(api_key=st.secrets["openai"]["api_key"])
+        self.max_concurrent_requests = max_concurrent_requests
         self.semaphore = asyncio.Semaphore(max_concurrent_requests)
         
     async def extract_eligibility_criteria(self, who_can_enter_text: str, trial_title: str) -> dict:
@@ -221,9 +223,17 @@ Clinical Trial Eligibility Text:
                 print(f"❌ Error processing trial '{trial_title}': {str(e)}")
                 return {}
     
-    async def process_clinical_trials(self, input_file: str, output_file: str) -> None:
+    async def process_clinical_trials(self, input_file: str, output_file: str,
+                                      checkpoint_every: int = 5) -> None:
         """
-        Process all clinical trials and add structured eligibility criteria
+        Process all clinical trials and add structured eligibility criteria.
+
+        Extraction is incremental: a trial whose eligibility text hashes to the
+        ``source_hash`` stored in its ``eligibility_extraction_v2_metadata`` (from a
+        previous ``output_file``) keeps its stored result and is not sent again.
+        Changed or new trials go through a work queue drained by
+        ``max_concurrent_requests`` workers, and ``output_file`` is checkpointed
+        as results finish, so an interrupted run resumes where it stopped.
         """
         print(f"📁 Loading clinical trials from {input_file}...")
         
@@ -232,60 +242,152 @@ Clinical Trial Eligibility Text:
         
         print(f"🏥 Found {len(trials)} clinical trials")
         
-        # Filter trials that have eligibility text
-        trials_with_eligibility = [
-            (i, trial) for i, trial in enumerate(trials) 
-            if 'who_can_enter' in trial and trial['who_can_enter'] and trial['who_can_enter'].strip()
-        ]
+        # Carry over stored extractions from the previous output / checkpoint
+        previous = {}
+        if os.path.exists(output_file):
+            try:
+                with open(output_file, 'r', encoding='utf-8') as f:
+                    previous = {_trial_key(t): t for t in json.load(f)}
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"⚠️ Ignoring unreadable previous output {output_file}: {e}")
+        
+        # Filter trials that have eligibility text, skipping those already extracted from the same text
+        pending = []
+        skipped = 0
+        for i, trial in enumerate(trials):
+            text = trial.get('who_can_enter') or ''
+            if not text.strip():
+                continue
+            stored = previous.get(_trial_key(trial), {})
+            metadata = stored.get('eligibility_extraction_v2_metadata')
+            if _is_current(metadata, text):
+                trial['structured_eligibility_v2'] = stored.get('structured_eligibility_v2', {})
+                trial['eligibility_extraction_v2_metadata'] = metadata
+                skipped += 1
+            else:
+                pending.append(i)
+        
+        print(f"📋 {len(pending) + skipped} trials have eligibility criteria "
+              f"({skipped} unchanged since the last run, {len(pending)} to process)")
         
-        print(f"📋 {len(trials_with_eligibility)} trials have eligibility criteria to process")
+        completed = 0
+        
+        def on_result(trial_idx):
+            nonlocal completed
+            completed += 1
+            if completed % checkpoint_every == 0:
+                _write_trials(output_file, trials)
+        
+        try:
+            processed_count = await self._extract_pending(trials, pending, on_result)
+        finally:
+            # Save results (also the checkpoint when a run is interrupted)
+            print(f"💾 Saving results to {output_file}...")
+            _write_trials(output_file, trials)
+        
+        print(f"🎉 Successfully processed {processed_count} trials!")
+        print(f"📊 Results saved to: {output_file}")
+    
+    async def process_trial_store(self, store) -> int:
+        """
+        Incremental extraction over a ``utils.trial_store.TrialStore``: trials whose
+        stored metadata matches their current eligibility text are skipped, and each
+        new result is written back as a single-row update as soon as it finishes.
+
+        Returns:
+            int: Number of trials extracted.
+        """
+        trials = [t for t in store.query_trials(status=None) if (t.get('who_can_enter') or '').strip()]
+        pending = [
+            i for i, trial in enumerate(trials)
+            if not _is_current(trial.get('eligibility_extraction_v2_metadata'), trial['who_can_enter'])
+        ]
+        print(f"📋 {len(trials)} trials have eligibility criteria "
+              f"({len(trials) - len(pending)} unchanged since the last run, {len(pending)} to process)")
         
-        # Create extraction tasks
-        tasks = []
-        for i, trial in trials_with_eligibility:
-            task = self.extract_eligibility_criteria(
-                trial['who_can_enter'], 
-                trial.get('title', f'Trial {i+1}')
+        def on_result(trial_idx):
+            trial = trials[trial_idx]
+            store.update_structured_eligibility(
+                _trial_key(trial), trial['structured_eligibility_v2'], trial['eligibility_extraction_v2_metadata']
             )
-            tasks.append((i, task))
         
+        processed_count = await self._extract_pending(trials, pending, on_result)
+        print(f"🎉 Successfully processed {processed_count} trials!")
+        return processed_count
+    
+    async def _extract_pending(self, trials: list, pending: list, on_result) -> int:
+        """
+        Extracts ``trials[i]`` for every index in ``pending`` through a work queue.
+        Each of the ``max_concurrent_requests`` workers picks up the next trial as
+        soon as its previous call returns; ``on_result(i)`` runs after each trial
+        is updated. Returns the number of trials processed.
+        """
+        queue = asyncio.Queue()
+        for trial_idx in pending:
+            queue.put_nowait(trial_idx)
         processed_count = 0
-        batch_size = 10
-        
-        print(f"🚀 Processing in batches of {batch_size}...")
         
-        # Process in batches
-        for batch_start in range(0, len(tasks), batch_size):
-            batch_tasks = tasks[batch_start:batch_start + batch_size]
-            batch_num = batch_start // batch_size + 1
-            total_batches = (len(tasks) + batch_size - 1) // batch_size
-            
-            print(f"⏳ Processing batch {batch_num}/{total_batches}...")
-            
-            # Execute batch
-            batch_results = await asyncio.gather(*[task for _, task in batch_tasks])
-            
-            # Update trials with results
-            for (trial_idx, _), result in zip(batch_tasks, batch_results):
-                trials[trial_idx]['structured_eligibility_v2'] = result
-                processed_count += 1
+        async def worker():
+            nonlocal processed_count
+            while True:
+                try:
+                    trial_idx = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                trial = trials[trial_idx]
+                result = await self.extract_eligibility_criteria(
+                    trial['who_can_enter'],
+                    trial.get('title', f'Trial {trial_idx+1}')
+                )
                 
-                # Add metadata
-                trials[trial_idx]['eligibility_extraction_v2_metadata'] = {
+                # Update the trial with its result and metadata
+                trial['structured_eligibility_v2'] = result
+                trial['eligibility_extraction_v2_metadata'] = {
                     'processed_at': datetime.now().isoformat(),
                     'extraction_success': bool(result),
-                    'extractor_version': '2.0'
+                    'extractor_version': EXTRACTOR_VERSION,
+                    'source_hash': eligibility_text_hash(trial['who_can_enter'])
                 }
-            
-            print(f"✅ Completed {processed_count}/{len(tasks)} extractions")
-        
-        # Save results
-        print(f"💾 Saving results to {output_file}...")
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(trials, f, indent=2, ensure_ascii=False)
+                processed_count += 1
+                print(f"✅ Completed {processed_count}/{len(pending)} extractions")
+                on_result(trial_idx)
         
-        print(f"🎉 Successfully processed {processed_count} trials!")
-        print(f"📊 Results saved to: {output_file}")
+        workers = [asyncio.ensure_future(worker())
+                   for _ in range(min(self.max_concurrent_requests, len(pending)))]
+        print(f"🚀 Processing with {len(workers)} concurrent workers...")
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+        return processed_count
+
+
+EXTRACTOR_VERSION = '2.0'
+
+
+def eligibility_text_hash(who_can_enter_text: str) -> str:
+    """Hash of the eligibility text (and extractor version) a stored extraction was made from."""
+    payload = f"{EXTRACTOR_VERSION}\n{who_can_enter_text.strip()}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _is_current(metadata, who_can_enter_text: str) -> bool:
+    """True when a stored extraction succeeded and was made from this exact text."""
+    metadata = metadata or {}
+    return bool(metadata.get('extraction_success')) and metadata.get('source_hash') == eligibility_text_hash(who_can_enter_text)
+
+
+def _trial_key(trial: dict) -> str:
+    return trial.get('link') or trial.get('title') or ''
+
+
+def _write_trials(output_file: str, trials: list) -> None:
+    """Atomically writes the trial list, so a crash mid-write never corrupts the checkpoint."""
+    tmp_file = f"{output_file}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(trials, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_file, output_file)
 
 
 async def main():
@@ -294,6 +396,7 @@ async def main():
     # Configuration
     INPUT_FILE = "trials-aggregator/clinical_trials.json"
     OUTPUT_FILE = "trials-aggregator/clinical_trials_with_structured_eligibility_v2.json"
+    STORE_FILE = "trials-aggregator/clinical_trials.sqlite3"
     
     print("🔬 Blood Cancer Clinical Trials Eligibility Extractor V2")
     print("🎯 Focus: Decisive, Programmatically Matchable Criteria")
@@ -302,8 +405,12 @@ async def main():
     # Create extractor (uses st.secrets for API key)
     extractor = EligibilityExtractorV2(max_concurrent_requests=10)
     
-    # Process trials
-    await extractor.process_clinical_trials(INPUT_FILE, OUTPUT_FILE)
+    # Process trials (row by row in the trial store when one has been built)
+    if os.path.exists(STORE_FILE):
+        from utils.trial_store import get_trial_store
+        await extractor.process_trial_store(get_trial_store(STORE_FILE))
+    else:
+        await extractor.process_clinical_trials(INPUT_FILE, OUTPUT_FILE)
     
     print("=" * 70)
     print("🏁 Processing complete!")
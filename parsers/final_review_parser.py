@@ -1,11 +1,14 @@
 import streamlit as st
 import json
-from openai import OpenAI
+from utils.llm_client import LazyOpenAIClient
+from utils.llm_metrics import tracked_completion
 
 ##############################
 # OPENAI API CONFIG
 ##############################
-client = OpenAI(api_key=st.secrets["openai"]["api_key"])
+client = LazyOpenAIClient()
+
+OVERVIEW_ERROR_TEXT = "Error generating comprehensive clinical overview. Please review the parsed data and classification results manually."
 
 
 ##############################
@@ -26,6 +29,32 @@ def generate_final_overview(parsed_data: dict, original_report_text: str = "") -
     if not parsed_data:
         return "No parsed data available for overview generation."
     
+    try:
+        return request_final_overview(build_overview_data(parsed_data, original_report_text))
+    except Exception as e:
+        st.error(f"❌ Error generating comprehensive overview: {str(e)}")
+        return OVERVIEW_ERROR_TEXT
+
+
+def build_overview_data(parsed_data: dict, original_report_text: str = "", eln_risk: tuple = None,
+                        state=None) -> dict:
+    """
+    Collects everything the overview prompt needs from the session state: classifications,
+    risk results and AI reviews. Reads ``st.session_state`` unless another ``state`` mapping
+    is given, so with the default it must run in the Streamlit script thread.
+
+    Args:
+        parsed_data (dict): The complete parsed data structure from the genetics report
+        original_report_text (str): Optional original report text for additional context
+        eln_risk (tuple): Optional (risk, median OS, derivation) from eln2022_intensive_risk,
+            when the caller has already computed it
+        state (Mapping): Report state with the session state keys; defaults to st.session_state
+
+    Returns:
+        dict: The data summarised by ``request_final_overview``
+    """
+    state = st.session_state if state is None else state
+
     # Gather all available information from session state
     comprehensive_data = {
         "parsed_data": parsed_data,
@@ -33,7 +62,7 @@ def generate_final_overview(parsed_data: dict, original_report_text: str = "") -
     }
     
     # Add AML results if available
-    aml_result = st.session_state.get("aml_manual_result") or st.session_state.get("aml_ai_result")
+    aml_result = state.get("aml_manual_result") or state.get("aml_ai_result")
     if aml_result:
         who_classification = aml_result.get("who_class", "")
         icc_classification = aml_result.get("icc_class", "")
@@ -42,8 +71,8 @@ def generate_final_overview(parsed_data: dict, original_report_text: str = "") -
         who_is_mds = "MDS" in who_classification if who_classification else False
         icc_is_mds = "MDS" in icc_classification if icc_classification else False
         
-        if (who_is_mds or icc_is_mds) and "mds_confirmation" in st.session_state:
-            mds_confirmation = st.session_state["mds_confirmation"]
+        if (who_is_mds or icc_is_mds) and "mds_confirmation" in state:
+            mds_confirmation = state["mds_confirmation"]
             if mds_confirmation.get("submitted", False) and mds_confirmation.get("has_exclusions", False):
                 # Override MDS classifications with exclusion result
                 if who_is_mds:
@@ -60,8 +89,10 @@ def generate_final_overview(parsed_data: dict, original_report_text: str = "") -
         
         # Add ELN risk if available
         try:
-            from classifiers.aml_risk_classifier import eln2022_intensive_risk
-            risk_eln2022, median_os_eln2022, _ = eln2022_intensive_risk(aml_result["parsed_data"])
+            if eln_risk is None:
+                from classifiers.aml_risk_classifier import eln2022_intensive_risk
+                eln_risk = eln2022_intensive_risk(aml_result["parsed_data"])
+            risk_eln2022, median_os_eln2022, _ = eln_risk
             comprehensive_data["eln_risk"] = {
                 "risk_category": risk_eln2022,
                 "median_os": median_os_eln2022
@@ -70,14 +101,14 @@ def generate_final_overview(parsed_data: dict, original_report_text: str = "") -
             pass
     
     # Add MDS results if available
-    mds_result = st.session_state.get("mds_manual_result") or st.session_state.get("mds_ai_result")
+    mds_result = state.get("mds_manual_result") or state.get("mds_ai_result")
     if mds_result:
         mds_who_classification = mds_result.get("who_class", "")
         mds_icc_classification = mds_result.get("icc_class", "")
         
         # Check if MDS confirmation form has been submitted and resulted in exclusions
-        if "mds_confirmation" in st.session_state:
-            mds_confirmation = st.session_state["mds_confirmation"]
+        if "mds_confirmation" in state:
+            mds_confirmation = state["mds_confirmation"]
             if mds_confirmation.get("submitted", False) and mds_confirmation.get("has_exclusions", False):
                 # Override MDS classifications with exclusion result
                 mds_who_classification = "Not MDS - consider other diagnostic pathways"
@@ -91,13 +122,13 @@ def generate_final_overview(parsed_data: dict, original_report_text: str = "") -
         }
         
         # Add IPSS risk if available
-        if 'ipssm_result' in st.session_state:
-            ipssm = st.session_state['ipssm_result']
+        if 'ipssm_result' in state:
+            ipssm = state['ipssm_result']
             comprehensive_data["ipss_risk"] = {
                 "ipssm_mean_risk": ipssm.get('means', {}).get('riskCat', ''),
                 "ipssm_mean_score": ipssm.get('means', {}).get('riskScore', ''),
-                "ipssr_risk": st.session_state.get('ipssr_result', {}).get('IPSSR_CAT', ''),
-                "ipssr_score": st.session_state.get('ipssr_result', {}).get('IPSSR_SCORE', '')
+                "ipssr_risk": state.get('ipssr_result', {}).get('IPSSR_CAT', ''),
+                "ipssr_score": state.get('ipssr_result', {}).get('IPSSR_SCORE', '')
             }
     
     # Add AI review comments if available
@@ -114,12 +145,20 @@ def generate_final_overview(parsed_data: dict, original_report_text: str = "") -
     ]
     
     for review_type, session_key in review_keys:
-        if session_key in st.session_state:
-            ai_reviews[review_type] = st.session_state[session_key][:500]  # Limit length
+        if session_key in state:
+            ai_reviews[review_type] = state[session_key][:500]  # Limit length
     
     if ai_reviews:
         comprehensive_data["ai_reviews"] = ai_reviews
     
+    return comprehensive_data
+
+
+def request_final_overview(comprehensive_data: dict) -> str:
+    """
+    Sends the data from ``build_overview_data`` to the model and returns the 5-sentence overview.
+    Does not touch the Streamlit session, so it can run on a worker thread; errors are raised.
+    """
     # Convert the comprehensive data to a readable format for the AI
     data_summary = json.dumps(comprehensive_data, indent=2)
     
@@ -153,31 +192,26 @@ def generate_final_overview(parsed_data: dict, original_report_text: str = "") -
     - Include specific details like gene names, risk categories, and percentages where relevant
     """
     
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a specialized hematopathology AI that generates comprehensive 5-sentence clinical overviews for diagnostic reports."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=800,  # Increased for longer overview
-            temperature=0.1  # Low temperature for consistent, factual output
-        )
-        
-        overview_text = response.choices[0].message.content.strip()
-        
-        # Clean up any potential formatting issues
-        overview_text = overview_text.replace('"', '').replace('\n\n', ' ').replace('\n', ' ')
-        
-        # Ensure it's not too long (but allow for longer comprehensive overview)
-        if len(overview_text) > 1200:
-            overview_text = overview_text[:1197] + "..."
-            
-        return overview_text
+    response = tracked_completion(client, "final_overview",
+        model="gpt-4",
+        messages=[
+            {"role": "system", "content": "You are a specialized hematopathology AI that generates comprehensive 5-sentence clinical overviews for diagnostic reports."},
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=800,  # Increased for longer overview
+        temperature=0.1  # Low temperature for consistent, factual output
+    )
+    
+    overview_text = response.choices[0].message.content.strip()
+    
+    # Clean up any potential formatting issues
+    overview_text = overview_text.replace('"', '').replace('\n\n', ' ').replace('\n', ' ')
+    
+    # Ensure it's not too long (but allow for longer comprehensive overview)
+    if len(overview_text) > 1200:
+        overview_text = overview_text[:1197] + "..."
         
-    except Exception as e:
-        st.error(f"❌ Error generating comprehensive overview: {str(e)}")
-        return "Error generating comprehensive clinical overview. Please review the parsed data and classification results manually."
+    return overview_text
 
 
 ##############################
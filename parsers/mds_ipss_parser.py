@@ -1,24 +1,36 @@
 import streamlit as st
 import json
-import concurrent.futures
-from openai import OpenAI
+from utils.llm_client import LazyOpenAIClient
+from utils.llm_cache import cached_json_completion
+from utils.extraction_engine import ExtractionCancelled, extract_unresolved_prompts, run_sync
+from parsers.pre_extractor import IPSSR_CYTO_CATEGORIES, ipssr_criteria_text, pre_extract_ipss_sections
+from utils.prompt_layout import EXTRACTION_SYSTEM_MESSAGE, report_first_prompt
+from utils.structured_output import StructuredOutputError, json_schema_for, section_schemas
 
 ##############################
 # OPENAI API CONFIG
 ##############################
-client = OpenAI(api_key=st.secrets["openai"]["api_key"])
+client = LazyOpenAIClient()
+
+SYSTEM_MESSAGE = EXTRACTION_SYSTEM_MESSAGE
+
+# Top-level keys of the required JSON structure that each prompt returns
+IPSS_PROMPT_FIELDS = {
+    "clinical_prompt": ("clinical_values",),
+    "cytogenetics_prompt": ("cytogenetics", "cyto_category_ipssr"),
+    "tp53_prompt": ("tp53_details",),
+    "genes_prompt": ("gene_mutations", "residual_genes"),
+}
 
 def get_json_from_prompt(prompt: str) -> dict:
-    """Helper function to call OpenAI and return the JSON-parsed response."""
-    response = client.chat.completions.create(
+    """Helper function to call OpenAI and return the JSON-parsed response (served from the shared cache when possible)."""
+    return cached_json_completion(
+        client,
         model="o3-mini",
-        messages=[
-            {"role": "system", "content": "You are a knowledgeable haematologist who returns valid JSON."},
-            {"role": "user", "content": prompt}
-        ]
+        system_message=SYSTEM_MESSAGE,
+        prompt=prompt,
+        metrics_name="ipss_parser.get_json_from_prompt"
     )
-    raw = response.choices[0].message.content.strip()
-    return json.loads(raw)
 
 def try_convert_tp53_vaf(vaf_value):
     """
@@ -45,25 +57,11 @@ def try_convert_tp53_vaf(vaf_value):
         # If conversion fails, return 0.0 instead of "NA"
         return 0.0
 
-def parse_ipss_report(report_text: str) -> dict:
+def _build_ipss_prompts(report_text: str):
     """
-    Sends the free-text haematological report to OpenAI to extract values 
-    needed for IPSS-M and IPSS-R risk classification.
-    
-    Extracts:
-    1) Clinical values - Hemoglobin, Platelet count, ANC, bone marrow blasts, age
-    2) Cytogenetic information - del5q, del7q, etc., karyotype complexity
-    3) TP53 mutation status
-    4) Gene mutations relevant for IPSS-M
-    
-    Returns:
-        dict: A dictionary containing all fields needed for IPSS-M/R classification
+    Builds the required JSON structure and the named extraction prompts for one report.
+    The prompts are returned in merge order.
     """
-    # Safety check: if user typed nothing, return empty.
-    if not report_text.strip():
-        st.warning("Empty report text received.")
-        return {}
-        
     # The required JSON structure for IPSS-M/R calculation
     required_json_structure = {
         "clinical_values": {
@@ -143,42 +141,32 @@ def parse_ipss_report(report_text: str) -> dict:
     # -------------------------------------------------------
     # Prompt #1: Clinical Values
     # -------------------------------------------------------
-    clinical_prompt = f"""
-The user has pasted a free-text haematological report.
-Please extract the following clinical values from the text and format them into a valid JSON object.
+    clinical_prompt = report_first_prompt(report_text, """
+Please extract the following clinical values from the report and format them into a valid JSON object.
 For numerical fields, provide the value as a number (not a string).
 If a field is not found or unclear, use the default value provided.
 
 Extract these fields:
-"clinical_values": {{
+"clinical_values": {
     "HB": [Hemoglobin level in g/dL, default: 10.0],
     "PLT": [Platelet count in 10^9/L or K/uL, default: 150],
     "ANC": [Absolute Neutrophil Count in 10^9/L, default: 2.0],
     "BM_BLAST": [Bone Marrow blast percentage, default: 0.0],
     "Age": [Patient's age in years, default: 70]
-}}
+}
 
 Return valid JSON only with these keys and no extra text.
-
-Here is the free-text haematological report to parse:
-
-[START OF REPORT]
-
-{report_text}
-
-[END OF REPORT]   
-    """
+""")
     
     # -------------------------------------------------------
     # Prompt #2: Cytogenetics
     # -------------------------------------------------------
-    cytogenetics_prompt = f"""
-The user has pasted a free-text haematological report.
-Please extract the following cytogenetic information from the text and format it into a valid JSON object.
+    cytogenetics_prompt = report_first_prompt(report_text, """
+Please extract the following cytogenetic information from the report and format it into a valid JSON object.
 For boolean fields, use true/false.
 
 Extract these fields:
-"cytogenetics": {{
+"cytogenetics": {
     "del5q": false,        
     "del7q": false,       
     "minus7": false,     
@@ -201,41 +189,28 @@ Extract these fields:
     "inv3": false,        
     "t3q_GATA2": false,
     "karyotype_complexity": "Normal" 
-}},
+},
 "cyto_category_ipssr": "Good"
 
 For "karyotype_complexity", choose from "Normal", "Complex (3 abnormalities)", or "Very complex (>3 abnormalities)".
 For "cyto_category_ipssr", choose from "Very Good", "Good", "Intermediate", "Poor", or "Very Poor" based on the IPSS-R criteria:
-- Very Good: isolated del(5q), isolated del(11q), -Y, or any double including one of these abnormalities
-- Good: normal, t(5;13), t(5;17)
-- Intermediate: del(13q), +8, t(2;11), -7/7q-, del(12p), i(17q), t(11;16), +2, +19, +6, +21, +1, +15, t(X;10)(q22;q21), t(11;17)(q;23;q21)  
-- Poor: inv(3), t(3;3), Monosomal karyotype (2 autosomal monosomies or 1 monosomy + 1 structural abnormality), Complex (3 abnormalities)
-- Very Poor: Very complex (>3 abnormalities)
+""" + ipssr_criteria_text() + """
 
 Return valid JSON only with these keys and no extra text.
-
-Here is the free-text haematological report to parse:
-
-[START OF REPORT]
-
-{report_text}
-
-[END OF REPORT]   
-    """
+""")
     
     # -------------------------------------------------------
     # Prompt #3: TP53 details
     # -------------------------------------------------------
-    tp53_prompt = f"""
-The user has pasted a free-text haematological report.
-Please extract the TP53 mutation information from the text and format it into a valid JSON object.
+    tp53_prompt = report_first_prompt(report_text, """
+Please extract the TP53 mutation information from the report and format it into a valid JSON object.
 
 Extract these fields:
-"tp53_details": {{
+"tp53_details": {
     "TP53mut": [TP53 mutation count as a string: "0" if none, "1" if single mutation, "2" if multiple mutations are present],
     "TP53maxvaf": [Maximum variant allele frequency (VAF) of the TP53 mutation as a number (0-100), default: 0.0],
     "TP53loh": [true if there's loss of heterozygosity in TP53, false otherwise]
-}}
+}
 
 IMPORTANT RULES:
 1. Return "TP53mut" as a STRING: "0", "1", or "2" 
@@ -252,26 +227,17 @@ Examples of what to look for:
 Take care to distinguish between single and multiple TP53 mutations. If the text mentions "biallelic" TP53 or multiple mutations, use "2" for TP53mut.
 
 Return valid JSON only with these keys and no extra text.
-
-Here is the free-text haematological report to parse:
-
-[START OF REPORT]
-
-{report_text}
-
-[END OF REPORT]   
-    """
+""")
     
     # -------------------------------------------------------
     # Prompt #4: Gene mutations
     # -------------------------------------------------------
-    genes_prompt = f"""
-The user has pasted a free-text haematological report.
-Please extract information about gene mutations from the text and format it into a valid JSON object.
-For each gene, set the value to true if the text indicates that gene is mutated; otherwise false.
+    genes_prompt = report_first_prompt(report_text, """
+Please extract information about gene mutations from the report and format it into a valid JSON object.
+For each gene, set the value to true if the report indicates that gene is mutated; otherwise false.
 
 Extract these fields:
-"gene_mutations": {{
+"gene_mutations": {
     "ASXL1": false,
     "RUNX1": false,
     "SF3B1": false,
@@ -288,8 +254,8 @@ Extract these fields:
     "NPM1": false,
     "ETV6": false,
     "TP53multi": false
-}},
-"residual_genes": {{
+},
+"residual_genes": {
     "BCOR": false,
     "BCORL1": false,
     "CEBPA": false,
@@ -305,7 +271,7 @@ Extract these fields:
     "SETBP1": false,
     "STAG2": false,
     "WT1": false
-}}
+}
 
 CRITICAL INSTRUCTIONS FOR TP53multi:
 Set "TP53multi" to true if ANY of these conditions are met:
@@ -323,202 +289,248 @@ Examples of text that should set TP53multi to true:
 - "TP53 mutation with loss of heterozygosity"
 
 Return valid JSON only with these keys and no extra text.
+""")
+
+    # Named prompts, also stored on the parsed result for debugging
+    prompts = {
+        "clinical_prompt": clinical_prompt,
+        "cytogenetics_prompt": cytogenetics_prompt,
+        "tp53_prompt": tp53_prompt,
+        "genes_prompt": genes_prompt
+    }
+    return required_json_structure, prompts
 
-Here is the free-text haematological report to parse:
 
-[START OF REPORT]
+def _build_ipss_schemas(required_json_structure: dict) -> dict:
+    """JSON Schema for each prompt's reply, generated from the required JSON structure."""
+    # TP53mut and TP53maxvaf are normalised in _merge_ipss_results, so numbers and strings are both fine
+    tp53_schema = json_schema_for(required_json_structure["tp53_details"])
+    tp53_schema["properties"]["TP53mut"] = {"type": ["string", "integer", "null"]}
+    tp53_schema["properties"]["TP53maxvaf"] = {"type": ["number", "string", "null"]}
+    return section_schemas(required_json_structure, IPSS_PROMPT_FIELDS, overrides={
+        "tp53_details": tp53_schema,
+        "cyto_category_ipssr": {"enum": IPSSR_CYTO_CATEGORIES},
+    })
 
-{report_text}
 
-[END OF REPORT]   
-   
+def _merge_ipss_results(results: dict, prompts: dict, required_json_structure: dict, report_text: str) -> dict:
+    """
+    Merges the per-prompt JSON results (in prompt order), applies the TP53 text
+    fallbacks and converts everything into the IPSS-M/R calculator format.
     """
+    # Merge all data into one dictionary
+    parsed_data = {}
+    for prompt_result in results.values():
+        parsed_data.update(prompt_result)
     
-    try:
-        # Store prompts for debugging
-        prompts = {
-            "clinical_prompt": clinical_prompt,
-            "cytogenetics_prompt": cytogenetics_prompt,
-            "tp53_prompt": tp53_prompt,
-            "genes_prompt": genes_prompt
-        }
-        
-        # Parallelize the prompt calls
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            future1 = executor.submit(get_json_from_prompt, clinical_prompt)
-            future2 = executor.submit(get_json_from_prompt, cytogenetics_prompt)
-            future3 = executor.submit(get_json_from_prompt, tp53_prompt)
-            future4 = executor.submit(get_json_from_prompt, genes_prompt)
-
-            # Gather results when all are complete
-            clinical_data = future1.result()
-            cytogenetics_data = future2.result()
-            tp53_data = future3.result()
-            genes_data = future4.result()
-
-        # Merge all data into one dictionary
-        parsed_data = {}
-        parsed_data.update(clinical_data)
-        parsed_data.update(cytogenetics_data)
-        parsed_data.update(tp53_data)
-        parsed_data.update(genes_data)
-        
-        # Add prompts to the parsed data for debugging
-        parsed_data["__prompts"] = prompts
-
-        # -------------------------------------------------------
-        # Validate TP53 data and ensure it exists with proper format
-        # -------------------------------------------------------
-        # Check if tp53_details exists in the parsed data
-        if "tp53_details" not in parsed_data or not isinstance(parsed_data["tp53_details"], dict):
-            print("⚠️ tp53_details missing or not a dictionary! Creating default structure.")
-            parsed_data["tp53_details"] = {"TP53mut": "0", "TP53maxvaf": 0.0, "TP53loh": False}
-        
-        # Direct text analysis for TP53 as a fallback
-        if "tp53_details" in parsed_data and (
-            parsed_data["tp53_details"].get("TP53mut", "0") == "0" or 
-            parsed_data["tp53_details"].get("TP53maxvaf", 0) == 0
-        ):
-            # Fallback: direct text search for TP53 mutations
-            tp53_text_patterns = [
-                "TP53 mutation", "p53 mutation", "TP53 mutated", 
-                "TP53 pathogenic", "mutated TP53", "TP53 variant"
-            ]
-            
-            # Check if any TP53 patterns are in the text
-            if any(pattern.lower() in report_text.lower() for pattern in tp53_text_patterns):
-                print("⚠️ Found TP53 mutation in text but not in JSON response. Setting values manually.")
-                parsed_data["tp53_details"]["TP53mut"] = "1"
-                parsed_data["tp53_details"]["TP53maxvaf"] = 30.0  # Default VAF
-                
-                # Look for biallelic/double mutations
-                biallelic_patterns = [
-                    "biallelic", "multiple", "two TP53", "second TP53", 
-                    "both allele", "both copies", "compound heterozygous"
-                ]
-                if any(pattern.lower() in report_text.lower() for pattern in biallelic_patterns):
-                    parsed_data["tp53_details"]["TP53mut"] = "2"
-                    parsed_data["gene_mutations"]["TP53multi"] = True
-                
-                # Look for LOH
-                loh_patterns = ["LOH", "loss of heterozygosity", "17p deletion", "del(17p)"]
-                if any(pattern.lower() in report_text.lower() for pattern in loh_patterns):
-                    parsed_data["tp53_details"]["TP53loh"] = True
-                
-                # Look for VAF patterns like "40%", "VAF 40", etc.
-                import re
-                vaf_matches = re.findall(r'(?:VAF|variant allele frequency|allele frequency)[^\d]*(\d+(?:\.\d+)?)', report_text, re.IGNORECASE)
-                if vaf_matches:
-                    try:
-                        parsed_data["tp53_details"]["TP53maxvaf"] = float(vaf_matches[0])
-                    except (ValueError, TypeError):
-                        pass  # Keep the default value
-
-        # Ensure TP53_details has all required fields
-        required_tp53_fields = {"TP53mut": "0", "TP53maxvaf": 0.0, "TP53loh": False}
-        for field, default_value in required_tp53_fields.items():
-            if field not in parsed_data["tp53_details"]:
-                print(f"⚠️ Missing {field} in tp53_details! Setting default value.")
-                parsed_data["tp53_details"][field] = default_value
-            elif parsed_data["tp53_details"][field] is None:
-                print(f"⚠️ {field} is None in tp53_details! Setting default value.")
-                parsed_data["tp53_details"][field] = default_value
-
-        # Fill missing keys from required structure
-        for key, val in required_json_structure.items():
-            if key not in parsed_data:
-                parsed_data[key] = val
-            elif isinstance(val, dict):
-                for sub_key, sub_val in val.items():
-                    if sub_key not in parsed_data[key]:
-                        parsed_data[key][sub_key] = sub_val
+    # Add prompts to the parsed data for debugging
+    parsed_data["__prompts"] = prompts
+
+    # -------------------------------------------------------
+    # Validate TP53 data and ensure it exists with proper format
+    # -------------------------------------------------------
+    # Check if tp53_details exists in the parsed data
+    if "tp53_details" not in parsed_data or not isinstance(parsed_data["tp53_details"], dict):
+        print("⚠️ tp53_details missing or not a dictionary! Creating default structure.")
+        parsed_data["tp53_details"] = {"TP53mut": "0", "TP53maxvaf": 0.0, "TP53loh": False}
+    
+    # Direct text analysis for TP53 as a fallback
+    if "tp53_details" in parsed_data and (
+        parsed_data["tp53_details"].get("TP53mut", "0") == "0" or 
+        parsed_data["tp53_details"].get("TP53maxvaf", 0) == 0
+    ):
+        # Fallback: direct text search for TP53 mutations
+        tp53_text_patterns = [
+            "TP53 mutation", "p53 mutation", "TP53 mutated", 
+            "TP53 pathogenic", "mutated TP53", "TP53 variant"
+        ]
         
-        # Prepare the data in the format expected by the IPSS-M/R calculator
-        ipssm_data = {
-            # Clinical values
-            "BM_BLAST": parsed_data["clinical_values"]["BM_BLAST"],
-            "HB": parsed_data["clinical_values"]["HB"],
-            "PLT": parsed_data["clinical_values"]["PLT"],
-            "ANC": parsed_data["clinical_values"]["ANC"],
-            "AGE": parsed_data["clinical_values"]["Age"],
-            
-            # IPSS-R cytogenetic category
-            "CYTO_IPSSR": parsed_data["cyto_category_ipssr"],
+        # Check if any TP53 patterns are in the text
+        if any(pattern.lower() in report_text.lower() for pattern in tp53_text_patterns):
+            print("⚠️ Found TP53 mutation in text but not in JSON response. Setting values manually.")
+            parsed_data["tp53_details"]["TP53mut"] = "1"
+            parsed_data["tp53_details"]["TP53maxvaf"] = 30.0  # Default VAF
             
-            # Cytogenetic abnormalities
-            "del5q": 1 if parsed_data["cytogenetics"]["del5q"] else 0,
-            "del7q": 1 if parsed_data["cytogenetics"]["del7q"] else 0,
-            "del7_minus7": 1 if parsed_data["cytogenetics"]["minus7"] else 0,
-            "del17_17p": 1 if parsed_data["cytogenetics"]["del17p"] else 0,
-            "complex": 1 if parsed_data["cytogenetics"]["karyotype_complexity"] in ["Complex (3 abnormalities)", "Very complex (>3 abnormalities)"] else 0,
+            # Look for biallelic/double mutations
+            biallelic_patterns = [
+                "biallelic", "multiple", "two TP53", "second TP53", 
+                "both allele", "both copies", "compound heterozygous"
+            ]
+            if any(pattern.lower() in report_text.lower() for pattern in biallelic_patterns):
+                parsed_data["tp53_details"]["TP53mut"] = "2"
+                parsed_data["gene_mutations"]["TP53multi"] = True
             
-            # TP53 status
-            "TP53mut": str(parsed_data["tp53_details"]["TP53mut"]),  # Ensure it's a string
-            "TP53maxvaf": try_convert_tp53_vaf(parsed_data["tp53_details"]["TP53maxvaf"]),
-            "TP53loh": "1" if parsed_data["tp53_details"]["TP53loh"] else "0",
-            "TP53multi": 1 if parsed_data["gene_mutations"].get("TP53multi", False) or str(parsed_data["tp53_details"]["TP53mut"]) == "2" else 0,
+            # Look for LOH
+            loh_patterns = ["LOH", "loss of heterozygosity", "17p deletion", "del(17p)"]
+            if any(pattern.lower() in report_text.lower() for pattern in loh_patterns):
+                parsed_data["tp53_details"]["TP53loh"] = True
             
-            # Flag to indicate if default values were used
-            "used_default_tp53_vaf": False
-        }
+            # Look for VAF patterns like "40%", "VAF 40", etc.
+            import re
+            vaf_matches = re.findall(r'(?:VAF|variant allele frequency|allele frequency)[^\d]*(\d+(?:\.\d+)?)', report_text, re.IGNORECASE)
+            if vaf_matches:
+                try:
+                    parsed_data["tp53_details"]["TP53maxvaf"] = float(vaf_matches[0])
+                except (ValueError, TypeError):
+                    pass  # Keep the default value
+
+    # Ensure TP53_details has all required fields
+    required_tp53_fields = {"TP53mut": "0", "TP53maxvaf": 0.0, "TP53loh": False}
+    for field, default_value in required_tp53_fields.items():
+        if field not in parsed_data["tp53_details"]:
+            print(f"⚠️ Missing {field} in tp53_details! Setting default value.")
+            parsed_data["tp53_details"][field] = default_value
+        elif parsed_data["tp53_details"][field] is None:
+            print(f"⚠️ {field} is None in tp53_details! Setting default value.")
+            parsed_data["tp53_details"][field] = default_value
+
+    # Fill missing keys from required structure
+    for key, val in required_json_structure.items():
+        if key not in parsed_data:
+            parsed_data[key] = val
+        elif isinstance(val, dict):
+            for sub_key, sub_val in val.items():
+                if sub_key not in parsed_data[key]:
+                    parsed_data[key][sub_key] = sub_val
+    
+    # Prepare the data in the format expected by the IPSS-M/R calculator
+    ipssm_data = {
+        # Clinical values
+        "BM_BLAST": parsed_data["clinical_values"]["BM_BLAST"],
+        "HB": parsed_data["clinical_values"]["HB"],
+        "PLT": parsed_data["clinical_values"]["PLT"],
+        "ANC": parsed_data["clinical_values"]["ANC"],
+        "AGE": parsed_data["clinical_values"]["Age"],
         
-        # Additional validation for TP53 data
-        if isinstance(ipssm_data["TP53mut"], (int, float)):
-            ipssm_data["TP53mut"] = str(int(ipssm_data["TP53mut"]))
+        # IPSS-R cytogenetic category
+        "CYTO_IPSSR": parsed_data["cyto_category_ipssr"],
         
-        # For TP53 mutations with no VAF value, use a default VAF
-        if ipssm_data["TP53mut"] in ["1", "2"] and (ipssm_data["TP53maxvaf"] == "NA" or ipssm_data["TP53maxvaf"] == 0):
-            print("⚠️ TP53 mutation present but VAF is missing or 0. Setting default value of 30.0")
-            ipssm_data["TP53maxvaf"] = 30.0  # Default value if mutation is present but VAF is missing
-            ipssm_data["used_default_tp53_vaf"] = True  # Mark that default VAF was used
-            
-        # If TP53mut isn't one of the expected values, fix it
-        if ipssm_data["TP53mut"] not in ["0", "1", "2"]:
-            print(f"⚠️ Invalid TP53mut value: {ipssm_data['TP53mut']}. Converting to appropriate string.")
-            if ipssm_data["TP53mut"] and ipssm_data["TP53mut"].lower() not in ["0", "false", "no", "none"]:
-                ipssm_data["TP53mut"] = "1"  # Any non-zero/non-false value becomes "1"
-                # Ensure we have a VAF value for this mutation
-                if not ipssm_data["TP53maxvaf"] or ipssm_data["TP53maxvaf"] == "NA":
-                    ipssm_data["TP53maxvaf"] = 30.0
-                    ipssm_data["used_default_tp53_vaf"] = True  # Mark that default VAF was used
-            else:
-                ipssm_data["TP53mut"] = "0"
-                
-        # If we have del17p and TP53 mutation, set TP53multi to 1
-        if ipssm_data["del17_17p"] == 1 and ipssm_data["TP53mut"] in ["1", "2"]:
-            ipssm_data["TP53multi"] = 1
-            ipssm_data["TP53loh"] = "1"
-            
-        # Add gene mutations
-        for gene_category in ["gene_mutations", "residual_genes"]:
-            for gene, value in parsed_data[gene_category].items():
-                if gene != "TP53multi":  # Already handled above
-                    ipssm_data[gene] = 1 if value else 0
+        # Cytogenetic abnormalities
+        "del5q": 1 if parsed_data["cytogenetics"]["del5q"] else 0,
+        "del7q": 1 if parsed_data["cytogenetics"]["del7q"] else 0,
+        "del7_minus7": 1 if parsed_data["cytogenetics"]["minus7"] else 0,
+        "del17_17p": 1 if parsed_data["cytogenetics"]["del17p"] else 0,
+        "complex": 1 if parsed_data["cytogenetics"]["karyotype_complexity"] in ["Complex (3 abnormalities)", "Very complex (>3 abnormalities)"] else 0,
         
-        # Add the prompts to the ipssm_data for debugging
-        ipssm_data["__prompts"] = parsed_data["__prompts"]
+        # TP53 status
+        "TP53mut": str(parsed_data["tp53_details"]["TP53mut"]),  # Ensure it's a string
+        "TP53maxvaf": try_convert_tp53_vaf(parsed_data["tp53_details"]["TP53maxvaf"]),
+        "TP53loh": "1" if parsed_data["tp53_details"]["TP53loh"] else "0",
+        "TP53multi": 1 if parsed_data["gene_mutations"].get("TP53multi", False) or str(parsed_data["tp53_details"]["TP53mut"]) == "2" else 0,
         
-        # Debug print
-        print("Parsed ipss Report JSON:")
-        print(json.dumps(parsed_data, indent=2))
+        # Flag to indicate if default values were used
+        "used_default_tp53_vaf": False
+    }
+    
+    # Additional validation for TP53 data
+    if isinstance(ipssm_data["TP53mut"], (int, float)):
+        ipssm_data["TP53mut"] = str(int(ipssm_data["TP53mut"]))
+    
+    # For TP53 mutations with no VAF value, use a default VAF
+    if ipssm_data["TP53mut"] in ["1", "2"] and (ipssm_data["TP53maxvaf"] == "NA" or ipssm_data["TP53maxvaf"] == 0):
+        print("⚠️ TP53 mutation present but VAF is missing or 0. Setting default value of 30.0")
+        ipssm_data["TP53maxvaf"] = 30.0  # Default value if mutation is present but VAF is missing
+        ipssm_data["used_default_tp53_vaf"] = True  # Mark that default VAF was used
         
-        # Debug TP53 data specifically
-        print("\nTP53 Data Debug:")
-        print(f"TP53 details from LLM: {json.dumps(parsed_data['tp53_details'], indent=2)}")
-        print(f"TP53multi from gene mutations: {parsed_data['gene_mutations']['TP53multi']}")
-        print(f"Final TP53 data in IPSSM format:")
-        print(f"  TP53mut: {ipssm_data['TP53mut']}")
-        print(f"  TP53maxvaf: {ipssm_data['TP53maxvaf']}")
-        print(f"  TP53loh: {ipssm_data['TP53loh']}")
-        print(f"  TP53multi: {ipssm_data['TP53multi']}")
+    # If TP53mut isn't one of the expected values, fix it
+    if ipssm_data["TP53mut"] not in ["0", "1", "2"]:
+        print(f"⚠️ Invalid TP53mut value: {ipssm_data['TP53mut']}. Converting to appropriate string.")
+        if ipssm_data["TP53mut"] and ipssm_data["TP53mut"].lower() not in ["0", "false", "no", "none"]:
+            ipssm_data["TP53mut"] = "1"  # Any non-zero/non-false value becomes "1"
+            # Ensure we have a VAF value for this mutation
+            if not ipssm_data["TP53maxvaf"] or ipssm_data["TP53maxvaf"] == "NA":
+                ipssm_data["TP53maxvaf"] = 30.0
+                ipssm_data["used_default_tp53_vaf"] = True  # Mark that default VAF was used
+        else:
+            ipssm_data["TP53mut"] = "0"
+            
+    # If we have del17p and TP53 mutation, set TP53multi to 1
+    if ipssm_data["del17_17p"] == 1 and ipssm_data["TP53mut"] in ["1", "2"]:
+        ipssm_data["TP53multi"] = 1
+        ipssm_data["TP53loh"] = "1"
+        
+    # Add gene mutations
+    for gene_category in ["gene_mutations", "residual_genes"]:
+        for gene, value in parsed_data[gene_category].items():
+            if gene != "TP53multi":  # Already handled above
+                ipssm_data[gene] = 1 if value else 0
+    
+    # Add the prompts to the ipssm_data for debugging
+    ipssm_data["__prompts"] = parsed_data["__prompts"]
+    
+    # Debug print
+    print("Parsed ipss Report JSON:")
+    print(json.dumps(parsed_data, indent=2))
+    
+    # Debug TP53 data specifically
+    print("\nTP53 Data Debug:")
+    print(f"TP53 details from LLM: {json.dumps(parsed_data['tp53_details'], indent=2)}")
+    print(f"TP53multi from gene mutations: {parsed_data['gene_mutations']['TP53multi']}")
+    print(f"Final TP53 data in IPSSM format:")
+    print(f"  TP53mut: {ipssm_data['TP53mut']}")
+    print(f"  TP53maxvaf: {ipssm_data['TP53maxvaf']}")
+    print(f"  TP53loh: {ipssm_data['TP53loh']}")
+    print(f"  TP53multi: {ipssm_data['TP53multi']}")
+    
+    return ipssm_data
+
+
+def parse_ipss_report(report_text: str) -> dict:
+    """
+    Sends the free-text haematological report to OpenAI to extract values 
+    needed for IPSS-M and IPSS-R risk classification.
+    
+    Extracts:
+    1) Clinical values - Hemoglobin, Platelet count, ANC, bone marrow blasts, age
+    2) Cytogenetic information - del5q, del7q, etc., karyotype complexity
+    3) TP53 mutation status
+    4) Gene mutations relevant for IPSS-M
+    
+    Returns:
+        dict: A dictionary containing all fields needed for IPSS-M/R classification
+    """
+    # Safety check: if user typed nothing, return empty.
+    if not report_text.strip():
+        st.warning("Empty report text received.")
+        return {}
         
-        return ipssm_data
+    required_json_structure, prompts = _build_ipss_prompts(report_text)
 
+    try:
+        # Structured karyotype/NGS data is read locally; the remaining prompts run
+        # concurrently on the shared extraction engine.
+        results = run_sync(extract_unresolved_prompts(
+            prompts, pre_extract_ipss_sections(report_text), SYSTEM_MESSAGE, group="ipss_parser",
+            schemas=_build_ipss_schemas(required_json_structure),
+        ), job_name="parse_ipss_report")
+        return _merge_ipss_results(results, prompts, required_json_structure, report_text)
+
+    except ExtractionCancelled:
+        print("⚠️ IPSS report parsing cancelled.")
+        return {}
     except json.JSONDecodeError:
         st.error("❌ Failed to parse AI response into JSON. Ensure the report is well-formatted.")
         print("❌ JSONDecodeError: Could not parse AI JSON response.")
         return {}
+    except StructuredOutputError as e:
+        st.error(f"❌ The AI response for '{e.name}' did not match the expected structure. "
+                 "The other sections are cached, so re-running only repeats this one.")
+        print(f"❌ {e}")
+        return {}
     except Exception as e:
         st.error(f"❌ Error communicating with OpenAI: {str(e)}")
         print(f"❌ Exception: {str(e)}")
-        return {} 
\ No newline at end of file
+        return {} 
+
+
+async def parse_ipss_report_async(report_text: str) -> dict:
+    """
+    Awaitable version of parse_ipss_report for callers already running an
+    event loop. Errors are raised to the caller instead of being shown in the UI.
+    """
+    if not report_text.strip():
+        return {}
+    required_json_structure, prompts = _build_ipss_prompts(report_text)
+    results = await extract_unresolved_prompts(prompts, pre_extract_ipss_sections(report_text), SYSTEM_MESSAGE,
+                                               group="ipss_parser", schemas=_build_ipss_schemas(required_json_structure))
+    return _merge_ipss_results(results, prompts, required_json_structure, report_text)
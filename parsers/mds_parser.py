@@ -1,11 +1,12 @@
 import streamlit as st
 import json
-from openai import OpenAI
+from utils.llm_client import LazyOpenAIClient
+from utils.llm_metrics import tracked_completion
 
 ##############################
 # OPENAI API CONFIG
 ##############################
-client = OpenAI(api_key=st.secrets["openai"]["api_key"])
+client = LazyOpenAIClient()
 
 
 ##############################
@@ -89,11 +90,8 @@ def parse_genetics_report_mds(report_text: str) -> dict:
     {report_text}
     """
 
-    # Replace `YOUR_OPENAI_API_KEY` or use st.secrets as appropriate
-    client = OpenAI(api_key=st.secrets["openai"]["api_key"])
-    
     try:
-        response = client.chat.completions.create(
+        response = tracked_completion(client, "mds_parser",
             model="gpt-4",  # or whichever model you prefer
             messages=[
                 {"role": "system", "content": "You are a helpful medical AI that returns valid JSON."},
@@ -0,0 +1,605 @@
+"""
+Rule-based pre-extraction for the structured parts of a report.
+
+Many lab reports carry an ISCN karyotype string (e.g. ``46,XY,del(5)(q13q33)[20]``)
+and an NGS variant table with VAFs. Those parts can be read locally with a few
+compiled regexes and a small ISCN grammar, so the matching LLM prompts in
+``aml_parser`` and ``mds_ipss_parser`` can be skipped.
+
+The rules are deliberately conservative. A prompt section is only resolved
+locally when every field in it is determined by the structured data. Any
+ambiguity leaves the section to the LLM. Examples of ambiguity:
+
+- FISH or array results next to the karyotype
+- a gene mentioned in free prose rather than a variant row or a negative result
+- a VUS
+- an LOH remark
+- a karyotype string that does not fully parse
+- a failed or insufficient culture
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Set
+
+##############################
+# GENE LISTS
+##############################
+AML_MDS_RELATED_GENES = [
+    "ASXL1", "BCOR", "EZH2", "RUNX1", "SF3B1", "SRSF2", "STAG2", "U2AF1", "ZRSR2", "UBA1", "JAK2",
+]
+IPSSM_MAIN_GENES = [
+    "ASXL1", "RUNX1", "SF3B1", "EZH2", "SRSF2", "U2AF1", "DNMT3A", "MLL_PTD", "FLT3", "CBL",
+    "NRAS", "IDH2", "KRAS", "NPM1", "ETV6",
+]
+IPSSM_RESIDUAL_GENES = [
+    "BCOR", "BCORL1", "CEBPA", "ETNK1", "GATA2", "GNB1", "IDH1", "NF1", "PHF6", "PPM1D",
+    "PRPF8", "PTPN11", "SETBP1", "STAG2", "WT1",
+]
+ALL_GENES = sorted(set(AML_MDS_RELATED_GENES + IPSSM_MAIN_GENES + IPSSM_RESIDUAL_GENES + ["TP53"]))
+
+##############################
+# ISCN GRAMMAR
+##############################
+_COUNT = r"\d{2,3}(?:~\d{2,3})?(?:<\d?n>)?"
+_SEX = r"(?:[XY]{1,4}|idem|sl|sdl\d*)"
+_STRUCTURAL = r"(?:del|add|dup|inv|ins|idic|ider|i|der|dic|t|r|trp|hsr)"
+_ABNORMALITY = (
+    rf"(?:[+\-](?:\d{{1,2}}|[XY])c?"
+    rf"|[+\-]?{_STRUCTURAL}\([^()\s,]+\)(?:\([^()\s,]+\))?c?"
+    rf"|\+?\d*~?\d*mar\d*|\+?dmin|idem|sl|sdl\d*)"
+)
+_CELLS = r"\[\d+\]"
+# ISCN strings have no spaces around commas; "aged 46, XY male" is not a karyotype.
+_CLONE = rf"{_COUNT},{_SEX}(?:,{_ABNORMALITY})*\s*(?:{_CELLS})?"
+
+KARYOTYPE_RE = re.compile(rf"(?<![\w.~]){_CLONE}(?:\s*/{{1,2}}\s*{_CLONE})*")
+_CLONE_SPLIT_RE = re.compile(r"\s*/{1,2}\s*")
+# Without a "[n]" cell count, "46,XY" only counts as a karyotype under a cytogenetics
+# label on its own or the previous line ("The patient is a 46,XY male" is not one).
+_KARYOTYPE_CONTEXT_RE = re.compile(
+    r"karyotyp|cytogenetic|\bISCN\b|metaphase|G-band|chromosom", re.IGNORECASE
+)
+_ABNORMALITY_RE = re.compile(rf"^{_ABNORMALITY}$")
+_NUMERICAL_RE = re.compile(r"^([+\-])(\d{1,2}|X|Y)(c?)$")
+_STRUCTURAL_RE = re.compile(rf"^([+\-]?)({_STRUCTURAL})\(([^()]+)\)(?:\(([^()]+)\))?(c?)$")
+_CHROMOSOME_RE = re.compile(r"^(\d{1,2}|X|Y)([pq])?")
+_INCOMPLETE_RE = re.compile(r"^\s*(?:,\s*\S|/|\()")
+
+# Unbalanced rearrangements imply losses/gains that are not spelled out in the string.
+_UNBALANCED_KINDS = {"der", "dic", "ider", "r", "ins", "hsr"}
+
+# Other cytogenetic techniques can add findings the karyotype does not show.
+_CYTO_AMBIGUITY_RE = re.compile(
+    r"\bFISH\b|\bnuc\s+ish\b|\bSNP\b|microarray|array[- ]CGH|\bCNV\b|copy[- ]number|optical genome",
+    re.IGNORECASE,
+)
+
+# A failed or inadequate culture means any karyotype in the text is not this sample's result.
+_CULTURE_FAILURE_RE = re.compile(
+    r"\bfail(?:ed|ure)\b|no (?:analysable |analyzable |evaluable )?metaphases|insufficient"
+    r"|inadequate|unsuccessful|no growth",
+    re.IGNORECASE,
+)
+
+##############################
+# NGS PATTERNS
+##############################
+_HGVS_RE = re.compile(r"\b[cpg]\.\(?[A-Za-z0-9_*+\->]+\)?")
+_VARIANT_TYPE_RE = re.compile(r"\b(?:ITD|TKD|PTD)\b")
+_VAF_RE = re.compile(
+    r"(?:VAF|variant allele (?:frequency|fraction)|allele (?:frequency|fraction))\s*[:=]?\s*(?:of\s*)?"
+    r"(\d+(?:\.\d+)?)\s*(%?)"
+    r"|(\d+(?:\.\d+)?)\s*%",
+    re.IGNORECASE,
+)
+_NEGATIVE_RE = re.compile(
+    r"not detected|negative|no (?:pathogenic |clinically significant )?(?:mutations?|variants?)"
+    r"|wild[- ]?type|\bWT\b|absent|none detected|no evidence",
+    re.IGNORECASE,
+)
+_UNCERTAIN_RE = re.compile(
+    r"\bVUS\b|uncertain significance|likely benign|\bbenign\b|polymorphism|germline|subclonal|equivocal",
+    re.IGNORECASE,
+)
+_LOH_RE = re.compile(
+    r"\bLOH\b|loss of heterozygosity|copy[- ]neutral|\bCN-?LOH\b|\bUPD\b|uniparental",
+    re.IGNORECASE,
+)
+_MULTI_HIT_RE = re.compile(
+    r"biallelic|bi-allelic|multi-?hit|compound heterozygous"
+    r"|\b(?:two|2|multiple|several)\s+(?:\w+\s+)?(?:mutations|variants|hits)\b",
+    re.IGNORECASE,
+)
+_P53_RE = re.compile(r"(?<![\w])p53\b", re.IGNORECASE)
+_FUSION_RE = re.compile(r"\b[A-Z0-9]{2,}(?:::|-)(?!ITD\b|TKD\b|PTD\b)[A-Z0-9]{2,}\b")
+_FRAGMENT_SPLIT_RE = re.compile(r"\n|;|(?<=[.!?])\s+(?=[A-Z])")
+# Negative results are often listed in one sentence ("NPM1 mutated, FLT3-ITD not detected").
+_RESULT_SPLIT_RE = re.compile(rf",|{_FRAGMENT_SPLIT_RE.pattern}")
+_GENE_RES = {
+    gene: re.compile(rf"(?<![\w]){re.escape(gene)}(?![\w])")
+    for gene in ALL_GENES if gene != "MLL_PTD"
+}
+_MLL_PTD_RE = re.compile(r"(?<![\w])(?:KMT2A|MLL)[-\s]?PTD\b", re.IGNORECASE)
+
+
+##############################
+# KARYOTYPE
+##############################
+def _parse_abnormality(token: str) -> Optional[dict]:
+    """Parses one ISCN abnormality into kind, chromosomes, arms and bands."""
+    token = token.strip()
+    numerical = _NUMERICAL_RE.match(token)
+    if numerical:
+        sign, chromosome, constitutional = numerical.groups()
+        return {
+            "text": token,
+            "kind": "gain" if sign == "+" else "loss",
+            "chromosomes": [chromosome],
+            "arms": [None],
+            "bands": [],
+            "constitutional": bool(constitutional),
+        }
+
+    structural = _STRUCTURAL_RE.match(token)
+    if structural:
+        _, kind, chromosome_part, band_part, constitutional = structural.groups()
+        chromosomes, arms = [], []
+        for chromosome_text in chromosome_part.split(";"):
+            chromosome = _CHROMOSOME_RE.match(chromosome_text.strip())
+            if not chromosome:
+                return None
+            chromosomes.append(chromosome.group(1))
+            arms.append(chromosome.group(2))
+        bands = band_part.split(";") if band_part else []
+        # The arm of each breakpoint comes from its band, e.g. del(5)(q13q33) -> q.
+        for index, band in enumerate(bands[:len(arms)]):
+            if arms[index] is None and band[:1] in ("p", "q"):
+                arms[index] = band[0]
+        # A deletion/addition/duplication without an arm cannot be mapped to a flag.
+        if kind in ("del", "add", "dup") and None in arms:
+            return None
+        return {
+            "text": token,
+            "kind": kind,
+            "chromosomes": chromosomes,
+            "arms": arms,
+            "bands": bands,
+            "constitutional": bool(constitutional),
+        }
+
+    if "mar" in token or "dmin" in token:
+        return {"text": token, "kind": "marker", "chromosomes": [], "arms": [], "bands": [],
+                "constitutional": False}
+    return None
+
+
+def _karyotype_context(report_text: str, position: int) -> bool:
+    """True when the line holding ``position`` or the line before it names cytogenetics."""
+    line_start = report_text.rfind("\n", 0, position)
+    previous_line_start = report_text.rfind("\n", 0, max(line_start, 0)) + 1
+    return bool(_KARYOTYPE_CONTEXT_RE.search(report_text[previous_line_start:position]))
+
+
+def parse_iscn_karyotype(report_text: str) -> Optional[dict]:
+    """
+    Finds and parses the ISCN karyotype string(s) in a report.
+
+    Returns:
+        dict: {"karyotypes": [...], "abnormalities": [...], "abnormality_count": int}
+        or None when there is no karyotype or one of them does not fully parse.
+    """
+    karyotypes = []
+    abnormalities: Dict[str, dict] = {}
+
+    for match in KARYOTYPE_RE.finditer(report_text):
+        if not re.search(_CELLS, match.group(0)) and not _karyotype_context(report_text, match.start()):
+            continue
+        # A match that stops before a further ",token" or "/clone" means part of
+        # the karyotype was not understood.
+        if _INCOMPLETE_RE.match(report_text[match.end():]):
+            return None
+        karyotype = match.group(0).strip()
+        karyotypes.append(karyotype)
+
+        for clone in _CLONE_SPLIT_RE.split(karyotype):
+            clone = re.sub(_CELLS, "", clone)
+            tokens = [t.strip() for t in clone.split(",")]
+            for token in tokens[2:]:
+                if token in ("idem", "sl") or token.startswith("sdl"):
+                    continue
+                if not _ABNORMALITY_RE.match(token):
+                    return None
+                abnormality = _parse_abnormality(token)
+                if abnormality is None:
+                    return None
+                if not abnormality["constitutional"]:
+                    abnormalities.setdefault(token, abnormality)
+
+    if not karyotypes:
+        return None
+    return {
+        "karyotypes": karyotypes,
+        "abnormalities": list(abnormalities.values()),
+        "abnormality_count": len(abnormalities),
+    }
+
+
+def _has(abnormalities: List[dict], kind: str, chromosome: str, arm: Optional[str] = None) -> bool:
+    for abnormality in abnormalities:
+        if abnormality["kind"] != kind:
+            continue
+        for chrom, chrom_arm in zip(abnormality["chromosomes"], abnormality["arms"]):
+            if chrom == chromosome and (arm is None or chrom_arm == arm):
+                return True
+    return False
+
+
+def _inv3_or_t33(abnormalities: List[dict]) -> bool:
+    return any(
+        (a["kind"] == "inv" and a["chromosomes"] == ["3"])
+        or (a["kind"] == "t" and a["chromosomes"] == ["3", "3"])
+        for a in abnormalities
+    )
+
+
+def derive_cytogenetic_flags(karyotype: dict) -> dict:
+    """Derives the boolean cytogenetic findings both parsers ask for from a parsed karyotype."""
+    abn = karyotype["abnormalities"]
+    return {
+        "count": karyotype["abnormality_count"],
+        "del_5q": _has(abn, "del", "5", "q"),
+        "t_5q": _has(abn, "t", "5", "q"),
+        "add_5q": _has(abn, "add", "5", "q"),
+        "minus_5": _has(abn, "loss", "5"),
+        "minus_7": _has(abn, "loss", "7"),
+        "del_7q": _has(abn, "del", "7", "q"),
+        "plus_8": _has(abn, "gain", "8"),
+        "del_9q": _has(abn, "del", "9", "q"),
+        "del_11q": _has(abn, "del", "11", "q"),
+        "del_12p": _has(abn, "del", "12", "p"),
+        "t_12p": _has(abn, "t", "12", "p"),
+        "add_12p": _has(abn, "add", "12", "p"),
+        "del_13q": _has(abn, "del", "13", "q"),
+        "minus_13": _has(abn, "loss", "13"),
+        "i_17q": _has(abn, "i", "17", "q"),
+        "minus_17": _has(abn, "loss", "17"),
+        "add_17p": _has(abn, "add", "17", "p"),
+        "del_17p": _has(abn, "del", "17", "p"),
+        "plus_19": _has(abn, "gain", "19"),
+        "del_20q": _has(abn, "del", "20", "q"),
+        "plus_21": _has(abn, "gain", "21"),
+        "minus_Y": _has(abn, "loss", "Y"),
+        "idic_X_q13": any(
+            a["kind"] == "idic" and a["chromosomes"] == ["X"] and any(b.startswith("q13") for b in a["bands"])
+            for a in abn
+        ),
+        "t_1q": _has(abn, "t", "1", "q"),
+        "t_3q": _has(abn, "t", "3", "q"),
+        "del_3q": _has(abn, "del", "3", "q"),
+        "inv_3": _has(abn, "inv", "3"),
+        "inv3_t33": _inv3_or_t33(abn),
+    }
+
+
+def _karyotype_complexity(count: int) -> str:
+    if count > 3:
+        return "Very complex (>3 abnormalities)"
+    if count == 3:
+        return "Complex (3 abnormalities)"
+    return "Normal"
+
+
+def resolve_cytogenetics(report_text: str) -> Optional[dict]:
+    """Returns the derived cytogenetic flags, or None when they cannot be trusted locally."""
+    if _CYTO_AMBIGUITY_RE.search(report_text) or _CULTURE_FAILURE_RE.search(report_text):
+        return None
+    karyotype = parse_iscn_karyotype(report_text)
+    if karyotype is None:
+        return None
+    if any(a["kind"] in _UNBALANCED_KINDS for a in karyotype["abnormalities"]):
+        return None
+    return derive_cytogenetic_flags(karyotype)
+
+
+##############################
+# IPSS-R CYTOGENETIC RISK
+##############################
+# Greenberg et al., 2012. The mds_ipss_parser prompt lists these same rules, so the
+# LLM and ipssr_cytogenetic_category() categorise a karyotype the same way.
+IPSSR_CYTOGENETIC_RULES = [
+    ("Very Good", "-Y or del(11q) as the only abnormality"),
+    ("Good", "normal karyotype; del(5q), del(12p) or del(20q) as the only abnormality; "
+             "two abnormalities including del(5q), unless the other one is -7 or del(7q)"),
+    ("Intermediate", "del(7q), +8, +19, i(17q) or any other single abnormality not listed here; "
+                     "any other two abnormalities"),
+    ("Poor", "-7, inv(3), t(3q) or del(3q) as the only abnormality; two abnormalities including "
+             "-7 or del(7q); complex karyotype with 3 abnormalities"),
+    ("Very Poor", "complex karyotype with more than 3 abnormalities"),
+]
+IPSSR_CYTO_CATEGORIES = [category for category, _ in IPSSR_CYTOGENETIC_RULES]
+
+
+def ipssr_criteria_text() -> str:
+    """The IPSS-R cytogenetic rules as the bullet list the prompts show the model."""
+    return "\n".join(f"- {category}: {rule}" for category, rule in IPSSR_CYTOGENETIC_RULES)
+
+
+def ipssr_cytogenetic_category(flags: dict) -> str:
+    """IPSS-R cytogenetic risk group from the derived flags, following IPSSR_CYTOGENETIC_RULES."""
+    count = flags["count"]
+    if count == 0:
+        return "Good"
+    if count > 3:
+        return "Very Poor"
+    if count == 3:
+        return "Poor"
+
+    if count == 1:
+        if flags["minus_Y"] or flags["del_11q"]:
+            return "Very Good"
+        if flags["del_5q"] or flags["del_12p"] or flags["del_20q"]:
+            return "Good"
+        if flags["minus_7"] or flags["inv_3"] or flags["t_3q"] or flags["inv3_t33"] or flags["del_3q"]:
+            return "Poor"
+        return "Intermediate"
+
+    # Two abnormalities
+    if flags["minus_7"] or flags["del_7q"]:
+        return "Poor"
+    if flags["del_5q"]:
+        return "Good"
+    return "Intermediate"
+
+
+##############################
+# NGS VARIANTS
+##############################
+def _parse_vafs(fragment: str) -> List[float]:
+    vafs = []
+    for match in _VAF_RE.finditer(fragment):
+        if match.group(1) is not None:
+            value = float(match.group(1))
+            # "VAF 0.45" without a percent sign is a fraction.
+            if not match.group(2) and value <= 1.0:
+                value *= 100
+            vafs.append(value)
+        else:
+            vafs.append(float(match.group(3)))
+    return vafs
+
+
+def _fragment_variant(fragment: str) -> dict:
+    """
+    The one variant a single-gene fragment describes, or {"hgvs": None, "vaf": None} when
+    it lists several ("c.817C>T (VAF 35%) and c.743G>A (VAF 30%)") that cannot be told apart.
+    """
+    notations = [match.group(0) for match in _HGVS_RE.finditer(fragment)]
+    vafs = _parse_vafs(fragment)
+    # One variant is often written in both notations ("c.818G>A p.R273H"), but never twice in one.
+    prefixes = [notation[0] for notation in notations]
+    if len(vafs) > 1 or len(prefixes) != len(set(prefixes)):
+        return {"hgvs": None, "vaf": None}
+    return {
+        "hgvs": notations[0] if notations else _VARIANT_TYPE_RE.search(fragment).group(0),
+        "vaf": vafs[0] if vafs else None,
+    }
+
+
+def resolve_genes(report_text: str) -> Dict[str, dict]:
+    """
+    Classifies every gene of interest from variant rows and negative statements.
+
+    Returns:
+        dict: gene -> {"status": True/False/None, "variants": [{"hgvs": ..., "vaf": ...}]}
+              where None means the gene could not be resolved without the LLM.
+    """
+    genes = {gene: {"status": False, "variants": [], "mentioned": False} for gene in ALL_GENES}
+
+    for fragment in _FRAGMENT_SPLIT_RE.split(report_text):
+        if not fragment.strip():
+            continue
+        # Fusion partners (RUNX1::RUNX1T1, CBFB-MYH11) are not point mutations.
+        scrubbed = _FUSION_RE.sub(" ", fragment)
+        present = [gene for gene, pattern in _GENE_RES.items() if pattern.search(scrubbed)]
+        if _MLL_PTD_RE.search(fragment):
+            present.append("MLL_PTD")
+        if not present:
+            continue
+
+        is_variant = bool(_HGVS_RE.search(scrubbed) or _VARIANT_TYPE_RE.search(scrubbed))
+        is_negative = bool(_NEGATIVE_RE.search(scrubbed))
+        is_uncertain = bool(_UNCERTAIN_RE.search(scrubbed))
+
+        for gene in present:
+            entry = genes[gene]
+            entry["mentioned"] = True
+            if entry["status"] is None:
+                continue
+            if is_uncertain or (is_variant and is_negative):
+                entry["status"] = None
+            elif is_variant:
+                if len(present) > 1:
+                    # Several genes in one fragment: positive, but the VAF cannot be attributed.
+                    entry["status"] = True
+                    entry["variants"].append({"hgvs": None, "vaf": None})
+                else:
+                    entry["status"] = True
+                    entry["variants"].append(_fragment_variant(scrubbed))
+            elif is_negative:
+                if entry["status"] is True:
+                    entry["status"] = None
+            else:
+                # Mentioned in prose we cannot interpret with certainty.
+                entry["status"] = None
+
+    # A gene that is never mentioned is false, exactly as the prompts instruct. Callers
+    # only rely on that when the report contains sequencing results at all.
+    return genes
+
+
+def _marker_pattern(marker: str) -> re.Pattern:
+    """Matches a marker written with any separator, e.g. FLT3_ITD -> "FLT3-ITD", "FLT3 ITD"."""
+    parts = [re.escape(part) for part in re.split(r"[\s_:\-]+", marker) if part]
+    return re.compile(r"(?<![\w])" + r"[\s_:-]*".join(parts) + r"(?![\w]|[-_:]\w)", re.IGNORECASE)
+
+
+def reported_negative(report_text: str, markers: Iterable[str]) -> Set[str]:
+    """
+    The markers the report explicitly states were tested negative, e.g. "FLT3-ITD: not
+    detected" or "negative for NPM1". A marker that is simply not mentioned is not negative.
+    """
+    negative = set()
+    patterns = {marker: _marker_pattern(marker) for marker in markers}
+    for fragment in _RESULT_SPLIT_RE.split(report_text or ""):
+        if not fragment or not _NEGATIVE_RE.search(fragment) or _UNCERTAIN_RE.search(fragment) \
+                or _HGVS_RE.search(fragment):
+            continue
+        negative.update(marker for marker, pattern in patterns.items() if pattern.search(fragment))
+    return negative
+
+
+def _sequencing_reported(genes: Dict[str, dict]) -> bool:
+    """True when the report has any variant row or negative gene result at all."""
+    return any(entry["mentioned"] for entry in genes.values())
+
+
+def _tp53_summary(genes: Dict[str, dict], cytogenetics: Optional[dict], report_text: str) -> Optional[dict]:
+    """Summarises TP53 hits, or None when the TP53 fields need the LLM."""
+    tp53 = genes["TP53"]
+    if not _sequencing_reported(genes) or tp53["status"] is None or _MULTI_HIT_RE.search(report_text):
+        return None
+    if not tp53["mentioned"] and _P53_RE.search(report_text):
+        return None
+    if tp53["status"] is False:
+        return {"count": 0, "max_vaf": 0.0, "loh": False, "del_17p": False, "mentioned": tp53["mentioned"]}
+
+    if _LOH_RE.search(report_text) or cytogenetics is None:
+        return None
+    distinct = {v["hgvs"] for v in tp53["variants"]}
+    vafs = [v["vaf"] for v in tp53["variants"]]
+    if None in distinct or None in vafs:
+        return None
+    return {
+        "count": len(distinct),
+        "max_vaf": max(vafs),
+        "loh": False,
+        "del_17p": cytogenetics["del_17p"],
+        "mentioned": True,
+    }
+
+
+##############################
+# SECTION RESOLUTION
+##############################
+def pre_extract_aml_sections(report_text: str) -> Dict[str, dict]:
+    """
+    Resolves whole aml_parser prompt sections locally.
+
+    Returns:
+        dict: prompt name -> the JSON that prompt would return, for resolved prompts only.
+    """
+    resolved = {}
+    cytogenetics = resolve_cytogenetics(report_text)
+    genes = resolve_genes(report_text)
+
+    tp53 = _tp53_summary(genes, cytogenetics, report_text)
+    if tp53 is not None:
+        single = tp53["count"] == 1
+        resolved["first_prompt_2b"] = {
+            "Biallelic_TP53_mutation": {
+                "tp53_mentioned": tp53["mentioned"],
+                "2_x_TP53_mutations": tp53["count"] >= 2,
+                "1_x_TP53_mutation_del_17p": single and tp53["del_17p"],
+                "1_x_TP53_mutation_LOH": False,
+                "1_x_TP53_mutation_10_percent_vaf": single and tp53["max_vaf"] >= 10,
+                "1_x_TP53_mutation_50_percent_vaf": single and tp53["max_vaf"] >= 50,
+            }
+        }
+
+    mds_genes = {gene: genes[gene]["status"] for gene in AML_MDS_RELATED_GENES}
+    if cytogenetics is not None and _sequencing_reported(genes) and None not in mds_genes.values():
+        resolved["first_prompt_2c"] = {
+            "MDS_related_mutation": mds_genes,
+            "MDS_related_cytogenetics": {
+                "Complex_karyotype": cytogenetics["count"] >= 3,
+                "del_5q": cytogenetics["del_5q"],
+                "t_5q": cytogenetics["t_5q"],
+                "add_5q": cytogenetics["add_5q"],
+                "-7": cytogenetics["minus_7"],
+                "del_7q": cytogenetics["del_7q"],
+                "+8": cytogenetics["plus_8"],
+                "del_11q": cytogenetics["del_11q"],
+                "del_12p": cytogenetics["del_12p"],
+                "t_12p": cytogenetics["t_12p"],
+                "add_12p": cytogenetics["add_12p"],
+                "-13": cytogenetics["minus_13"],
+                "i_17q": cytogenetics["i_17q"],
+                "-17": cytogenetics["minus_17"],
+                "add_17p": cytogenetics["add_17p"],
+                "del_17p": cytogenetics["del_17p"],
+                "del_20q": cytogenetics["del_20q"],
+                "idic_X_q13": cytogenetics["idic_X_q13"],
+                "inv3_t33": cytogenetics["inv3_t33"],
+            },
+        }
+    return resolved
+
+
+def pre_extract_ipss_sections(report_text: str) -> Dict[str, dict]:
+    """
+    Resolves whole mds_ipss_parser prompt sections locally.
+
+    Returns:
+        dict: prompt name -> the JSON that prompt would return, for resolved prompts only.
+    """
+    resolved = {}
+    cytogenetics = resolve_cytogenetics(report_text)
+    genes = resolve_genes(report_text)
+
+    if cytogenetics is not None:
+        resolved["cytogenetics_prompt"] = {
+            "cytogenetics": {
+                "del5q": cytogenetics["del_5q"],
+                "del7q": cytogenetics["del_7q"],
+                "minus7": cytogenetics["minus_7"],
+                "del17p": cytogenetics["del_17p"],
+                "minus17": cytogenetics["minus_17"],
+                "plus8": cytogenetics["plus_8"],
+                "plus19": cytogenetics["plus_19"],
+                "del13q": cytogenetics["del_13q"],
+                "del11q": cytogenetics["del_11q"],
+                "del9q": cytogenetics["del_9q"],
+                "del20q": cytogenetics["del_20q"],
+                "delY": cytogenetics["minus_Y"],
+                "i17q": cytogenetics["i_17q"],
+                "plus21": cytogenetics["plus_21"],
+                "t3q": cytogenetics["t_3q"],
+                "t5q": cytogenetics["t_5q"],
+                "minus13": cytogenetics["minus_13"],
+                "minus5": cytogenetics["minus_5"],
+                "t1q": cytogenetics["t_1q"],
+                "inv3": cytogenetics["inv_3"],
+                "t3q_GATA2": cytogenetics["inv3_t33"],
+                "karyotype_complexity": _karyotype_complexity(cytogenetics["count"]),
+            },
+            "cyto_category_ipssr": ipssr_cytogenetic_category(cytogenetics),
+        }
+
+    tp53 = _tp53_summary(genes, cytogenetics, report_text)
+    if tp53 is not None:
+        resolved["tp53_prompt"] = {
+            "tp53_details": {
+                "TP53mut": str(min(tp53["count"], 2)),
+                "TP53maxvaf": float(tp53["max_vaf"]),
+                "TP53loh": False,
+            }
+        }
+
+    main = {gene: genes[gene]["status"] for gene in IPSSM_MAIN_GENES}
+    residual = {gene: genes[gene]["status"] for gene in IPSSM_RESIDUAL_GENES}
+    if tp53 is not None and None not in main.values() and None not in residual.values():
+        main["TP53multi"] = tp53["count"] >= 2 or (
+            tp53["count"] == 1 and (tp53["del_17p"] or tp53["max_vaf"] > 50)
+        )
+        resolved["genes_prompt"] = {"gene_mutations": main, "residual_genes": residual}
+    return resolved
@@ -5,51 +5,45 @@ Based on the consensus guideline approach by Tom Coats et al.
 """
 
 import streamlit as st
-import json
-import concurrent.futures
-from openai import OpenAI
+from utils.llm_client import LazyOpenAIClient
+from utils.llm_cache import cached_json_completion
+from utils.extraction_engine import ExtractionCancelled, extract_prompts, run_sync
+from utils.prompt_layout import EXTRACTION_SYSTEM_MESSAGE, report_first_prompt
+from utils.structured_output import (
+    BOOLEAN_OR_NULL, DYSPLASTIC_LINEAGES_OR_NULL, PERCENTAGE_OR_NULL, section_schemas
+)
 
 ##############################
 # OPENAI API CONFIG
 ##############################
-client = OpenAI(api_key=st.secrets["openai"]["api_key"])
+client = LazyOpenAIClient()
+
+SYSTEM_MESSAGE = EXTRACTION_SYSTEM_MESSAGE
+
+# Top-level keys of the required structure that each prompt returns
+TREATMENT_PROMPT_FIELDS = {
+    "qualifiers_prompt": ("qualifiers",),
+    "flow_prompt": ("cd33_positive", "cd33_percentage"),
+    "genetics_prompt": ("AML_defining_recurrent_genetic_abnormalities",),
+    "mds_prompt": ("MDS_related_mutation", "MDS_related_cytogenetics"),
+    "morphology_prompt": ("number_of_dysplastic_lineages", "no_cytogenetics_data"),
+}
 
 def get_json_from_prompt(prompt: str) -> dict:
-    """Helper function to call OpenAI and return the JSON-parsed response."""
-    response = client.chat.completions.create(
+    """Helper function to call OpenAI and return the JSON-parsed response (served from the shared cache when possible)."""
+    return cached_json_completion(
+        client,
         model="o3-mini",
-        messages=[
-            {"role": "system", "content": "You are a knowledgeable haematologist who returns valid JSON for treatment planning."},
-            {"role": "user", "content": prompt}
-        ]
+        system_message=SYSTEM_MESSAGE,
+        prompt=prompt,
+        metrics_name="treatment_parser.get_json_from_prompt"
     )
-    raw = response.choices[0].message.content.strip()
-    return json.loads(raw)
 
-def parse_treatment_data(report_text: str) -> dict:
+def _build_treatment_prompts(report_text: str):
     """
-    Extracts data fields required for AML treatment recommendations from medical reports.
-    
-    Uses parallel OpenAI prompts to extract:
-    1) Patient qualifiers and clinical history
-    2) Flow cytometry data (CD33 status)
-    3) AML-defining recurrent genetic abnormalities
-    4) MDS-related mutations
-    5) MDS-related cytogenetics
-    6) Morphologic features (dysplastic lineages)
-    7) Cytogenetic data availability
-    
-    Args:
-        report_text (str): Free-text medical report
-        
-    Returns:
-        dict: Structured data for treatment algorithm
+    Builds the required structure and the named extraction prompts for one report.
+    The prompts are returned in merge order.
     """
-    # Safety check
-    if not report_text.strip():
-        st.warning("Empty report text received.")
-        return {}
-
     # Required structure for treatment algorithm
     required_structure = {
         "qualifiers": {
@@ -105,11 +99,11 @@ def parse_treatment_data(report_text: str) -> dict:
     }
 
     # Define prompts
-    qualifiers_prompt = f"""
-Extract clinical history and qualifiers from this haematological report.
+    qualifiers_prompt = report_first_prompt(report_text, """
+Extract clinical history and qualifiers from the report.
 Return JSON with boolean values for each field:
 
-"qualifiers": {{
+"qualifiers": {
     "therapy_related": false,           # True if AML is therapy-related
     "previous_chemotherapy": false,     # True if prior chemotherapy mentioned
     "previous_radiotherapy": false,     # True if prior radiation mentioned
@@ -120,26 +114,22 @@ Return JSON with boolean values for each field:
     "relapsed": false,                  # True if relapsed AML
     "refractory": false,                # True if refractory AML
     "secondary": false                  # True if secondary AML
-}}
+}
+""")
 
-Report: {report_text}
-    """
-
-    flow_prompt = f"""
-Extract CD33 flow cytometry data from this report.
+    flow_prompt = report_first_prompt(report_text, """
+Extract CD33 flow cytometry data from the report.
 Return JSON:
 
 "cd33_positive": null,      # true/false/null
 "cd33_percentage": null     # 0-100 or null
+""")
 
-Report: {report_text}
-    """
-
-    genetics_prompt = f"""
-Extract AML-defining genetic abnormalities from this report.
+    genetics_prompt = report_first_prompt(report_text, """
+Extract AML-defining genetic abnormalities from the report.
 Return JSON:
 
-"AML_defining_recurrent_genetic_abnormalities": {{
+"AML_defining_recurrent_genetic_abnormalities": {
     "RUNX1_RUNX1T1": false,    # t(8;21) or RUNX1-RUNX1T1
     "t_8_21": false,           # t(8;21)
     "CBFB_MYH11": false,       # inv(16) or CBFB-MYH11
@@ -149,16 +139,14 @@ Return JSON:
     "FLT3_ITD": false,         # FLT3-ITD
     "FLT3_TKD": false,         # FLT3-TKD
     "PML_RARA": false          # PML-RARA (APL)
-}}
+}
+""")
 
-Report: {report_text}
-    """
-
-    mds_prompt = f"""
-Extract MDS-related mutations and cytogenetics from this report.
+    mds_prompt = report_first_prompt(report_text, """
+Extract MDS-related mutations and cytogenetics from the report.
 Return JSON:
 
-"MDS_related_mutation": {{
+"MDS_related_mutation": {
     "FLT3": false,
     "ASXL1": false,
     "BCOR": false,
@@ -171,8 +159,8 @@ Return JSON:
     "ZRSR2": false,
     "UBA1": false,
     "JAK2": false
-}},
-"MDS_related_cytogenetics": {{
+},
+"MDS_related_cytogenetics": {
     "Complex_karyotype": false,
     "-5": false,
     "del_5q": false,
@@ -180,67 +168,115 @@ Return JSON:
     "del_7q": false,
     "-17": false,
     "del_17p": false
-}}
-
-Report: {report_text}
-    """
+}
+""")
 
-    morphology_prompt = f"""
-Extract morphologic features and cytogenetic data availability from this report.
+    morphology_prompt = report_first_prompt(report_text, """
+Extract morphologic features and cytogenetic data availability from the report.
 Return JSON:
 
 "number_of_dysplastic_lineages": null,  # 0-3 or null
 "no_cytogenetics_data": false          # true if no cytogenetic data
+""")
+
+    prompts = {
+        "qualifiers_prompt": qualifiers_prompt,
+        "flow_prompt": flow_prompt,
+        "genetics_prompt": genetics_prompt,
+        "mds_prompt": mds_prompt,
+        "morphology_prompt": morphology_prompt,
+    }
+    return required_structure, prompts
 
-Report: {report_text}
-    """
 
-    try:
-        # Run prompts in parallel
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            future1 = executor.submit(get_json_from_prompt, qualifiers_prompt)
-            future2 = executor.submit(get_json_from_prompt, flow_prompt)
-            future3 = executor.submit(get_json_from_prompt, genetics_prompt)
-            future4 = executor.submit(get_json_from_prompt, mds_prompt)
-            future5 = executor.submit(get_json_from_prompt, morphology_prompt)
-
-            # Get results
-            qualifiers_data = future1.result()
-            flow_data = future2.result()
-            genetics_data = future3.result()
-            mds_data = future4.result()
-            morphology_data = future5.result()
-
-        # Merge data
-        parsed_data = {}
-        parsed_data.update(qualifiers_data)
-        parsed_data.update(flow_data)
-        parsed_data.update(genetics_data)
-        parsed_data.update(mds_data)
-        parsed_data.update(morphology_data)
-
-        # Post-process CD33 data
-        cd33_percentage = parsed_data.get("cd33_percentage")
-        if cd33_percentage is not None and parsed_data.get("cd33_positive") is None:
-            parsed_data["cd33_positive"] = cd33_percentage >= 20
+def _build_treatment_schemas(required_structure: dict) -> dict:
+    """JSON Schema for each prompt's reply, generated from the required structure."""
+    return section_schemas(required_structure, TREATMENT_PROMPT_FIELDS, overrides={
+        "cd33_positive": BOOLEAN_OR_NULL,
+        "cd33_percentage": PERCENTAGE_OR_NULL,
+        "number_of_dysplastic_lineages": DYSPLASTIC_LINEAGES_OR_NULL,
+    })
+
+
+def _merge_treatment_results(results: dict, required_structure: dict) -> dict:
+    """Merges the per-prompt JSON results (in prompt order), fills defaults and validates."""
+    # Merge data
+    parsed_data = {}
+    for prompt_result in results.values():
+        parsed_data.update(prompt_result)
 
-        # Fill missing fields with defaults
-        for key, val in required_structure.items():
+    # Post-process CD33 data
+    cd33_percentage = parsed_data.get("cd33_percentage")
+    if cd33_percentage is not None and parsed_data.get("cd33_positive") is None:
+        parsed_data["cd33_positive"] = cd33_percentage >= 20
+
+    # Fill missing fields with defaults
+    for key, val in required_structure.items():
+        if key not in parsed_data:
+            parsed_data[key] = val
+        elif isinstance(val, dict):
             if key not in parsed_data:
-                parsed_data[key] = val
-            elif isinstance(val, dict):
-                if key not in parsed_data:
-                    parsed_data[key] = {}
-                for sub_key, sub_val in val.items():
-                    if sub_key not in parsed_data[key]:
-                        parsed_data[key][sub_key] = sub_val
+                parsed_data[key] = {}
+            for sub_key, sub_val in val.items():
+                if sub_key not in parsed_data[key]:
+                    parsed_data[key][sub_key] = sub_val
+
+    return validate_treatment_data(parsed_data)
 
-        return validate_treatment_data(parsed_data)
 
+def parse_treatment_data(report_text: str) -> dict:
+    """
+    Extracts data fields required for AML treatment recommendations from medical reports.
+    
+    Uses parallel OpenAI prompts to extract:
+    1) Patient qualifiers and clinical history
+    2) Flow cytometry data (CD33 status)
+    3) AML-defining recurrent genetic abnormalities
+    4) MDS-related mutations
+    5) MDS-related cytogenetics
+    6) Morphologic features (dysplastic lineages)
+    7) Cytogenetic data availability
+    
+    Args:
+        report_text (str): Free-text medical report
+        
+    Returns:
+        dict: Structured data for treatment algorithm
+    """
+    # Safety check
+    if not report_text.strip():
+        st.warning("Empty report text received.")
+        return {}
+
+    required_structure, prompts = _build_treatment_prompts(report_text)
+
+    try:
+        # Run all prompts concurrently on the shared extraction engine.
+        schemas = _build_treatment_schemas(required_structure)
+        results = run_sync(extract_prompts(prompts, SYSTEM_MESSAGE, group="treatment_parser", schemas=schemas), job_name="parse_treatment_data")
+        return _merge_treatment_results(results, required_structure)
+
+    except ExtractionCancelled:
+        print("⚠️ Treatment data parsing cancelled.")
+        return {}
     except Exception as e:
         st.error(f"❌ Parsing error: {str(e)}")
         return {}
 
+
+async def parse_treatment_data_async(report_text: str) -> dict:
+    """
+    Awaitable version of parse_treatment_data for callers already running an
+    event loop. Errors are raised to the caller instead of being shown in the UI.
+    """
+    if not report_text.strip():
+        return {}
+    required_structure, prompts = _build_treatment_prompts(report_text)
+    results = await extract_prompts(prompts, SYSTEM_MESSAGE, group="treatment_parser",
+                                    schemas=_build_treatment_schemas(required_structure))
+    return _merge_treatment_results(results, required_structure)
+
+
 def validate_treatment_data(parsed_data: dict) -> dict:
     """
     Validate and clean the parsed treatment data.
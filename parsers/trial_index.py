@@ -0,0 +1,442 @@
+"""
+In-memory clinical trial index with a structured eligibility prefilter.
+
+The trial list is loaded once per file version, not on every match. Each trial's
+``structured_eligibility_v2`` block (written by ``eligibility_extractor_v2``) is
+compiled into a small ``TrialConstraints`` record, which holds:
+
+- age bounds and ECOG limits
+- required and excluded disease families
+- required-positive and required-negative markers
+- disease-status and prior-therapy constraints
+- exclusion flags for comorbidities and pregnancy
+
+``TrialIndex.shortlist()`` checks a ``PatientProfile`` against those records and
+drops the trials the patient clearly cannot enter. Only the remaining shortlist
+is sent to the LLM matcher.
+
+The prefilter is conservative. A trial is only excluded when the patient value
+is known and contradicts an explicit constraint. Trials without structured
+eligibility are always kept. So are free-text diagnoses that do not map to a
+known disease family, and markers the report does not explicitly show as
+negative.
+"""
+
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from parsers.pre_extractor import reported_negative
+from parsers.trial_ranker import BM25Index
+from utils.trial_store import get_trial_store
+
+##############################
+# FILE LOCATIONS
+##############################
+TRIALS_FILE = "trials-aggregator/clinical_trials.json"
+STRUCTURED_TRIALS_FILE = "trials-aggregator/clinical_trials_with_structured_eligibility_v2.json"
+TRIAL_STORE_FILE = "trials-aggregator/clinical_trials.sqlite3"
+
+##############################
+# DISEASE FAMILIES
+##############################
+# Keyword patterns for the disease families a trial can require or exclude.
+DISEASE_FAMILIES = {
+    "AML": r"acute myeloid|acute myelogenous|acute non-?lymphocytic|\bAML\b|acute promyelocytic|\bAPL\b",
+    "MDS": r"myelodysplastic|\bMDS\b",
+    "CMML": r"chronic myelomonocytic|\bCMML\b",
+    "ALL": r"acute lymphoblastic|acute lymphocytic|\bALL\b",
+    "CML": r"chronic myeloid|chronic myelogenous|\bCML\b",
+    "CLL": r"chronic lymphocytic|\bCLL\b|small lymphocytic|\bSLL\b",
+    "MPN": r"myeloproliferative|\bMPN\b|myelofibrosis|polycythaemia|polycythemia|thrombocythaemia|thrombocythemia",
+    "LYMPHOMA": r"lymphoma|\bDLBCL\b|hodgkin",
+    "MYELOMA": r"myeloma|plasma cell",
+}
+_DISEASE_RES = {family: re.compile(pattern, re.IGNORECASE) for family, pattern in DISEASE_FAMILIES.items()}
+
+# Patient disease types (as used by the classifiers) -> families a trial may list.
+PATIENT_DISEASE_FAMILIES = {
+    "AML": frozenset({"AML"}),
+    "MDS": frozenset({"MDS"}),
+}
+
+_MARKER_ALIASES = {
+    "MLL": "KMT2A",
+    "MLL_PTD": "KMT2A_PTD",
+}
+
+
+##############################
+# NORMALISATION
+##############################
+def _normalise_marker(name: str) -> str:
+    """Upper-cases a marker and strips punctuation, e.g. "flt3-ITD mutation" -> "FLT3_ITD"."""
+    token = re.sub(r"[^A-Z0-9:]+", "_", str(name).upper()).strip("_")
+    return re.sub(r"_(MUTATION|MUTATIONS|MUTATED|MUTANT|POSITIVE)$", "", token)
+
+
+def _marker_keys(name: str, gene_level: bool = False) -> FrozenSet[str]:
+    """
+    The normalised marker plus its alias. With ``gene_level`` the gene itself is
+    added too, so a positive FLT3_ITD also satisfies an "FLT3" requirement. Negative
+    results are never widened: FLT3_ITD negative says nothing about FLT3-TKD.
+    """
+    token = _normalise_marker(name)
+    keys = {token, _MARKER_ALIASES.get(token, token)}
+    if gene_level and "::" not in token:
+        keys.add(re.split(r"[_:]", token)[0])
+    return frozenset(keys)
+
+
+def disease_families(text: str) -> Optional[FrozenSet[str]]:
+    """Families mentioned in a diagnosis string, or None if it maps to none of them."""
+    found = frozenset(family for family, pattern in _DISEASE_RES.items() if pattern.search(text or ""))
+    return found or None
+
+
+def _int_or_none(value) -> Optional[int]:
+    try:
+        return None if value is None or value == "" else int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+##############################
+# PATIENT PROFILE
+##############################
+@dataclass
+class PatientProfile:
+    """The patient facts the prefilter can check. None / empty means unknown."""
+    age: Optional[int] = None
+    ecog: Optional[int] = None
+    disease_type: Optional[str] = None
+    disease_status: Optional[str] = None            # newly_diagnosed / relapsed / refractory / in_remission
+    positive_markers: FrozenSet[str] = frozenset()
+    negative_markers: FrozenSet[str] = frozenset()
+    prior_chemotherapy_regimens: Optional[int] = None
+    conditions: FrozenSet[str] = frozenset()        # e.g. {"hiv", "heart_failure", "pregnant"}
+
+
+_MARKER_SECTIONS = (
+    "AML_defining_recurrent_genetic_abnormalities",
+    "MDS_related_mutation",
+    "ELN2024_risk_genes",
+)
+_CONDITION_FLAGS = {
+    "hiv_positive": "hiv",
+    "hepatitis_b_positive": "hepatitis_b",
+    "hepatitis_c_positive": "hepatitis_c",
+    "heart_failure": "heart_failure",
+    "active_infection": "active_infection",
+    "other_cancers": "other_cancers",
+    "pregnant": "pregnant",
+    "breastfeeding": "breastfeeding",
+}
+_DISEASE_STATUSES = ("newly_diagnosed", "relapsed", "refractory", "in_remission")
+
+
+def build_patient_profile(parsed_data: Dict, additional_info: Optional[Dict] = None,
+                          disease_type: Optional[str] = None,
+                          report_text: Optional[str] = None) -> PatientProfile:
+    """
+    Builds the prefilter profile from the main parser output and the optional
+    "Additional Patient Information" form used by the clinical trials tab.
+
+    A parser value of False only means the marker was not found, so a marker is
+    negative only when ``report_text`` states that it was tested negative.
+
+    Args:
+        parsed_data (dict): Output of the main AML/MDS parser.
+        additional_info (dict, optional): Form values (age, ecog_status, disease status flags,
+                                          prior_chemotherapy_regimens, comorbidity flags...).
+        disease_type (str, optional): "AML" or "MDS" from the combined classifiers.
+        report_text (str, optional): The report, used to find explicit negative results.
+
+    Returns:
+        PatientProfile
+    """
+    parsed_data = parsed_data or {}
+    additional_info = additional_info or {}
+
+    positive, not_found = set(), []
+    for section in _MARKER_SECTIONS:
+        for marker, value in (parsed_data.get(section) or {}).items():
+            if value is True:
+                positive |= _marker_keys(marker, gene_level=True)
+            elif value is False:
+                not_found.append(marker)
+    negative = set()
+    for marker in reported_negative(report_text, not_found) if report_text else ():
+        negative |= _marker_keys(marker)
+    tp53 = parsed_data.get("Biallelic_TP53_mutation") or {}
+    if any(v is True for k, v in tp53.items() if k != "tp53_mentioned"):
+        positive.add("TP53")
+    # A gene seen positive under any alias is not negative.
+    negative -= positive
+
+    status = next((s for s in _DISEASE_STATUSES if additional_info.get(s)), None)
+    conditions = frozenset(
+        name for flag, name in _CONDITION_FLAGS.items() if additional_info.get(flag)
+    )
+    return PatientProfile(
+        age=_int_or_none(additional_info.get("age", parsed_data.get("age"))),
+        ecog=_int_or_none(additional_info.get("ecog_status")),
+        disease_type=disease_type,
+        disease_status=status,
+        positive_markers=frozenset(positive),
+        negative_markers=frozenset(negative),
+        prior_chemotherapy_regimens=_int_or_none(additional_info.get("prior_chemotherapy_regimens")),
+        conditions=conditions,
+    )
+
+
+##############################
+# TRIAL CONSTRAINTS
+##############################
+@dataclass
+class TrialConstraints:
+    """Compiled, programmatically checkable part of one trial's eligibility."""
+    min_age: Optional[int] = None
+    max_age: Optional[int] = None
+    ecog_max: Optional[int] = None
+    required_families: Optional[FrozenSet[str]] = None   # None = any / not mappable
+    excluded_families: FrozenSet[str] = frozenset()
+    required_positive: Tuple[Tuple[str, FrozenSet[str]], ...] = ()
+    required_negative: Tuple[Tuple[str, FrozenSet[str]], ...] = ()
+    required_statuses: FrozenSet[str] = frozenset()      # statuses explicitly allowed
+    excluded_statuses: FrozenSet[str] = frozenset()
+    chemo_required: Optional[bool] = None
+    min_prior_regimens: Optional[int] = None
+    max_prior_regimens: Optional[int] = None
+    excluded_conditions: FrozenSet[str] = frozenset()
+    structured: bool = False
+
+
+_CONDITION_EXCLUSIONS = {
+    ("infections", "hiv_excluded"): "hiv",
+    ("infections", "hepatitis_b_excluded"): "hepatitis_b",
+    ("infections", "hepatitis_c_excluded"): "hepatitis_c",
+    ("infections", "active_infection_excluded"): "active_infection",
+    ("cardiac", "heart_failure_excluded"): "heart_failure",
+    ("other_cancers", "excluded"): "other_cancers",
+}
+
+
+def compile_constraints(structured: Optional[Dict]) -> TrialConstraints:
+    """Compiles a ``structured_eligibility_v2`` block into TrialConstraints."""
+    if not structured:
+        return TrialConstraints()
+
+    age = structured.get("age") or {}
+    performance = structured.get("performance_status") or {}
+    markers = structured.get("genetic_markers") or {}
+    diagnosis = structured.get("cancer_diagnosis") or {}
+    chemo = (structured.get("prior_treatments") or {}).get("chemotherapy") or {}
+    conditions = structured.get("medical_conditions") or {}
+    reproductive = structured.get("reproductive") or {}
+
+    # Required diagnoses only narrow the trial if every entry maps to a known family.
+    required_families = None
+    required = [d for d in diagnosis.get("required_diagnoses") or [] if str(d).strip()]
+    if required:
+        mapped = [disease_families(str(d)) for d in required]
+        if all(mapped):
+            required_families = frozenset().union(*mapped)
+    excluded_families = frozenset().union(
+        *(disease_families(str(d)) or frozenset() for d in diagnosis.get("excluded_diagnoses") or [])
+    )
+
+    statuses = diagnosis.get("disease_status") or {}
+    required_statuses = frozenset(s for s in _DISEASE_STATUSES if statuses.get(s) is True)
+    excluded_statuses = frozenset(s for s in _DISEASE_STATUSES if statuses.get(s) is False)
+
+    excluded_conditions = {
+        name for (group, key), name in _CONDITION_EXCLUSIONS.items()
+        if (conditions.get(group) or {}).get(key) is True
+    }
+    if reproductive.get("pregnancy_excluded") is True:
+        excluded_conditions.add("pregnant")
+    if reproductive.get("breastfeeding_excluded") is True:
+        excluded_conditions.add("breastfeeding")
+
+    return TrialConstraints(
+        min_age=_int_or_none(age.get("min_age")),
+        max_age=_int_or_none(age.get("max_age")),
+        ecog_max=_int_or_none(performance.get("ecog_max")),
+        required_families=required_families,
+        excluded_families=excluded_families,
+        required_positive=tuple(
+            (str(m), _marker_keys(m)) for m in markers.get("required_positive") or [] if str(m).strip()
+        ),
+        required_negative=tuple(
+            (str(m), _marker_keys(m)) for m in markers.get("required_negative") or [] if str(m).strip()
+        ),
+        required_statuses=required_statuses,
+        excluded_statuses=excluded_statuses,
+        chemo_required=chemo.get("required") if isinstance(chemo.get("required"), bool) else None,
+        min_prior_regimens=_int_or_none(chemo.get("min_prior_regimens")),
+        max_prior_regimens=_int_or_none(chemo.get("max_prior_regimens")),
+        excluded_conditions=frozenset(excluded_conditions),
+        structured=True,
+    )
+
+
+def exclusion_reasons(constraints: TrialConstraints, profile: PatientProfile) -> List[str]:
+    """
+    Returns why the patient clearly cannot enter the trial, or [] if the trial is
+    still plausible. Unknown patient values never exclude.
+    """
+    if not constraints.structured:
+        return []
+    reasons = []
+    c, p = constraints, profile
+
+    if p.age is not None:
+        if c.min_age is not None and p.age < c.min_age:
+            reasons.append(f"Age {p.age} is below the minimum age of {c.min_age}")
+        if c.max_age is not None and p.age > c.max_age:
+            reasons.append(f"Age {p.age} is above the maximum age of {c.max_age}")
+    if p.ecog is not None and c.ecog_max is not None and p.ecog > c.ecog_max:
+        reasons.append(f"ECOG {p.ecog} exceeds the maximum of {c.ecog_max}")
+
+    patient_families = PATIENT_DISEASE_FAMILIES.get(p.disease_type or "")
+    if patient_families:
+        if c.required_families is not None and not (patient_families & c.required_families):
+            reasons.append(f"Trial requires {', '.join(sorted(c.required_families))}, patient has {p.disease_type}")
+        if patient_families & c.excluded_families:
+            reasons.append(f"Trial excludes {p.disease_type}")
+
+    for name, keys in c.required_positive:
+        if keys & p.negative_markers and not keys & p.positive_markers:
+            reasons.append(f"Requires {name} positive, patient is negative")
+    for name, keys in c.required_negative:
+        if keys & p.positive_markers:
+            reasons.append(f"Requires {name} negative, patient is positive")
+
+    if p.disease_status is not None:
+        if c.required_statuses and p.disease_status not in c.required_statuses:
+            reasons.append(f"Disease status {p.disease_status.replace('_', ' ')} is not eligible")
+        elif p.disease_status in c.excluded_statuses:
+            reasons.append(f"Disease status {p.disease_status.replace('_', ' ')} is excluded")
+
+    regimens = p.prior_chemotherapy_regimens
+    if regimens is not None:
+        if c.chemo_required is False and regimens > 0:
+            reasons.append("Trial excludes prior chemotherapy")
+        if c.chemo_required is True and regimens == 0:
+            reasons.append("Trial requires prior chemotherapy")
+        if c.min_prior_regimens is not None and regimens < c.min_prior_regimens:
+            reasons.append(f"Requires at least {c.min_prior_regimens} prior regimens")
+        if c.max_prior_regimens is not None and regimens > c.max_prior_regimens:
+            reasons.append(f"Allows at most {c.max_prior_regimens} prior regimens")
+
+    for condition in sorted(c.excluded_conditions & p.conditions):
+        reasons.append(f"Excluded condition: {condition.replace('_', ' ')}")
+    return reasons
+
+
+##############################
+# INDEX
+##############################
+@dataclass
+class TrialIndex:
+    """Open trials with their compiled constraints, loaded once per file version."""
+    trials: List[Dict] = field(default_factory=list)
+    constraints: List[TrialConstraints] = field(default_factory=list)
+    source_file: Optional[str] = None
+    _ranker: Optional[BM25Index] = field(default=None, repr=False, compare=False)
+
+    @classmethod
+    def from_trials(cls, trials: List[Dict], source_file: Optional[str] = None) -> "TrialIndex":
+        open_trials = [t for t in trials if str(t.get("status", "")).lower() == "open"]
+        return cls(
+            trials=open_trials,
+            constraints=[compile_constraints(t.get("structured_eligibility_v2")) for t in open_trials],
+            source_file=source_file,
+        )
+
+    @property
+    def structured_count(self) -> int:
+        return sum(1 for c in self.constraints if c.structured)
+
+    def shortlist(self, profile: Optional[PatientProfile]) -> Tuple[List[Dict], List[Tuple[Dict, List[str]]]]:
+        """
+        Splits the open trials into (plausible trials, [(excluded trial, reasons)]).
+        Without a profile every open trial is plausible.
+        """
+        if profile is None:
+            return list(self.trials), []
+        plausible, excluded = [], []
+        for trial, constraints in zip(self.trials, self.constraints):
+            reasons = exclusion_reasons(constraints, profile)
+            if reasons:
+                excluded.append((trial, reasons))
+            else:
+                plausible.append(trial)
+        return plausible, excluded
+
+    @property
+    def ranker(self) -> BM25Index:
+        """BM25 index over the open trials, built on first use and kept with this index."""
+        if self._ranker is None:
+            self._ranker = BM25Index.from_trials(self.trials)
+        return self._ranker
+
+    def rank(self, patient_text: str, trials: Optional[List[Dict]] = None) -> List[Tuple[Dict, float]]:
+        """
+        Ranks ``trials`` (default: all open trials, which they must be drawn from)
+        by BM25 relevance to the formatted patient description, best first.
+        """
+        candidates = None if trials is None else {id(t) for t in trials}
+        return [
+            (self.trials[doc_id], score)
+            for doc_id, score in self.ranker.rank(patient_text)
+            if candidates is None or id(self.trials[doc_id]) in candidates
+        ]
+
+
+_index_cache: Dict[str, Tuple[float, TrialIndex]] = {}
+_index_lock = threading.Lock()
+
+
+def resolve_trials_file(trials_file: str = TRIALS_FILE) -> str:
+    """
+    For the default trials file, prefers the SQLite trial store, then the
+    structured-eligibility output, when they exist.
+    """
+    if trials_file == TRIALS_FILE:
+        for candidate in (TRIAL_STORE_FILE, STRUCTURED_TRIALS_FILE):
+            if os.path.exists(candidate):
+                return candidate
+    return trials_file
+
+
+def _is_trial_store(path: str) -> bool:
+    return path.endswith((".sqlite3", ".db"))
+
+
+def get_trial_index(trials_file: str = TRIALS_FILE) -> TrialIndex:
+    """
+    Returns the index for ``trials_file``, loading and compiling it only when the
+    source is new or has changed since the last load. A trial store is read with
+    an indexed query for open trials and versioned by its write counter; a JSON
+    file is versioned by its mtime.
+    """
+    path = resolve_trials_file(trials_file)
+    store = get_trial_store(path) if _is_trial_store(path) else None
+    version = store.version() if store is not None else os.path.getmtime(path)
+    with _index_lock:
+        cached = _index_cache.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        if store is not None:
+            index = TrialIndex.from_trials(store.query_trials(status="Open"), source_file=path)
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                index = TrialIndex.from_trials(json.load(f), source_file=path)
+        _index_cache[path] = (version, index)
+        print(f"📚 Indexed {len(index.trials)} open trials ({index.structured_count} with structured eligibility) from {path}")
+        return index
@@ -0,0 +1,130 @@
+"""
+BM25 lexical ranking of clinical trials against a patient description.
+
+This is the zero-cost first stage in front of the GPT-4o matcher. Trials are
+tokenised over their title, description, cancer types and "who can enter"
+text, with field weights, and scored with Okapi BM25 against the output of
+``format_patient_data_for_matching``. Only the top-K trials go on to the LLM.
+
+Tokenisation understands the usual molecular notation:
+
+- compound tokens such as ``FLT3-ITD``, ``PML::RARA`` and ``KMT2A-PTD`` are
+  kept whole, and their parts (``flt3``, ``itd``) are emitted as well
+- British and American spellings are folded together (leukemia -> leukaemia)
+- simple plurals are stripped from word tokens, but never from gene names
+
+The index is built once per trial catalog version (see ``TrialIndex.ranker``).
+"""
+
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+##############################
+# TOKENISATION
+##############################
+FIELD_WEIGHTS = {
+    "title": 2,
+    "cancer_types": 3,
+    "description": 1,
+    "who_can_enter": 1,
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:(?:::|[-/])[a-z0-9]+)*")
+_PART_RE = re.compile(r"::|[-/]")
+
+_SPELLINGS = {
+    "leukemia": "leukaemia",
+    "leukemic": "leukaemic",
+    "anemia": "anaemia",
+    "tumor": "tumour",
+    "hematologic": "haematologic",
+    "hematological": "haematological",
+    "hemoglobin": "haemoglobin",
+    "myelogenous": "myeloid",
+    "randomized": "randomised",
+}
+
+STOPWORDS = frozenset("""
+a about after all also an and any are as at be been before but by can could did do does for from had has
+have if in into is it its may might more must no not of on or other such than that the their them then there
+these they this those to too under until up was were what when where which while who will with within would
+you your yes none unknown patient patients clinical profile years year old trial trials study studies
+""".split())
+
+
+def _normalise_word(word: str) -> str:
+    word = _SPELLINGS.get(word, word)
+    # Strip simple plurals from words, never from gene-like tokens containing digits
+    if len(word) > 4 and word.endswith("s") and not word.endswith(("ss", "us", "is")) and not any(c.isdigit() for c in word):
+        word = _SPELLINGS.get(word[:-1], word[:-1])
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased, domain-aware tokens for BM25 indexing and querying."""
+    tokens = []
+    for match in _TOKEN_RE.finditer((text or "").lower()):
+        token = match.group()
+        parts = _PART_RE.split(token)
+        if len(parts) > 1:
+            tokens.append(token)
+        for part in parts:
+            if part and part not in STOPWORDS and (len(part) > 1 or part.isdigit()):
+                tokens.append(_normalise_word(part))
+    return tokens
+
+
+def trial_tokens(trial: Dict, field_weights: Dict[str, int] = FIELD_WEIGHTS) -> List[str]:
+    """Tokens of one trial, with each field repeated according to its weight."""
+    tokens = []
+    for field, weight in field_weights.items():
+        tokens.extend(tokenize(str(trial.get(field) or "")) * weight)
+    return tokens
+
+
+##############################
+# BM25 INDEX
+##############################
+class BM25Index:
+    """Inverted index with Okapi BM25 scoring over a fixed list of documents."""
+
+    def __init__(self, documents: Sequence[Sequence[str]], k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.size = len(documents)
+        self.lengths = [len(doc) for doc in documents]
+        self.average_length = (sum(self.lengths) / self.size) if self.size else 0.0
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for doc_id, doc in enumerate(documents):
+            for term, frequency in Counter(doc).items():
+                self.postings[term].append((doc_id, frequency))
+        self.postings = dict(self.postings)
+        self.idf = {
+            term: math.log(1 + (self.size - len(posting) + 0.5) / (len(posting) + 0.5))
+            for term, posting in self.postings.items()
+        }
+
+    @classmethod
+    def from_trials(cls, trials: Iterable[Dict], field_weights: Dict[str, int] = FIELD_WEIGHTS,
+                    **params) -> "BM25Index":
+        return cls([trial_tokens(trial, field_weights) for trial in trials], **params)
+
+    def scores(self, query_tokens: Iterable[str]) -> List[float]:
+        """BM25 score of every document; each distinct query term counts once."""
+        scores = [0.0] * self.size
+        for term in set(query_tokens):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = self.idf[term]
+            for doc_id, frequency in posting:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / self.average_length)
+                scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return scores
+
+    def rank(self, query: str) -> List[Tuple[int, float]]:
+        """Document ids with their scores, best first (ties keep document order)."""
+        scores = self.scores(tokenize(query))
+        return sorted(enumerate(scores), key=lambda item: -item[1])
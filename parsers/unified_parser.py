@@ -0,0 +1,283 @@
+"""
+Unified "parse once" extraction for a single report.
+
+The classification, ELN, IPSS and treatment parsers each send their own set of
+prompts, and several of them ask for the same facts (NPM1, FLT3, TP53, del(5q),
+complex karyotype, dysplastic lineages...). This module treats every prompt as
+a named section of one canonical extraction, plans the smallest set of sections
+that covers all requested consumers, runs them once on the shared extraction
+engine and projects the results into each consumer's usual dict shape.
+
+Consumers:
+    "classification" -> parse_genetics_report_aml format
+    "eln"            -> parse_eln_report format
+    "ipss"           -> parse_ipss_report format
+    "treatment"      -> parse_treatment_data format
+
+Treatment has two recipes: its own five prompts, or its history prompt plus the
+classification and ELN sections. The planner picks whichever needs fewer prompts
+for the requested combination.
+"""
+
+import asyncio
+import copy
+import itertools
+import json
+from typing import Dict, Iterable, List, Tuple
+
+import streamlit as st
+
+from parsers import aml_eln_parser, aml_parser, mds_ipss_parser, treatment_parser
+from parsers.pre_extractor import pre_extract_aml_sections, pre_extract_ipss_sections
+from utils.extraction_engine import ExtractionCancelled, extract_prompts, run_sync
+from utils.structured_output import StructuredOutputError
+from utils.transformation_utils import transform_unified_to_treatment_format
+
+##############################
+# CANONICAL SECTIONS
+##############################
+# Canonical section name -> prompt name used by the dedicated parser's builder.
+AML_SECTIONS = {
+    "aml.clinical": "first_prompt_1",
+    "aml.recurrent_abnormalities": "first_prompt_2a",
+    "aml.biallelic_tp53": "first_prompt_2b",
+    "aml.mds_related": "first_prompt_2c",
+    "aml.qualifiers": "first_prompt_3",
+    "aml.differentiation": "second_prompt",
+    "aml.eln2024_genes": "eln2024_prompt",
+    "aml.cytogenetics_check": "cytogenetics_check_prompt",
+}
+ELN_SECTIONS = {
+    "eln.markers": "prompt",
+}
+IPSS_SECTIONS = {
+    "ipss.clinical": "clinical_prompt",
+    "ipss.cytogenetics": "cytogenetics_prompt",
+    "ipss.tp53": "tp53_prompt",
+    "ipss.genes": "genes_prompt",
+}
+TREATMENT_SECTIONS = {
+    "treatment.qualifiers": "qualifiers_prompt",
+    "treatment.flow": "flow_prompt",
+    "treatment.genetics": "genetics_prompt",
+    "treatment.mds": "mds_prompt",
+    "treatment.morphology": "morphology_prompt",
+}
+
+# Main-parser sections read by transform_main_parser_to_treatment_format.
+TREATMENT_SHARED_AML_SECTIONS = (
+    "aml.clinical",
+    "aml.recurrent_abnormalities",
+    "aml.mds_related",
+    "aml.qualifiers",
+    "aml.eln2024_genes",
+    "aml.cytogenetics_check",
+)
+
+# Consumer -> recipes in order of preference: (recipe name, sections needed).
+CONSUMER_RECIPES = {
+    "classification": [("dedicated", tuple(AML_SECTIONS))],
+    "eln": [("dedicated", tuple(ELN_SECTIONS))],
+    "ipss": [("dedicated", tuple(IPSS_SECTIONS))],
+    "treatment": [
+        ("dedicated", tuple(TREATMENT_SECTIONS)),
+        ("shared", ("treatment.qualifiers",) + TREATMENT_SHARED_AML_SECTIONS + ("eln.markers",)),
+    ],
+}
+
+DEFAULT_CONSUMERS = ("classification", "eln", "treatment")
+
+
+##############################
+# PLANNER
+##############################
+def plan_extraction(consumers: Iterable[str] = DEFAULT_CONSUMERS) -> Tuple[List[str], Dict[str, str]]:
+    """
+    Chooses one recipe per consumer so that the union of sections is as small as possible.
+
+    Returns:
+        tuple: (ordered list of section names to run, {consumer: chosen recipe name})
+    """
+    consumers = list(dict.fromkeys(consumers))
+    unknown = [c for c in consumers if c not in CONSUMER_RECIPES]
+    if unknown:
+        raise ValueError(f"Unknown extraction consumer(s): {', '.join(unknown)}")
+
+    best = None
+    for combination in itertools.product(*(CONSUMER_RECIPES[c] for c in consumers)):
+        sections = list(dict.fromkeys(s for _, recipe_sections in combination for s in recipe_sections))
+        if best is None or len(sections) < len(best[0]):
+            best = (sections, {c: name for c, (name, _) in zip(consumers, combination)})
+    return best
+
+
+##############################
+# PROMPT BUILDING & PROJECTION
+##############################
+def _build_eln_prompts(report_text: str):
+    """Wraps the single ELN prompt in the same (structure, prompts) shape as the other builders."""
+    default_structure, prompt = aml_eln_parser._build_eln_prompt(report_text)
+    return default_structure, {"prompt": prompt}
+
+
+def _build_section_requests(report_text: str, sections: List[str]):
+    """
+    Builds only the parser prompt sets the plan needs, leaving out sections the
+    rule-based pre-extractor already resolved from structured report data.
+
+    Returns:
+        tuple: ({system message: {section name: prompt}},
+                {section name: locally resolved result},
+                {parser name: required structure, "<parser>_prompts": that parser's prompts},
+                {section name: JSON Schema of its reply})
+    """
+    requests: Dict[str, Dict[str, str]] = {}
+    resolved: Dict[str, dict] = {}
+    structures = {}
+    schemas: Dict[str, dict] = {}
+    builders = [
+        ("aml", AML_SECTIONS, aml_parser.SYSTEM_MESSAGE,
+         lambda: aml_parser._build_aml_prompts(report_text), pre_extract_aml_sections,
+         aml_parser._build_aml_schemas),
+        ("eln", ELN_SECTIONS, aml_eln_parser.ELN_SYSTEM_MESSAGE,
+         lambda: _build_eln_prompts(report_text), None,
+         lambda structure: {"prompt": aml_eln_parser._build_eln_schema(structure)}),
+        ("ipss", IPSS_SECTIONS, mds_ipss_parser.SYSTEM_MESSAGE,
+         lambda: mds_ipss_parser._build_ipss_prompts(report_text), pre_extract_ipss_sections,
+         mds_ipss_parser._build_ipss_schemas),
+        ("treatment", TREATMENT_SECTIONS, treatment_parser.SYSTEM_MESSAGE,
+         lambda: treatment_parser._build_treatment_prompts(report_text), None,
+         treatment_parser._build_treatment_schemas),
+    ]
+    for parser_name, section_map, system_message, build, pre_extract, build_schemas in builders:
+        wanted = [s for s in section_map if s in sections]
+        if not wanted:
+            continue
+        structure, prompts = build()
+        structures[parser_name] = structure
+        structures[f"{parser_name}_prompts"] = prompts
+        prompt_schemas = build_schemas(structure)
+        local = pre_extract(report_text) if pre_extract else {}
+        group = requests.setdefault(system_message, {})
+        for section in wanted:
+            prompt_name = section_map[section]
+            if prompt_name in local:
+                resolved[section] = local[prompt_name]
+            else:
+                group[section] = prompts[prompt_name]
+                schemas[section] = prompt_schemas[prompt_name]
+    return requests, resolved, structures, schemas
+
+
+def _select(results: Dict[str, dict], section_map: Dict[str, str]) -> Dict[str, dict]:
+    """Copies the results for one parser's sections, in that parser's merge order."""
+    return {
+        section: copy.deepcopy(results[section])
+        for section in section_map
+        if section in results
+    }
+
+
+def _project(consumer: str, recipe: str, results: Dict[str, dict], structures: dict, report_text: str) -> dict:
+    """Projects the canonical section results into one consumer's usual format."""
+    if consumer == "classification":
+        return aml_parser._merge_aml_results(_select(results, AML_SECTIONS), structures["aml"])
+    if consumer == "eln":
+        return aml_eln_parser._merge_eln_result(copy.deepcopy(results["eln.markers"]), structures["eln"])
+    if consumer == "ipss":
+        return mds_ipss_parser._merge_ipss_results(
+            _select(results, IPSS_SECTIONS), structures["ipss_prompts"], structures["ipss"], report_text
+        )
+    if recipe == "dedicated":
+        return treatment_parser._merge_treatment_results(
+            _select(results, TREATMENT_SECTIONS), structures["treatment"]
+        )
+
+    # Shared treatment recipe: main-parser sections + ELN markers + treatment history.
+    main_parser_data = {}
+    for section_result in _select(results, AML_SECTIONS).values():
+        main_parser_data.update(section_result)
+    eln_data = aml_eln_parser._merge_eln_result(copy.deepcopy(results["eln.markers"]), structures["eln"])
+    qualifiers = results.get("treatment.qualifiers", {}).get("qualifiers", {})
+    return treatment_parser.validate_treatment_data(
+        transform_unified_to_treatment_format(main_parser_data, eln_data, qualifiers)
+    )
+
+
+##############################
+# ENTRY POINTS
+##############################
+async def parse_report_once_async(report_text: str,
+                                  consumers: Iterable[str] = DEFAULT_CONSUMERS) -> Dict[str, dict]:
+    """
+    Runs the planned sections once and returns {consumer: projected dict}.
+    Errors are raised to the caller instead of being shown in the UI.
+    """
+    if not report_text.strip():
+        return {}
+    sections, recipes = plan_extraction(consumers)
+    requests, resolved, structures, schemas = _build_section_requests(report_text, sections)
+
+    # One extract_prompts call per system message, all sharing the engine's semaphore.
+    grouped = await asyncio.gather(*(
+        extract_prompts(prompts, system_message, schemas=schemas)
+        for system_message, prompts in requests.items() if prompts
+    ))
+    results = dict(resolved)
+    for group_results in grouped:
+        results.update(group_results)
+
+    return {
+        consumer: _project(consumer, recipe, results, structures, report_text)
+        for consumer, recipe in recipes.items()
+    }
+
+
+def parse_report_once(report_text: str, consumers: Iterable[str] = DEFAULT_CONSUMERS) -> Dict[str, dict]:
+    """
+    Extracts everything the requested consumers need from one report in a single
+    round of deduplicated prompts, and returns {consumer: dict in that consumer's
+    usual format}. Returns {} on failure, like the dedicated parsers.
+    """
+    if not report_text.strip():
+        st.warning("Empty report text received.")
+        return {}
+
+    try:
+        return run_sync(parse_report_once_async(report_text, consumers), job_name="parse_report_once")
+    except ExtractionCancelled:
+        print("⚠️ Unified report parsing cancelled.")
+        return {}
+    except json.JSONDecodeError:
+        st.error("❌ Failed to parse AI response into JSON. Ensure the report is well-formatted.")
+        print("❌ JSONDecodeError: Could not parse AI JSON response.")
+        return {}
+    except StructuredOutputError as e:
+        st.error(f"❌ The AI response for '{e.name}' did not match the expected structure. "
+                 "The other sections are cached, so re-running only repeats this one.")
+        print(f"❌ {e}")
+        return {}
+    except Exception as e:
+        st.error(f"❌ Error communicating with OpenAI: {str(e)}")
+        print(f"❌ Exception: {str(e)}")
+        return {}
+
+
+##############################
+# SESSION REUSE
+##############################
+def store_unified_results(report_text: str, results: Dict[str, dict]) -> None:
+    """Keeps the projections for this report so later tabs can skip their own prompts."""
+    st.session_state["unified_extraction"] = {"report_text": report_text, "results": results}
+
+
+def get_unified_result(consumer: str, report_text: str):
+    """
+    Returns a copy of the stored projection for ``consumer`` if it was extracted
+    from exactly this report, else None.
+    """
+    stored = st.session_state.get("unified_extraction")
+    if not stored or stored.get("report_text") != report_text:
+        return None
+    result = stored.get("results", {}).get(consumer)
+    return copy.deepcopy(result) if result else None
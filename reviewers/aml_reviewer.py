@@ -1,10 +1,10 @@
-import streamlit as st
-from openai import OpenAI
+from utils.llm_client import LazyOpenAIClient
+from utils.llm_metrics import tracked_completion
 
 ##############################
 # OPENAI API CONFIG
 ##############################
-client = OpenAI(api_key=st.secrets["openai"]["api_key"])
+client = LazyOpenAIClient()
 
 
 ##############################
@@ -85,7 +85,7 @@ Derivation: {icc_deriv}
 
     # Call OpenAI
     try:
-        classification_response = client.chat.completions.create(
+        classification_response = tracked_completion(client, "aml_review.classification",
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are a knowledgeable haematologist."},
@@ -152,7 +152,7 @@ Please follow these rules:
 
     # Call OpenAI
     try:
-        gene_response = client.chat.completions.create(
+        gene_response = tracked_completion(client, "aml_review.genes",
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are a knowledgeable haematologist."},
@@ -218,7 +218,7 @@ Please follow these rules:
 
     # Call OpenAI
     try:
-        mrd_response = client.chat.completions.create(
+        mrd_response = tracked_completion(client, "aml_review.mrd",
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are a knowledgeable haematologist."},
@@ -279,7 +279,7 @@ def get_gpt4_review_aml_additional_comments(classification: dict,
 
     # Call OpenAI
     try:
-        additional_comments_response = client.chat.completions.create(
+        additional_comments_response = tracked_completion(client, "aml_review.additional_comments",
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are a knowledgeable haematologist."},
@@ -344,7 +344,7 @@ Provide a section titled "Differentiation Review" and list your bullet point jus
 
     # Call GPT-4
     try:
-        additional_review_response = client.chat.completions.create(
+        additional_review_response = tracked_completion(client, "aml_review.differentiation",
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are a specialist haematology AI classifying acute myeloid leukaemia based solely on differentiation."},
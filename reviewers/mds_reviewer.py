@@ -1,12 +1,12 @@
 # File name: ai_review_mds.py
 
-import streamlit as st
-from openai import OpenAI
+from utils.llm_client import LazyOpenAIClient
+from utils.llm_metrics import tracked_completion
 
 ##############################
 # OPENAI API CONFIG
 ##############################
-client = OpenAI(api_key=st.secrets["openai"]["api_key"])
+client = LazyOpenAIClient()
 
 
 ##############################
@@ -85,7 +85,7 @@ Derivation: {icc_deriv}
 
     # Call OpenAI
     try:
-        classification_response = client.chat.completions.create(
+        classification_response = tracked_completion(client, "mds_review.classification",
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are a knowledgeable haematologist experienced in MDS."},
@@ -151,7 +151,7 @@ Follow these rules:
 
     # Call OpenAI
     try:
-        gene_response = client.chat.completions.create(
+        gene_response = tracked_completion(client, "mds_review.genes",
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are a knowledgeable haematologist experienced in MDS."},
@@ -210,7 +210,7 @@ Provide a section called Additional Considerations for MDS.
 
     # Call OpenAI
     try:
-        additional_comments_response = client.chat.completions.create(
+        additional_comments_response = tracked_completion(client, "mds_review.additional_comments",
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are a knowledgeable haematologist experienced in MDS."},
@@ -0,0 +1,63 @@
+"""
+Speculative prefetch of the AI reviews shown on the results page.
+
+Each review used to start only when its sub-tab was opened, and then blocked
+for a GPT-4o round trip. ``prefetch_reviews()`` is called as soon as the
+classification results exist. It submits every review as a background job
+(see utils.job_queue), so they all run concurrently while the user is still
+reading the classification. ``review_in_background()`` is what the tabs call.
+It collects the same job, so a tab opened after its review finished renders
+immediately.
+
+The classification review is prefetched even while a confirmation form is
+pending. If the form changes the classification, the tab simply asks again
+with the new inputs.
+"""
+
+from typing import List, Optional
+
+from reviewers.aml_reviewer import (
+    get_gpt4_review_aml_classification,
+    get_gpt4_review_aml_genes,
+    get_gpt4_review_aml_additional_comments,
+    get_gpt4_review_aml_differentiation
+)
+from utils.job_queue import Job, run_in_background, submit_in_background
+
+##############################
+# REVIEWS SHOWN ON THE RESULTS PAGE
+##############################
+# Session state key -> (status label, reviewer)
+REVIEWS = {
+    "aml_class_review": ("Generating Classification Review", get_gpt4_review_aml_classification),
+    "aml_gene_review": ("Generating Gene Review", get_gpt4_review_aml_genes),
+    "aml_additional_comments": ("Generating Additional Comments", get_gpt4_review_aml_additional_comments),
+    "differentiation": ("Generating Differentiation Review", get_gpt4_review_aml_differentiation),
+}
+
+
+def prefetch_reviews(classification: dict, parsed_data: dict,
+                     free_text_input: Optional[str] = None) -> List[Job]:
+    """
+    Starts every review that is not in the session state yet. Safe to call on
+    every rerun; a review already queued or running for the same inputs is not
+    submitted again. Returns the jobs that are still pending.
+    """
+    jobs = []
+    for state_key, (label, reviewer) in REVIEWS.items():
+        job = submit_in_background(state_key, label, reviewer, classification, parsed_data,
+                                   free_text_input=free_text_input)
+        if job is not None and not job.finished:
+            jobs.append(job)
+    return jobs
+
+
+def review_in_background(state_key: str, classification: dict, parsed_data: dict,
+                         free_text_input: Optional[str] = None) -> Optional[str]:
+    """
+    The review text for ``state_key`` once it is ready, or None while it is still
+    being generated (a status box is shown in its place).
+    """
+    label, reviewer = REVIEWS[state_key]
+    return run_in_background(state_key, label, reviewer, classification, parsed_data,
+                             free_text_input=free_text_input)
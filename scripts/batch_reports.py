@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Headless batch report generator: many free-text reports in, one PDF per report out.
+
+Each report goes through the same steps as the free-text mode of the app:
+    1. parse_report_once_async (classification, ELN and treatment data in one round)
+    2. classify_combined_WHO2022 / classify_combined_ICC2022
+    3. optionally the clinical overview (--overview, one extra GPT call per report)
+    4. render_report_pdf, the session-free renderer behind the PDF button
+
+Parsing runs on one event loop with at most --concurrency reports in flight; PDFs
+are rendered on a process pool of --workers. Every finished report is appended to
+<output>/manifest.jsonl straight away, so an interrupted run can simply be started
+again: reports whose text is unchanged and whose PDF exists are skipped.
+
+The interactive confirmations of the app (TP53, unknown blasts, ambiguous
+differentiation) are not asked; such reports are listed with "flags" in the
+manifest so they can be reviewed in the app before the MDT.
+
+Input is either a directory of .txt files (report id = file name) or a JSONL file
+of {"id": ..., "report": ...} lines.
+
+Usage:
+    python scripts/batch_reports.py mdt_reports/ --output mdt_pdfs/
+    python scripts/batch_reports.py reports.jsonl --output out/ --concurrency 8 --workers 4 --overview
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classifiers.aml_mds_combined import classify_combined_ICC2022, classify_combined_WHO2022
+from parsers.unified_parser import parse_report_once_async
+
+MANIFEST_NAME = "manifest.jsonl"
+REPORT_TEXT_KEYS = ("report", "text", "free_text_input")
+
+
+##############################
+# INPUT AND MANIFEST
+##############################
+def load_reports(source: str) -> List[Tuple[str, str]]:
+    """Returns [(report id, report text)] from a directory of .txt files or a JSONL file."""
+    if os.path.isdir(source):
+        reports = []
+        for name in sorted(os.listdir(source)):
+            if name.endswith(".txt"):
+                with open(os.path.join(source, name), "r", encoding="utf-8") as f:
+                    reports.append((os.path.splitext(name)[0], f.read()))
+        return reports
+
+    reports = []
+    with open(source, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            text = next((record[key] for key in REPORT_TEXT_KEYS if record.get(key)), "")
+            reports.append((str(record.get("id", line_number)), text))
+    return reports
+
+
+def report_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def pdf_name(report_id: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", report_id).strip("._") + ".pdf"
+
+
+def load_manifest(output_dir: str) -> Dict[str, dict]:
+    """Latest manifest entry per report id (later lines win)."""
+    entries = {}
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries[entry["id"]] = entry
+    return entries
+
+
+def is_complete(entry: Optional[dict], text: str, output_dir: str) -> bool:
+    return bool(
+        entry
+        and entry.get("status") == "done"
+        and entry.get("input_hash") == report_hash(text)
+        and os.path.exists(os.path.join(output_dir, entry.get("pdf", "")))
+    )
+
+
+##############################
+# PIPELINE STEPS
+##############################
+def review_flags(parsed_data: dict) -> List[str]:
+    """Reasons the app would have stopped for a user confirmation on this report."""
+    flags = []
+    if parsed_data.get("blasts_percentage") == "Unknown":
+        flags.append("blasts_unknown")
+    differentiation = parsed_data.get("AML_differentiation")
+    if differentiation is None or str(differentiation).lower() == "ambiguous":
+        flags.append("differentiation_unclear")
+    if parsed_data.get("Biallelic_TP53_mutation", {}).get("tp53_mentioned", False):
+        flags.append("tp53_confirmation")
+    return flags
+
+
+def classify_report(parsed_data: dict, report_text: str) -> dict:
+    """The app's aml_ai_result for one parsed report."""
+    who_class, who_deriv, who_disease_type = classify_combined_WHO2022(parsed_data, not_erythroid=False)
+    icc_class, icc_deriv, icc_disease_type = classify_combined_ICC2022(parsed_data)
+    return {
+        "parsed_data": parsed_data,
+        "who_class": who_class,
+        "who_derivation": who_deriv,
+        "who_disease_type": who_disease_type,
+        "icc_class": icc_class,
+        "icc_derivation": icc_deriv,
+        "icc_disease_type": icc_disease_type,
+        "free_text_input": report_text,
+    }
+
+
+async def parse_report(report_text: str) -> dict:
+    """Classification fields of one report; raises when extraction fails."""
+    results = await parse_report_once_async(report_text)
+    parsed_data = results.get("classification")
+    if not parsed_data:
+        raise ValueError("No classification data extracted from report")
+    return parsed_data
+
+
+def generate_overview(state: dict) -> str:
+    from parsers.final_review_parser import build_overview_data, request_final_overview
+    from utils.pdf import get_report_aml_risks
+
+    aml_result = state["aml_ai_result"]
+    overview_data = build_overview_data(
+        aml_result["parsed_data"],
+        aml_result["free_text_input"],
+        eln_risk=get_report_aml_risks(aml_result, state)["eln2022"],
+        state=state,
+    )
+    return request_final_overview(overview_data)
+
+
+def render_pdf_file(state: dict, clinical_overview: Optional[str], path: str) -> int:
+    """Process pool task: renders one report and writes it atomically. Returns its size."""
+    from utils.pdf import render_report_pdf
+
+    pdf_bytes = render_report_pdf(state, clinical_overview)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(pdf_bytes)
+    os.replace(tmp_path, path)
+    return len(pdf_bytes)
+
+
+##############################
+# BATCH RUN
+##############################
+async def run_batch(reports: List[Tuple[str, str]], output_dir: str, concurrency: int = 8,
+                    workers: int = 4, overview: bool = False, force: bool = False) -> dict:
+    """
+    Processes every report that is not already complete in the manifest and returns
+    counts of done / failed / skipped reports.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = load_manifest(output_dir)
+    pending = [(rid, text) for rid, text in reports
+               if force or not is_complete(manifest.get(rid), text, output_dir)]
+    stats = {"total": len(reports), "skipped": len(reports) - len(pending), "done": 0, "failed": 0}
+    print(f"📄 {len(reports)} reports, {len(pending)} to process, {stats['skipped']} already done")
+    if not pending:
+        return stats
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    manifest_file = open(os.path.join(output_dir, MANIFEST_NAME), "a", encoding="utf-8")
+
+    def record(entry: dict) -> None:
+        # Only called from the event loop thread, so lines never interleave
+        manifest_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        manifest_file.flush()
+
+    async def process(pool: ProcessPoolExecutor, report_id: str, text: str) -> None:
+        entry = {"id": report_id, "input_hash": report_hash(text), "pdf": pdf_name(report_id)}
+        start = time.perf_counter()
+        try:
+            async with semaphore:
+                parsed_data = await parse_report(text)
+                state = {"aml_ai_result": classify_report(parsed_data, text)}
+                clinical_overview = await asyncio.to_thread(generate_overview, state) if overview else None
+            await loop.run_in_executor(pool, render_pdf_file, state, clinical_overview,
+                                       os.path.join(output_dir, entry["pdf"]))
+            result = state["aml_ai_result"]
+            entry.update({
+                "status": "done",
+                "who_class": result["who_class"],
+                "icc_class": result["icc_class"],
+                "flags": review_flags(parsed_data),
+            })
+            stats["done"] += 1
+            print(f"✅ {report_id}: {result['who_class']}")
+        except Exception as e:
+            entry.update({"status": "failed", "error": str(e) or type(e).__name__})
+            stats["failed"] += 1
+            print(f"❌ {report_id}: {entry['error']}")
+        entry["seconds"] = round(time.perf_counter() - start, 2)
+        entry["finished_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        record(entry)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            await asyncio.gather(*(process(pool, rid, text) for rid, text in pending))
+    finally:
+        manifest_file.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Directory of .txt reports or a JSONL file")
+    parser.add_argument("--output", required=True, help="Directory for the PDFs and manifest.jsonl")
+    parser.add_argument("--concurrency", type=int, default=8, help="Reports parsed at the same time")
+    parser.add_argument("--workers", type=int, default=4, help="PDF rendering processes")
+    parser.add_argument("--overview", action="store_true", help="Add the GPT clinical overview to each PDF")
+    parser.add_argument("--force", action="store_true", help="Reprocess reports already in the manifest")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    stats = asyncio.run(run_batch(load_reports(args.source), args.output, concurrency=args.concurrency,
+                                  workers=args.workers, overview=args.overview, force=args.force))
+    print(f"🏁 {stats['done']} done, {stats['failed']} failed, {stats['skipped']} skipped "
+          f"in {time.perf_counter() - start:.1f}s")
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-dict classification vs classifiers.batch_classifier.classify_batch.
+
+Builds a synthetic registry of parsed cases (with the duplication typical of
+historical data) and reports cases/sec for:
+    1. the per-dict loop over classify_combined_WHO2022 + classify_combined_ICC2022
+    2. classify_batch in this process
+    3. classify_batch with include_derivations=False (no derivation text built)
+    4. classify_batch on a process pool, when --workers is above 1
+
+The batch speedup comes from classifying each distinct record once, so it
+shrinks as --distinct approaches --cases. The pool has to pickle every record
+and result; compare it with (2) on the target machine before using it.
+
+Usage:
+    python scripts/benchmark_batch_classifier.py --cases 100000 --distinct 5000
+    python scripts/benchmark_batch_classifier.py --cases 100000 --distinct 100000 --workers 4
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classifiers.aml_mds_combined import classify_combined_ICC2022, classify_combined_WHO2022
+from classifiers.batch_classifier import classify_batch
+
+AML_DEFINING = ["NPM1", "RUNX1::RUNX1T1", "CBFB::MYH11", "PML::RARA", "KMT2A", "MECOM", "CEBPA"]
+MDS_MUTATIONS = ["ASXL1", "BCOR", "EZH2", "RUNX1", "SF3B1", "SRSF2", "STAG2", "U2AF1", "ZRSR2"]
+MDS_CYTOGENETICS = ["Complex_karyotype", "del_5q", "-7", "del_7q", "+8", "del_20q"]
+
+
+def make_case(rng: random.Random) -> dict:
+    """Builds one plausible parsed record in the main parser's format."""
+    defining = rng.choice(AML_DEFINING + [None] * 6)
+    return {
+        "blasts_percentage": rng.choice([2, 5, 8, 12, 15, 19, 22, 35, 60, 85]),
+        "AML_defining_recurrent_genetic_abnormalities": {g: g == defining for g in AML_DEFINING},
+        "Biallelic_TP53_mutation": {"2_x_TP53_mutations": rng.random() < 0.05},
+        "MDS_related_mutation": {g: rng.random() < 0.1 for g in MDS_MUTATIONS},
+        "MDS_related_cytogenetics": {c: rng.random() < 0.05 for c in MDS_CYTOGENETICS},
+        "AML_differentiation": rng.choice([None, "FAB M1", "FAB M2", "FAB M4", "FAB M5"]),
+        "qualifiers": {
+            "previous_cytotoxic_therapy": rng.choice(["None", "Ionising radiation"]),
+            "predisposing_germline_variant": "None",
+            "previous_MDS_diagnosed_over_3_months_ago": rng.random() < 0.1,
+        },
+        "number_of_dysplastic_lineages": rng.choice([0, 1, 2, 3]),
+    }
+
+
+def timed(label: str, n_cases: int, fn) -> None:
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<45} {elapsed:8.2f}s  {n_cases / elapsed:12,.0f} cases/sec")
+
+
+def per_dict_loop(cases):
+    for case in cases:
+        classify_combined_WHO2022(case, not_erythroid=False)
+        classify_combined_ICC2022(case)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=100_000)
+    parser.add_argument("--distinct", type=int, default=5_000, help="number of distinct parsed records")
+    parser.add_argument("--workers", type=int, default=1, help="also time classify_batch on this many processes")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    distinct = [make_case(rng) for _ in range(args.distinct)]
+    cases = [rng.choice(distinct) for _ in range(args.cases)]
+    print(f"📊 {args.cases:,} cases, {args.distinct:,} distinct records\n")
+
+    timed("per-dict classify_combined_*", args.cases, lambda: per_dict_loop(cases))
+    timed("classify_batch", args.cases, lambda: classify_batch(cases))
+    timed("classify_batch (no derivations)", args.cases,
+          lambda: classify_batch(cases, include_derivations=False))
+    if args.workers > 1:
+        timed(f"classify_batch ({args.workers} workers)", args.cases,
+              lambda: classify_batch(cases, workers=args.workers))
+
+
+if __name__ == "__main__":
+    main()
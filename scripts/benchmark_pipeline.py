@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Benchmark: end-to-end wall time and LLM calls per report for the main pipeline.
+
+Each report goes through the steps the results page runs:
+    - aml:    parse_genetics_report_aml
+    - ipss:   parse_ipss_report
+    - trials: ClinicalTrialMatcher.find_matching_trials on the formatted AML result
+
+and the script reports p50 / p95 / mean wall time and LLM calls per report for
+every step and for the whole report.
+
+The OpenAI traffic goes through utils.llm_transport, so the same reports can be
+timed without the network:
+    - --mode record: calls OpenAI and saves every response to --fixtures
+    - --mode replay: serves the saved responses in-process, delayed by --latency
+    - --mode server: serves them from a local chat-completions server instead,
+      which also exercises sockets, the connection pool and the SDK
+
+The LLM response cache and the trial match cache are replaced by empty in-memory
+caches before every report (unless --keep-cache), so each report pays for all
+of its calls. Reports run one after another; the prompts inside a report run
+concurrently, as in the app.
+
+Usage:
+    python scripts/benchmark_pipeline.py reports/ --mode record --fixtures bench.sqlite3
+    python scripts/benchmark_pipeline.py reports/ --mode replay --fixtures bench.sqlite3 --latency lognormal:1.5,0.4
+    python scripts/benchmark_pipeline.py reports.jsonl --mode server --fixtures bench.sqlite3 --steps aml trials
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+from typing import Dict, List
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.llm_cache as llm_cache
+import utils.trial_match_cache as trial_match_cache
+from utils.llm_transport import (
+    DEFAULT_REPLAY_LATENCY, LatencyModel, get_fixture_store, recorded_call_count, serve_fixtures
+)
+
+STEPS = ("aml", "ipss", "trials")
+MODES = ("record", "replay", "server")
+
+
+##############################
+# PIPELINE STEPS
+##############################
+def run_aml(text: str, results: dict) -> bool:
+    from parsers.aml_parser import parse_genetics_report_aml
+    results["aml"] = parse_genetics_report_aml(text)
+    return bool(results["aml"])
+
+
+def run_ipss(text: str, results: dict) -> bool:
+    from parsers.mds_ipss_parser import parse_ipss_report
+    results["ipss"] = parse_ipss_report(text)
+    return bool(results["ipss"])
+
+
+def run_trials(text: str, results: dict) -> bool:
+    from parsers.clinical_trial_matcher import ClinicalTrialMatcher, format_patient_data_for_matching
+    patient_data = format_patient_data_for_matching(results.get("aml") or {}, text)
+    results["trials"] = asyncio.run(ClinicalTrialMatcher().find_matching_trials(patient_data))
+    return True
+
+
+STEP_FUNCTIONS = {"aml": run_aml, "ipss": run_ipss, "trials": run_trials}
+
+
+def reset_caches() -> None:
+    llm_cache._cache_instance = llm_cache.LLMResponseCache(path=":memory:")
+    trial_match_cache._cache_instance = trial_match_cache.TrialMatchCache(path=":memory:")
+
+
+def benchmark_report(text: str, steps: List[str], keep_cache: bool = False) -> Dict[str, dict]:
+    """Runs the steps for one report; returns {step: {"seconds", "calls", "ok"}}."""
+    if not keep_cache:
+        reset_caches()
+    timings, results = {}, {}
+    for step in steps:
+        calls, start = recorded_call_count(), time.perf_counter()
+        try:
+            ok = STEP_FUNCTIONS[step](text, results)
+        except Exception as e:
+            print(f"❌ {step}: {e}")
+            ok = False
+        timings[step] = {"seconds": time.perf_counter() - start,
+                         "calls": recorded_call_count() - calls, "ok": ok}
+    return timings
+
+
+##############################
+# REPORTING
+##############################
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarise(runs: List[Dict[str, dict]], steps: List[str]) -> Dict[str, dict]:
+    summary = {}
+    for step in steps + ["report"]:
+        if step == "report":
+            seconds = [sum(t["seconds"] for t in run.values()) for run in runs]
+            calls = [sum(t["calls"] for t in run.values()) for run in runs]
+            failed = sum(not all(t["ok"] for t in run.values()) for run in runs)
+        else:
+            seconds = [run[step]["seconds"] for run in runs]
+            calls = [run[step]["calls"] for run in runs]
+            failed = sum(not run[step]["ok"] for run in runs)
+        summary[step] = {
+            "p50": percentile(seconds, 50),
+            "p95": percentile(seconds, 95),
+            "mean": sum(seconds) / len(seconds),
+            "calls_per_report": sum(calls) / len(calls),
+            "failed": failed,
+        }
+    return summary
+
+
+def print_summary(summary: Dict[str, dict], n_reports: int, total_seconds: float) -> None:
+    print(f"\n{'step':<8} {'p50 s':>8} {'p95 s':>8} {'mean s':>8} {'calls/report':>13} {'failed':>7}")
+    for step, row in summary.items():
+        print(f"{step:<8} {row['p50']:>8.2f} {row['p95']:>8.2f} {row['mean']:>8.2f} "
+              f"{row['calls_per_report']:>13.1f} {row['failed']:>7}")
+    print(f"\n🏁 {n_reports} reports in {total_seconds:.1f}s "
+          f"({n_reports / total_seconds * 60:.1f} reports/min)")
+
+
+##############################
+# MAIN
+##############################
+def configure_transport(mode: str, fixtures: str, latency: str, seed: int):
+    """Points the OpenAI clients at the chosen transport; returns the stand-in server, if any."""
+    os.environ["OPENAI_FIXTURES_PATH"] = fixtures
+    os.environ["OPENAI_REPLAY_LATENCY"] = latency
+    os.environ["OPENAI_REPLAY_SEED"] = str(seed)
+    os.environ["OPENAI_TRANSPORT"] = "live" if mode == "server" else mode
+    if mode in ("replay", "server"):
+        os.environ.setdefault("OPENAI_API_KEY", "replay")
+    if mode != "server":
+        return None
+    server = serve_fixtures(get_fixture_store(fixtures), LatencyModel(latency, seed=seed))
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    print(f"🛰️ Stand-in chat-completions server on {server.base_url}")
+    return server
+
+
+def main():
+    from batch_reports import load_reports
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Directory of .txt reports or a JSONL file")
+    parser.add_argument("--mode", choices=MODES, default="replay")
+    parser.add_argument("--fixtures", default="llm_fixtures.sqlite3", help="Fixture store to record to / replay from")
+    parser.add_argument("--latency", default=DEFAULT_REPLAY_LATENCY,
+                        help="Replay latency per call, e.g. recorded, fixed:1.2, lognormal:1.5,0.4")
+    parser.add_argument("--steps", nargs="+", choices=STEPS, default=list(STEPS))
+    parser.add_argument("--repeat", type=int, default=1, help="Passes over the reports")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep-cache", action="store_true", help="Keep the LLM caches between reports")
+    parser.add_argument("--json", help="Write per-report timings and the summary to this file")
+    args = parser.parse_args()
+
+    LatencyModel(args.latency)  # fail fast on a bad spec
+    reports = load_reports(args.source)
+    if not reports:
+        parser.error(f"no reports found in {args.source}")
+    server = configure_transport(args.mode, args.fixtures, args.latency, args.seed)
+    print(f"📊 {len(reports)} reports x {args.repeat}, steps: {', '.join(args.steps)}, mode: {args.mode}")
+
+    runs, start = [], time.perf_counter()
+    try:
+        for _ in range(args.repeat):
+            for report_id, text in reports:
+                timings = benchmark_report(text, args.steps, keep_cache=args.keep_cache)
+                runs.append(timings)
+                total = sum(t["seconds"] for t in timings.values())
+                print(f"{'✅' if all(t['ok'] for t in timings.values()) else '⚠️'} {report_id}: {total:.2f}s, "
+                      f"{sum(t['calls'] for t in timings.values())} calls")
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+    total_seconds = time.perf_counter() - start
+
+    summary = summarise(runs, args.steps)
+    print_summary(summary, len(runs), total_seconds)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"mode": args.mode, "latency": args.latency, "summary": summary, "runs": runs}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Benchmark: cached versus uncached input tokens per report.
+
+The extraction prompts put a shared system message and the report first and the
+section-specific task last (utils/prompt_layout.py), so OpenAI's automatic prompt
+caching can serve the common prefix of every prompt after the first. For each
+report this script runs the extraction parsers the app uses (classification,
+ELN, IPSS, treatment and IPSS-M) and reports:
+
+    - prompts:   LLM calls made for the report
+    - input:     prompt tokens billed, from the API usage
+    - cached:    prompt tokens served from the provider cache (usage.prompt_tokens_details)
+    - uncached:  input - cached
+    - estimate:  share of the input the layout makes cacheable, computed locally
+                 from the assembled prompts (about 4 characters per token, caching
+                 from 1024 tokens in 128-token steps)
+
+Prompts of one report run concurrently, so the first few can miss the cache
+before it is populated; the measured share is normally below the estimate.
+
+Token usage comes from the API responses, so --mode record (live calls) gives
+real numbers and replay/server modes repeat the usage recorded with the
+fixtures. --estimate-only makes no calls at all.
+
+Usage:
+    python scripts/benchmark_prompt_cache.py reports/ --mode record --fixtures bench.sqlite3
+    python scripts/benchmark_prompt_cache.py reports/ --estimate-only
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from typing import Dict, List
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.llm_metrics as llm_metrics
+from utils.llm_metrics import LLMMetrics
+from utils.llm_transport import DEFAULT_REPLAY_LATENCY
+from utils.prompt_layout import EXTRACTION_SYSTEM_MESSAGE, shared_prefix_length
+
+CONSUMERS = ("classification", "eln", "ipss", "treatment")
+CHARS_PER_TOKEN = 4
+CACHE_MIN_TOKENS = 1024
+CACHE_INCREMENT_TOKENS = 128
+
+
+##############################
+# LAYOUT ESTIMATE
+##############################
+def report_prompts(report_text: str) -> List[str]:
+    """Every extraction prompt the parsers build for one report."""
+    from classifiers.mds_risk_classifier import _build_ipssm_prompts
+    from parsers import aml_eln_parser, aml_parser, mds_ipss_parser, treatment_parser
+
+    prompts = list(aml_parser._build_aml_prompts(report_text)[1].values())
+    prompts.append(aml_eln_parser._build_eln_prompt(report_text)[1])
+    prompts += list(mds_ipss_parser._build_ipss_prompts(report_text)[1].values())
+    prompts += list(treatment_parser._build_treatment_prompts(report_text)[1].values())
+    prompts += list(_build_ipssm_prompts(report_text)[1].values())
+    return prompts
+
+
+def estimate_cacheable_share(prompts: List[str]) -> float:
+    """Share of the input tokens of ``prompts`` that prefix caching can serve."""
+    if len(prompts) < 2:
+        return 0.0
+    system_chars = len(EXTRACTION_SYSTEM_MESSAGE)
+    prefix_tokens = (system_chars + shared_prefix_length(prompts)) // CHARS_PER_TOKEN
+    if prefix_tokens < CACHE_MIN_TOKENS:
+        return 0.0
+    cacheable = prefix_tokens // CACHE_INCREMENT_TOKENS * CACHE_INCREMENT_TOKENS
+    total_tokens = sum(system_chars + len(p) for p in prompts) / CHARS_PER_TOKEN
+    return cacheable * (len(prompts) - 1) / total_tokens
+
+
+##############################
+# MEASUREMENT
+##############################
+async def run_parsers(report_text: str) -> None:
+    from classifiers.mds_risk_classifier import parse_for_ipssm_async
+    from parsers.unified_parser import parse_report_once_async
+
+    await asyncio.gather(parse_report_once_async(report_text, CONSUMERS), parse_for_ipssm_async(report_text))
+
+
+def measure_report(report_text: str) -> Dict[str, int]:
+    """Runs the parsers for one report on fresh caches and sums the token usage."""
+    from benchmark_pipeline import reset_caches
+
+    reset_caches()
+    llm_metrics._metrics_instance = LLMMetrics()
+    asyncio.run(run_parsers(report_text))
+    prompts = llm_metrics.metrics_snapshot()["prompts"].values()
+    return {
+        "prompts": sum(p["api_calls"] for p in prompts),
+        "input": sum(p["prompt_tokens"] for p in prompts),
+        "cached": sum(p["cached_prompt_tokens"] for p in prompts),
+    }
+
+
+def main():
+    from batch_reports import load_reports
+    from benchmark_pipeline import configure_transport
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Directory of .txt reports or a JSONL file")
+    parser.add_argument("--mode", choices=("record", "replay", "server"), default="record")
+    parser.add_argument("--fixtures", default="llm_fixtures.sqlite3", help="Fixture store to record to / replay from")
+    parser.add_argument("--latency", default=DEFAULT_REPLAY_LATENCY, help="Replay latency per call")
+    parser.add_argument("--estimate-only", action="store_true", help="Only compute the layout estimate")
+    args = parser.parse_args()
+
+    reports = load_reports(args.source)
+    if not reports:
+        parser.error(f"no reports found in {args.source}")
+    server = None if args.estimate_only else configure_transport(args.mode, args.fixtures, args.latency, seed=0)
+
+    print(f"{'report':<24} {'prompts':>7} {'input':>8} {'cached':>8} {'uncached':>9} {'cached %':>9} {'estimate':>9}")
+    totals = {"prompts": 0, "input": 0, "cached": 0}
+    try:
+        for report_id, text in reports:
+            estimate = estimate_cacheable_share(report_prompts(text))
+            if args.estimate_only:
+                print(f"{report_id[:24]:<24} {'':>7} {'':>8} {'':>8} {'':>9} {'':>9} {estimate:>9.0%}")
+                continue
+            usage = measure_report(text)
+            for key in totals:
+                totals[key] += usage[key]
+            share = usage["cached"] / usage["input"] if usage["input"] else 0.0
+            print(f"{report_id[:24]:<24} {usage['prompts']:>7} {usage['input']:>8} {usage['cached']:>8} "
+                  f"{usage['input'] - usage['cached']:>9} {share:>9.0%} {estimate:>9.0%}")
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    if not args.estimate_only and totals["input"]:
+        print(f"\n🏁 {totals['cached']:,} of {totals['input']:,} input tokens cached "
+              f"({totals['cached'] / totals['input']:.0%}), {totals['prompts']} prompts")
+
+
+if __name__ == "__main__":
+    main()
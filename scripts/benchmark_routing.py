@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Benchmark: parse latency and agreement with model routing on versus off.
+
+Each report is parsed twice on fresh caches, once with every prompt on its usual
+model and once through utils/model_router.py, and the script reports:
+
+    - off / on:   wall time of the parse steps (p50 / p95 over the reports)
+    - agreement:  share of extracted fields with the same value in both runs
+    - routes:     calls per route and escalation reasons of the routed runs
+
+Both runs need their responses in the fixture store, so record the corpus once
+with --mode record (which calls the fast and the usual models) before replaying.
+Use ``--latency recorded`` to replay with the latencies measured while recording;
+the other latency specs give every model the same delay.
+
+Usage:
+    python scripts/benchmark_routing.py reports/ --mode record --fixtures bench.sqlite3
+    python scripts/benchmark_routing.py reports/ --mode replay --fixtures bench.sqlite3 --latency recorded
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.model_router as model_router
+from utils.llm_transport import DEFAULT_REPLAY_LATENCY
+from utils.model_router import get_model_router
+
+STEPS = ["aml", "ipss"]
+# Per-route statistics of each routed run
+ROUTE_TOTALS: List[dict] = []
+
+
+def flatten(value: Any, prefix: str = "") -> Dict[str, Any]:
+    """{"a.b.c": leaf} for a nested parser result."""
+    if not isinstance(value, dict):
+        return {prefix: value}
+    flat = {}
+    for key, inner in value.items():
+        flat.update(flatten(inner, f"{prefix}.{key}" if prefix else str(key)))
+    return flat
+
+
+def parse_report(text: str, routing: bool) -> Tuple[float, Dict[str, Any]]:
+    """Runs the parse steps for one report on fresh caches; returns (seconds, flattened results)."""
+    from benchmark_pipeline import STEP_FUNCTIONS, reset_caches
+
+    reset_caches()
+    model_router._router_instance = None
+    router = get_model_router()
+    router.enabled = routing
+    results, start = {}, time.perf_counter()
+    for step in STEPS:
+        try:
+            STEP_FUNCTIONS[step](text, results)
+        except Exception as e:
+            print(f"❌ {step} ({'routed' if routing else 'usual model'}): {e}")
+    seconds = time.perf_counter() - start
+    if routing:
+        ROUTE_TOTALS.append(router.snapshot()["routes"])
+    return seconds, flatten(results)
+
+
+def agreement(baseline: Dict[str, Any], routed: Dict[str, Any]) -> Tuple[int, int]:
+    """(fields with the same value, fields compared)."""
+    keys = set(baseline) | set(routed)
+    return sum(baseline.get(key) == routed.get(key) for key in keys), len(keys)
+
+
+def main():
+    from batch_reports import load_reports
+    from benchmark_pipeline import configure_transport, percentile
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Directory of .txt reports or a JSONL file")
+    parser.add_argument("--mode", choices=("record", "replay", "server"), default="replay")
+    parser.add_argument("--fixtures", default="llm_fixtures.sqlite3", help="Fixture store to record to / replay from")
+    parser.add_argument("--latency", default=DEFAULT_REPLAY_LATENCY, help="Replay latency per call")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    reports = load_reports(args.source)
+    if not reports:
+        parser.error(f"no reports found in {args.source}")
+    server = configure_transport(args.mode, args.fixtures, args.latency, args.seed)
+
+    print(f"{'report':<24} {'off s':>8} {'on s':>8} {'agreement':>10}")
+    off_times, on_times, same, compared = [], [], 0, 0
+    try:
+        for report_id, text in reports:
+            off_seconds, baseline = parse_report(text, routing=False)
+            on_seconds, routed = parse_report(text, routing=True)
+            matched, total = agreement(baseline, routed)
+            off_times.append(off_seconds)
+            on_times.append(on_seconds)
+            same, compared = same + matched, compared + total
+            print(f"{report_id[:24]:<24} {off_seconds:>8.2f} {on_seconds:>8.2f} "
+                  f"{matched / total if total else 1.0:>10.1%}")
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    calls, reasons = Counter(), Counter()
+    for routes in ROUTE_TOTALS:
+        for route, stats in routes.items():
+            calls[route] += stats["calls"]
+            reasons.update(stats["escalation_reasons"])
+    print(f"\nrouting off: p50 {percentile(off_times, 50):.2f}s, p95 {percentile(off_times, 95):.2f}s")
+    print(f"routing on:  p50 {percentile(on_times, 50):.2f}s, p95 {percentile(on_times, 95):.2f}s")
+    print(f"routes: {dict(calls)}, escalations: {dict(reasons) or 'none'}")
+    print(f"\n🏁 {same:,} of {compared:,} fields agree ({same / compared if compared else 1.0:.1%}) "
+          f"over {len(reports)} reports")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Benchmark: BM25 first-stage trial retrieval vs scoring every trial with the LLM.
+
+Scoring every open trial sends ceil(N / 5) GPT-4o batches per patient. With the
+BM25 ranker only the top K trials are sent. This script reports, for several K:
+    - recall: the share of relevant trials that survive the top-K cut
+    - LLM batches per patient, and the saving against scoring everything
+    - ranking time per patient
+
+Relevant trials come from one of two sources:
+    - default: synthetic AML / MDS patients, formatted with
+      format_patient_data_for_matching. A trial is relevant when its cancer
+      types or title name the patient's disease.
+    - --labels file.json: real judgements, given as a list of
+      {"patient": "<formatted patient text>", "relevant": ["<trial link>", ...]}.
+      For example, the trials GPT-4o scored >= 40 when every trial was scored.
+
+Usage:
+    python scripts/benchmark_trial_ranker.py --patients 200 --k 5 10 15 20 30
+    python scripts/benchmark_trial_ranker.py --labels llm_labels.json
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+# Add parent directory to path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parsers.clinical_trial_matcher import format_patient_data_for_matching
+from parsers.trial_index import TRIALS_FILE, TrialIndex, disease_families
+
+AML_GENES = ["NPM1", "FLT3_ITD", "CEBPA", "RUNX1", "TP53", "IDH1", "IDH2", "KMT2A", "ASXL1"]
+MDS_GENES = ["SF3B1", "ASXL1", "SRSF2", "U2AF1", "TP53", "EZH2", "RUNX1", "STAG2"]
+DIAGNOSES = {"AML": "Acute Myeloid Leukemia (AML)", "MDS": "Myelodysplastic Syndrome (MDS)"}
+STATUSES = ["newly_diagnosed", "relapsed", "refractory", "in_remission"]
+
+
+def make_patient(rng: random.Random):
+    """Returns (formatted patient text, disease family) for one synthetic patient."""
+    family = rng.choice(["AML", "MDS"])
+    genes = AML_GENES if family == "AML" else MDS_GENES
+    positive = set(rng.sample(genes, rng.randint(0, 3)))
+    parsed = {
+        "blasts_percentage": rng.choice([3, 8, 12, 25, 40, 70]) if family == "AML" else rng.choice([2, 4, 7, 12, 16]),
+        "ELN2024_risk_genes": {g: g in positive for g in genes},
+        "MDS_related_mutation": {g: g in positive for g in MDS_GENES} if family == "MDS" else {},
+    }
+    status = rng.choice(STATUSES)
+    additional_info = {
+        "age": rng.randint(25, 85),
+        "ecog_status": rng.choice([0, 1, 2]),
+        status: True,
+        "prior_chemotherapy_regimens": 0 if status == "newly_diagnosed" else rng.randint(1, 3),
+        "primary_diagnosis": DIAGNOSES[family],
+    }
+    return format_patient_data_for_matching(parsed, None, additional_info), family
+
+
+def synthetic_labels(index: TrialIndex, n_patients: int, seed: int):
+    rng = random.Random(seed)
+    families = [
+        disease_families(f"{t.get('cancer_types', '')} {t.get('title', '')}") or frozenset()
+        for t in index.trials
+    ]
+    cases = []
+    for _ in range(n_patients):
+        text, family = make_patient(rng)
+        cases.append((text, {t.get("link") for t, f in zip(index.trials, families) if family in f}))
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", default=TRIALS_FILE)
+    parser.add_argument("--patients", type=int, default=200)
+    parser.add_argument("--k", type=int, nargs="+", default=[5, 10, 15, 20, 25, 30])
+    parser.add_argument("--labels", help="JSON list of {patient, relevant} judgements")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with open(args.trials, "r", encoding="utf-8") as f:
+        index = TrialIndex.from_trials(json.load(f), source_file=args.trials)
+
+    start = time.perf_counter()
+    index.ranker
+    build_ms = (time.perf_counter() - start) * 1000
+
+    if args.labels:
+        with open(args.labels, "r", encoding="utf-8") as f:
+            cases = [(case["patient"], set(case["relevant"])) for case in json.load(f)]
+    else:
+        cases = synthetic_labels(index, args.patients, args.seed)
+    cases = [(text, relevant) for text, relevant in cases if relevant]
+
+    start = time.perf_counter()
+    rankings = [[t.get("link") for t, _ in index.rank(text)] for text, _ in cases]
+    rank_ms = (time.perf_counter() - start) * 1000 / max(len(cases), 1)
+
+    n_trials = len(index.trials)
+    full_batches = math.ceil(n_trials / 5)
+    print(f"{n_trials} open trials, {len(cases)} patients with at least one relevant trial")
+    print(f"BM25 index built in {build_ms:.1f} ms; ranking takes {rank_ms:.2f} ms per patient")
+    print(f"Score everything: recall 1.000, {full_batches} LLM batches per patient")
+    print(f"{'K':>4} {'recall':>8} {'all found':>10} {'batches':>8} {'saved':>7}")
+    for k in sorted(args.k):
+        recalls, complete = [], 0
+        for (_, relevant), ranking in zip(cases, rankings):
+            found = len(relevant & set(ranking[:k]))
+            recalls.append(found / len(relevant))
+            complete += found == len(relevant)
+        batches = math.ceil(min(k, n_trials) / 5)
+        print(f"{k:>4} {sum(recalls) / len(recalls):>8.3f} {complete / len(cases):>10.1%} "
+              f"{batches:>8} {1 - batches / full_batches:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
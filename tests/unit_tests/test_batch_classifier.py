@@ -0,0 +1,99 @@
+"""
+Tests for batch WHO/ICC classification (classifiers/batch_classifier.py).
+"""
+
+import json
+import os
+import sys
+
+import pandas as pd
+import pyarrow as pa
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from classifiers.aml_mds_combined import classify_combined_ICC2022, classify_combined_WHO2022
+from classifiers.batch_classifier import classify_batch
+
+CASES = [
+    {
+        "blasts_percentage": 30.0,
+        "AML_defining_recurrent_genetic_abnormalities": {"NPM1": True},
+        "qualifiers": {},
+    },
+    {
+        "blasts_percentage": 8.0,
+        "AML_defining_recurrent_genetic_abnormalities": {"NPM1": False},
+        "MDS_related_mutation": {"SF3B1": True},
+        "qualifiers": {},
+    },
+    {
+        "blasts_percentage": 25.0,
+        "AML_defining_recurrent_genetic_abnormalities": {"PML::RARA": True},
+        "qualifiers": {},
+    },
+]
+
+
+def expected_row(case):
+    who, _, who_type = classify_combined_WHO2022(case, not_erythroid=False)
+    icc, _, icc_type = classify_combined_ICC2022(case)
+    return who, who_type, icc, icc_type
+
+
+def rows(frame):
+    return list(frame[["who_classification", "who_disease_type",
+                       "icc_classification", "icc_disease_type"]].itertuples(index=False, name=None))
+
+
+def test_matches_per_dict_path():
+    result = classify_batch(CASES)
+    assert rows(result) == [expected_row(case) for case in CASES]
+    assert result["error"].isna().all()
+
+
+def test_duplicates_are_fanned_out_in_order():
+    cases = [CASES[0], CASES[1], CASES[0], CASES[2], CASES[1]]
+    result = classify_batch(cases)
+    assert rows(result) == [expected_row(case) for case in cases]
+    assert result.loc[0, "who_derivation"] == classify_combined_WHO2022(CASES[0], not_erythroid=False)[1]
+
+
+def test_dataframe_input_keeps_index():
+    frame = pd.DataFrame({"parsed": [json.dumps(case) for case in CASES]}, index=["a", "b", "c"])
+    result = classify_batch(frame, record_column="parsed")
+    assert list(result.index) == ["a", "b", "c"]
+    assert rows(result) == [expected_row(case) for case in CASES]
+
+
+def test_pyarrow_table_rows_with_missing_fields():
+    # Struct columns fill fields absent from a row with nulls; those must not
+    # reach the classifiers as explicit None values.
+    table = pa.Table.from_pylist(CASES)
+    result = classify_batch(table)
+    assert rows(result) == [expected_row(case) for case in CASES]
+
+
+def test_failing_case_is_reported_not_raised():
+    broken = {"blasts_percentage": 30.0, "AML_defining_recurrent_genetic_abnormalities": "NPM1"}
+    result = classify_batch([CASES[0], broken])
+    assert result.loc[0, "error"] is None
+    assert "items" in result.loc[1, "error"]
+    assert result.loc[1, "who_classification"] is None
+    assert result.loc[1, "who_derivation"] is None
+
+
+def test_derivations_can_be_skipped():
+    cases = CASES + [{"blasts_percentage": None, "qualifiers": {}}, {
+        "blasts_percentage": 12.0,
+        "Biallelic_TP53_mutation": {"2_x_TP53_mutations": True},
+        "AML_differentiation": "M6a",
+        "qualifiers": {"previous_cytotoxic_therapy": "Ionising radiation"},
+    }]
+    result = classify_batch(cases, include_derivations=False)
+    assert rows(result) == [expected_row(case) for case in cases]
+    assert result["who_derivation"].isna().all() and result["icc_derivation"].isna().all()
+
+    for case in cases:
+        assert classify_combined_WHO2022(case, not_erythroid=False, explain=False)[1] == []
+        assert classify_combined_ICC2022(case, explain=False)[1] == []
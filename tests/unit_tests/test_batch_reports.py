@@ -0,0 +1,86 @@
+"""
+Tests for the headless batch report generator (scripts/batch_reports.py).
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+# Add the project root and the scripts directory to the Python path
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+
+# utils.pdf creates an OpenAI client at import time; no request is ever sent here.
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+import batch_reports
+from batch_reports import load_manifest, load_reports, run_batch
+
+PARSED = {
+    "blasts_percentage": 45,
+    "AML_defining_recurrent_genetic_abnormalities": {"NPM1": True},
+    "Biallelic_TP53_mutation": {},
+    "MDS_related_mutation": {},
+    "MDS_related_cytogenetics": {},
+    "AML_differentiation": "FAB M2",
+    "qualifiers": {"previous_cytotoxic_therapy": "None"},
+    "ELN2024_risk_genes": {"NPM1": True},
+}
+
+
+@pytest.fixture
+def parsed_reports(monkeypatch):
+    parsed = []
+
+    async def fake_parse(report_text):
+        if "unreadable" in report_text:
+            raise ValueError("No classification data extracted from report")
+        parsed.append(report_text)
+        return dict(PARSED, blasts_percentage="Unknown" if "blasts?" in report_text else 45)
+
+    monkeypatch.setattr(batch_reports, "parse_report", fake_parse)
+    return parsed
+
+
+def write_reports(directory, reports):
+    directory.mkdir(exist_ok=True)
+    for name, text in reports.items():
+        (directory / f"{name}.txt").write_text(text)
+
+
+def run(reports, output):
+    return asyncio.run(run_batch(reports, str(output), concurrency=2, workers=1))
+
+
+def test_load_reports_from_directory_and_jsonl(tmp_path):
+    write_reports(tmp_path / "in", {"b": "second", "a": "first"})
+    assert load_reports(str(tmp_path / "in")) == [("a", "first"), ("b", "second")]
+
+    jsonl = tmp_path / "reports.jsonl"
+    jsonl.write_text(json.dumps({"id": "p1", "report": "one"}) + "\n\n" + json.dumps({"text": "two"}) + "\n")
+    assert load_reports(str(jsonl)) == [("p1", "one"), ("3", "two")]
+
+
+def test_batch_writes_pdfs_and_resumes_from_manifest(tmp_path, parsed_reports):
+    source, output = tmp_path / "in", tmp_path / "out"
+    write_reports(source, {"pt 1": "NPM1 mutated AML", "pt2": "AML, blasts? pending", "pt3": "unreadable"})
+
+    stats = run(load_reports(str(source)), output)
+    assert stats == {"total": 3, "skipped": 0, "done": 2, "failed": 1}
+    manifest = load_manifest(str(output))
+    assert manifest["pt 1"]["status"] == "done" and manifest["pt 1"]["pdf"] == "pt_1.pdf"
+    assert manifest["pt2"]["flags"] == ["blasts_unknown"]
+    assert manifest["pt3"]["status"] == "failed"
+    assert (output / "pt_1.pdf").read_bytes().startswith(b"%PDF")
+
+    # A rerun only retries the failure and reports whose text changed
+    (source / "pt2.txt").write_text("AML, blasts 30%")
+    parsed_reports.clear()
+    stats = run(load_reports(str(source)), output)
+    assert stats == {"total": 3, "skipped": 1, "done": 1, "failed": 1}
+    assert parsed_reports == ["AML, blasts 30%"]
+    assert load_manifest(str(output))["pt2"]["flags"] == []
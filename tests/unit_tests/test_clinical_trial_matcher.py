@@ -0,0 +1,100 @@
+"""
+Tests for streaming trial matching (ClinicalTrialMatcher.stream_matching_trials).
+"""
+
+import asyncio
+import json
+import os
+import re
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import utils.trial_match_cache as trial_match_cache
+from parsers.clinical_trial_matcher import ClinicalTrialMatcher
+from utils.trial_match_cache import TrialMatchCache
+
+TRIALS = [
+    {"title": f"Trial {i}", "link": f"https://example.org/trial-{i}", "status": "Open"}
+    for i in range(10)
+]
+
+
+class SlowFirstBatchClient:
+    """Answers the batch containing "Trial 0" last; every trial scores its index * 5."""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        prompt = kwargs["messages"][1]["content"]
+        titles = re.findall(r"^Title: (.*)$", prompt, flags=re.MULTILINE)
+        await asyncio.sleep(0.05 if "Trial 0" in titles else 0)
+        content = json.dumps({
+            f"trial_{i}": {"relevance_score": int(title.split()[-1]) * 5, "recommendation": "consider"}
+            for i, title in enumerate(titles, 1)
+        })
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+@pytest.fixture
+def matcher(tmp_path, monkeypatch):
+    monkeypatch.setattr(trial_match_cache, "_cache_instance",
+                        TrialMatchCache(path=str(tmp_path / "matches.sqlite3")))
+    instance = ClinicalTrialMatcher.__new__(ClinicalTrialMatcher)
+    instance.client = SlowFirstBatchClient()
+    instance.semaphore = asyncio.Semaphore(3)
+    return instance
+
+
+@pytest.fixture
+def trials_file(tmp_path):
+    path = tmp_path / "trials.json"
+    path.write_text(json.dumps(TRIALS))
+    return str(path)
+
+
+def collect(matcher, trials_file):
+    async def run():
+        return [update async for update in matcher.stream_matching_trials("Age: 70", trials_file)]
+    return asyncio.run(run())
+
+
+def test_batches_are_yielded_as_they_complete(matcher, trials_file):
+    updates = collect(matcher, trials_file)
+
+    assert [u["stage"] for u in updates] == ["scoring", "scoring", "done"]
+    assert [u["completed_batches"] for u in updates] == [1, 2, 2]
+    # The fast batch (trials 5-9) is reported before the slow one, sorted by score.
+    assert [t["title"] for t in updates[0]["trials"]] == [f"Trial {i}" for i in range(9, 4, -1)]
+    assert len(updates[-1]["trials"]) == len(TRIALS)
+
+
+def test_find_matching_trials_returns_final_update(matcher, trials_file):
+    streamed = collect(matcher, trials_file)[-1]["trials"]
+    # Second run is served from the match cache in a single update.
+    cached_updates = collect(matcher, trials_file)
+    assert [u["stage"] for u in cached_updates] == ["scoring", "done"]
+
+    final = asyncio.run(matcher.find_matching_trials("Age: 70", trials_file=trials_file))
+    assert [t["title"] for t in final] == [t["title"] for t in streamed]
+
+
+def test_only_top_k_trials_are_sent_to_the_llm(matcher, trials_file):
+    sent = []
+    create = matcher.client._create
+
+    async def recording_create(**kwargs):
+        sent.extend(re.findall(r"^Title: (.*)$", kwargs["messages"][1]["content"], flags=re.MULTILINE))
+        return await create(**kwargs)
+
+    matcher.client.chat.completions.create = recording_create
+    results = asyncio.run(matcher.find_matching_trials("Age: 70", trials_file=trials_file, top_k=4))
+
+    assert len(sent) == 4
+    assert len(results) == len(TRIALS)
+    assert sum(r["recommendation"] == "not_evaluated" for r in results) == len(TRIALS) - 4
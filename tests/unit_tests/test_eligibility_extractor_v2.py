@@ -0,0 +1,105 @@
+"""
+Tests for incremental, checkpointed eligibility extraction
+(EligibilityExtractorV2.process_clinical_trials).
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from parsers.eligibility_extractor_v2 import EligibilityExtractorV2
+from utils.trial_store import TrialStore
+
+TRIALS = [
+    {"title": f"Trial {i}", "link": f"https://example.org/trial-{i}", "who_can_enter": f"Adults over {18 + i}"}
+    for i in range(6)
+] + [{"title": "No criteria", "link": "https://example.org/none", "who_can_enter": ""}]
+
+
+def make_extractor(fail_on=None):
+    """Extractor with a stub extraction call that records the trials it was asked about."""
+    extractor = EligibilityExtractorV2.__new__(EligibilityExtractorV2)
+    extractor.max_concurrent_requests = 3
+    extractor.semaphore = asyncio.Semaphore(3)
+    extractor.calls = []
+
+    async def extract(text, title):
+        if title == fail_on:
+            raise RuntimeError("connection lost")
+        await asyncio.sleep(0.01 if title.endswith("0") else 0)
+        extractor.calls.append(title)
+        return {"age": {"min_age": int(text.split()[-1])}}
+
+    extractor.extract_eligibility_criteria = extract
+    return extractor
+
+
+@pytest.fixture
+def files(tmp_path):
+    input_file = tmp_path / "trials.json"
+    input_file.write_text(json.dumps(TRIALS))
+    return str(input_file), str(tmp_path / "structured.json")
+
+
+def run(extractor, input_file, output_file):
+    asyncio.run(extractor.process_clinical_trials(input_file, output_file, checkpoint_every=1))
+    with open(output_file) as f:
+        return json.load(f)
+
+
+def test_only_changed_trials_are_reextracted(files):
+    input_file, output_file = files
+    first = make_extractor()
+    output = run(first, input_file, output_file)
+    assert sorted(first.calls) == [f"Trial {i}" for i in range(6)]
+    assert output[2]["structured_eligibility_v2"] == {"age": {"min_age": 20}}
+    assert "structured_eligibility_v2" not in output[6]
+
+    second = make_extractor()
+    assert run(second, input_file, output_file) == output
+    assert second.calls == []
+
+    changed = [dict(t) for t in TRIALS]
+    changed[4]["who_can_enter"] = "Adults over 65"
+    with open(input_file, "w") as f:
+        json.dump(changed, f)
+    third = make_extractor()
+    output = run(third, input_file, output_file)
+    assert third.calls == ["Trial 4"]
+    assert output[4]["structured_eligibility_v2"] == {"age": {"min_age": 65}}
+
+
+def test_interrupted_run_resumes_from_checkpoint(files):
+    input_file, output_file = files
+    crashing = make_extractor(fail_on="Trial 3")
+    with pytest.raises(RuntimeError):
+        run(crashing, input_file, output_file)
+
+    with open(output_file) as f:
+        checkpoint = json.load(f)
+    done = [t["title"] for t in checkpoint if "eligibility_extraction_v2_metadata" in t]
+    assert set(done) == set(crashing.calls) and "Trial 3" not in done
+
+    resumed = make_extractor()
+    run(resumed, input_file, output_file)
+    assert set(resumed.calls) == {f"Trial {i}" for i in range(6)} - set(done)
+
+
+def test_trial_store_rows_are_updated_incrementally(tmp_path):
+    store = TrialStore(str(tmp_path / "trials.sqlite3"))
+    store.upsert_trials(TRIALS)
+    first = make_extractor()
+    assert asyncio.run(first.process_trial_store(store)) == 6
+    assert store.get(TRIALS[1]["link"])["structured_eligibility_v2"] == {"age": {"min_age": 19}}
+
+    store.upsert_trials([dict(TRIALS[1], who_can_enter="Adults over 70")])
+    second = make_extractor()
+    assert asyncio.run(second.process_trial_store(store)) == 1
+    assert second.calls == ["Trial 1"]
+    assert store.get(TRIALS[1]["link"])["structured_eligibility_v2"] == {"age": {"min_age": 70}}
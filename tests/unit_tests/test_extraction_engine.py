@@ -0,0 +1,83 @@
+"""
+Tests for the shared asyncio extraction engine (utils/extraction_engine.py).
+"""
+
+import asyncio
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import utils.extraction_engine as extraction_engine
+import utils.llm_cache as llm_cache
+from utils.extraction_engine import extract_prompts, run_sync
+from utils.llm_cache import LLMResponseCache
+
+
+class FakeAsyncClient:
+    """Stand-in AsyncOpenAI client that answers each prompt from a dict after a delay."""
+
+    def __init__(self, answers: dict, delay: float = 0.01):
+        self.answers = answers
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self.cancelled = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, model, messages, **kwargs):
+        prompt = messages[-1]["content"]
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay if prompt != "slow" else 10)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.active -= 1
+        message = SimpleNamespace(content=json.dumps(self.answers.get(prompt, {})))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+@pytest.fixture
+def fake_client(tmp_path, monkeypatch):
+    client = FakeAsyncClient({"a": {"first": 1}, "b": {"second": 2}})
+    monkeypatch.setattr(llm_cache, "_cache_instance", LLMResponseCache(path=str(tmp_path / "cache.sqlite3")))
+    monkeypatch.setattr(extraction_engine, "get_async_openai_client", lambda: client)
+    return client
+
+
+def test_extract_prompts_returns_results_in_prompt_order(fake_client):
+    results = asyncio.run(extract_prompts({"prompt_b": "b", "prompt_a": "a"}, "system"))
+    assert list(results) == ["prompt_b", "prompt_a"]
+    assert results == {"prompt_b": {"second": 2}, "prompt_a": {"first": 1}}
+
+
+def test_timeout_cancels_remaining_prompts(fake_client):
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(extract_prompts({"ok": "a", "stuck": "slow"}, "system", timeout=0.2))
+    assert fake_client.cancelled == 1
+
+
+def test_semaphore_caps_prompts_in_flight(fake_client, monkeypatch):
+    monkeypatch.setenv("OPENAI_MAX_CONCURRENT_PROMPTS", "2")
+    prompts = {f"p{i}": f"prompt {i}" for i in range(6)}
+    asyncio.run(extract_prompts(prompts, "system"))
+    assert fake_client.peak <= 2
+
+
+def test_run_sync_uses_shared_loop_and_propagates_errors(fake_client):
+    assert run_sync(extract_prompts({"prompt_a": "a"}, "system")) == {"prompt_a": {"first": 1}}
+
+    async def fail():
+        raise asyncio.TimeoutError()
+
+    # A timeout raised by the coroutine must surface instead of being mistaken for "still running".
+    with pytest.raises(asyncio.TimeoutError):
+        run_sync(fail())
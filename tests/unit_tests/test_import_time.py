@@ -0,0 +1,60 @@
+"""
+Startup imports of app.py.
+
+Streamlit imports app.py on a cold start before the first page can render. This
+test runs the module-level imports of app.py in a fresh interpreter and checks
+which modules they leave in ``sys.modules``: heavy, rarely needed packages and
+the modules only used by the risk calculators, the PDF export and the reviews
+must stay out of the startup path. Unlike a wall-clock budget, this does not
+depend on how fast or busy the machine running the tests is.
+"""
+
+import ast
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Loaded on first use only: the OpenAI SDK (first GPT call), plotting (IPSS charts),
+# fpdf (report download) and pandas.
+LAZY_MODULES = ("openai", "matplotlib", "pandas", "fpdf", "yaml")
+# Project modules the pages import inside the functions that need them.
+DEFERRED_MODULES = (
+    "classifiers.aml_risk_classifier",
+    "classifiers.mds_risk_classifier",
+    "classifiers.ipssm_vectorized",
+    "classifiers.batch_classifier",
+    "reviewers.mds_reviewer",
+    "utils.displayers",
+    "utils.pdf",
+)
+
+
+def app_import_statements():
+    with open(os.path.join(ROOT, "app.py"), "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return [ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+
+def modules_loaded_by(statements):
+    code = "\n".join(statements + [
+        "import json, sys",
+        "print(json.dumps(sorted(sys.modules)))",
+    ])
+    # No API key: importing the app must not need one
+    env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+    result = subprocess.run([sys.executable, "-c", code],
+                            capture_output=True, text=True, cwd=ROOT, env=env, timeout=120)
+    assert result.returncode == 0, result.stderr[-2000:]
+    return set(json.loads(result.stdout.strip().splitlines()[-1]))
+
+
+def test_app_imports_stay_lazy():
+    loaded = modules_loaded_by(app_import_statements())
+
+    lazy = sorted(m for m in loaded if m.split(".")[0] in LAZY_MODULES)
+    assert lazy == [], f"loaded at startup: {lazy}"
+    deferred = sorted(m for m in DEFERRED_MODULES if m in loaded)
+    assert deferred == [], f"loaded at startup: {deferred}"
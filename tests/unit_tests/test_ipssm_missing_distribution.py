@@ -0,0 +1,117 @@
+"""
+Tests for the exact IPSS-M missing-data distribution
+(calculate_ipssm_missing_distribution in classifiers/mds_risk_classifier.py).
+"""
+
+import itertools
+import math
+import os
+import sys
+
+import pytest
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from classifiers.mds_risk_classifier import (
+    BETAS,
+    IPSSM_CATEGORIES,
+    RAW_INPUT_PREVALENCE,
+    RESIDUAL_GENE_PREVALENCE,
+    RESIDUAL_GENES,
+    calculate_ipssm,
+    calculate_ipssm_missing_distribution,
+)
+
+MAIN_GENES = ["ASXL1", "SRSF2", "DNMT3A", "RUNX1", "U2AF1", "EZH2", "CBL", "NRAS",
+              "IDH2", "KRAS", "MLL_PTD", "ETV6", "NPM1", "FLT3"]
+BASE = {"HB": 9, "PLT": 120, "BM_BLAST": 6, "CYTO_IPSSR": "Intermediate", "TP53mut": "0",
+        "SF3B1": 0, "del5q": 0, "del7_7q": 0, "complex": 0}
+
+
+def fully_sequenced(**overrides):
+    patient = dict(BASE)
+    patient.update({gene: 0 for gene in MAIN_GENES + RESIDUAL_GENES})
+    patient.update(overrides)
+    return patient
+
+
+def brute_force(patient, missing_genes, missing_residual):
+    """Scores every completion with calculate_ipssm and weights it by prevalence."""
+    prevalence = dict({beta["name"]: beta["means"] for beta in BETAS}, **RAW_INPUT_PREVALENCE)
+    counts = {c: 0 for c in IPSSM_CATEGORIES}
+    probabilities = {c: 0.0 for c in IPSSM_CATEGORIES}
+    genes = missing_genes + missing_residual
+    for values in itertools.product([0, 1], repeat=len(genes)):
+        completed = dict(patient, **dict(zip(genes, values)))
+        category = calculate_ipssm(completed, rounding=False)["means"]["risk_cat"]
+        probability = 1.0
+        for gene, value in zip(genes, values):
+            p = prevalence.get(gene, RESIDUAL_GENE_PREVALENCE)
+            probability *= p if value else 1 - p
+        counts[category] += 1
+        probabilities[category] += probability
+    return counts, probabilities
+
+
+def test_fully_sequenced_patient_has_a_single_category():
+    patient = fully_sequenced(ASXL1=1)
+    result = calculate_ipssm_missing_distribution(patient)
+    category = calculate_ipssm(patient)["means"]["risk_cat"]
+    assert result["distribution"] == {category: {"count": 1, "probability": 1.0}}
+    assert result["probability_category_change"] == 0.0
+
+
+@pytest.mark.parametrize("missing_genes, missing_residual", [
+    (["ASXL1", "RUNX1", "NRAS", "FLT3", "MLL_PTD"], []),
+    (["ASXL1", "EZH2", "NPM1"], ["BCOR", "WT1", "STAG2"]),
+])
+def test_matches_brute_force_enumeration(missing_genes, missing_residual):
+    patient = fully_sequenced(**{gene: "NA" for gene in missing_genes + missing_residual})
+    result = calculate_ipssm_missing_distribution(patient, rounding=False)
+    counts, probabilities = brute_force(patient, missing_genes, missing_residual)
+
+    assert result["total_combinations"] == 2 ** (len(missing_genes) + len(missing_residual))
+    for category in IPSSM_CATEGORIES:
+        entry = result["distribution"].get(category, {"count": 0, "probability": 0.0})
+        assert entry["count"] == counts[category]
+        assert math.isclose(entry["probability"], probabilities[category], abs_tol=1e-12)
+
+
+@pytest.mark.parametrize("overrides", [
+    {"SF3B1": "NA", "del5q": 1},
+    {"SF3B1": "NA", "del5q": "NA", "SRSF2": "NA", "STAG2": "NA", "WT1": "NA"},
+    {"SF3B1": 1, "del5q": "NA", "complex": "NA", "RUNX1": "NA", "BCOR": "NA", "ASXL1": "NA"},
+])
+def test_sf3b1_features_follow_their_raw_inputs(overrides):
+    patient = fully_sequenced(**overrides)
+    missing = [name for name, value in overrides.items() if value == "NA"]
+    result = calculate_ipssm_missing_distribution(patient, rounding=False)
+    counts, probabilities = brute_force(patient, missing, [])
+
+    # One branch per raw input, not per derived feature: alpha=1 with 5q=1 never occurs.
+    assert result["total_combinations"] == 2 ** len(missing)
+    for category in IPSSM_CATEGORIES:
+        entry = result["distribution"].get(category, {"count": 0, "probability": 0.0})
+        assert entry["count"] == counts[category]
+        assert math.isclose(entry["probability"], probabilities[category], abs_tol=1e-12)
+
+
+def test_many_missing_genes_are_pruned():
+    patient = dict(BASE, **{gene: "NA" for gene in MAIN_GENES + RESIDUAL_GENES})
+    result = calculate_ipssm_missing_distribution(patient, rounding=False)
+
+    assert result["total_combinations"] == 2 ** (len(MAIN_GENES) + len(RESIDUAL_GENES))
+    assert result["nodes_visited"] < 10_000
+    assert math.isclose(sum(v["probability"] for v in result["distribution"].values()), 1.0)
+    assert sum(v["count"] for v in result["distribution"].values()) == result["total_combinations"]
+
+    scenarios = calculate_ipssm(patient, rounding=False)
+    assert scenarios["best"]["risk_cat"] in result["distribution"]
+    assert scenarios["worst"]["risk_cat"] in result["distribution"]
+
+
+def test_available_through_calculate_ipssm():
+    patient = fully_sequenced(ASXL1="NA", RUNX1="NA")
+    result = calculate_ipssm(patient, include_missing_distribution=True)
+    assert result["missing_distribution"]["missing_features"] == ["ASXL1", "RUNX1"]
@@ -0,0 +1,102 @@
+"""
+Tests for the vectorised IPSS-M engine (classifiers/ipssm_vectorized.py).
+The cohort results must be identical to calculate_ipssm, patient by patient.
+"""
+
+import os
+import random
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from classifiers.ipssm_vectorized import ipssm_categories, calculate_ipssm_cohort
+from classifiers.mds_risk_classifier import BETAS, IPSSM_CUTPOINTS, RESIDUAL_GENES, calculate_ipssm
+
+SCENARIOS = ("means", "worst", "best")
+MAIN_GENES = [
+    beta["name"] for beta in BETAS
+    if beta["name"] not in ("CYTOVEC", "BLAST5", "TRANSF_PLT100", "HB1", "SF3B1_alpha", "SF3B1_5q", "TP53multi", "Nres2")
+]
+
+
+def random_patient(rng: random.Random) -> dict:
+    """A patient dict with a mix of ints, strings, booleans, "NA", None and absent keys."""
+    patient = {
+        "HB": rng.choice([6.5, 8, 9.5, 12, 15.2]),
+        "PLT": rng.choice([20, 80, 150, 300]),
+        "BM_BLAST": rng.choice([0, 3, 7, 12, 25]),
+        "CYTO_IPSSR": rng.choice(["Very Good", "Good", "Intermediate", "Poor", "Very Poor", None]),
+    }
+    for gene in MAIN_GENES + ["SF3B1", "del5q", "del7_7q", "complex", "del17_17p"]:
+        if rng.random() < 0.8:
+            patient[gene] = rng.choice([0, 1, "0", "1", "NA", None, True, False])
+    for gene in RESIDUAL_GENES:
+        if rng.random() < 0.8:
+            patient[gene] = rng.choice([0, 1, "0", "1", "NA", None])
+    if rng.random() < 0.8:
+        patient["TP53mut"] = rng.choice(["0", "1", "2", "2 or more", 0, 1, 2, None, "NA"])
+    if rng.random() < 0.8:
+        patient["TP53maxvaf"] = rng.choice([0, 0.2, 0.55, 0.6, "NA", None])
+    if rng.random() < 0.5:
+        patient["TP53loh"] = rng.choice([0, 1, "0", "1", "NA", None, True])
+    return patient
+
+
+@pytest.fixture(scope="module")
+def cohort():
+    rng = random.Random(2024)
+    return [random_patient(rng) for _ in range(500)]
+
+
+@pytest.mark.parametrize("rounding", [True, False])
+def test_matches_scalar_calculation(cohort, rounding):
+    vectorised = calculate_ipssm_cohort(cohort, rounding=rounding)
+    for i, patient in enumerate(cohort):
+        expected = calculate_ipssm(patient, rounding=rounding)
+        for scenario in SCENARIOS:
+            assert vectorised[scenario]["risk_score"][i] == expected[scenario]["risk_score"]
+            assert vectorised[scenario]["risk_cat"][i] == expected[scenario]["risk_cat"]
+
+
+def test_dataframe_numeric_columns(cohort):
+    # Numeric-only records: NaN cells in the DataFrame stand for absent keys.
+    numeric = [
+        {k: v for k, v in patient.items() if isinstance(v, (int, float)) and not isinstance(v, bool)}
+        for patient in cohort
+    ]
+    vectorised = calculate_ipssm_cohort(pd.DataFrame(numeric))
+    for i, patient in enumerate(numeric):
+        expected = calculate_ipssm(patient)
+        for scenario in SCENARIOS:
+            assert vectorised[scenario]["risk_score"][i] == expected[scenario]["risk_score"]
+            assert vectorised[scenario]["risk_cat"][i] == expected[scenario]["risk_cat"]
+
+
+def test_cutpoints_are_closed_on_the_left():
+    categories = ipssm_categories(np.array(IPSSM_CUTPOINTS + [-10.0, 10.0, np.nan]))
+    assert list(categories) == [
+        "Low", "Moderate Low", "Moderate High", "High", "Very High", "Very Low", "Very High", "Unknown",
+    ]
+
+
+@pytest.mark.parametrize("field", ["HB", "PLT", "BM_BLAST"])
+@pytest.mark.parametrize("value", ["NA", None, "x", float("nan")])
+def test_invalid_clinical_values_are_unknown(cohort, field, value):
+    patient = dict(cohort[0], **{field: value})
+    try:
+        expected = calculate_ipssm(patient)
+    except (ValueError, TypeError):
+        # The scalar scorer rejects the value outright.
+        expected = {scenario: {"risk_score": np.nan, "risk_cat": "Unknown"} for scenario in SCENARIOS}
+
+    vectorised = calculate_ipssm_cohort([patient, cohort[1]])
+    for scenario in SCENARIOS:
+        assert np.isnan(vectorised[scenario]["risk_score"][0])
+        assert np.isnan(expected[scenario]["risk_score"])
+        assert vectorised[scenario]["risk_cat"][0] == expected[scenario]["risk_cat"] == "Unknown"
+        assert vectorised[scenario]["risk_cat"][1] == calculate_ipssm(cohort[1])[scenario]["risk_cat"]
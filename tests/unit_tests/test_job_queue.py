@@ -0,0 +1,165 @@
+"""
+Tests for the background job pool (utils/job_queue.py).
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from utils.job_queue import CANCELLED, DONE, FAILED, QUEUED, JobManager, report_progress
+
+
+def wait_for(job, timeout=5.0):
+    deadline = time.time() + timeout
+    while not job.finished and time.time() < deadline:
+        time.sleep(0.01)
+    assert job.finished, f"{job.name} did not finish"
+    return job
+
+
+@pytest.fixture
+def manager():
+    instance = JobManager(max_workers=4, max_jobs_per_session=1)
+    yield instance
+    instance.shutdown()
+
+
+def test_job_result_and_progress(manager):
+    def work(x, y=0):
+        report_progress({"step": 1})
+        return x + y
+
+    job = wait_for(manager.submit("s1", "add", work, 2, y=3))
+    assert job.status == DONE and job.result == 5
+    assert job.progress == {"step": 1}
+    assert job.started_at >= job.submitted_at and job.finished_at >= job.started_at
+
+
+def test_failed_job_records_error(manager):
+    def boom():
+        raise ValueError("no report text")
+
+    job = wait_for(manager.submit("s1", "boom", boom))
+    assert job.status == FAILED and job.error == "no report text"
+
+
+def test_same_key_is_not_submitted_twice(manager):
+    calls = []
+    first = wait_for(manager.submit("s1", "review", calls.append, 1, key="review:abc"))
+    again = manager.submit("s1", "review", calls.append, 1, key="review:abc")
+    other_session = wait_for(manager.submit("s2", "review", calls.append, 1, key="review:abc"))
+    assert again is first and other_session is not first
+    assert calls == [1, 1]
+
+    manager.discard(first.id)
+    assert manager.find("s1", "review:abc") is None
+    wait_for(manager.submit("s1", "review", calls.append, 1, key="review:abc"))
+    assert calls == [1, 1, 1]
+
+
+def test_slow_session_does_not_block_other_sessions(manager):
+    release = threading.Event()
+    slow = [manager.submit("slow", f"slow {i}", release.wait, 5) for i in range(3)]
+    # Only one job per session runs; the rest wait in that session's queue.
+    assert [job.status for job in slow[1:]] == [QUEUED, QUEUED]
+
+    fast = wait_for(manager.submit("fast", "fast", lambda: "ok"))
+    assert fast.result == "ok"
+    assert manager.cancel(slow[2].id)
+    assert slow[2].status == CANCELLED and not manager.cancel(slow[0].id)
+
+    release.set()
+    wait_for(slow[1])
+    assert slow[0].status == DONE and slow[2].status == CANCELLED
+    assert [job.name for job in manager.jobs_for_session("slow")] == ["slow 0", "slow 1", "slow 2"]
+    assert manager.stats()["done"] == 3
+
+
+def test_prune_drops_old_finished_jobs(manager):
+    job = wait_for(manager.submit("s1", "old", lambda: None))
+    manager.retention_seconds = 0
+    job.finished_at -= 1
+    assert manager.prune() == 1
+    assert manager.get(job.id) is None
+
+
+def test_run_in_background_collects_result_on_a_later_rerun():
+    from streamlit.testing.v1 import AppTest
+
+    def page():
+        import time
+        import streamlit as st
+        from utils.job_queue import run_in_background
+
+        def slow_review(x):
+            time.sleep(0.2)
+            return x * 2
+
+        value = run_in_background("doubled", "Doubling", slow_review, 21)
+        if value is not None:
+            st.write(f"value={value}")
+
+    app = AppTest.from_function(page).run()
+    assert "⏳ Doubling (" in app.info[0].value and not app.markdown
+
+    time.sleep(0.5)
+    app.run()
+    assert not app.info and app.markdown[0].value == "value=42"
+    assert app.session_state["doubled"] == 42
+
+
+def test_failed_job_is_kept_until_retry(tmp_path):
+    from streamlit.testing.v1 import AppTest
+
+    def page(attempts_file):
+        import streamlit as st
+        from utils.job_queue import job_failed, run_in_background
+
+        def flaky(x):
+            with open(attempts_file, "a") as f:
+                f.write("x")
+            with open(attempts_file) as f:
+                if len(f.read()) == 1:
+                    raise RuntimeError("rate limited")
+            return x * 2
+
+        value = run_in_background("doubled", "Doubling", flaky, 21)
+        st.write(f"value={value} failed={job_failed('doubled')}")
+        st.write("rest of the page")
+
+    def job_errors(app):
+        # AppTest also shows a "No secrets found" error when there is no secrets.toml
+        return [e.value for e in app.error if "Doubling" in e.value]
+
+    attempts_file = tmp_path / "attempts"
+    attempts_file.write_text("")
+
+    def rerun_until(app, done):
+        for _ in range(40):
+            if done(app):
+                return app
+            time.sleep(0.05)
+            app.run()
+        return app
+
+    app = AppTest.from_function(page, args=(str(attempts_file),)).run()
+    rerun_until(app, job_errors)
+    assert job_errors(app) == ["❌ Doubling failed: rate limited"]
+    assert app.markdown[0].value == "value=None failed=True"
+    assert app.markdown[1].value == "rest of the page"
+
+    # Further reruns do not resubmit the failed job
+    app.run()
+    app.run()
+    assert attempts_file.read_text() == "x" and job_errors(app)
+
+    app.button(key="retry_doubled").click().run()
+    rerun_until(app, lambda a: a.markdown[0].value == "value=42 failed=False")
+    assert app.markdown[0].value == "value=42 failed=False"
+    assert not job_errors(app) and attempts_file.read_text() == "xx"
@@ -0,0 +1,124 @@
+"""
+Tests for the on-disk LLM response cache (utils/llm_cache.py).
+"""
+
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import utils.llm_cache as llm_cache
+from utils.llm_cache import LLMResponseCache, cached_json_completion
+
+
+class FakeClient:
+    """Minimal stand-in for the OpenAI client that counts completion calls."""
+
+    def __init__(self, content: str):
+        self.calls = 0
+        self.content = content
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        self.calls += 1
+        message = SimpleNamespace(content=self.content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    instance = LLMResponseCache(path=str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(llm_cache, "_cache_instance", instance)
+    return instance
+
+
+class TestLLMResponseCache:
+
+    def test_key_depends_on_model_system_and_prompt(self):
+        base = LLMResponseCache.make_key("o3-mini", "system", "prompt")
+        assert base == LLMResponseCache.make_key("o3-mini", "system", "prompt")
+        assert base != LLMResponseCache.make_key("gpt-4o", "system", "prompt")
+        assert base != LLMResponseCache.make_key("o3-mini", "other system", "prompt")
+        assert base != LLMResponseCache.make_key("o3-mini", "system", "prompt 2")
+
+    def test_hit_and_miss_counters(self, cache):
+        assert cache.get("missing") is None
+        cache.set("key", '{"a": 1}')
+        assert cache.get("key") == '{"a": 1}'
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["entries"] == 1
+
+    def test_expired_entries_are_misses(self, tmp_path):
+        cache = LLMResponseCache(path=str(tmp_path / "ttl.sqlite3"), ttl_seconds=0.01)
+        cache.set("key", "{}")
+        time.sleep(0.05)
+        assert cache.get("key") is None
+        assert cache.stats()["entries"] == 0
+
+    def test_least_recently_used_entries_are_evicted(self, tmp_path):
+        cache = LLMResponseCache(path=str(tmp_path / "lru.sqlite3"), max_entries=2)
+        cache.set("first", "1")
+        time.sleep(0.01)
+        cache.set("second", "2")
+        time.sleep(0.01)
+        cache.get("first")  # "second" is now the least recently used entry
+        time.sleep(0.01)
+        cache.set("third", "3")
+        assert cache.get("second") is None
+        assert cache.get("first") == "1"
+        assert cache.get("third") == "3"
+
+
+class TestCacheLocation:
+
+    @pytest.fixture(autouse=True)
+    def no_secrets(self, monkeypatch):
+        monkeypatch.setattr("utils.llm_client._openai_secrets", lambda: {})
+        monkeypatch.delenv("OPENAI_CACHE_DIR", raising=False)
+        monkeypatch.delenv("OPENAI_DISK_CACHE", raising=False)
+
+    def test_default_location_is_outside_the_repository(self):
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        path = llm_cache.cache_path("llm_cache.sqlite3")
+        assert not os.path.abspath(path).startswith(root + os.sep)
+
+    def test_cache_dir_setting(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("OPENAI_CACHE_DIR", str(tmp_path))
+        assert llm_cache.cache_path("llm_cache.sqlite3") == str(tmp_path / "llm_cache.sqlite3")
+
+    def test_disk_cache_off_writes_nothing(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("OPENAI_CACHE_DIR", str(tmp_path))
+        monkeypatch.setenv("OPENAI_DISK_CACHE", "off")
+        monkeypatch.setattr(llm_cache, "_cache_instance", None)
+
+        client = FakeClient('{"ok": true}')
+        cached_json_completion(client, "o3-mini", "system", "patient report")
+        cached_json_completion(client, "o3-mini", "system", "patient report")
+
+        assert llm_cache.get_llm_cache().path == ":memory:"
+        assert client.calls == 1
+        assert list(tmp_path.iterdir()) == []
+
+
+class TestCachedJsonCompletion:
+
+    def test_second_call_is_served_from_cache(self, cache):
+        client = FakeClient(json.dumps({"fibrotic": True}))
+        first = cached_json_completion(client, "o3-mini", "system", "report")
+        second = cached_json_completion(client, "o3-mini", "system", "report")
+        assert first == second == {"fibrotic": True}
+        assert client.calls == 1
+
+    def test_malformed_responses_are_not_cached(self, cache):
+        client = FakeClient("not json")
+        with pytest.raises(json.JSONDecodeError):
+            cached_json_completion(client, "o3-mini", "system", "report")
+        assert cache.stats()["entries"] == 0
@@ -0,0 +1,79 @@
+"""
+Tests for the shared OpenAI client factory (utils/llm_client.py).
+"""
+
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import utils.llm_client as llm_client
+from utils.llm_client import ConcurrencyLimitedTransport, build_openai_client, get_openai_client
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    """Records the peak number of requests being served at the same time."""
+
+    lock = threading.Lock()
+    active = 0
+    peak = 0
+
+    def do_GET(self):
+        with SlowHandler.lock:
+            SlowHandler.active += 1
+            SlowHandler.peak = max(SlowHandler.peak, SlowHandler.active)
+        time.sleep(0.05)
+        with SlowHandler.lock:
+            SlowHandler.active -= 1
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    SlowHandler.active = 0
+    SlowHandler.peak = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_transport_caps_requests_in_flight(server):
+    transport = ConcurrencyLimitedTransport(max_concurrent_requests=2, limits=httpx.Limits(max_connections=10))
+    with httpx.Client(transport=transport) as http_client:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            responses = list(executor.map(lambda _: http_client.get(server), range(8)))
+
+    assert all(r.status_code == 200 and r.text == "ok" for r in responses)
+    assert SlowHandler.peak <= 2
+
+
+def test_shared_client_is_reused(monkeypatch):
+    monkeypatch.setattr(llm_client, "_client_instance", None)
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    assert get_openai_client() is get_openai_client()
+
+
+def test_build_client_applies_limits(monkeypatch):
+    monkeypatch.setenv("OPENAI_MAX_CONCURRENT_REQUESTS", "3")
+    client = build_openai_client(api_key="test-key", max_connections=5)
+    transport = client._client._transport
+    assert isinstance(transport, ConcurrencyLimitedTransport)
+    assert transport.max_concurrent_requests == 3
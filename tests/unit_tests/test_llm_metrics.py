@@ -0,0 +1,170 @@
+"""
+Tests for the per-prompt LLM metrics (utils/llm_metrics.py).
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import utils.extraction_engine as extraction_engine
+import utils.llm_cache as llm_cache
+import utils.llm_metrics as llm_metrics
+from utils.extraction_engine import extract_prompts
+from utils.llm_cache import LLMResponseCache, cached_json_completion
+from utils.llm_client import build_openai_client
+from utils.llm_metrics import LLMMetrics, call_cost, track_llm_call, tracked_completion
+
+
+def completion(content, prompt_tokens=120, completion_tokens=30, model="o3-mini-2025-01-31"):
+    return SimpleNamespace(
+        model=model,
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+        usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens),
+    )
+
+
+class FakeAsyncClient:
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, model, messages, **kwargs):
+        await asyncio.sleep(self.delay)
+        return completion(json.dumps({"prompt": messages[-1]["content"]}))
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    instance = LLMMetrics()
+    monkeypatch.setattr(llm_metrics, "_metrics_instance", instance)
+    return instance
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    instance = LLMResponseCache(path=str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(llm_cache, "_cache_instance", instance)
+    return instance
+
+
+def test_tracked_call_records_latency_tokens_and_errors(metrics):
+    with track_llm_call("review.classification") as call:
+        # Nested tracking joins the outer call instead of recording twice
+        with track_llm_call("inner") as inner:
+            assert inner is call
+        call.record_response(completion("ok", model="gpt-4o-2024-08-06"))
+    with pytest.raises(RuntimeError):
+        with track_llm_call("review.classification"):
+            raise RuntimeError("rate limited")
+
+    stats = metrics.snapshot()["prompts"]
+    assert list(stats) == ["review.classification"]
+    review = stats["review.classification"]
+    assert review["calls"] == 2 and review["errors"] == 1
+    assert review["prompt_tokens"] == 120 and review["completion_tokens"] == 30
+    assert review["cost_usd"] == pytest.approx(call_cost("gpt-4o", 120, 30))
+    assert review["wall_p95"] is not None and review["wall_histogram"][-1] == ("+Inf", 2)
+
+
+def test_cache_hits_are_counted_but_not_timed(metrics, cache):
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        create=lambda **kwargs: completion('{"blasts": 20}'))))
+    for _ in range(3):
+        assert cached_json_completion(client, "o3-mini", "system", "report",
+                                      metrics_name="aml_eln_parser.markers") == {"blasts": 20}
+
+    eln = metrics.snapshot()["prompts"]["aml_eln_parser.markers"]
+    assert eln["calls"] == 3 and eln["cache_hits"] == 2 and eln["api_calls"] == 1
+    assert eln["prompt_tokens"] == 120
+    assert eln["wall_histogram"][-1] == ("+Inf", 1)
+
+
+def test_extract_prompts_records_each_named_prompt_and_queue_wait(metrics, cache, monkeypatch):
+    monkeypatch.setattr(extraction_engine, "get_async_openai_client", lambda: FakeAsyncClient())
+    monkeypatch.setenv("OPENAI_MAX_CONCURRENT_PROMPTS", "1")
+    asyncio.run(extract_prompts({"first_prompt_1": "a", "first_prompt_2a": "b"}, "system", group="aml_parser"))
+
+    stats = metrics.snapshot()["prompts"]
+    assert set(stats) == {"aml_parser.first_prompt_1", "aml_parser.first_prompt_2a"}
+    assert all(s["api_calls"] == 1 and s["prompt_tokens"] == 120 for s in stats.values())
+    # With one slot, one of the two prompts waited for the other
+    assert max(s["queue_wait_mean"] for s in stats.values()) >= 0.04
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Fails the first request with a 500, then answers."""
+
+    protocol_version = "HTTP/1.1"
+    requests = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        FlakyHandler.requests += 1
+        status = 500 if FlakyHandler.requests == 1 else 200
+        body = json.dumps({
+            "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-4o",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "ok"}}],
+            "usage": {"prompt_tokens": 50, "completion_tokens": 10, "total_tokens": 60},
+        } if status == 200 else {"error": {"message": "server error"}}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_sdk_retries_are_counted(metrics, monkeypatch):
+    FlakyHandler.requests = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    try:
+        monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{httpd.server_address[1]}/v1")
+        monkeypatch.setenv("OPENAI_TRANSPORT", "live")
+        client = build_openai_client(api_key="test-key").with_options(max_retries=1)
+        response = tracked_completion(client, "aml_review.genes", model="gpt-4o",
+                                      messages=[{"role": "user", "content": "genes"}])
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+    assert response.choices[0].message.content == "ok"
+    genes = metrics.snapshot()["prompts"]["aml_review.genes"]
+    assert genes["retries"] == 1 and genes["errors"] == 0 and genes["prompt_tokens"] == 50
+
+
+def test_cached_prompt_tokens_are_recorded_and_discounted(metrics):
+    response = completion("ok", prompt_tokens=2000, model="gpt-4o")
+    response.usage.prompt_tokens_details = SimpleNamespace(cached_tokens=1536)
+    with track_llm_call("aml_parser.first_prompt_2a") as call:
+        call.record_response(response)
+
+    stats = metrics.snapshot()["prompts"]["aml_parser.first_prompt_2a"]
+    assert stats["prompt_tokens"] == 2000 and stats["cached_prompt_tokens"] == 1536
+    assert stats["cost_usd"] < call_cost("gpt-4o", 2000, 30)
+    assert stats["cost_usd"] == pytest.approx(call_cost("gpt-4o", 2000, 30, cached_prompt_tokens=1536))
+    assert 'llm_cached_prompt_tokens_total{prompt="aml_parser.first_prompt_2a"} 1536' in metrics.prometheus_text()
+
+
+def test_prometheus_text(metrics):
+    with track_llm_call('odd "name"') as call:
+        call.record_response(completion("ok"))
+    text = metrics.prometheus_text()
+    assert "# TYPE llm_call_duration_seconds histogram" in text
+    assert 'llm_calls_total{prompt="odd \\"name\\""} 1' in text
+    assert 'llm_call_duration_seconds_bucket{prompt="odd \\"name\\"",le="+Inf"} 1' in text
+    assert 'llm_prompt_tokens_total{prompt="odd \\"name\\""} 120' in text
+
+    metrics.reset()
+    assert metrics.snapshot()["prompts"] == {}
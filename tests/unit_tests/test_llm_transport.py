@@ -0,0 +1,166 @@
+"""
+Tests for the record/replay transports and the stand-in server (utils/llm_transport.py).
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from utils.llm_client import build_async_openai_client, build_openai_client
+from utils.llm_transport import (
+    Fixture, FixtureStore, LatencyModel, ReplayTransport, recorded_call_count, serve_fixtures
+)
+
+MESSAGES = [{"role": "user", "content": "Extract the blasts percentage"}]
+
+
+def completion(content):
+    return {"id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-4o",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}]}
+
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+    """Fake OpenAI endpoint that echoes the number of requests it has served."""
+
+    protocol_version = "HTTP/1.1"
+    served = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        UpstreamHandler.served += 1
+        body = json.dumps(completion(f'{{"blasts_percentage": {UpstreamHandler.served}}}')).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def upstream():
+    UpstreamHandler.served = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), UpstreamHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/v1"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def fixtures_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "fixtures.sqlite3")
+    monkeypatch.setenv("OPENAI_FIXTURES_PATH", path)
+    monkeypatch.setenv("OPENAI_REPLAY_LATENCY", "none")
+    return path
+
+
+def ask(client, content="Extract the blasts percentage"):
+    response = client.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": content}])
+    return response.choices[0].message.content
+
+
+def test_record_then_replay_without_network(upstream, fixtures_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_BASE_URL", upstream)
+    monkeypatch.setenv("OPENAI_TRANSPORT", "record")
+    assert ask(build_openai_client(api_key="test-key")) == '{"blasts_percentage": 1}'
+    assert UpstreamHandler.served == 1
+
+    # Replay needs neither the upstream server nor an API key
+    monkeypatch.setenv("OPENAI_BASE_URL", "http://127.0.0.1:9/v1")
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.setenv("OPENAI_TRANSPORT", "replay")
+    calls = recorded_call_count()
+    assert ask(build_openai_client()) == '{"blasts_percentage": 1}'
+    assert recorded_call_count() == calls + 1 and UpstreamHandler.served == 1
+
+
+def test_replay_miss_raises_not_found(fixtures_path, monkeypatch):
+    import openai
+
+    monkeypatch.setenv("OPENAI_TRANSPORT", "replay")
+    with pytest.raises(openai.NotFoundError, match="No recorded response"):
+        ask(build_openai_client(api_key="test-key"), "A prompt that was never recorded")
+
+
+def test_async_record_and_replay(upstream, fixtures_path, monkeypatch):
+    async def ask_async():
+        client = build_async_openai_client(api_key="test-key")
+        response = await client.chat.completions.create(model="gpt-4o", messages=MESSAGES)
+        return response.choices[0].message.content
+
+    monkeypatch.setenv("OPENAI_BASE_URL", upstream)
+    monkeypatch.setenv("OPENAI_TRANSPORT", "record")
+    recorded = asyncio.run(ask_async())
+    monkeypatch.setenv("OPENAI_TRANSPORT", "replay")
+    assert asyncio.run(ask_async()) == recorded
+    assert UpstreamHandler.served == 1
+
+
+def test_fixture_key_ignores_host_and_json_key_order():
+    body = json.dumps({"model": "gpt-4o", "messages": MESSAGES}).encode("utf-8")
+    reordered = json.dumps({"messages": MESSAGES, "model": "gpt-4o"}).encode("utf-8")
+    key = FixtureStore.make_key("POST", "/v1/chat/completions", body)
+    assert key == FixtureStore.make_key("post", "/v1/chat/completions", reordered)
+    assert key != FixtureStore.make_key("POST", "/v1/embeddings", body)
+
+
+def test_latency_models():
+    assert LatencyModel("recorded").sample(0.8) == 0.8
+    assert LatencyModel("recorded:0.5").sample(0.8) == 0.4
+    assert LatencyModel("none").sample(3.0) == 0.0
+    assert LatencyModel("fixed:1.2").sample() == 1.2
+    assert all(0.1 <= LatencyModel("uniform:0.1,0.3").sample() <= 0.3 for _ in range(50))
+    assert LatencyModel("normal:0,1", seed=1).sample() >= 0.0
+    # Seeded models repeat exactly
+    first = [LatencyModel("lognormal:1.5,0.4", seed=7).sample() for _ in range(3)]
+    assert len(set(first)) == 1
+    with pytest.raises(ValueError):
+        LatencyModel("gamma:1,2")
+
+
+def test_replay_transport_applies_latency(tmp_path):
+    import httpx
+
+    store = FixtureStore(str(tmp_path / "fixtures.sqlite3"))
+    body = json.dumps({"model": "gpt-4o", "messages": MESSAGES}).encode("utf-8")
+    with httpx.Client(transport=ReplayTransport(store, LatencyModel("fixed:0.01"))) as http_client:
+        miss = http_client.post("https://api.openai.com/v1/chat/completions", content=body)
+        assert miss.status_code == 404
+
+        store.put("POST", "/v1/chat/completions", body,
+                  Fixture(200, "application/json", json.dumps(completion("{}")).encode("utf-8"), 0.5))
+        start = time.perf_counter()
+        hit = http_client.post("https://api.openai.com/v1/chat/completions", content=body)
+        assert hit.status_code == 200 and hit.json()["choices"][0]["message"]["content"] == "{}"
+        assert time.perf_counter() - start >= 0.01
+    assert len(store) == 1
+
+
+def test_stand_in_server_speaks_chat_completions(upstream, fixtures_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_BASE_URL", upstream)
+    monkeypatch.setenv("OPENAI_TRANSPORT", "record")
+    recorded = ask(build_openai_client(api_key="test-key"))
+
+    server = serve_fixtures(FixtureStore(fixtures_path), LatencyModel("none"))
+    try:
+        monkeypatch.setenv("OPENAI_TRANSPORT", "live")
+        monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+        client = build_openai_client(api_key="test-key")
+        assert ask(client) == recorded
+        assert UpstreamHandler.served == 1
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,185 @@
+"""
+Tests for the fast-model routing of simple extraction sections (utils/model_router.py).
+"""
+
+import asyncio
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import utils.extraction_engine as extraction_engine
+import utils.llm_cache as llm_cache
+import utils.llm_metrics as llm_metrics
+import utils.model_router as model_router
+from utils.extraction_engine import extract_prompts
+from utils.llm_cache import LLMResponseCache
+from utils.llm_metrics import LLMMetrics
+from utils.model_router import CONFIDENCE_INSTRUCTION, ModelRouter, find_conflicts
+from utils.structured_output import section_schema
+
+STRUCTURE = {
+    "no_cytogenetics_data": False,
+    "MDS_related_cytogenetics": {"del_7q": False, "Complex_karyotype": False},
+    "blasts_percentage": None,
+}
+SCHEMAS = {
+    "cytogenetics_check_prompt": section_schema(STRUCTURE, ["no_cytogenetics_data"]),
+    "first_prompt_2c": section_schema(STRUCTURE, ["MDS_related_cytogenetics"]),
+    "first_prompt_1": section_schema(STRUCTURE, ["blasts_percentage"]),
+}
+PROMPTS = {name: f"TASK: {name}" for name in SCHEMAS}
+
+
+class RoutedAsyncClient:
+    """Answers each (model, section) pair from ``replies``; sections are matched by prompt name."""
+
+    def __init__(self, replies):
+        self.replies = {key: list(answers) for key, answers in replies.items()}
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, model, messages, **kwargs):
+        prompt = messages[1]["content"]
+        section = prompt.split("\n")[0].replace("TASK: ", "")
+        self.requests.append((model, section, CONFIDENCE_INSTRUCTION in prompt))
+        content = self.replies[(model, section)].pop(0)
+        return SimpleNamespace(model=model, choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    def calls(self, model):
+        return sorted(section for m, section, _ in self.requests if m == model)
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    instance = LLMResponseCache(path=str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(llm_cache, "_cache_instance", instance)
+    return instance
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    instance = LLMMetrics()
+    monkeypatch.setattr(llm_metrics, "_metrics_instance", instance)
+    return instance
+
+
+@pytest.fixture
+def router(monkeypatch):
+    instance = ModelRouter()
+    monkeypatch.setattr(model_router, "_router_instance", instance)
+    return instance
+
+
+def use_client(monkeypatch, replies):
+    client = RoutedAsyncClient(replies)
+    monkeypatch.setattr(extraction_engine, "get_async_openai_client", lambda: client)
+    return client
+
+
+def run(prompts=None, schemas=SCHEMAS):
+    return asyncio.run(extract_prompts(prompts or PROMPTS, "system", group="aml_parser", schemas=schemas))
+
+
+def test_simple_sections_use_the_fast_model(cache, metrics, router, monkeypatch):
+    client = use_client(monkeypatch, {
+        ("gpt-4o-mini", "cytogenetics_check_prompt"): ['{"no_cytogenetics_data": false, "_confidence": 0.95}'],
+        ("o3-mini", "first_prompt_2c"): ['{"MDS_related_cytogenetics": {"del_7q": false}}'],
+        ("o3-mini", "first_prompt_1"): ['{"blasts_percentage": 25}'],
+    })
+    results = run()
+
+    # The confidence key is only asked of the fast model and never reaches the parsers
+    assert results["cytogenetics_check_prompt"] == {"no_cytogenetics_data": False}
+    assert client.calls("gpt-4o-mini") == ["cytogenetics_check_prompt"]
+    assert client.calls("o3-mini") == ["first_prompt_1", "first_prompt_2c"]
+    assert all(asked == (model == "gpt-4o-mini") for model, _, asked in client.requests)
+
+    routes = router.snapshot()["routes"]
+    assert routes["fast"]["calls"] == 1 and routes["strong"]["calls"] == 2
+    assert "escalated" not in routes
+    assert routes["fast"]["wall_p50"] is not None
+
+    # A rerun is served from the cache and counted as cache hits per route
+    assert run() == results
+    assert len(client.requests) == 3
+    routes = router.snapshot()["routes"]
+    assert routes["fast"]["cache_hits"] == 1 and routes["strong"]["cache_hits"] == 2
+
+
+def test_low_confidence_is_escalated(cache, metrics, router, monkeypatch):
+    client = use_client(monkeypatch, {
+        ("gpt-4o-mini", "cytogenetics_check_prompt"): ['{"no_cytogenetics_data": true, "_confidence": 0.4}'],
+        ("o3-mini", "cytogenetics_check_prompt"): ['{"no_cytogenetics_data": false}'],
+    })
+    results = run({"cytogenetics_check_prompt": PROMPTS["cytogenetics_check_prompt"]})
+
+    assert results == {"cytogenetics_check_prompt": {"no_cytogenetics_data": False}}
+    assert client.calls("o3-mini") == ["cytogenetics_check_prompt"]
+    routes = router.snapshot()["routes"]
+    assert "fast" not in routes
+    assert routes["escalated"]["calls"] == 1
+    assert routes["escalated"]["escalation_reasons"] == {"low_confidence": 1}
+
+
+def test_invalid_fast_reply_is_escalated_without_reasks(cache, metrics, router, monkeypatch):
+    client = use_client(monkeypatch, {
+        ("gpt-4o-mini", "cytogenetics_check_prompt"): ['{"no_cytogenetics_data": "unknown", "_confidence": 0.9}'],
+        ("o3-mini", "cytogenetics_check_prompt"): ['{"no_cytogenetics_data": true}'],
+    })
+    results = run({"cytogenetics_check_prompt": PROMPTS["cytogenetics_check_prompt"]})
+
+    assert results == {"cytogenetics_check_prompt": {"no_cytogenetics_data": True}}
+    assert [model for model, _, _ in client.requests] == ["gpt-4o-mini", "o3-mini"]
+    assert router.snapshot()["routes"]["escalated"]["escalation_reasons"] == {"validation": 1}
+    assert metrics.snapshot()["prompts"]["aml_parser.cytogenetics_check_prompt"]["errors"] == 0
+
+
+def test_conflicting_fast_section_is_escalated(cache, metrics, router, monkeypatch):
+    client = use_client(monkeypatch, {
+        ("gpt-4o-mini", "cytogenetics_check_prompt"): ['{"no_cytogenetics_data": true, "_confidence": 0.9}'],
+        ("o3-mini", "cytogenetics_check_prompt"): ['{"no_cytogenetics_data": false}'],
+        ("o3-mini", "first_prompt_2c"): ['{"MDS_related_cytogenetics": {"del_7q": true}}'],
+        ("o3-mini", "first_prompt_1"): ['{"blasts_percentage": 25}'],
+    })
+    results = run()
+
+    assert results["cytogenetics_check_prompt"] == {"no_cytogenetics_data": False}
+    assert client.calls("gpt-4o-mini") == ["cytogenetics_check_prompt"]
+    assert client.calls("o3-mini") == ["cytogenetics_check_prompt", "first_prompt_1", "first_prompt_2c"]
+    routes = router.snapshot()["routes"]
+    assert routes["fast"]["calls"] == 1
+    assert routes["escalated"]["escalation_reasons"] == {"conflict": 1}
+
+
+def test_find_conflicts_only_blames_candidates():
+    results = {
+        "cytogenetics_check_prompt": {"no_cytogenetics_data": True},
+        "first_prompt_2c": {"MDS_related_cytogenetics": {"del_7q": True}},
+        "eln2024_prompt": {"ELN2024_risk_genes": {"NPM1": True, "TP53": False}},
+        "first_prompt_2a": {"AML_defining_recurrent_genetic_abnormalities": {"NPM1": True}},
+    }
+    assert find_conflicts(results, ["cytogenetics_check_prompt", "eln2024_prompt"]) == {"cytogenetics_check_prompt"}
+    assert find_conflicts(results, ["eln2024_prompt"]) == set()
+
+    results["first_prompt_2a"]["AML_defining_recurrent_genetic_abnormalities"]["NPM1"] = False
+    assert find_conflicts(results, ["eln2024_prompt"]) == {"eln2024_prompt"}
+
+
+def test_routing_can_be_disabled(cache, metrics, monkeypatch):
+    monkeypatch.setattr(model_router, "_router_instance", None)
+    monkeypatch.setenv("OPENAI_MODEL_ROUTING", "off")
+    client = use_client(monkeypatch, {
+        ("o3-mini", "cytogenetics_check_prompt"): ['{"no_cytogenetics_data": false}'],
+    })
+    run({"cytogenetics_check_prompt": PROMPTS["cytogenetics_check_prompt"]})
+
+    assert client.calls("gpt-4o-mini") == []
+    snapshot = model_router.routing_snapshot()
+    assert snapshot["enabled"] is False
+    assert json.loads(json.dumps(snapshot))["routes"]["strong"]["calls"] == 1
@@ -0,0 +1,70 @@
+"""
+Tests for PDF report assembly (utils/pdf.py).
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+# The overview parser creates its OpenAI client at import time; no request is ever sent here.
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+import utils.pdf as pdf_module
+from utils.pdf import clean_text
+
+OVERVIEW_CALLS = []
+
+
+def fake_overview(comprehensive_data):
+    OVERVIEW_CALLS.append(comprehensive_data)
+    return "Overview of an NPM1-mutated AML — favourable risk ✓."
+
+
+def report_page():
+    import streamlit as st
+    from utils.pdf import create_base_pdf
+
+    st.session_state.setdefault("aml_ai_result", {
+        "who_class": "AML with NPM1 mutation",
+        "icc_class": "AML with mutated NPM1",
+        "who_derivation": ["NPM1 mutation detected"],
+        "icc_derivation": ["NPM1 mutation detected"],
+        "parsed_data": {"blasts_percentage": 45, "ELN2024_risk_genes": {"NPM1": True}},
+        "free_text_input": "NPM1 c.860_863dup detected ≥ 10% β-thal trait",
+    })
+    st.session_state["pdf_bytes"] = create_base_pdf(user_comments=st.session_state.get("comments"))
+
+
+@pytest.fixture
+def fake_overview_call(monkeypatch):
+    OVERVIEW_CALLS.clear()
+    monkeypatch.setattr(pdf_module, "request_final_overview", fake_overview)
+
+
+def test_clean_text_replaces_non_latin1_in_one_pass():
+    assert clean_text("**VAF** ≥ 10% — β ’ok’ café") == "VAF ? 10% - ? 'ok' café"
+
+
+def test_overview_is_memoized_per_result(fake_overview_call):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_function(report_page).run()
+    assert not app.exception
+    first = app.session_state["pdf_bytes"]
+    assert first.startswith(b"%PDF") and len(OVERVIEW_CALLS) == 1
+    assert OVERVIEW_CALLS[0]["eln_risk"]["risk_category"]
+
+    # Pressing the button again reuses the overview and the risk results
+    app.session_state["comments"] = "Discussed at MDT"
+    app.run()
+    assert len(OVERVIEW_CALLS) == 1
+    assert len(app.session_state["pdf_bytes"]) > len(first)
+
+    # A new AI review changes the overview inputs, so the overview is regenerated
+    app.session_state["aml_gene_review"] = "NPM1 is favourable."
+    app.run()
+    assert len(OVERVIEW_CALLS) == 2
@@ -0,0 +1,143 @@
+"""
+Tests for the rule-based pre-extractor (parsers/pre_extractor.py).
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from parsers.pre_extractor import (
+    IPSSR_CYTOGENETIC_RULES,
+    ipssr_criteria_text,
+    ipssr_cytogenetic_category,
+    parse_iscn_karyotype,
+    pre_extract_aml_sections,
+    pre_extract_ipss_sections,
+    resolve_cytogenetics,
+    resolve_genes,
+)
+
+STRUCTURED_REPORT = """Karyotype: 46,XY,del(5)(q13q33)[18]/46,XY[2]
+NGS panel:
+SF3B1 c.2098A>G p.K700E VAF 38%
+TP53 c.818G>A p.R273H VAF 12%
+No pathogenic variants detected in ASXL1, RUNX1, EZH2, SRSF2, U2AF1, ZRSR2, BCOR, STAG2, UBA1, JAK2.
+"""
+
+
+class TestKaryotype:
+
+    def test_parses_clones_and_ignores_cell_counts(self):
+        karyotype = parse_iscn_karyotype("Result: 47,XX,+8[15]/46,XX[5]")
+        assert karyotype["karyotypes"] == ["47,XX,+8[15]/46,XX[5]"]
+        assert karyotype["abnormality_count"] == 1
+        assert karyotype["abnormalities"][0]["kind"] == "gain"
+
+    def test_incomplete_karyotype_is_not_resolved(self):
+        assert parse_iscn_karyotype("46,XY,del(5)(q13") is None
+        assert parse_iscn_karyotype("46,XY,del(5)[20]") is None
+
+    def test_fish_results_leave_cytogenetics_to_the_llm(self):
+        assert resolve_cytogenetics("45,XY,-7[20]") is not None
+        assert resolve_cytogenetics("45,XY,-7[20]. FISH: negative for del(5q).") is None
+
+    def test_failed_culture_is_not_a_normal_karyotype(self):
+        report = "Cytogenetics: culture failed, no metaphases. Referral: 46, XY"
+        assert resolve_cytogenetics(report) is None
+        assert resolve_cytogenetics("Referral: 46,XY. Culture insufficient for analysis.") is None
+        assert "cytogenetics_prompt" not in pre_extract_ipss_sections(report)
+
+    def test_prose_numbers_are_not_a_karyotype(self):
+        assert parse_iscn_karyotype("Patient aged 46, XY male with pancytopenia.") is None
+        assert resolve_cytogenetics("Patient aged 46, XY male with pancytopenia.") is None
+        assert "cytogenetics_prompt" not in pre_extract_ipss_sections("Patient aged 46, XY male.")
+
+    def test_karyotype_needs_a_cell_count_or_a_cytogenetics_label(self):
+        assert parse_iscn_karyotype("The patient is a 46,XY male with anaemia.") is None
+        assert resolve_cytogenetics("The patient is a 46,XY male with anaemia.") is None
+        assert parse_iscn_karyotype("Karyotype: 46,XY") is not None
+        assert parse_iscn_karyotype("CYTOGENETICS\n46,XX") is not None
+
+    def test_ipssr_categories(self):
+        assert ipssr_cytogenetic_category(resolve_cytogenetics("46,XY,del(5)(q13q33)[20]")) == "Good"
+        assert ipssr_cytogenetic_category(resolve_cytogenetics("45,XY,-7[20]")) == "Poor"
+        complex_karyotype = resolve_cytogenetics("44,XY,del(5)(q13q33),-7,+8,-17,del(20)(q11q13)[20]")
+        assert ipssr_cytogenetic_category(complex_karyotype) == "Very Poor"
+        assert ipssr_cytogenetic_category(resolve_cytogenetics("45,X,-Y[20]")) == "Very Good"
+        assert ipssr_cytogenetic_category(resolve_cytogenetics("46,XY,del(3)(q21q26)[20]")) == "Poor"
+        assert ipssr_cytogenetic_category(resolve_cytogenetics("47,XY,+8[20]")) == "Intermediate"
+        assert ipssr_cytogenetic_category(resolve_cytogenetics("45,XY,del(5)(q13q33),-7[20]")) == "Poor"
+
+    def test_ipss_prompt_lists_the_local_rules(self):
+        from parsers.mds_ipss_parser import _build_ipss_prompts
+
+        prompt = _build_ipss_prompts("Karyotype: 46,XY[20]")[1]["cytogenetics_prompt"]
+        assert ipssr_criteria_text() in prompt
+        for category, _ in IPSSR_CYTOGENETIC_RULES:
+            assert f"- {category}: " in prompt
+
+
+class TestGenes:
+
+    def test_variant_rows_and_negative_statements(self):
+        genes = resolve_genes(STRUCTURED_REPORT)
+        assert genes["SF3B1"]["status"] is True
+        assert genes["SF3B1"]["variants"][0]["vaf"] == 38.0
+        assert genes["ASXL1"]["status"] is False
+        assert genes["TP53"]["variants"][0]["hgvs"] == "c.818G>A"
+
+    def test_fusion_partner_is_not_a_mutation(self):
+        assert resolve_genes("RUNX1::RUNX1T1 fusion detected.")["RUNX1"]["status"] is False
+
+    def test_several_variants_in_one_fragment_are_not_merged(self):
+        genes = resolve_genes("TP53 c.817C>T (VAF 35%) and c.743G>A (VAF 30%)")
+        assert genes["TP53"]["status"] is True
+        assert genes["TP53"]["variants"] == [{"hgvs": None, "vaf": None}]
+
+    def test_uncertain_variants_are_unresolved(self):
+        genes = resolve_genes("ASXL1 c.1934dupG, variant of uncertain significance.")
+        assert genes["ASXL1"]["status"] is None
+
+
+class TestSections:
+
+    def test_structured_report_resolves_all_local_sections(self):
+        aml = pre_extract_aml_sections(STRUCTURED_REPORT)
+        assert set(aml) == {"first_prompt_2b", "first_prompt_2c"}
+        tp53 = aml["first_prompt_2b"]["Biallelic_TP53_mutation"]
+        assert tp53["1_x_TP53_mutation_10_percent_vaf"] is True
+        assert tp53["2_x_TP53_mutations"] is False
+        assert aml["first_prompt_2c"]["MDS_related_mutation"]["SF3B1"] is True
+        assert aml["first_prompt_2c"]["MDS_related_cytogenetics"]["del_5q"] is True
+
+        ipss = pre_extract_ipss_sections(STRUCTURED_REPORT)
+        assert set(ipss) == {"cytogenetics_prompt", "tp53_prompt", "genes_prompt"}
+        assert ipss["cytogenetics_prompt"]["cyto_category_ipssr"] == "Good"
+        assert ipss["tp53_prompt"]["tp53_details"]["TP53mut"] == "1"
+        assert ipss["genes_prompt"]["gene_mutations"]["TP53multi"] is False
+
+    def test_prose_report_resolves_nothing(self):
+        report = "Bone marrow shows 30% blasts with multilineage dysplasia."
+        assert pre_extract_aml_sections(report) == {}
+        assert pre_extract_ipss_sections(report) == {}
+
+    @pytest.mark.parametrize("tp53_line", [
+        "TP53 c.817C>T (VAF 35%) and c.743G>A (VAF 30%)",
+        "TP53 p.R273C VAF 35%, p.R248Q VAF 30%",
+        "two TP53 mutations detected: c.817C>T and c.743G>A",
+    ])
+    def test_several_tp53_variants_are_never_counted_as_one(self, tp53_line):
+        report = STRUCTURED_REPORT.replace("TP53 c.818G>A p.R273H VAF 12%", tp53_line)
+        assert "first_prompt_2b" not in pre_extract_aml_sections(report)
+        ipss = pre_extract_ipss_sections(report)
+        assert "tp53_prompt" not in ipss
+        assert "genes_prompt" not in ipss
+
+    def test_loh_remark_leaves_tp53_to_the_llm(self):
+        report = STRUCTURED_REPORT + "SNP array shows copy-neutral LOH of 17p.\n"
+        assert "first_prompt_2b" not in pre_extract_aml_sections(report)
+        assert "tp53_prompt" not in pre_extract_ipss_sections(report)
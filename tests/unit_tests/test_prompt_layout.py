@@ -0,0 +1,68 @@
+"""
+Tests for the report-first prompt layout (utils/prompt_layout.py).
+"""
+
+import os
+import sys
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from classifiers.mds_risk_classifier import _build_ipssm_prompts
+from parsers import aml_eln_parser, aml_parser, mds_ipss_parser, treatment_parser
+from parsers.unified_parser import _build_section_requests, plan_extraction
+from utils.prompt_layout import (
+    EXTRACTION_SYSTEM_MESSAGE, TASK_HEADER, report_block, report_first_prompt, shared_prefix_length
+)
+
+REPORT = """
+Bone marrow aspirate: 32% myeloblasts, dysplasia in two lineages.
+NGS: NPM1 c.860_863dup VAF 41%, FLT3-ITD allelic ratio 0.7. Karyotype: 46,XX[20].
+"""
+
+
+def all_prompts(report_text):
+    prompts = dict(aml_parser._build_aml_prompts(report_text)[1])
+    prompts["eln"] = aml_eln_parser._build_eln_prompt(report_text)[1]
+    prompts.update({f"ipss.{k}": v for k, v in mds_ipss_parser._build_ipss_prompts(report_text)[1].items()})
+    prompts.update({f"treatment.{k}": v for k, v in treatment_parser._build_treatment_prompts(report_text)[1].items()})
+    prompts.update({f"ipssm.{k}": v for k, v in _build_ipssm_prompts(report_text)[1].items()})
+    return prompts
+
+
+def test_report_first_prompt_layout():
+    prompt = report_first_prompt(REPORT, """
+        Extract "blasts_percentage".
+        Return valid JSON only.
+    """)
+    assert prompt.startswith(report_block(REPORT))
+    assert prompt.endswith(f'{TASK_HEADER}\nExtract "blasts_percentage".\nReturn valid JSON only.\n')
+
+
+def test_every_parser_prompt_shares_the_report_prefix():
+    prompts = all_prompts(REPORT)
+    assert len(prompts) == 23
+    # The report is sent once per prompt, always at the same position
+    assert all(p.count(REPORT.strip()) == 1 for p in prompts.values())
+    shared = shared_prefix_length(prompts.values())
+    assert shared == len(report_block(REPORT) + TASK_HEADER) + 1
+    # Only the task differs between prompts
+    assert len({p[shared:] for p in prompts.values()}) == len(prompts)
+
+
+def test_parsers_share_one_system_message():
+    assert aml_parser.SYSTEM_MESSAGE is EXTRACTION_SYSTEM_MESSAGE
+    assert mds_ipss_parser.SYSTEM_MESSAGE is EXTRACTION_SYSTEM_MESSAGE
+    assert treatment_parser.SYSTEM_MESSAGE is EXTRACTION_SYSTEM_MESSAGE
+    assert aml_eln_parser.ELN_SYSTEM_MESSAGE is EXTRACTION_SYSTEM_MESSAGE
+
+    # The unified parser now sends every section in one group
+    sections, _ = plan_extraction(("classification", "eln", "ipss", "treatment"))
+    requests, _, _, _ = _build_section_requests(REPORT, sections)
+    assert list(requests) == [EXTRACTION_SYSTEM_MESSAGE]
+
+
+def test_shared_prefix_length():
+    assert shared_prefix_length([]) == 0
+    assert shared_prefix_length(["abc"]) == 3
+    assert shared_prefix_length(["report|task a", "report|task b", "report|other"]) == 7
@@ -0,0 +1,84 @@
+"""
+Tests for speculative review prefetching (reviewers/prefetch.py).
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+# The reviewers create their OpenAI client at import time; no request is ever sent here.
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+import reviewers.prefetch as prefetch
+import utils.job_queue as job_queue
+
+CALLS = []
+RELEASE = threading.Event()
+
+
+def fake_reviewer(name):
+    def review(classification, parsed_data, free_text_input=None):
+        CALLS.append(name)
+        RELEASE.wait(5)
+        return f"{name} review of {classification['WHO 2022']['Classification']}"
+    return review
+
+
+@pytest.fixture
+def fake_reviews(monkeypatch):
+    CALLS.clear()
+    RELEASE.clear()
+    monkeypatch.setattr(job_queue, "_manager_instance", job_queue.JobManager(max_workers=8))
+    monkeypatch.setattr(prefetch, "REVIEWS", {
+        key: (label, fake_reviewer(key)) for key, (label, _) in prefetch.REVIEWS.items()
+    })
+    yield
+    RELEASE.set()
+
+
+def results_page():
+    import streamlit as st
+    from reviewers.prefetch import prefetch_reviews, review_in_background
+
+    classification = {"WHO 2022": {"Classification": "AML with NPM1 mutation"}}
+    parsed_data = {"blasts_percentage": 30}
+    prefetch_reviews(classification, parsed_data, free_text_input="report")
+    if st.session_state.get("open_tab"):
+        review = review_in_background(st.session_state["open_tab"], classification, parsed_data,
+                                      free_text_input="report")
+        if review is not None:
+            st.write(review)
+
+
+def wait_for_calls(count, timeout=5.0):
+    deadline = time.time() + timeout
+    while len(CALLS) < count and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_all_reviews_start_together_and_tabs_render_them(fake_reviews):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_function(results_page).run()
+    wait_for_calls(len(prefetch.REVIEWS))
+    # Every review is running at once, before any tab was opened
+    assert sorted(CALLS) == sorted(prefetch.REVIEWS)
+
+    RELEASE.set()
+    time.sleep(0.2)
+    app.session_state["open_tab"] = "aml_gene_review"
+    app.run()
+    assert not app.info
+    assert app.markdown[0].value == "aml_gene_review review of AML with NPM1 mutation"
+
+    # Reruns neither resubmit collected reviews nor repeat finished ones
+    app.session_state["open_tab"] = "differentiation"
+    app.run()
+    assert app.markdown[0].value.startswith("differentiation review")
+    assert len(CALLS) == len(prefetch.REVIEWS)
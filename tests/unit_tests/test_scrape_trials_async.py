@@ -0,0 +1,194 @@
+"""
+Tests for the incremental HTTP trial scraper (trials-aggregator/scrape_trials_async.py),
+run against a local fixture server.
+"""
+
+import asyncio
+import hashlib
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+# Add the project root and the trials aggregator to the Python path
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "trials-aggregator"))
+
+from scrape_trials_async import crawl, listing_page_url, parse_detail, scrape_trials_incremental
+from utils.trial_store import TrialStore
+
+CARD = """
+<a class="chakra-card" href="/trial/{slug}">
+  <h2 class="chakra-heading">{title}</h2>
+  <p class="chakra-text label-text">Clinical trial</p>
+  <p class="chakra-text">A study of {title}</p>
+  <p class="chakra-text">Status: Open</p>
+  <p class="chakra-text">Cancer type(s): Acute myeloid leukaemia (AML)</p>
+  <p class="chakra-text">Locations: Leeds, London</p>
+</a>
+"""
+PAGINATION = """
+<ul class="rc-pagination">
+  <li class="rc-pagination-item" title="1">1</li><li class="rc-pagination-item" title="2">2</li>
+  <li class="rc-pagination-next"></li>
+</ul>
+"""
+DETAIL = """
+<html><body>
+<div class="pane-node-field-trial-recruitment-start"><time datetime="2024-01-01T00:00:00+00:00">01/01/2024</time></div>
+<div class="pane-node-field-trial-recruitment-end"><time datetime="2026-12-31T00:00:00+00:00">31/12/2026</time></div>
+<div><h3>Chief Investigator</h3><p>Dr {title} Lead</p></div>
+<div><h3>Supported by</h3><p>University Hospital</p></div>
+<p>Freephone 0808 800 4040</p>
+<a href="mailto:trials@example.org">Email</a>
+<div class="accordion"><h2 class="accordion-header">Who can enter</h2>
+  <div class="accordion-body"><div class="field-item" property="schema:population">{eligibility}</div></div></div>
+<div class="accordion"><h2 class="accordion-header">Location</h2>
+  <div class="accordion-body">Leeds<br/>London</div></div>
+</body></html>
+"""
+
+
+class FixtureSite:
+    """Serves two listing pages and one detail page per trial, with ETag support."""
+
+    def __init__(self):
+        self.trials = {slug: f"Adults with AML ({slug})" for slug in ("alpha", "beta", "gamma")}
+        self.etags = True
+        self.failing = set()
+        self.requests = []
+
+    def page(self, path: str, query: dict) -> str:
+        if path == "/clinical-trials":
+            page = query.get("current", ["n_1_n"])[0]
+            slugs = ["alpha", "beta"] if page == "n_1_n" else ["gamma"]
+            cards = "".join(CARD.format(slug=s, title=s.title()) for s in slugs)
+            return f"<html><body>{cards}{PAGINATION}</body></html>"
+        slug = path.rsplit("/", 1)[-1]
+        return DETAIL.format(title=slug.title(), eligibility=self.trials[slug])
+
+
+@pytest.fixture
+def site():
+    fixture = FixtureSite()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            fixture.requests.append(parts.path)
+            if parts.path.rsplit("/", 1)[-1] in fixture.failing:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = fixture.page(parts.path, parse_qs(parts.query)).encode("utf-8")
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+            if fixture.etags and self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            if fixture.etags:
+                self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    fixture.url = f"http://127.0.0.1:{server.server_address[1]}/clinical-trials?size=n_20_n"
+    yield fixture
+    server.shutdown()
+    server.server_close()
+
+
+def run_crawl(site, state, previous=None):
+    return asyncio.run(crawl(site.url, state, concurrency=4, previous_trials=previous))
+
+
+def test_listing_page_url():
+    url = "https://example.org/clinical-trials?size=n_20_n&filters%5B0%5D=x"
+    assert listing_page_url(url, 1) == url
+    assert listing_page_url(url, 3) == "https://example.org/clinical-trials?current=n_3_n&size=n_20_n&filters%5B0%5D=x"
+
+
+def test_parse_detail_fields():
+    detail = parse_detail(DETAIL.format(title="Alpha", eligibility="Adults over 18"))
+    assert detail["recruitment_start"] == "01/01/2024"
+    assert detail["recruitment_end_iso"] == "2026-12-31T00:00:00+00:00"
+    assert detail["chief_investigator"] == "Dr Alpha Lead"
+    assert detail["supported_by"] == "University Hospital"
+    assert detail["contact_phone"] == "Freephone 0808 800 4040"
+    assert detail["contact_email"] == "trials@example.org"
+    assert detail["who_can_enter"] == "Adults over 18"
+    assert detail["location_panel"] == "Leeds\nLondon"
+
+
+def test_full_crawl_then_conditional_recrawl(site):
+    state = {}
+    trials, stats = run_crawl(site, state)
+    assert [t["title"] for t in trials] == ["Alpha", "Beta", "Gamma"]
+    assert trials[0]["status"] == "Open" and trials[0]["locations"] == "Leeds, London"
+    assert trials[2]["who_can_enter"] == "Adults with AML (gamma)"
+    assert len(stats["new"]) == 3 and stats["requests"] == 5
+
+    again, stats = run_crawl(site, state, previous=trials)
+    assert again == trials
+    assert stats["not_modified"] == 5
+    assert stats["new"] == stats["changed_trials"] == stats["removed"] == []
+
+
+def test_only_changed_trial_is_reparsed(site):
+    state = {}
+    trials, _ = run_crawl(site, state)
+    site.trials["beta"] = "Adults with relapsed AML only"
+
+    updated, stats = run_crawl(site, state, previous=trials)
+    assert stats["changed"] == 1 and stats["not_modified"] == 4
+    assert stats["changed_trials"] == [trials[1]["link"]]
+    assert updated[1]["who_can_enter"] == "Adults with relapsed AML only"
+
+
+def test_failed_detail_page_never_writes_empty_details(site):
+    trials, _ = run_crawl(site, {})
+    site.failing.add("beta")
+
+    # No stored detail and no previous record: the trial is skipped
+    fresh, stats = run_crawl(site, {})
+    assert [t["title"] for t in fresh] == ["Alpha", "Gamma"]
+    assert stats["failed"] == 1 and stats["skipped"] == [trials[1]["link"]]
+
+    # With a previous record, that record is kept unchanged
+    kept, stats = run_crawl(site, {}, previous=trials)
+    assert kept == trials
+    assert stats["skipped"] == stats["changed_trials"] == stats["removed"] == []
+
+
+def test_content_hash_without_etags(site):
+    site.etags = False
+    state = {}
+    trials, _ = run_crawl(site, state)
+    again, stats = run_crawl(site, state, previous=trials)
+    assert again == trials
+    assert stats["unchanged"] == 5 and stats["changed"] == 0
+
+
+def test_incremental_scrape_into_trial_store(site, tmp_path):
+    store_path = str(tmp_path / "trials.sqlite3")
+    state_path = str(tmp_path / "state.json")
+    stats = scrape_trials_incremental(state_path=state_path, start_url=site.url, store_path=store_path)
+    assert stats["store"] == {"inserted": 3, "updated": 0, "unchanged": 0}
+
+    site.trials["gamma"] = "Adults with AML after transplant"
+    stats = scrape_trials_incremental(state_path=state_path, start_url=site.url, store_path=store_path)
+    assert stats["store"] == {"inserted": 0, "updated": 1, "unchanged": 2}
+    assert [t["title"] for t in TrialStore(store_path).query_trials(text="transplant")] == ["Gamma"]
@@ -0,0 +1,159 @@
+"""
+Tests for the per-prompt JSON Schemas and re-asks (utils/structured_output.py).
+"""
+
+import asyncio
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import utils.extraction_engine as extraction_engine
+import utils.llm_cache as llm_cache
+import utils.llm_metrics as llm_metrics
+from classifiers.mds_risk_classifier import _build_ipssm_prompts, _build_ipssm_schemas
+from parsers import aml_eln_parser, aml_parser, mds_ipss_parser, treatment_parser
+from utils.extraction_engine import extract_prompts
+from utils.llm_cache import LLMResponseCache, cached_json_completion
+from utils.llm_metrics import LLMMetrics
+from utils.structured_output import StructuredOutputError, parse_reply, section_schema
+
+STRUCTURE = {
+    "blasts_percentage": None,
+    "fibrotic": False,
+    "qualifiers": {"previous_cytotoxic_therapy": None, "predisposing_germline_variant": "None"},
+}
+SCHEMAS = {
+    "clinical": section_schema(STRUCTURE, ["blasts_percentage", "fibrotic"]),
+    "qualifiers": section_schema(STRUCTURE, ["qualifiers"]),
+}
+
+
+class ScriptedAsyncClient:
+    """Replies to each prompt (the first user message) with a scripted sequence of answers."""
+
+    def __init__(self, script):
+        self.script = {prompt: list(replies) for prompt, replies in script.items()}
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, model, messages, **kwargs):
+        self.requests.append(messages)
+        content = self.script[messages[1]["content"]].pop(0)
+        return SimpleNamespace(model=model, choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    instance = LLMResponseCache(path=str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(llm_cache, "_cache_instance", instance)
+    return instance
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    instance = LLMMetrics()
+    monkeypatch.setattr(llm_metrics, "_metrics_instance", instance)
+    return instance
+
+
+def use_client(monkeypatch, script):
+    client = ScriptedAsyncClient(script)
+    monkeypatch.setattr(extraction_engine, "get_async_openai_client", lambda: client)
+    return client
+
+
+def test_schema_generated_from_required_structure():
+    schema = SCHEMAS["clinical"]
+    assert schema["required"] == ["blasts_percentage", "fibrotic"]
+    assert parse_reply('{"blasts_percentage": 32, "fibrotic": null}', schema)["blasts_percentage"] == 32
+    with pytest.raises(ValueError, match="fibrotic"):
+        parse_reply('{"blasts_percentage": 32, "fibrotic": "yes"}', schema)
+    with pytest.raises(ValueError, match="'fibrotic' is a required property"):
+        parse_reply('{"blasts_percentage": 32}', schema)
+    with pytest.raises(ValueError, match="not valid JSON"):
+        parse_reply('{"blasts_percentage": 32,', schema)
+    # Nested keys are optional; the merge step fills them in
+    assert parse_reply('{"qualifiers": {}}', SCHEMAS["qualifiers"]) == {"qualifiers": {}}
+
+
+def test_every_parser_prompt_has_a_schema():
+    report = "Bone marrow: 25% blasts."
+    builders = [
+        (aml_parser._build_aml_prompts, aml_parser._build_aml_schemas),
+        (mds_ipss_parser._build_ipss_prompts, mds_ipss_parser._build_ipss_schemas),
+        (treatment_parser._build_treatment_prompts, treatment_parser._build_treatment_schemas),
+        (_build_ipssm_prompts, _build_ipssm_schemas),
+    ]
+    for build_prompts, build_schemas in builders:
+        structure, prompts = build_prompts(report)
+        schemas = build_schemas(structure)
+        assert set(schemas) == set(prompts)
+        for schema in schemas.values():
+            assert set(schema["required"]) <= set(structure)
+
+    structure, _ = aml_eln_parser._build_eln_prompt(report)
+    eln_schema = aml_eln_parser._build_eln_schema(structure)
+    assert "required" not in eln_schema
+    with pytest.raises(ValueError, match="cd33_percentage"):
+        parse_reply('{"npm1_mutation": true, "cd33_percentage": 140}', eln_schema)
+
+
+def test_only_the_failing_section_is_reasked(cache, metrics, monkeypatch):
+    client = use_client(monkeypatch, {
+        "clinical": ['{"blasts_percentage": 32}', '{"blasts_percentage": 32, "fibrotic": false}'],
+        "qualifiers": ['{"qualifiers": {"predisposing_germline_variant": "DDX41"}}'],
+    })
+    results = asyncio.run(extract_prompts({"clinical": "clinical", "qualifiers": "qualifiers"}, "system",
+                                          group="aml_parser", schemas=SCHEMAS))
+
+    assert results["clinical"] == {"blasts_percentage": 32, "fibrotic": False}
+    assert len(client.requests) == 3
+    # The re-ask continues the same conversation and quotes the validation error
+    reask = next(messages for messages in client.requests if len(messages) == 4)
+    assert reask[1] == {"role": "user", "content": "clinical"}
+    assert reask[2] == {"role": "assistant", "content": '{"blasts_percentage": 32}'}
+    assert "'fibrotic' is a required property" in reask[3]["content"]
+
+    stats = metrics.snapshot()["prompts"]
+    assert stats["aml_parser.clinical"]["reasks"] == 1 and stats["aml_parser.clinical"]["errors"] == 0
+    assert stats["aml_parser.qualifiers"]["reasks"] == 0
+
+    # Only the valid final reply is cached
+    assert asyncio.run(extract_prompts({"clinical": "clinical"}, "system", schemas=SCHEMAS)) == {
+        "clinical": {"blasts_percentage": 32, "fibrotic": False}
+    }
+    assert len(client.requests) == 3
+
+
+def test_reasks_are_bounded_and_other_sections_are_kept(cache, metrics, monkeypatch):
+    monkeypatch.setenv("OPENAI_SCHEMA_REASKS", "1")
+    client = use_client(monkeypatch, {
+        "clinical": ["not json", '{"blasts_percentage": 32, "fibrotic": "yes"}'],
+        "qualifiers": ['{"qualifiers": {}}'],
+    })
+    with pytest.raises(StructuredOutputError) as excinfo:
+        asyncio.run(extract_prompts({"clinical": "clinical", "qualifiers": "qualifiers"}, "system",
+                                    schemas=SCHEMAS))
+
+    assert excinfo.value.name == "clinical" and excinfo.value.raw == '{"blasts_percentage": 32, "fibrotic": "yes"}'
+    assert len(client.requests) == 3
+    # The well-formed section finished and was cached, so a rerun only repeats the failing one
+    assert cache.get(cache.make_key("o3-mini", "system", "qualifiers")) == '{"qualifiers": {}}'
+    assert metrics.snapshot()["prompts"]["clinical"]["errors"] == 1
+
+
+def test_cached_reply_that_fails_the_schema_is_refetched(cache, metrics):
+    cache.set(cache.make_key("o3-mini", "system", "clinical"), '{"blasts_percentage": 32}')
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        create=lambda **kwargs: SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(
+            content='{"blasts_percentage": 32, "fibrotic": true}'))]))))
+
+    parsed = cached_json_completion(client, "o3-mini", "system", "clinical", schema=SCHEMAS["clinical"])
+    assert parsed == {"blasts_percentage": 32, "fibrotic": True}
+    assert json.loads(cache.get(cache.make_key("o3-mini", "system", "clinical")))["fibrotic"] is True
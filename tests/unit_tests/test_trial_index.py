@@ -0,0 +1,138 @@
+"""
+Tests for the trial index and structured eligibility prefilter (parsers/trial_index.py).
+"""
+
+import json
+import os
+import sys
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from parsers.trial_index import (
+    PatientProfile,
+    TrialIndex,
+    build_patient_profile,
+    compile_constraints,
+    exclusion_reasons,
+    get_trial_index,
+)
+
+
+def trial(title, structured=None, status="Open"):
+    entry = {"title": title, "status": status}
+    if structured is not None:
+        entry["structured_eligibility_v2"] = structured
+    return entry
+
+
+TRIALS = [
+    trial("Unstructured trial"),
+    trial("Adults 18-60", {"age": {"min_age": 18, "max_age": 60}}),
+    trial("FLT3-ITD positive AML", {
+        "cancer_diagnosis": {"required_diagnoses": ["Acute Myeloid Leukemia"]},
+        "genetic_markers": {"required_positive": ["FLT3-ITD mutation"]},
+    }),
+    trial("Any FLT3 AML", {"genetic_markers": {"required_positive": ["FLT3"]}}),
+    trial("Relapsed MDS, no HIV", {
+        "cancer_diagnosis": {"required_diagnoses": ["MDS"], "disease_status": {"relapsed": True}},
+        "medical_conditions": {"infections": {"hiv_excluded": True}},
+    }),
+    trial("Solid tumour basket", {"cancer_diagnosis": {"required_diagnoses": ["Advanced solid tumors"]}}),
+    trial("Closed trial", {"age": {"min_age": 18}}, status="Closed"),
+]
+
+PARSED = {
+    "AML_defining_recurrent_genetic_abnormalities": {"NPM1": True, "PML::RARA": False},
+    "ELN2024_risk_genes": {"FLT3_ITD": False, "TP53": False},
+    "MDS_related_mutation": {"ASXL1": None},
+}
+REPORT = "NGS: NPM1 c.860_863dup, VAF 38%. FLT3-ITD not detected; TP53: no mutations detected."
+
+
+def titles(trials):
+    return [t["title"] for t in trials]
+
+
+def test_build_patient_profile():
+    profile = build_patient_profile(
+        PARSED,
+        {"age": "72", "ecog_status": None, "relapsed": True, "prior_chemotherapy_regimens": 1, "hiv_positive": True},
+        disease_type="AML",
+        report_text=REPORT,
+    )
+    assert profile.age == 72
+    assert profile.ecog is None
+    assert profile.disease_status == "relapsed"
+    assert "NPM1" in profile.positive_markers
+    # FLT3_ITD negative is not a negative FLT3 result (TKD is untested); unknown ASXL1 is neither.
+    assert {"FLT3_ITD", "TP53"} <= profile.negative_markers
+    assert "FLT3" not in profile.negative_markers
+    assert "ASXL1" not in profile.positive_markers | profile.negative_markers
+    assert profile.conditions == frozenset({"hiv"})
+
+
+def test_shortlist_excludes_only_clear_violations():
+    index = TrialIndex.from_trials(TRIALS)
+    profile = build_patient_profile(PARSED, {"age": 72}, disease_type="AML", report_text=REPORT)
+    plausible, excluded = index.shortlist(profile)
+
+    assert titles(plausible) == ["Unstructured trial", "Any FLT3 AML", "Solid tumour basket"]
+    assert titles(t for t, _ in excluded) == ["Adults 18-60", "FLT3-ITD positive AML", "Relapsed MDS, no HIV"]
+    reasons = dict((t["title"], r) for t, r in excluded)
+    assert reasons["Adults 18-60"] == ["Age 72 is above the maximum age of 60"]
+    assert reasons["FLT3-ITD positive AML"] == ["Requires FLT3-ITD mutation positive, patient is negative"]
+    assert reasons["Relapsed MDS, no HIV"] == ["Trial requires MDS, patient has AML"]
+
+
+def test_unmentioned_marker_keeps_the_trial():
+    # False from the parser only means "not found": without a negative result in the
+    # report, a trial requiring FLT3-ITD stays on the shortlist.
+    index = TrialIndex.from_trials(TRIALS)
+    for report_text in (None, "NGS: NPM1 c.860_863dup, VAF 38%. FLT3 analysis pending."):
+        profile = build_patient_profile(PARSED, {"age": 72}, disease_type="AML", report_text=report_text)
+        assert profile.negative_markers == frozenset()
+        plausible, excluded = index.shortlist(profile)
+        assert "FLT3-ITD positive AML" in titles(plausible)
+        assert "FLT3-ITD positive AML" not in titles(t for t, _ in excluded)
+
+
+def test_unknown_patient_values_never_exclude():
+    index = TrialIndex.from_trials(TRIALS)
+    plausible, excluded = index.shortlist(PatientProfile())
+    assert excluded == []
+    assert "Closed trial" not in titles(plausible)
+    assert index.shortlist(None) == (index.trials, [])
+
+
+def test_positive_variant_satisfies_gene_requirement():
+    profile = build_patient_profile({"ELN2024_risk_genes": {"FLT3_TKD": True, "FLT3_ITD": False}})
+    any_flt3 = compile_constraints({"genetic_markers": {"required_positive": ["FLT3"]}})
+    flt3_negative = compile_constraints({"genetic_markers": {"required_negative": ["FLT3"]}})
+    assert exclusion_reasons(any_flt3, profile) == []
+    assert exclusion_reasons(flt3_negative, profile) == ["Requires FLT3 negative, patient is positive"]
+
+
+def test_status_and_conditions():
+    constraints = compile_constraints(TRIALS[4]["structured_eligibility_v2"])
+    profile = PatientProfile(disease_type="MDS", disease_status="newly_diagnosed", conditions=frozenset({"hiv"}))
+    assert exclusion_reasons(constraints, profile) == [
+        "Disease status newly diagnosed is not eligible",
+        "Excluded condition: hiv",
+    ]
+    assert exclusion_reasons(constraints, PatientProfile(disease_type="MDS", disease_status="relapsed")) == []
+
+
+def test_index_is_cached_until_file_changes(tmp_path):
+    path = tmp_path / "trials.json"
+    path.write_text(json.dumps(TRIALS[:2]))
+    first = get_trial_index(str(path))
+    assert get_trial_index(str(path)) is first
+
+    path.write_text(json.dumps(TRIALS))
+    # Make sure the rewrite is visible even on filesystems with coarse mtimes.
+    mtime_ns = os.stat(path).st_mtime_ns + 1_000_000_000
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+    second = get_trial_index(str(path))
+    assert second is not first
+    assert len(second.trials) == len(TRIALS) - 1
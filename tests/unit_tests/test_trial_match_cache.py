@@ -0,0 +1,111 @@
+"""
+Tests for the per-(patient, trial) match result cache (utils/trial_match_cache.py)
+and its use in ClinicalTrialMatcher.find_matching_trials.
+"""
+
+import asyncio
+import json
+import os
+import re
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import utils.trial_match_cache as trial_match_cache
+from parsers.clinical_trial_matcher import ClinicalTrialMatcher
+from utils.trial_match_cache import TrialMatchCache, patient_fingerprint, trial_content_hash
+
+TRIALS = [
+    {"title": f"Trial {i}", "link": f"https://example.org/trial-{i}", "status": "Open",
+     "description": f"Description {i}", "cancer_types": "Acute myeloid leukaemia (AML)"}
+    for i in range(7)
+]
+RESULT = {"relevance_score": 50, "explanation": "Possible", "matching_factors": ["AML"],
+          "exclusion_factors": [], "recommendation": "consider"}
+
+
+class FakeAsyncClient:
+    """Scores every trial in a batch prompt and records which trials it was asked about."""
+
+    def __init__(self):
+        self.scored_titles = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        prompt = kwargs["messages"][1]["content"]
+        titles = re.findall(r"^Title: (.*)$", prompt, flags=re.MULTILINE)
+        self.scored_titles += titles
+        content = json.dumps({f"trial_{i}": RESULT for i in range(1, len(titles) + 1)})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    instance = TrialMatchCache(path=str(tmp_path / "matches.sqlite3"))
+    monkeypatch.setattr(trial_match_cache, "_cache_instance", instance)
+    return instance
+
+
+def test_patient_fingerprint_ignores_whitespace():
+    a = patient_fingerprint("PATIENT CLINICAL PROFILE:\n\nAge: 70 years\n")
+    b = patient_fingerprint("PATIENT CLINICAL PROFILE:\nAge:  70 years  \n\n")
+    assert a == b
+    assert a != patient_fingerprint("PATIENT CLINICAL PROFILE:\nAge: 71 years")
+    assert a != patient_fingerprint("PATIENT CLINICAL PROFILE:\nAge: 70 years", model="gpt-4o")
+
+
+def test_trial_hash_ignores_match_fields():
+    assert trial_content_hash(TRIALS[0]) == trial_content_hash({**TRIALS[0], **RESULT})
+    assert trial_content_hash(TRIALS[0]) != trial_content_hash({**TRIALS[0], "status": "Closed"})
+
+
+def test_changed_trial_is_a_miss(cache):
+    cache.set_many("patient", [{**trial, **RESULT} for trial in TRIALS[:2]])
+    changed = {**TRIALS[1], "description": "Amended protocol"}
+
+    assert set(cache.get_many("patient", [TRIALS[0], changed])) == {TRIALS[0]["link"]}
+    assert cache.get_many("other patient", [TRIALS[0]]) == {}
+    assert cache.stats()["stale"] == 1
+    assert cache.stats()["entries"] == 1
+
+
+def test_invalidate_changed_trials(cache):
+    cache.set_many("p1", [{**trial, **RESULT} for trial in TRIALS[:3]])
+    cache.set_many("p2", [{**TRIALS[0], **RESULT}])
+    removed = cache.invalidate_changed_trials([{**TRIALS[0], "locations": "Leeds"}, TRIALS[1]])
+    assert removed == 2
+    assert cache.stats()["entries"] == 2
+
+
+def test_matcher_rescores_only_changed_trials(cache, tmp_path):
+    trials_file = tmp_path / "trials.json"
+    trials_file.write_text(json.dumps(TRIALS))
+    matcher = ClinicalTrialMatcher.__new__(ClinicalTrialMatcher)
+    matcher.client = FakeAsyncClient()
+    matcher.semaphore = asyncio.Semaphore(3)
+
+    def run(patient_data):
+        matcher.client.scored_titles = []
+        results = asyncio.run(matcher.find_matching_trials(patient_data, trials_file=str(trials_file)))
+        return results, matcher.client.scored_titles
+
+    results, scored = run("Age: 70\nNPM1 mutation")
+    assert len(results) == len(TRIALS) and len(scored) == len(TRIALS)
+
+    results, scored = run("Age: 70\n\nNPM1 mutation  ")
+    assert len(results) == len(TRIALS) and scored == []
+    assert all(r["relevance_score"] == 50 for r in results)
+
+    updated = [dict(t) for t in TRIALS]
+    updated[3]["description"] = "Amended protocol"
+    trials_file.write_text(json.dumps(updated))
+    mtime_ns = os.stat(trials_file).st_mtime_ns + 1_000_000_000
+    os.utime(trials_file, ns=(mtime_ns, mtime_ns))
+
+    results, scored = run("Age: 70\nNPM1 mutation")
+    assert scored == ["Trial 3"]
+    assert next(r for r in results if r["title"] == "Trial 3")["description"] == "Amended protocol"
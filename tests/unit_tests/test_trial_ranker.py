@@ -0,0 +1,61 @@
+"""
+Tests for BM25 trial ranking (parsers/trial_ranker.py and TrialIndex.rank).
+"""
+
+import os
+import sys
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from parsers.trial_index import TrialIndex
+from parsers.trial_ranker import BM25Index, tokenize
+
+
+def trial(title, cancer_types, who_can_enter="", description=""):
+    return {"title": title, "status": "Open", "cancer_types": cancer_types,
+            "who_can_enter": who_can_enter, "description": description, "link": title}
+
+
+TRIALS = [
+    trial("Gilteritinib for relapsed AML", "Acute myeloid leukaemia (AML)",
+          "have AML with an FLT3-ITD or FLT3-TKD mutation"),
+    trial("Venetoclax with azacitidine", "Acute myeloid leukaemia (AML), Blood cancers",
+          "have AML with an NPM1 gene change"),
+    trial("Luspatercept in lower risk MDS", "Myelodysplastic syndrome (MDS)",
+          "have anaemia needing transfusions and an SF3B1 mutation"),
+    trial("Ibrutinib in CLL", "Chronic lymphocytic leukaemia (CLL)", "have CLL needing treatment"),
+]
+
+
+def test_tokenize_keeps_gene_notation():
+    tokens = tokenize("FLT3-ITD positive, PML::RARA fusion; NPM1 mutations in Leukemia")
+    assert {"flt3-itd", "flt3", "itd", "pml::rara", "pml", "rara", "npm1", "mutation", "leukaemia"} <= set(tokens)
+    assert "in" not in tokens
+    # Gene names are never de-pluralised
+    assert tokenize("KMT2As") == ["kmt2as"]
+
+
+def test_bm25_prefers_rare_matching_terms():
+    index = BM25Index([["aml", "flt3"], ["aml", "npm1"], ["mds"]])
+    scores = index.scores(["aml", "flt3"])
+    assert scores[0] > scores[1] > scores[2] == 0.0
+    assert index.scores(["unseen"]) == [0.0, 0.0, 0.0]
+
+
+def test_rank_trials_against_patient_text():
+    index = TrialIndex.from_trials(TRIALS)
+    ranked = [t["title"] for t, _ in index.rank("Acute Myeloid Leukemia (AML)\nFLT3-ITD: positive")]
+    assert ranked[0] == "Gilteritinib for relapsed AML"
+    assert ranked.index("Venetoclax with azacitidine") < ranked.index("Ibrutinib in CLL")
+
+    mds = [t["title"] for t, _ in index.rank("Myelodysplastic Syndrome (MDS), SF3B1 mutated, anemia")]
+    assert mds[0] == "Luspatercept in lower risk MDS"
+
+
+def test_rank_restricted_to_candidates():
+    index = TrialIndex.from_trials(TRIALS)
+    candidates = index.trials[1:3]
+    ranked = index.rank("AML with NPM1", candidates)
+    assert [t["title"] for t, _ in ranked] == ["Venetoclax with azacitidine", "Luspatercept in lower risk MDS"]
+    assert index.ranker is index.ranker
@@ -0,0 +1,103 @@
+"""
+Tests for the SQLite trial catalog (utils/trial_store.py).
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from parsers.trial_index import get_trial_index
+from utils.trial_store import TrialStore
+
+
+def trial(slug, status="Open", cancer_types="Acute myeloid leukaemia (AML)", locations="Leeds, London",
+          start="2024-01-01T00:00:00+00:00", end="2026-12-31T00:00:00+00:00", who_can_enter=""):
+    return {
+        "title": f"Trial {slug}",
+        "status": status,
+        "cancer_types": cancer_types,
+        "locations": locations,
+        "link": f"https://example.org/{slug}",
+        "recruitment_start_iso": start,
+        "recruitment_end_iso": end,
+        "who_can_enter": who_can_enter,
+    }
+
+
+TRIALS = [
+    trial("a", who_can_enter="Adults with newly diagnosed AML and an FLT3 mutation"),
+    trial("b", cancer_types="Blood cancers, Myelodysplastic syndrome (MDS)", locations="Oxford",
+          who_can_enter="Adults with higher risk MDS"),
+    trial("c", status="Closed", who_can_enter="Adults with AML in first remission"),
+    trial("d", start="2027-01-01T00:00:00+00:00", end="", who_can_enter="Children with relapsed AML"),
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    instance = TrialStore(str(tmp_path / "trials.sqlite3"))
+    instance.upsert_trials(TRIALS)
+    return instance
+
+
+def links(trials):
+    return [t["link"].rsplit("/", 1)[-1] for t in trials]
+
+
+def test_records_round_trip(store):
+    assert store.get("https://example.org/b") == TRIALS[1]
+    assert store.count() == 4
+
+
+def test_indexed_filters(store):
+    assert links(store.query_trials()) == ["a", "b", "d"]
+    assert links(store.query_trials(status=None)) == ["a", "b", "c", "d"]
+    assert links(store.query_trials(status="closed")) == ["c"]
+    assert links(store.query_trials(cancer_type="Myelodysplastic syndrome (MDS)")) == ["b"]
+    assert links(store.query_trials(location="london")) == ["a", "d"]
+    assert links(store.query_trials(recruiting_on="2025-06-01")) == ["a", "b"]
+
+
+def test_full_text_search(store):
+    assert links(store.query_trials(text="FLT3")) == ["a"]
+    assert set(links(store.query_trials(status=None, text="AML"))) == {"a", "c", "d"}
+    assert links(store.query_trials(text='relapsed" OR "MDS')) == []
+
+
+def test_upserts_only_touch_changed_rows(store):
+    version = store.version()
+    assert store.upsert_trials(TRIALS) == {"inserted": 0, "updated": 0, "unchanged": 4}
+
+    moved = dict(TRIALS[0], locations="Glasgow")
+    assert store.upsert_trials([moved, trial("e")]) == {"inserted": 1, "updated": 1, "unchanged": 0}
+    assert store.version() > version
+    assert links(store.query_trials(location="Glasgow")) == ["a"]
+    assert links(store.query_trials(location="Leeds")) == ["d", "e"]
+
+
+def test_structured_eligibility_follows_eligibility_text(store):
+    store.update_structured_eligibility("https://example.org/a", {"age": {"min_age": 18}}, {"source_hash": "x"})
+    store.upsert_trials([dict(TRIALS[0], locations="Leeds")])
+    assert store.get("https://example.org/a")["structured_eligibility_v2"] == {"age": {"min_age": 18}}
+
+    store.upsert_trials([dict(TRIALS[0], who_can_enter="Adults over 60 with AML")])
+    assert "structured_eligibility_v2" not in store.get("https://example.org/a")
+
+
+def test_delete_trials(store):
+    assert store.delete_trials(["https://example.org/a", "https://example.org/missing"]) == 1
+    assert store.get("https://example.org/a") is None
+    assert store.query_trials(text="FLT3") == []
+
+
+def test_trial_index_reads_open_trials_from_store(store):
+    index = get_trial_index(store.path)
+    assert links(index.trials) == ["a", "b", "d"]
+    assert get_trial_index(store.path) is index
+
+    store.upsert_trials([dict(TRIALS[2], status="Open")])
+    assert links(get_trial_index(store.path).trials) == ["a", "b", "c", "d"]
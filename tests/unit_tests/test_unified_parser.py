@@ -0,0 +1,100 @@
+"""
+Tests for the unified "parse once" extraction planner (parsers/unified_parser.py).
+"""
+
+import asyncio
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+# The parser modules build the shared OpenAI client at import time.
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+import utils.extraction_engine as extraction_engine
+import utils.llm_cache as llm_cache
+import utils.model_router as model_router
+from parsers.unified_parser import parse_report_once_async, plan_extraction
+from utils.llm_cache import LLMResponseCache
+from utils.model_router import ModelRouter
+
+
+class FakeAsyncClient:
+    """Answers every prompt with the same canned JSON and counts the calls."""
+
+    def __init__(self, answer: dict):
+        self.answer = answer
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, model, messages, **kwargs):
+        self.calls += 1
+        message = SimpleNamespace(content=json.dumps(self.answer))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+@pytest.fixture
+def fake_client(tmp_path, monkeypatch):
+    client = FakeAsyncClient({
+        "blasts_percentage": 35,
+        "qualifiers": {"relapsed": True},
+        "cd33_percentage": 80,
+        "npm1_mutation": True,
+        "flt3_tkd": True,
+        # Remaining keys the section schemas require
+        "fibrotic": False,
+        "hypoplasia": False,
+        "number_of_dysplastic_lineages": None,
+        "AML_defining_recurrent_genetic_abnormalities": {},
+        "Biallelic_TP53_mutation": {},
+        "MDS_related_mutation": {},
+        "MDS_related_cytogenetics": {},
+        "AML_differentiation": None,
+        "ELN2024_risk_genes": {},
+        "no_cytogenetics_data": False,
+    })
+    monkeypatch.setattr(llm_cache, "_cache_instance", LLMResponseCache(path=str(tmp_path / "cache.sqlite3")))
+    monkeypatch.setattr(extraction_engine, "get_async_openai_client", lambda: client)
+    # Every section on the usual model; routing has its own tests
+    monkeypatch.setattr(model_router, "_router_instance", ModelRouter(enabled=False))
+    return client
+
+
+class TestPlanner:
+
+    def test_treatment_alone_uses_its_dedicated_prompts(self):
+        sections, recipes = plan_extraction(["treatment"])
+        assert recipes == {"treatment": "dedicated"}
+        assert len(sections) == 5
+
+    def test_full_page_shares_sections(self):
+        sections, recipes = plan_extraction(["classification", "eln", "treatment"])
+        assert recipes["treatment"] == "shared"
+        # 8 classification + 1 ELN + 1 treatment history, instead of 8 + 1 + 5
+        assert len(sections) == 10
+        assert len(sections) == len(set(sections))
+
+    def test_unknown_consumer_is_rejected(self):
+        with pytest.raises(ValueError):
+            plan_extraction(["classification", "survival"])
+
+
+def test_parse_once_issues_each_section_once_and_projects(fake_client):
+    results = asyncio.run(parse_report_once_async("report", ["classification", "eln", "treatment"]))
+
+    assert fake_client.calls == 10
+    assert set(results) == {"classification", "eln", "treatment"}
+    assert results["classification"]["blasts_percentage"] == 35
+    assert results["eln"]["NPM1"] is True
+
+    treatment = results["treatment"]
+    assert treatment["cd33_percentage"] == 80
+    assert treatment["cd33_positive"] is True
+    assert treatment["qualifiers"]["relapsed"] is True
+    assert treatment["AML_defining_recurrent_genetic_abnormalities"]["NPM1_mutation"] is True
+    assert treatment["AML_defining_recurrent_genetic_abnormalities"]["FLT3_TKD"] is True
@@ -9,12 +9,12 @@ import json
 import time
 import logging
 
+from trial_sources import FILTERED_URL
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-FILTERED_URL = "https://find.cancerresearchuk.org/clinical-trials?size=n_20_n&filters%5B0%5D%5Bfield%5D=trial_status&filters%5B0%5D%5Bvalues%5D%5B0%5D=Open&filters%5B0%5D%5Btype%5D=any&filters%5B1%5D%5Bfield%5D=cancer_types&filters%5B1%5D%5Bvalues%5D%5B0%5D=Acute%20leukaemia&filters%5B1%5D%5Bvalues%5D%5B1%5D=Acute%20lymphoblastic%20leukaemia%20%28ALL%29&filters%5B1%5D%5Bvalues%5D%5B2%5D=Acute%20myeloid%20leukaemia%20%28AML%29&filters%5B1%5D%5Bvalues%5D%5B3%5D=Blood%20cancers&filters%5B1%5D%5Bvalues%5D%5B4%5D=Chronic%20leukaemia&filters%5B1%5D%5Bvalues%5D%5B5%5D=Chronic%20lymphocytic%20leukaemia%20%28CLL%29&filters%5B1%5D%5Bvalues%5D%5B6%5D=Chronic%20myeloid%20leukaemia%20%28CML%29&filters%5B1%5D%5Bvalues%5D%5B7%5D=Hairy%20cell%20leukaemia&filters%5B1%5D%5Bvalues%5D%5B8%5D=High%20grade%20lymphoma&filters%5B1%5D%5Bvalues%5D%5B9%5D=Hodgkin%20lymphoma&filters%5B1%5D%5Bvalues%5D%5B10%5D=Leukaemia&filters%5B1%5D%5Bvalues%5D%5B11%5D=Low%20grade%20lymphoma&filters%5B1%5D%5Bvalues%5D%5B12%5D=Lymphoma&filters%5B1%5D%5Bvalues%5D%5B13%5D=Myelodysplastic%20syndrome%20%28MDS%29&filters%5B1%5D%5Bvalues%5D%5B14%5D=Myelofibrosis&filters%5B1%5D%5Bvalues%5D%5B15%5D=Myeloma&filters%5B1%5D%5Bvalues%5D%5B16%5D=Myeloproliferative%20neoplasms&filters%5B1%5D%5Bvalues%5D%5B17%5D=Non-Hodgkin%20lymphoma&filters%5B1%5D%5Bvalues%5D%5B18%5D=Thrombocythaemia&filters%5B1%5D%5Btype%5D=any"
-
 def setup_driver():
     """Set up and return a configured Chrome WebDriver."""
     try:
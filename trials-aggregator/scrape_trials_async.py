@@ -0,0 +1,359 @@
+"""
+Concurrent, incremental HTTP scraper for the Cancer Research UK trial finder.
+
+This is a faster alternative to scrape_trials.py. That scraper drives one
+headless Chrome in sequence, with fixed sleeps on every page. This one:
+
+- fetches listing and detail pages concurrently with httpx
+- parses them with BeautifulSoup, using the same selectors as scrape_trials.py
+- keeps a crawl state file with each URL's ETag, Last-Modified and content hash
+
+On later runs every page is requested conditionally. A 304, or a body whose
+hash has not changed, reuses the stored trial. Only new or changed trials are
+re-parsed, and they are reported back so that downstream steps (structured
+eligibility extraction, match caching) can be limited to them.
+
+Usage:
+    python scrape_trials_async.py [--concurrency 8] [--output clinical_trials.json]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sys
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+import httpx
+from bs4 import BeautifulSoup
+
+from trial_sources import FILTERED_URL
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_OUTPUT = "clinical_trials.json"
+DEFAULT_STATE = "crawl_state.json"
+DEFAULT_CONCURRENCY = 8
+MAX_RETRIES = 3
+USER_AGENT = "Mozilla/5.0 (compatible; haem-trials-aggregator/1.0)"
+
+
+##############################
+# CRAWL STATE
+##############################
+def load_state(path: str) -> Dict[str, Dict]:
+    """Loads {url: {etag, last_modified, content_hash, data}} from a previous crawl."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Ignoring unreadable crawl state {path}: {e}")
+        return {}
+
+
+def save_state(path: str, state: Dict[str, Dict]) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+##############################
+# PARSING
+##############################
+def listing_page_url(url: str, page: int) -> str:
+    """Returns the listing URL for ``page`` (Search UI keeps it in ``current=n_<page>_n``)."""
+    parts = urlsplit(url)
+    # Edit the raw query so the already-encoded filter parameters are kept byte for byte
+    query = [p for p in parts.query.split("&") if p and not p.startswith("current=")]
+    if page > 1:
+        query.insert(0, f"current=n_{page}_n")
+    return urlunsplit(parts._replace(query="&".join(query)))
+
+
+def parse_listing(html: str, base_url: str) -> Tuple[List[Dict], int]:
+    """
+    Parses the trial cards on one listing page.
+
+    Returns:
+        (trial summaries, last page number shown in the pagination, or 1)
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    summaries = []
+    for card in soup.select("a.chakra-card"):
+        heading = card.select_one("h2.chakra-heading")
+        label = card.select_one("p.chakra-text.label-text")
+        if heading is None or not card.get("href"):
+            continue
+        type_text = label.get_text(strip=True) if label else ""
+        summary = {
+            "title": heading.get_text(strip=True),
+            "type": type_text,
+            "description": "",
+            "status": "",
+            "cancer_types": "",
+            "locations": "",
+            "link": urljoin(base_url, card["href"]),
+        }
+        for p in card.select("p.chakra-text"):
+            text = p.get_text(" ", strip=True)
+            if text.startswith("Status:"):
+                summary["status"] = text.replace("Status:", "").strip()
+            elif text.startswith("Cancer type(s):"):
+                summary["cancer_types"] = text.replace("Cancer type(s):", "").strip()
+            elif text.startswith("Locations:"):
+                summary["locations"] = text.replace("Locations:", "").strip()
+            elif text and text != type_text and not summary["description"]:
+                summary["description"] = text
+        summaries.append(summary)
+
+    last_page = 1
+    for item in soup.select("ul.rc-pagination li.rc-pagination-item"):
+        title = item.get("title") or item.get_text(strip=True)
+        if str(title).isdigit():
+            last_page = max(last_page, int(title))
+    return summaries, last_page
+
+
+def _following_text(soup: BeautifulSoup, label: str) -> Optional[str]:
+    node = soup.find(string=lambda s: s and label in s)
+    if node is None:
+        return None
+    sibling = node.parent.find_next_sibling()
+    return sibling.get_text(strip=True) if sibling else None
+
+
+def _accordion_body(soup: BeautifulSoup, heading: str, selector: str) -> str:
+    for header in soup.select("h2.accordion-header"):
+        if heading in header.get_text():
+            panel = header.parent.select_one(selector)
+            return panel.get_text("\n", strip=True) if panel else ""
+    return ""
+
+
+def parse_detail(html: str) -> Dict:
+    """Extracts the same detail fields as scrape_trials.extract_detail_fields."""
+    soup = BeautifulSoup(html, "html.parser")
+    detail = {}
+    for key, pane in (("recruitment_start", "start"), ("recruitment_end", "end")):
+        time_tag = soup.select_one(f"div.pane-node-field-trial-recruitment-{pane} time")
+        detail[key] = time_tag.get_text(strip=True) if time_tag else ""
+        detail[f"{key}_iso"] = time_tag.get("datetime", "") if time_tag else ""
+
+    chief = _following_text(soup, "Chief Investigator")
+    if chief is not None:
+        detail["chief_investigator"] = chief
+    supported = _following_text(soup, "Supported by")
+    if supported is not None:
+        detail["supported_by"] = supported
+    phone = soup.find(string=lambda s: s and "Freephone" in s)
+    if phone is not None:
+        detail["contact_phone"] = phone.strip()
+    email = soup.select_one("a[href^='mailto:']")
+    email_addr = email["href"].replace("mailto:", "") if email else ""
+    detail["contact_email"] = email_addr if "@" in email_addr else None
+
+    detail["who_can_enter"] = _accordion_body(soup, "Who can enter", "div.field-item[property='schema:population']")
+    detail["location_panel"] = _accordion_body(soup, "Location", "div.accordion-body")
+    return detail
+
+
+##############################
+# FETCHING
+##############################
+class IncrementalFetcher:
+    """Conditional, rate-limited GETs that record validators and content hashes in the crawl state."""
+
+    def __init__(self, client: httpx.AsyncClient, state: Dict[str, Dict], concurrency: int):
+        self.client = client
+        self.state = state
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.stats = {"requests": 0, "not_modified": 0, "unchanged": 0, "changed": 0, "failed": 0}
+
+    async def fetch(self, url: str) -> Tuple[Optional[str], bool]:
+        """
+        Returns (body, changed). ``body`` is None when the stored copy is still
+        current (304 or identical hash) or the request failed.
+        """
+        entry = self.state.get(url, {})
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        for attempt in range(1, MAX_RETRIES + 1):
+            try:
+                async with self.semaphore:
+                    self.stats["requests"] += 1
+                    response = await self.client.get(url, headers=headers)
+                if response.status_code == 304:
+                    self.stats["not_modified"] += 1
+                    return None, False
+                if response.status_code >= 500 and attempt < MAX_RETRIES:
+                    raise httpx.HTTPStatusError("server error", request=response.request, response=response)
+                response.raise_for_status()
+                break
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                if attempt == MAX_RETRIES or (
+                    isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500
+                ):
+                    logger.error(f"Failed to fetch {url}: {e}")
+                    self.stats["failed"] += 1
+                    return None, False
+                await asyncio.sleep(0.5 * 2 ** (attempt - 1))
+
+        body = response.text
+        digest = content_hash(body)
+        entry = dict(entry,
+                     etag=response.headers.get("etag"),
+                     last_modified=response.headers.get("last-modified"))
+        changed = digest != entry.get("content_hash")
+        entry["content_hash"] = digest
+        self.state[url] = entry
+        self.stats["changed" if changed else "unchanged"] += 1
+        return (body if changed else None), changed
+
+
+async def _listing_page(fetcher: IncrementalFetcher, url: str) -> Tuple[List[Dict], int]:
+    body, _ = await fetcher.fetch(url)
+    entry = fetcher.state.get(url, {})
+    if body is None:
+        data = entry.get("data") or {}
+        return data.get("summaries", []), data.get("last_page", 1)
+    summaries, last_page = parse_listing(body, url)
+    entry["data"] = {"summaries": summaries, "last_page": last_page}
+    return summaries, last_page
+
+
+async def _trial_detail(fetcher: IncrementalFetcher, summary: Dict, previous: Dict[str, Dict]) -> Optional[Dict]:
+    """
+    The summary merged with its detail page. When the page could not be fetched
+    and no parsed copy is stored, the previously written record is kept instead,
+    or None if there is none, so a failed request never writes empty details.
+    """
+    url = summary["link"]
+    body, _ = await fetcher.fetch(url)
+    entry = fetcher.state.get(url, {})
+    if body is not None:
+        entry["data"] = parse_detail(body)
+    elif "data" not in entry:
+        if url in previous:
+            logger.warning(f"No detail page for {url}; keeping the previous record")
+        else:
+            logger.warning(f"No detail page for {url}; skipping the trial")
+        return previous.get(url)
+    return {**summary, **entry["data"]}
+
+
+async def crawl(start_url: str = FILTERED_URL, state: Optional[Dict[str, Dict]] = None,
+                concurrency: int = DEFAULT_CONCURRENCY, previous_trials: Optional[List[Dict]] = None,
+                transport: Optional[httpx.AsyncBaseTransport] = None) -> Tuple[List[Dict], Dict]:
+    """
+    Crawls every listing page and trial detail page.
+
+    Args:
+        start_url: First listing page (the filtered trial search).
+        state: Crawl state from a previous run; updated in place.
+        concurrency: Maximum number of requests in flight.
+        previous_trials: The last written trial list, used to report which trials changed.
+        transport: Optional httpx transport (tests use a local fixture server instead).
+
+    Returns:
+        (trials in listing order, stats dict with request counters and changed/new/removed/skipped links)
+    """
+    state = {} if state is None else state
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(headers={"User-Agent": USER_AGENT}, follow_redirects=True,
+                                 timeout=30.0, limits=limits, transport=transport) as client:
+        fetcher = IncrementalFetcher(client, state, concurrency)
+
+        # Page 1 tells us how many listing pages there are; fetch the rest together
+        first_summaries, last_page = await _listing_page(fetcher, listing_page_url(start_url, 1))
+        other_pages = await asyncio.gather(*(
+            _listing_page(fetcher, listing_page_url(start_url, page)) for page in range(2, last_page + 1)
+        ))
+        summaries = first_summaries + [s for page_summaries, _ in other_pages for s in page_summaries]
+        logger.info(f"Found {len(summaries)} trials on {last_page} listing pages")
+
+        # De-duplicate trials that appear on more than one page, keeping listing order
+        unique = list({s["link"]: s for s in reversed(summaries)}.values())[::-1]
+        previous = {t.get("link"): t for t in previous_trials or []}
+        details = await asyncio.gather(*(_trial_detail(fetcher, s, previous) for s in unique))
+
+    trials = [t for t in details if t is not None]
+    current_links = {t["link"] for t in trials}
+    stats = dict(fetcher.stats)
+    stats["new"] = [t["link"] for t in trials if t["link"] not in previous]
+    stats["changed_trials"] = [
+        t["link"] for t in trials if t["link"] in previous and previous[t["link"]] != t
+    ]
+    stats["removed"] = [link for link in previous if link not in current_links]
+    stats["skipped"] = [s["link"] for s, t in zip(unique, details) if t is None]
+    return trials, stats
+
+
+def scrape_trials_incremental(output: str = DEFAULT_OUTPUT, state_path: str = DEFAULT_STATE,
+                              start_url: str = FILTERED_URL, concurrency: int = DEFAULT_CONCURRENCY,
+                              store_path: Optional[str] = None) -> Dict:
+    """
+    Runs one incremental crawl. Trials are written in the scrape_trials.py JSON
+    format to ``output``, or upserted into the SQLite trial store at ``store_path``
+    (removed trials are deleted from it).
+    """
+    store = None
+    if store_path:
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        from utils.trial_store import METADATA_FIELD, STRUCTURED_FIELD, TrialStore
+        store = TrialStore(store_path)
+        # Compare scraped fields only; extracted eligibility lives alongside them in the store
+        previous_trials = [
+            {k: v for k, v in t.items() if k not in (STRUCTURED_FIELD, METADATA_FIELD)}
+            for t in store.query_trials(status=None)
+        ]
+    elif os.path.exists(output):
+        with open(output, "r", encoding="utf-8") as f:
+            previous_trials = json.load(f)
+    else:
+        previous_trials = []
+
+    state = load_state(state_path)
+    trials, stats = asyncio.run(crawl(start_url, state, concurrency, previous_trials))
+    if not trials and previous_trials:
+        logger.error("Crawl returned no trials; keeping the existing trial list")
+        return stats
+
+    if store is not None:
+        stats["store"] = store.upsert_trials(trials)
+        store.delete_trials(stats["removed"])
+    else:
+        with open(output, "w") as f:
+            json.dump(trials, f, indent=2)
+    save_state(state_path, state)
+    logger.info(
+        f"Wrote {len(trials)} trials ({len(stats['new'])} new, {len(stats['changed_trials'])} changed, "
+        f"{len(stats['removed'])} removed) in {stats['requests']} requests"
+    )
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=FILTERED_URL, help="First listing page to crawl")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--state", default=DEFAULT_STATE, help="Crawl state (ETags and content hashes)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--store", help="Upsert into this SQLite trial store instead of writing --output")
+    args = parser.parse_args()
+    scrape_trials_incremental(args.output, args.state, args.url, args.concurrency, args.store)
@@ -0,0 +1,260 @@
+"""
+Asyncio engine for the multi-prompt report parsers.
+
+The AML, IPSS, treatment and IPSS-M parsers each send several independent
+prompts for one report. Instead of starting a fresh ``ThreadPoolExecutor`` per
+click, the prompts run as tasks on one shared background event loop:
+
+- ``extract_prompts()`` awaits a dict of named prompts and returns a dict of
+  parsed JSON results. Each prompt has its own timeout, and a process-wide
+  semaphore caps how many prompts are in flight across all sessions. Prompts
+  given a JSON Schema are validated and re-asked on their own when a reply does
+  not match (utils/structured_output.py), and simple sections go to a fast
+  model first (utils/model_router.py).
+- ``run_sync()`` lets Streamlit script code wait for a coroutine on the shared
+  loop. It cancels the work when the session disconnects or a rerun/stop is
+  requested, and also when the same session starts the same job again.
+
+The concurrency cap and timeout can be set in the ``[openai]`` section of
+``secrets.toml`` (``max_concurrent_prompts``, ``prompt_timeout_seconds``) or
+with the matching ``OPENAI_*`` environment variables.
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+import time
+import weakref
+from typing import Any, Awaitable, Dict, Optional
+
+from utils.llm_cache import cached_json_completion_async
+from utils.llm_client import _openai_secrets, _setting, get_async_openai_client
+from utils.llm_metrics import track_llm_call
+from utils.model_router import ESCALATED, FAST, STRONG, find_conflicts, get_model_router
+from utils.structured_output import StructuredOutputError
+
+##############################
+# ENGINE CONFIG
+##############################
+DEFAULT_MODEL = "o3-mini"
+DEFAULT_MAX_CONCURRENT_PROMPTS = 16
+DEFAULT_PROMPT_TIMEOUT_SECONDS = 120.0
+POLL_INTERVAL_SECONDS = 0.1
+
+
+class ExtractionCancelled(Exception):
+    """Raised by ``run_sync`` when the waiting session goes away or is rerun."""
+
+
+##############################
+# SHARED EVENT LOOP
+##############################
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+_running_jobs: Dict[Any, concurrent.futures.Future] = {}
+_jobs_lock = threading.Lock()
+
+
+def get_engine_loop() -> asyncio.AbstractEventLoop:
+    """Returns the shared event loop, starting its background thread on first use."""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=loop.run_forever, name="extraction-engine", daemon=True
+                )
+                thread.start()
+                _loop = loop
+    return _loop
+
+
+def _get_prompt_semaphore() -> asyncio.Semaphore:
+    """Returns the prompt semaphore for the running loop."""
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        limit = _setting(_openai_secrets(), "max_concurrent_prompts", DEFAULT_MAX_CONCURRENT_PROMPTS)
+        semaphore = asyncio.Semaphore(limit)
+        _semaphores[loop] = semaphore
+    return semaphore
+
+
+##############################
+# PROMPT EXECUTION
+##############################
+async def _complete(prompt: str, system_message: str, model: str, name: str,
+                    schema: Optional[dict], escalation_reason: Optional[str]):
+    """One prompt through the model router. Returns (result, route)."""
+    client = get_async_openai_client()
+    router = get_model_router()
+    if escalation_reason is None and router.routes_fast(name, model, schema):
+        return await router.complete(client, name, model, system_message, prompt, schema)
+
+    started = time.perf_counter()
+    result = await cached_json_completion_async(client, model, system_message, prompt, schema=schema)
+    route = STRONG if escalation_reason is None else ESCALATED
+    router.record(route, time.perf_counter() - started, escalation_reason)
+    return result, route
+
+
+async def _run_prompt(prompt: str, system_message: str, model: str, timeout: Optional[float],
+                      name: str, schema: Optional[dict], escalation_reason: Optional[str] = None):
+    if timeout is None:
+        timeout = _setting(
+            _openai_secrets(), "prompt_timeout_seconds", DEFAULT_PROMPT_TIMEOUT_SECONDS, cast=float
+        )
+    with track_llm_call(name, model) as call:
+        async with _get_prompt_semaphore():
+            call.mark_started()
+            return await asyncio.wait_for(
+                _complete(prompt, system_message, model, name, schema, escalation_reason), timeout
+            )
+
+
+async def run_prompt(prompt: str, system_message: str, model: str = DEFAULT_MODEL,
+                     timeout: Optional[float] = None, name: str = "extraction",
+                     schema: Optional[dict] = None) -> dict:
+    """
+    Runs one cached JSON prompt under the global semaphore and a per-prompt timeout.
+    Its latency, queue wait and tokens are recorded in utils.llm_metrics under ``name``.
+    With a ``schema`` the reply is validated, and re-asks share the prompt's timeout.
+    Simple sections may be answered by a faster model (utils/model_router.py).
+    """
+    result, _ = await _run_prompt(prompt, system_message, model, timeout, name, schema)
+    return result
+
+
+async def extract_prompts(prompts: Dict[str, str], system_message: str,
+                          model: str = DEFAULT_MODEL,
+                          timeout: Optional[float] = None,
+                          group: Optional[str] = None,
+                          schemas: Optional[Dict[str, dict]] = None) -> Dict[str, dict]:
+    """
+    Runs all prompts concurrently and returns their parsed JSON keyed by prompt name.
+    Metrics are recorded per prompt as ``<group>.<name>`` (or just the name), and
+    ``schemas`` maps prompt names to the JSON Schema their reply must match.
+
+    If any prompt fails or times out, the remaining prompts are cancelled and the
+    first error is raised, matching the previous all-or-nothing behaviour. A reply
+    that still fails its schema after the re-asks is the exception: the other
+    prompts are left to finish, so their results are cached and a rerun only
+    repeats the failing section.
+
+    Sections answered by the fast model that conflict with another section are
+    asked again on ``model`` once all prompts have finished.
+    """
+    schemas = schemas or {}
+    metric_names = {name: f"{group}.{name}" if group else name for name in prompts}
+    tasks = {
+        name: asyncio.ensure_future(_run_prompt(prompt, system_message, model, timeout,
+                                                metric_names[name], schemas.get(name)))
+        for name, prompt in prompts.items()
+    }
+    try:
+        await asyncio.gather(*tasks.values())
+    except StructuredOutputError:
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+    results = {name: task.result()[0] for name, task in tasks.items()}
+
+    fast = [name for name, task in tasks.items() if task.result()[1] == FAST]
+    conflicting = sorted(find_conflicts(results, fast))
+    if conflicting:
+        print(f"↗️ Fast-model sections conflict with the rest of the report: {', '.join(conflicting)}; escalating.")
+        escalated = await asyncio.gather(*(
+            _run_prompt(prompts[name], system_message, model, timeout, metric_names[name],
+                        schemas.get(name), escalation_reason="conflict")
+            for name in conflicting
+        ))
+        for name, (result, _) in zip(conflicting, escalated):
+            results[name] = result
+    return results
+
+
+async def extract_unresolved_prompts(prompts: Dict[str, str], resolved: Dict[str, dict],
+                                     system_message: str, group: Optional[str] = None,
+                                     schemas: Optional[Dict[str, dict]] = None) -> Dict[str, dict]:
+    """
+    Runs only the prompts missing from ``resolved`` (the sections the rule-based
+    pre-extractor already answered) and returns all results in prompt order.
+    """
+    pending = {name: prompt for name, prompt in prompts.items() if name not in resolved}
+    if resolved:
+        print(f"⚡ Resolved {len(resolved)}/{len(prompts)} prompts from structured report data.")
+    results = await extract_prompts(pending, system_message, group=group, schemas=schemas) if pending else {}
+    return {name: resolved[name] if name in resolved else results[name] for name in prompts}
+
+
+##############################
+# SYNC BRIDGE FOR STREAMLIT
+##############################
+def _current_script_context():
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        return get_script_run_ctx(suppress_warning=True)
+    except Exception:
+        return None
+
+
+def _script_run_abandoned(ctx) -> bool:
+    """True once the session behind ``ctx`` has disconnected or asked for a rerun/stop."""
+    if ctx is None:
+        return False
+    requests = getattr(ctx, "script_requests", None)
+    state = getattr(requests, "_state", None)
+    if state is not None and getattr(state, "name", "CONTINUE") != "CONTINUE":
+        return True
+    try:
+        from streamlit import runtime
+        if runtime.exists() and not runtime.get_instance().is_active_session(ctx.session_id):
+            return True
+    except Exception:
+        pass
+    return False
+
+
+def run_sync(coro: Awaitable, job_name: Optional[str] = None):
+    """
+    Runs ``coro`` on the shared event loop and blocks until it finishes.
+
+    When called from a Streamlit script run, the job is registered under the
+    session id and ``job_name`` (by default the coroutine's name). A still-running
+    job with the same key is treated as stale and cancelled. Raises
+    ``ExtractionCancelled`` if the session disconnects or reruns while waiting.
+    """
+    ctx = _current_script_context()
+    future = asyncio.run_coroutine_threadsafe(coro, get_engine_loop())
+
+    job_key = None
+    if ctx is not None:
+        job_key = (ctx.session_id, job_name or getattr(coro, "__qualname__", repr(coro)))
+        with _jobs_lock:
+            stale = _running_jobs.get(job_key)
+            _running_jobs[job_key] = future
+        if stale is not None and not stale.done():
+            stale.cancel()
+
+    try:
+        # Poll with wait() rather than result(timeout=...): a prompt timeout raised
+        # by the coroutine is also a TimeoutError and must not look like "still running".
+        while not future.done():
+            concurrent.futures.wait([future], timeout=POLL_INTERVAL_SECONDS)
+            if not future.done() and _script_run_abandoned(ctx):
+                future.cancel()
+                raise ExtractionCancelled("Extraction cancelled because the session was rerun or closed.")
+        if future.cancelled():
+            raise ExtractionCancelled("Extraction was superseded by a newer request.")
+        return future.result()
+    finally:
+        if job_key is not None:
+            with _jobs_lock:
+                if _running_jobs.get(job_key) is future:
+                    del _running_jobs[job_key]
@@ -0,0 +1,349 @@
+"""
+Background jobs for the slow AI steps of the results page.
+
+GPT reviews, treatment parsing and trial matching used to run inline under
+``st.spinner``, which blocked the script run (and every rerun) for tens of
+seconds. They now run as jobs on one process-wide thread pool:
+
+- ``JobManager`` keeps a job table (id, session, name, status, result, error,
+  timestamps). Each session may only run a few jobs at a time; the rest wait in
+  that session's queue, so one slow session cannot occupy the whole pool.
+- ``run_in_background()`` is the Streamlit side. It submits a job once per
+  (session, result key, inputs), and returns the result once it is ready,
+  storing it in ``st.session_state`` like the inline code did. While the job is
+  running it renders a small ``st.fragment`` that polls the job table and
+  reruns the app when the job finishes, so users can keep switching tabs. A
+  failed job is remembered with a Retry button rather than resubmitted on
+  every rerun.
+
+Job functions run outside the Streamlit script thread and must not draw to
+the page; anything they report goes through ``report_progress()``.
+
+The pool size and per-session limit can be set in the ``[openai]`` section of
+``secrets.toml`` (``max_background_jobs``, ``max_jobs_per_session``) or with the
+matching ``OPENAI_*`` environment variables.
+"""
+
+import hashlib
+import itertools
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import streamlit as st
+
+from utils.llm_client import _openai_secrets, _setting
+
+##############################
+# JOB CONFIG
+##############################
+DEFAULT_MAX_WORKERS = 16
+DEFAULT_MAX_JOBS_PER_SESSION = 4
+DEFAULT_RETENTION_SECONDS = 60 * 60  # finished jobs are kept for an hour
+POLL_SECONDS = 1.0
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATUSES = (DONE, FAILED, CANCELLED)
+
+
+@dataclass(eq=False)
+class Job:
+    """One unit of background work and its outcome."""
+    id: str
+    session_id: str
+    name: str
+    key: Optional[str]
+    fn: Callable = field(repr=False)
+    args: tuple = field(default=(), repr=False)
+    kwargs: dict = field(default_factory=dict, repr=False)
+    status: str = QUEUED
+    result: Any = field(default=None, repr=False)
+    error: Optional[str] = None
+    progress: Any = field(default=None, repr=False)
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the job was submitted (or its total duration once finished)."""
+        return (self.finished_at or time.time()) - self.submitted_at
+
+
+@dataclass
+class JobFailure:
+    """Kept under a job's result key after it failed, so reruns do not resubmit it."""
+    label: str
+    error: str
+
+
+##############################
+# JOB MANAGER
+##############################
+_current_job = threading.local()
+
+
+def report_progress(progress: Any) -> None:
+    """Publishes a progress value for the job running on this thread (no-op elsewhere)."""
+    job = getattr(_current_job, "job", None)
+    if job is not None:
+        job.progress = progress
+
+
+class JobManager:
+    """Thread pool with a job table and a per-session concurrency limit."""
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS,
+                 max_jobs_per_session: int = DEFAULT_MAX_JOBS_PER_SESSION,
+                 retention_seconds: float = DEFAULT_RETENTION_SECONDS):
+        self.max_workers = max_workers
+        self.max_jobs_per_session = max(1, max_jobs_per_session)
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="background-job")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+        self._keys: Dict[tuple, str] = {}
+        self._waiting: Dict[str, Deque[Job]] = {}
+        self._running: Dict[str, int] = {}
+        self._ids = itertools.count(1)
+
+    def submit(self, session_id: str, name: str, fn: Callable, *args,
+               key: Optional[str] = None, **kwargs) -> Job:
+        """
+        Queues ``fn(*args, **kwargs)`` for ``session_id``. When ``key`` is given and
+        the session already has a queued, running or finished job under that key,
+        that job is returned instead of submitting a duplicate.
+        """
+        self.prune()
+        with self._lock:
+            if key is not None:
+                existing = self._jobs.get(self._keys.get((session_id, key), ""))
+                if existing is not None and existing.status not in (FAILED, CANCELLED):
+                    return existing
+            job = Job(id=f"job-{next(self._ids)}", session_id=session_id, name=name, key=key,
+                      fn=fn, args=args, kwargs=kwargs)
+            self._jobs[job.id] = job
+            if key is not None:
+                self._keys[(session_id, key)] = job.id
+            if self._running.get(session_id, 0) < self.max_jobs_per_session:
+                self._start(job)
+            else:
+                self._waiting.setdefault(session_id, deque()).append(job)
+        return job
+
+    def _start(self, job: Job) -> None:
+        # Called with the lock held
+        self._running[job.session_id] = self._running.get(job.session_id, 0) + 1
+        self._executor.submit(self._run, job)
+
+    def _run(self, job: Job) -> None:
+        job.status, job.started_at = RUNNING, time.time()
+        _current_job.job = job
+        try:
+            job.result = job.fn(*job.args, **job.kwargs)
+            job.status = DONE
+        except Exception as e:
+            print(f"❌ Background job '{job.name}' failed: {e}")
+            job.error = str(e) or type(e).__name__
+            job.status = FAILED
+        finally:
+            _current_job.job = None
+            job.finished_at = time.time()
+            self._finished(job)
+
+    def _finished(self, job: Job) -> None:
+        """Frees the session's slot and starts its next waiting job, if any."""
+        with self._lock:
+            self._running[job.session_id] -= 1
+            waiting = self._waiting.get(job.session_id)
+            if waiting:
+                self._start(waiting.popleft())
+            if not waiting:
+                self._waiting.pop(job.session_id, None)
+            if not self._running[job.session_id]:
+                del self._running[job.session_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def find(self, session_id: str, key: str) -> Optional[Job]:
+        """The latest job submitted by ``session_id`` under ``key``."""
+        with self._lock:
+            return self._jobs.get(self._keys.get((session_id, key), ""))
+
+    def jobs_for_session(self, session_id: str) -> List[Job]:
+        """All known jobs of a session, oldest first."""
+        with self._lock:
+            return [job for job in self._jobs.values() if job.session_id == session_id]
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancels a job that has not started yet. Running jobs are left to finish."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            waiting = self._waiting.get(job.session_id) if job else None
+            if job is None or job.status != QUEUED or not waiting or job not in waiting:
+                return False
+            waiting.remove(job)
+            job.status, job.finished_at = CANCELLED, time.time()
+            return True
+
+    def discard(self, job_id: str) -> None:
+        """Forgets a finished job, so its key can be submitted again."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or not job.finished:
+                return
+            del self._jobs[job_id]
+            if job.key is not None and self._keys.get((job.session_id, job.key)) == job_id:
+                del self._keys[(job.session_id, job.key)]
+
+    def prune(self) -> int:
+        """Drops finished jobs older than the retention period; returns how many."""
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            expired = [job.id for job in self._jobs.values() if job.finished and job.finished_at < cutoff]
+        for job_id in expired:
+            self.discard(job_id)
+        return len(expired)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            counts = {status: 0 for status in (QUEUED, RUNNING) + FINISHED_STATUSES}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            counts["sessions"] = len({job.session_id for job in self._jobs.values()})
+            return counts
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_manager_instance: Optional[JobManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """Returns the process-wide job manager, creating it on first use."""
+    global _manager_instance
+    if _manager_instance is None:
+        with _manager_lock:
+            if _manager_instance is None:
+                secrets = _openai_secrets()
+                _manager_instance = JobManager(
+                    max_workers=_setting(secrets, "max_background_jobs", DEFAULT_MAX_WORKERS),
+                    max_jobs_per_session=_setting(secrets, "max_jobs_per_session", DEFAULT_MAX_JOBS_PER_SESSION),
+                )
+    return _manager_instance
+
+
+##############################
+# STREAMLIT HELPERS
+##############################
+def session_job_id() -> str:
+    """Stable id of the current browser session, used to scope its jobs."""
+    if "job_session_id" not in st.session_state:
+        st.session_state["job_session_id"] = uuid.uuid4().hex
+    return st.session_state["job_session_id"]
+
+
+def inputs_fingerprint(*args, **kwargs) -> str:
+    """Short hash of a job's inputs, so a new report never collects an old report's job."""
+    return hashlib.sha256(repr((args, sorted(kwargs.items()))).encode("utf-8")).hexdigest()[:16]
+
+
+def _show_pending(job: Job, label: str, render_progress: Optional[Callable[[Any], None]]) -> None:
+    @st.fragment(run_every=POLL_SECONDS)
+    def poll():
+        current = get_job_manager().get(job.id)
+        if current is None or current.finished:
+            # Full rerun, so the page collects the result
+            st.rerun()
+        position = "running" if current.status == RUNNING else "queued"
+        st.info(f"⏳ {label} ({position}, {current.elapsed:.0f}s). You can keep using the other tabs.")
+        if render_progress is not None and current.progress is not None:
+            render_progress(current.progress)
+
+    poll()
+
+
+def _job_key(state_key: str, *args, **kwargs) -> str:
+    return f"{state_key}:{inputs_fingerprint(*args, **kwargs)}"
+
+
+def submit_in_background(state_key: str, label: str, fn: Callable, *args, **kwargs) -> Optional[Job]:
+    """
+    Starts computing ``st.session_state[state_key]`` without waiting for it.
+    A later ``run_in_background`` call with the same key and inputs collects the
+    same job. Returns None when the result is already in the session state.
+    """
+    if state_key in st.session_state:
+        return None
+    return get_job_manager().submit(session_job_id(), label, fn, *args,
+                                    key=_job_key(state_key, *args, **kwargs), **kwargs)
+
+
+def job_failed(state_key: str) -> bool:
+    """True when the job for ``state_key`` failed and has not been retried yet."""
+    return isinstance(st.session_state.get(state_key), JobFailure)
+
+
+def _show_failure(state_key: str, failure: JobFailure) -> bool:
+    """Shows the error with a Retry button; returns True once Retry is clicked."""
+    placeholder = st.empty()
+    with placeholder.container():
+        st.error(f"❌ {failure.label} failed: {failure.error}")
+        retry = st.button("Retry", key=f"retry_{state_key}")
+    if not retry:
+        return False
+    placeholder.empty()
+    del st.session_state[state_key]
+    return True
+
+
+def run_in_background(state_key: str, label: str, fn: Callable, *args,
+                      render_progress: Optional[Callable[[Any], None]] = None, **kwargs):
+    """
+    Returns ``st.session_state[state_key]``, computing it with ``fn(*args, **kwargs)``
+    on the job pool if needed.
+
+    Returns None while the job is queued or running (a polling status box is
+    shown in its place) and when it failed. A failure is kept under ``state_key``
+    (see ``job_failed``) and shown with a Retry button, so it is only resubmitted
+    when the user asks. ``render_progress`` draws the job's latest ``report_progress`` value.
+    """
+    if state_key in st.session_state:
+        value = st.session_state[state_key]
+        if not isinstance(value, JobFailure):
+            return value
+        if not _show_failure(state_key, value):
+            return None
+
+    manager = get_job_manager()
+    # Collect a finished job before submitting: submit() would start a failed one again
+    job = manager.find(session_job_id(), _job_key(state_key, *args, **kwargs))
+    if job is None:
+        job = submit_in_background(state_key, label, fn, *args, **kwargs)
+    if job.status == DONE:
+        st.session_state[state_key] = job.result
+        manager.discard(job.id)
+        return job.result
+    if job.finished:
+        manager.discard(job.id)
+        failure = st.session_state[state_key] = JobFailure(label, job.error or job.status)
+        _show_failure(state_key, failure)
+        return None
+    _show_pending(job, label, render_progress)
+    return None
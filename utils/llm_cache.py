@@ -0,0 +1,303 @@
+"""
+On-disk cache for LLM extraction results.
+
+Responses are stored in a small SQLite database keyed on a content hash of the
+model name, system message and prompt text, so re-running the same report
+(e.g. after toggling a single form field) is served locally instead of going
+back to OpenAI. Entries expire after a TTL and the least recently used rows are
+evicted once the cache grows past its size limit.
+
+Cached prompts contain report text, so the database lives in the user's cache
+directory rather than the repository. ``cache_dir`` in the ``[openai]`` secrets
+(or ``OPENAI_CACHE_DIR``) moves it, and ``disk_cache = "off"`` (or
+``OPENAI_DISK_CACHE=off``) keeps the cache in memory for the life of the process
+so that nothing is written to disk.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from utils.llm_metrics import track_llm_call
+from utils.structured_output import StructuredOutputError, parse_reply, reask_message, schema_reasks
+
+##############################
+# CACHE CONFIG
+##############################
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "haematology-classifier",
+)
+DEFAULT_CACHE_PATH = os.path.join(DEFAULT_CACHE_DIR, "llm_cache.sqlite3")
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60  # one week
+DEFAULT_MAX_ENTRIES = 5000
+
+
+class LLMResponseCache:
+    """
+    Content-addressed SQLite cache for raw LLM responses.
+
+    The cache is safe to share between the worker threads that the parsers use
+    to fan out their prompts. Only raw response text is stored; callers decide
+    what counts as a cacheable (i.e. successfully parsed) response.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_responses (
+                cache_key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_accessed REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_llm_responses_last_accessed "
+            "ON llm_responses (last_accessed)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, system_message: str, prompt: str) -> str:
+        """Builds the content hash used as the cache key for one LLM call."""
+        payload = json.dumps(
+            {"model": model, "system": system_message, "prompt": prompt},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the cached response for ``key``, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM llm_responses WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            response, created_at = row
+            if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_responses WHERE cache_key = ?", (key,))
+                self._conn.commit()
+                self.misses += 1
+                self.evictions += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE llm_responses SET last_accessed = ? WHERE cache_key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return response
+
+    def set(self, key: str, response: str, model: str = "") -> None:
+        """Stores a raw response and evicts the least recently used rows if over the limit."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_responses "
+                "(cache_key, model, response, created_at, last_accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now),
+            )
+            self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self) -> None:
+        if self.ttl_seconds is not None:
+            cursor = self._conn.execute(
+                "DELETE FROM llm_responses WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            )
+            self.evictions += max(cursor.rowcount, 0)
+
+        if self.max_entries is None:
+            return
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM llm_responses WHERE cache_key IN ("
+                "SELECT cache_key FROM llm_responses ORDER BY last_accessed ASC LIMIT ?)",
+                (overflow,),
+            )
+            self.evictions += overflow
+
+    def clear(self) -> None:
+        """Removes every cached response and resets the counters."""
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_responses")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns hit/miss counters and the current number of stored entries."""
+        with self._lock:
+            (size,) = self._conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "entries": size,
+        }
+
+
+##############################
+# SHARED INSTANCE
+##############################
+_cache_instance: Optional[LLMResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def cache_path(filename: str) -> str:
+    """Path of a cache database under the configured ``cache_dir``, or ``:memory:`` with ``disk_cache`` off."""
+    from utils.llm_client import _on_off, _openai_secrets, _setting
+    secrets = _openai_secrets()
+    if not _setting(secrets, "disk_cache", True, cast=_on_off):
+        return ":memory:"
+    return os.path.join(_setting(secrets, "cache_dir", DEFAULT_CACHE_DIR, cast=os.path.expanduser), filename)
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """Returns the process-wide LLM response cache, creating it on first use."""
+    global _cache_instance
+    if _cache_instance is None:
+        with _cache_lock:
+            if _cache_instance is None:
+                _cache_instance = LLMResponseCache(path=cache_path("llm_cache.sqlite3"))
+    return _cache_instance
+
+
+# Marks a cache miss or a reply that has to be asked again
+_NO_REPLY = object()
+
+
+def _validated_cached_reply(cache: LLMResponseCache, cache_key: str, schema: Optional[dict]):
+    """The cached reply for ``cache_key``, or _NO_REPLY if missing or no longer valid for ``schema``."""
+    raw = cache.get(cache_key)
+    if raw is None:
+        return _NO_REPLY
+    if schema is None:
+        return json.loads(raw)
+    try:
+        return parse_reply(raw, schema)
+    except ValueError:
+        # Stored before the schema changed; fetch a fresh reply
+        return _NO_REPLY
+
+
+def _check_reply(call, messages: list, raw: str, schema: dict, reasks_left: int):
+    """
+    Validates ``raw`` against ``schema``. Returns the parsed reply, or _NO_REPLY after
+    appending a re-ask turn to ``messages``; raises once no re-asks are left.
+    """
+    try:
+        return parse_reply(raw, schema)
+    except ValueError as e:
+        if reasks_left <= 0:
+            raise StructuredOutputError(call.name, str(e), raw) from e
+        print(f"⚠️ {call.name}: reply did not match its schema ({e}); asking again.")
+        call.reasks += 1
+        messages.append({"role": "assistant", "content": raw})
+        messages.append({"role": "user", "content": reask_message(str(e), schema)})
+        return _NO_REPLY
+
+
+def cached_json_completion(client, model: str, system_message: str, prompt: str,
+                           metrics_name: str = "json_completion", schema: Optional[dict] = None,
+                           max_reasks: Optional[int] = None, **create_kwargs) -> dict:
+    """
+    Calls the chat completions API through the shared cache and returns parsed JSON.
+
+    A response is only written to the cache once it has been parsed successfully,
+    so a malformed reply is retried on the next run rather than replayed. The call
+    is tracked in utils.llm_metrics under ``metrics_name`` unless a caller is
+    already tracking it.
+
+    With a ``schema`` (see utils.structured_output) the reply is also validated,
+    and a reply that does not match is re-asked up to ``max_reasks`` times (by
+    default the ``schema_reasks`` setting) before ``StructuredOutputError`` is raised.
+    """
+    cache = get_llm_cache()
+    cache_key = cache.make_key(model, system_message, prompt)
+    messages = [
+        {"role": "system", "content": system_message},
+        {"role": "user", "content": prompt}
+    ]
+
+    with track_llm_call(metrics_name, model) as call:
+        cached = _validated_cached_reply(cache, cache_key, schema)
+        if cached is not _NO_REPLY:
+            call.cache_hit = call.api_responses == 0
+            return cached
+
+        reasks_left = schema_reasks() if max_reasks is None else max_reasks
+        parsed = _NO_REPLY
+        while parsed is _NO_REPLY:
+            response = client.chat.completions.create(model=model, messages=messages, **create_kwargs)
+            call.record_response(response, model)
+            raw = response.choices[0].message.content.strip()
+            if schema is None:
+                parsed = json.loads(raw)
+            else:
+                parsed = _check_reply(call, messages, raw, schema, reasks_left)
+                reasks_left -= 1
+    cache.set(cache_key, raw, model=model)
+    return parsed
+
+
+async def cached_json_completion_async(client, model: str, system_message: str, prompt: str,
+                                       metrics_name: str = "json_completion", schema: Optional[dict] = None,
+                                       max_reasks: Optional[int] = None, **create_kwargs) -> dict:
+    """Awaitable version of ``cached_json_completion`` for an ``AsyncOpenAI`` client."""
+    cache = get_llm_cache()
+    cache_key = cache.make_key(model, system_message, prompt)
+    messages = [
+        {"role": "system", "content": system_message},
+        {"role": "user", "content": prompt}
+    ]
+
+    with track_llm_call(metrics_name, model) as call:
+        cached = _validated_cached_reply(cache, cache_key, schema)
+        if cached is not _NO_REPLY:
+            call.cache_hit = call.api_responses == 0
+            return cached
+
+        reasks_left = schema_reasks() if max_reasks is None else max_reasks
+        parsed = _NO_REPLY
+        while parsed is _NO_REPLY:
+            response = await client.chat.completions.create(model=model, messages=messages, **create_kwargs)
+            call.record_response(response, model)
+            raw = response.choices[0].message.content.strip()
+            if schema is None:
+                parsed = json.loads(raw)
+            else:
+                parsed = _check_reply(call, messages, raw, schema, reasks_left)
+                reasks_left -= 1
+    cache.set(cache_key, raw, model=model)
+    return parsed
@@ -0,0 +1,220 @@
+"""
+Shared OpenAI client for the parsers and reviewers.
+
+Every module used to build its own ``OpenAI(...)`` at import time, so each one
+held a separate connection pool and the parallel prompt fan-outs could open
+dozens of sockets at once. ``get_openai_client()`` returns one process-wide
+client backed by a keep-alive ``httpx`` pool with a bounded number of
+connections, and caps the number of requests in flight across all callers.
+``get_async_openai_client()`` does the same for ``AsyncOpenAI``, with one client
+per event loop because async connections cannot be shared between loops.
+
+The ``openai`` package itself is only imported when the first client is built.
+Modules that keep a module-level ``client`` use ``LazyOpenAIClient()``, so
+importing a parser or reviewer no longer costs the SDK import or needs an API key.
+
+The HTTP transport under both clients can be switched to record or replay
+fixtures for offline benchmarks; see ``utils.llm_transport``.
+
+The limits can be tuned under the ``[openai]`` section of ``secrets.toml``
+(``max_connections``, ``max_keepalive_connections``, ``max_concurrent_requests``,
+``timeout_seconds``) or with the matching ``OPENAI_*`` environment variables.
+"""
+
+import asyncio
+import os
+import threading
+import weakref
+from typing import TYPE_CHECKING, Optional
+
+import httpx
+
+from utils.llm_metrics import count_retry, count_retry_async
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
+
+##############################
+# CLIENT CONFIG
+##############################
+DEFAULT_MAX_CONNECTIONS = 20
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 10
+DEFAULT_KEEPALIVE_EXPIRY_SECONDS = 60.0
+DEFAULT_MAX_CONCURRENT_REQUESTS = 8
+DEFAULT_TIMEOUT_SECONDS = 120.0
+DEFAULT_CONNECT_TIMEOUT_SECONDS = 10.0
+
+
+def _openai_secrets() -> dict:
+    """Returns the ``[openai]`` secrets section, or an empty dict when unavailable."""
+    try:
+        import streamlit as st
+        return dict(st.secrets["openai"])
+    except Exception:
+        return {}
+
+
+def _setting(secrets: dict, key: str, default, cast=int):
+    """Reads a setting from secrets, then ``OPENAI_<KEY>`` in the environment, then the default."""
+    value = secrets.get(key, os.environ.get(f"OPENAI_{key.upper()}"))
+    if value is None or value == "":
+        return default
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _on_off(value) -> bool:
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+def _replay_api_key() -> Optional[str]:
+    """Placeholder key for replay mode, which never sends a request to OpenAI."""
+    from utils.llm_transport import REPLAY, transport_mode
+    return "replay" if transport_mode() == REPLAY else None
+
+
+class ConcurrencyLimitedTransport(httpx.HTTPTransport):
+    """
+    HTTP transport that allows at most ``max_concurrent_requests`` requests in
+    flight at once. Extra requests block until a slot frees up instead of
+    opening more sockets or failing with a pool timeout.
+    """
+
+    def __init__(self, max_concurrent_requests: int, **kwargs):
+        super().__init__(**kwargs)
+        self.max_concurrent_requests = max_concurrent_requests
+        self._slots = threading.BoundedSemaphore(max_concurrent_requests)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        with self._slots:
+            response = super().handle_request(request)
+            # Read the body while holding the slot so the connection is back in
+            # the pool before the next waiting request starts.
+            try:
+                response.read()
+            finally:
+                response.close()
+        return response
+
+
+def build_openai_client(api_key: Optional[str] = None,
+                        max_connections: Optional[int] = None,
+                        max_keepalive_connections: Optional[int] = None,
+                        max_concurrent_requests: Optional[int] = None,
+                        timeout_seconds: Optional[float] = None) -> "OpenAI":
+    """
+    Builds an OpenAI client with a pooled keep-alive HTTP client and a
+    concurrency cap. Arguments left as None fall back to secrets, the
+    environment and then the module defaults.
+    """
+    secrets = _openai_secrets()
+    api_key = api_key or secrets.get("api_key") or os.environ.get("OPENAI_API_KEY") or _replay_api_key()
+    max_connections = max_connections or _setting(secrets, "max_connections", DEFAULT_MAX_CONNECTIONS)
+    max_keepalive_connections = max_keepalive_connections or _setting(
+        secrets, "max_keepalive_connections", DEFAULT_MAX_KEEPALIVE_CONNECTIONS
+    )
+    max_concurrent_requests = max_concurrent_requests or _setting(
+        secrets, "max_concurrent_requests", DEFAULT_MAX_CONCURRENT_REQUESTS
+    )
+    timeout_seconds = timeout_seconds or _setting(
+        secrets, "timeout_seconds", DEFAULT_TIMEOUT_SECONDS, cast=float
+    )
+
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=min(max_keepalive_connections, max_connections),
+        keepalive_expiry=DEFAULT_KEEPALIVE_EXPIRY_SECONDS,
+    )
+    from utils.llm_transport import wrap_transport
+
+    http_client = httpx.Client(
+        transport=wrap_transport(ConcurrencyLimitedTransport(
+            max_concurrent_requests=min(max_concurrent_requests, max_connections),
+            limits=limits,
+        )),
+        timeout=httpx.Timeout(timeout_seconds, connect=DEFAULT_CONNECT_TIMEOUT_SECONDS),
+        event_hooks={"request": [count_retry]},
+    )
+    from openai import OpenAI
+    return OpenAI(api_key=api_key, http_client=http_client)
+
+
+def build_async_openai_client(api_key: Optional[str] = None,
+                              max_connections: Optional[int] = None,
+                              max_keepalive_connections: Optional[int] = None,
+                              timeout_seconds: Optional[float] = None) -> "AsyncOpenAI":
+    """
+    Builds an AsyncOpenAI client on a pooled keep-alive HTTP client. Requests
+    beyond ``max_connections`` wait for a free pooled connection; callers that
+    need a tighter cap should also hold a semaphore around each call.
+    """
+    secrets = _openai_secrets()
+    api_key = api_key or secrets.get("api_key") or os.environ.get("OPENAI_API_KEY") or _replay_api_key()
+    max_connections = max_connections or _setting(secrets, "max_connections", DEFAULT_MAX_CONNECTIONS)
+    max_keepalive_connections = max_keepalive_connections or _setting(
+        secrets, "max_keepalive_connections", DEFAULT_MAX_KEEPALIVE_CONNECTIONS
+    )
+    timeout_seconds = timeout_seconds or _setting(
+        secrets, "timeout_seconds", DEFAULT_TIMEOUT_SECONDS, cast=float
+    )
+
+    from utils.llm_transport import wrap_async_transport
+
+    http_client = httpx.AsyncClient(
+        transport=wrap_async_transport(httpx.AsyncHTTPTransport(limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=min(max_keepalive_connections, max_connections),
+            keepalive_expiry=DEFAULT_KEEPALIVE_EXPIRY_SECONDS,
+        ))),
+        # No pool timeout: queued requests wait for a connection instead of failing.
+        timeout=httpx.Timeout(timeout_seconds, connect=DEFAULT_CONNECT_TIMEOUT_SECONDS, pool=None),
+        event_hooks={"request": [count_retry_async]},
+    )
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(api_key=api_key, http_client=http_client)
+
+
+##############################
+# SHARED INSTANCES
+##############################
+_client_instance: Optional["OpenAI"] = None
+_client_lock = threading.Lock()
+
+
+def get_openai_client() -> "OpenAI":
+    """Returns the process-wide OpenAI client, creating it on first use."""
+    global _client_instance
+    if _client_instance is None:
+        with _client_lock:
+            if _client_instance is None:
+                _client_instance = build_openai_client()
+    return _client_instance
+
+
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+
+
+def get_async_openai_client() -> "AsyncOpenAI":
+    """Returns the AsyncOpenAI client for the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    with _client_lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            client = build_async_openai_client()
+            _async_clients[loop] = client
+    return client
+
+
+class LazyOpenAIClient:
+    """
+    Stand-in for the shared OpenAI client that builds it on first attribute access,
+    e.g. ``client.chat.completions.create(...)``.
+    """
+
+    def __getattr__(self, name):
+        return getattr(get_openai_client(), name)
+
+    def __repr__(self):
+        return "LazyOpenAIClient()"
@@ -0,0 +1,346 @@
+"""
+Per-prompt latency, token and cost metrics for every LLM call.
+
+Each call is tracked under a prompt name such as ``aml_parser.first_prompt_1``,
+``parse_for_ipssm.ipssm_genes`` or ``aml_review.classification``:
+
+- ``track_llm_call(name)`` wraps one logical call. It records the wall time,
+  the time spent waiting for a concurrency slot (``mark_started()``), cache
+  hits, retries, schema re-asks and errors. Nested calls join the outer record,
+  so the cache helpers can add tokens to a call that ``run_prompt`` has already
+  named.
+- ``tracked_completion()`` / ``tracked_completion_async()`` wrap
+  ``client.chat.completions.create`` for the reviewers and other direct callers.
+- Retries done inside the OpenAI SDK are counted from its retry-count header by
+  ``count_retry``, an httpx request hook installed on the shared clients.
+
+Calls are aggregated per prompt into histograms of wall time, queue wait and
+tokens, plus a rolling window of recent wall times for exact p50/p95. Cache hits
+are counted but kept out of the latency histograms, so a warm cache does not
+hide a slow prompt. ``metrics_snapshot()`` returns the aggregates as JSON-ready
+data and ``prometheus_text()`` in the Prometheus text exposition format; both
+back the LLM metrics admin page.
+"""
+
+import contextvars
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+##############################
+# METRICS CONFIG
+##############################
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+RECENT_CALLS = 500  # wall times kept per prompt for exact percentiles
+
+# Cached prompt tokens are billed at this fraction of the prompt price
+CACHED_PROMPT_DISCOUNT = 0.5
+# USD per million (prompt, completion) tokens, matched on the longest model prefix
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4": (30.00, 60.00),
+    "o3-mini": (1.10, 4.40),
+}
+
+
+def call_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_prompt_tokens: int = 0) -> float:
+    """List-price cost in USD of one call; 0 for unknown models."""
+    prefix = max((p for p in MODEL_PRICES if (model or "").startswith(p)), key=len, default=None)
+    if prefix is None:
+        return 0.0
+    prompt_price, completion_price = MODEL_PRICES[prefix]
+    uncached = prompt_tokens - cached_prompt_tokens
+    prompt_cost = (uncached + cached_prompt_tokens * CACHED_PROMPT_DISCOUNT) * prompt_price
+    return (prompt_cost + completion_tokens * completion_price) / 1_000_000
+
+
+##############################
+# AGGREGATES
+##############################
+class Histogram:
+    """Cumulative-bucket histogram, as Prometheus exposes it."""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """[(upper bound label, cumulative count)] including ``+Inf``."""
+        running, rows = 0, []
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            running += count
+            rows.append((str(bound), running))
+        return rows
+
+
+def _percentile(values: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+@dataclass
+class PromptStats:
+    """Running totals for one prompt name."""
+    calls: int = 0
+    errors: int = 0
+    cache_hits: int = 0
+    retries: int = 0
+    reasks: int = 0
+    prompt_tokens: int = 0
+    cached_prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost_usd: float = 0.0
+    wall: Histogram = field(default_factory=lambda: Histogram(LATENCY_BUCKETS))
+    queue_wait: Histogram = field(default_factory=lambda: Histogram(LATENCY_BUCKETS))
+    tokens: Histogram = field(default_factory=lambda: Histogram(TOKEN_BUCKETS))
+    recent: Deque[float] = field(default_factory=lambda: deque(maxlen=RECENT_CALLS))
+
+
+@dataclass
+class CallRecord:
+    """What is known about one in-progress call."""
+    name: str
+    model: str = ""
+    started: float = field(default_factory=time.perf_counter)
+    queue_wait: float = 0.0
+    cache_hit: bool = False
+    retries: int = 0
+    reasks: int = 0
+    prompt_tokens: int = 0
+    cached_prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost_usd: float = 0.0
+    api_responses: int = 0
+
+    def mark_started(self) -> None:
+        """Marks the end of the queue wait (e.g. once a semaphore slot is acquired)."""
+        self.queue_wait = time.perf_counter() - self.started
+
+    def record_response(self, response: Any, model: Optional[str] = None) -> None:
+        """
+        Adds the token usage and cost of a chat completion response, when it carries
+        usage. One call can span several responses (re-asks, model escalation).
+        """
+        usage = getattr(response, "usage", None)
+        self.model = getattr(response, "model", None) or model or self.model
+        self.api_responses += 1
+        # Something was fetched from the API, so the call is no longer a pure cache hit
+        self.cache_hit = False
+        if usage is not None:
+            prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+            completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+            # Prompt tokens served from the provider's prefix cache
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached_tokens = getattr(details, "cached_tokens", 0) or 0
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cached_prompt_tokens += cached_tokens
+            self.cost_usd += call_cost(self.model, prompt_tokens, completion_tokens, cached_tokens)
+
+
+class LLMMetrics:
+    """Thread-safe per-prompt aggregates."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._prompts: Dict[str, PromptStats] = {}
+        self.since = time.time()
+
+    def record(self, call: CallRecord, wall_seconds: float, error: bool = False) -> None:
+        with self._lock:
+            stats = self._prompts.setdefault(call.name, PromptStats())
+            stats.calls += 1
+            stats.errors += int(error)
+            stats.retries += call.retries
+            stats.reasks += call.reasks
+            stats.prompt_tokens += call.prompt_tokens
+            stats.cached_prompt_tokens += call.cached_prompt_tokens
+            stats.completion_tokens += call.completion_tokens
+            stats.cost_usd += call.cost_usd
+            if call.cache_hit:
+                stats.cache_hits += 1
+                return
+            stats.wall.observe(wall_seconds)
+            stats.queue_wait.observe(call.queue_wait)
+            stats.recent.append(wall_seconds)
+            if call.prompt_tokens or call.completion_tokens:
+                stats.tokens.observe(call.prompt_tokens + call.completion_tokens)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-ready aggregates per prompt, slowest p95 first."""
+        with self._lock:
+            prompts = {}
+            for name, stats in self._prompts.items():
+                api_calls = stats.calls - stats.cache_hits
+                recent = list(stats.recent)
+                prompts[name] = {
+                    "calls": stats.calls,
+                    "api_calls": api_calls,
+                    "errors": stats.errors,
+                    "cache_hits": stats.cache_hits,
+                    "retries": stats.retries,
+                    "reasks": stats.reasks,
+                    "prompt_tokens": stats.prompt_tokens,
+                    "cached_prompt_tokens": stats.cached_prompt_tokens,
+                    "completion_tokens": stats.completion_tokens,
+                    "cost_usd": round(stats.cost_usd, 6),
+                    "wall_p50": _percentile(recent, 50),
+                    "wall_p95": _percentile(recent, 95),
+                    "wall_max": max(recent) if recent else None,
+                    "wall_mean": stats.wall.total / api_calls if api_calls else None,
+                    "queue_wait_mean": stats.queue_wait.total / api_calls if api_calls else None,
+                    "wall_histogram": stats.wall.cumulative(),
+                    "queue_wait_histogram": stats.queue_wait.cumulative(),
+                    "tokens_histogram": stats.tokens.cumulative(),
+                }
+        ordered = dict(sorted(prompts.items(), key=lambda item: -(item[1]["wall_p95"] or 0.0)))
+        return {"since": self.since, "prompts": ordered}
+
+    def prometheus_text(self) -> str:
+        """The aggregates in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            items = sorted(self._prompts.items())
+
+            def counter(metric, help_text, value_of):
+                lines.extend([f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"])
+                for name, stats in items:
+                    lines.append(f'{metric}{{prompt="{_escape(name)}"}} {value_of(stats)}')
+
+            def histogram(metric, help_text, histogram_of):
+                lines.extend([f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"])
+                for name, stats in items:
+                    hist, label = histogram_of(stats), _escape(name)
+                    for bound, count in hist.cumulative():
+                        lines.append(f'{metric}_bucket{{prompt="{label}",le="{bound}"}} {count}')
+                    lines.append(f'{metric}_sum{{prompt="{label}"}} {hist.total}')
+                    lines.append(f'{metric}_count{{prompt="{label}"}} {hist.count}')
+
+            counter("llm_calls_total", "LLM calls per prompt, including cache hits.", lambda s: s.calls)
+            counter("llm_call_errors_total", "LLM calls that raised.", lambda s: s.errors)
+            counter("llm_cache_hits_total", "LLM calls served from the response cache.", lambda s: s.cache_hits)
+            counter("llm_retries_total", "Retries made by the OpenAI SDK.", lambda s: s.retries)
+            counter("llm_reasks_total", "Replies re-asked after failing schema validation.", lambda s: s.reasks)
+            counter("llm_prompt_tokens_total", "Prompt tokens used.", lambda s: s.prompt_tokens)
+            counter("llm_cached_prompt_tokens_total", "Prompt tokens served from the provider prefix cache.",
+                    lambda s: s.cached_prompt_tokens)
+            counter("llm_completion_tokens_total", "Completion tokens used.", lambda s: s.completion_tokens)
+            counter("llm_cost_usd_total", "Estimated cost at list prices.", lambda s: round(s.cost_usd, 6))
+            histogram("llm_call_duration_seconds", "Wall time of LLM calls that reached the API.",
+                      lambda s: s.wall)
+            histogram("llm_queue_wait_seconds", "Time waiting for a concurrency slot.", lambda s: s.queue_wait)
+            histogram("llm_call_tokens", "Prompt plus completion tokens per call.", lambda s: s.tokens)
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._prompts.clear()
+            self.since = time.time()
+
+
+def _escape(label: str) -> str:
+    return label.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+##############################
+# SHARED INSTANCE
+##############################
+_metrics_instance: Optional[LLMMetrics] = None
+_metrics_lock = threading.Lock()
+
+
+def get_llm_metrics() -> LLMMetrics:
+    """Returns the process-wide metrics registry, creating it on first use."""
+    global _metrics_instance
+    if _metrics_instance is None:
+        with _metrics_lock:
+            if _metrics_instance is None:
+                _metrics_instance = LLMMetrics()
+    return _metrics_instance
+
+
+def metrics_snapshot() -> Dict[str, Any]:
+    return get_llm_metrics().snapshot()
+
+
+def prometheus_text() -> str:
+    return get_llm_metrics().prometheus_text()
+
+
+##############################
+# CALL TRACKING
+##############################
+_current_call: contextvars.ContextVar[Optional[CallRecord]] = contextvars.ContextVar("llm_call", default=None)
+
+
+def current_call() -> Optional[CallRecord]:
+    """The call being tracked in this thread or task, if any."""
+    return _current_call.get()
+
+
+@contextmanager
+def track_llm_call(name: str, model: str = ""):
+    """
+    Tracks one LLM call under ``name`` and yields its ``CallRecord``. Inside an
+    already tracked call it yields the outer record and records nothing itself.
+    """
+    outer = _current_call.get()
+    if outer is not None:
+        yield outer
+        return
+    call = CallRecord(name=name, model=model)
+    token = _current_call.set(call)
+    error = False
+    try:
+        yield call
+    except BaseException:
+        error = True
+        raise
+    finally:
+        _current_call.reset(token)
+        get_llm_metrics().record(call, time.perf_counter() - call.started, error=error)
+
+
+def count_retry(request) -> None:
+    """httpx request hook: counts SDK retries against the current call."""
+    call = _current_call.get()
+    if call is not None and request.headers.get("x-stainless-retry-count", "0") != "0":
+        call.retries += 1
+
+
+async def count_retry_async(request) -> None:
+    count_retry(request)
+
+
+def tracked_completion(client, name: str, **create_kwargs):
+    """``client.chat.completions.create(**create_kwargs)``, tracked under ``name``."""
+    with track_llm_call(name, create_kwargs.get("model", "")) as call:
+        response = client.chat.completions.create(**create_kwargs)
+        call.record_response(response)
+    return response
+
+
+async def tracked_completion_async(client, name: str, **create_kwargs):
+    """Awaitable version of ``tracked_completion`` for an ``AsyncOpenAI`` client."""
+    with track_llm_call(name, create_kwargs.get("model", "")) as call:
+        response = await client.chat.completions.create(**create_kwargs)
+        call.record_response(response)
+    return response
@@ -0,0 +1,388 @@
+"""
+Record/replay HTTP transports for the OpenAI clients.
+
+Every parser, reviewer and the trial matcher reaches OpenAI through the clients
+built in ``utils.llm_client``. This module can swap the HTTP transport under
+those clients so the pipeline can be run and timed without the network:
+
+- ``live`` (default): requests go to OpenAI, or to ``OPENAI_BASE_URL`` when set
+  (for example the stand-in server below).
+- ``record``: requests go out as usual and every successful request/response
+  pair is saved in a SQLite fixture store, keyed on the request path and body.
+- ``replay``: responses are served from the fixture store after an injected
+  delay drawn from a latency model; nothing leaves the machine.
+
+``serve_fixtures()`` starts a local HTTP server that speaks the chat-completions
+API from the same fixture store. Pointing ``OPENAI_BASE_URL`` at it exercises the
+real socket, connection pool and SDK paths, which the in-process replay skips.
+
+Settings live under the ``[openai]`` section of ``secrets.toml`` (``transport``,
+``fixtures_path``, ``replay_latency``, ``replay_seed``) or in the matching
+``OPENAI_*`` environment variables. Latency specs are ``recorded`` (the latency
+seen while recording, the default), ``none``, ``fixed:S``, ``uniform:LO,HI``,
+``normal:MEAN,SD`` or ``lognormal:MEDIAN,SIGMA``, in seconds. ``recorded`` takes
+an optional scale factor, e.g. ``recorded:0.5``.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from utils.llm_client import _openai_secrets, _setting
+
+##############################
+# TRANSPORT CONFIG
+##############################
+LIVE = "live"
+RECORD = "record"
+REPLAY = "replay"
+TRANSPORT_MODES = (LIVE, RECORD, REPLAY)
+
+DEFAULT_FIXTURES_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "llm_fixtures.sqlite3"
+)
+DEFAULT_REPLAY_LATENCY = "recorded"
+
+FIXTURE_NOT_FOUND = "fixture_not_found"
+
+
+def transport_mode() -> str:
+    """The configured transport mode; unknown values fall back to ``live``."""
+    mode = _setting(_openai_secrets(), "transport", LIVE, cast=str).strip().lower()
+    return mode if mode in TRANSPORT_MODES else LIVE
+
+
+##############################
+# FIXTURE STORE
+##############################
+@dataclass
+class Fixture:
+    """One recorded response."""
+    status: int
+    content_type: str
+    body: bytes
+    latency: float
+
+
+def _canonical_body(body: bytes) -> bytes:
+    """JSON bodies are re-serialised with sorted keys so key order never changes a fixture key."""
+    try:
+        return json.dumps(json.loads(body), sort_keys=True, ensure_ascii=False).encode("utf-8")
+    except (ValueError, UnicodeDecodeError):
+        return body
+
+
+class FixtureStore:
+    """
+    SQLite store of recorded responses, keyed on method, URL path and request body.
+
+    The host is left out of the key, so fixtures recorded against OpenAI replay
+    unchanged through the stand-in server. Safe to share between threads.
+    """
+
+    def __init__(self, path: str = DEFAULT_FIXTURES_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_fixtures (
+                fixture_key TEXT PRIMARY KEY,
+                method TEXT NOT NULL,
+                path TEXT NOT NULL,
+                request BLOB NOT NULL,
+                status INTEGER NOT NULL,
+                content_type TEXT NOT NULL,
+                response BLOB NOT NULL,
+                latency REAL NOT NULL,
+                recorded_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(method: str, path: str, body: bytes) -> str:
+        digest = hashlib.sha256(f"{method.upper()} {path}\n".encode("utf-8"))
+        digest.update(_canonical_body(body))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Fixture]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, content_type, response, latency FROM llm_fixtures WHERE fixture_key = ?",
+                (key,),
+            ).fetchone()
+        return Fixture(row[0], row[1], bytes(row[2]), row[3]) if row else None
+
+    def put(self, method: str, path: str, body: bytes, fixture: Fixture) -> str:
+        """Stores (or replaces) the response for one request and returns its key."""
+        key = self.make_key(method, path, body)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_fixtures "
+                "(fixture_key, method, path, request, status, content_type, response, latency, recorded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, method.upper(), path, body, fixture.status, fixture.content_type,
+                 fixture.body, fixture.latency, time.time()),
+            )
+            self._conn.commit()
+        return key
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM llm_fixtures").fetchone()
+        return count
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_fixture_store(path: Optional[str] = None) -> FixtureStore:
+    """Returns the shared fixture store for ``path`` (default: the configured fixtures path)."""
+    path = path or _setting(_openai_secrets(), "fixtures_path", DEFAULT_FIXTURES_PATH, cast=str)
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = FixtureStore(path)
+        return _stores[path]
+
+
+##############################
+# LATENCY MODELS
+##############################
+class LatencyModel:
+    """
+    Draws the injected delay for each replayed call from a spec string (see the
+    module docstring). Seeded, so a benchmark run can be repeated exactly.
+    """
+
+    def __init__(self, spec: str = DEFAULT_REPLAY_LATENCY, seed: Optional[int] = None):
+        self.spec = spec
+        self._sample = self._parse(spec)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _parse(spec: str) -> Callable[[random.Random, float], float]:
+        name, _, params = spec.strip().lower().partition(":")
+        try:
+            values = [float(p) for p in params.split(",")] if params else []
+            if name == "recorded" and len(values) <= 1:
+                scale = values[0] if values else 1.0
+                return lambda rng, recorded: recorded * scale
+            if name in ("none", "0") and not values:
+                return lambda rng, recorded: 0.0
+            if name == "fixed" and len(values) == 1:
+                return lambda rng, recorded: values[0]
+            if name == "uniform" and len(values) == 2:
+                return lambda rng, recorded: rng.uniform(values[0], values[1])
+            if name == "normal" and len(values) == 2:
+                return lambda rng, recorded: rng.gauss(values[0], values[1])
+            if name == "lognormal" and len(values) == 2:
+                return lambda rng, recorded: rng.lognormvariate(math.log(values[0]), values[1])
+        except ValueError:
+            pass
+        raise ValueError(f"Invalid latency spec: {spec!r}")
+
+    def sample(self, recorded: float = 0.0) -> float:
+        with self._lock:
+            return max(0.0, self._sample(self._rng, recorded))
+
+
+##############################
+# CALL COUNTER
+##############################
+_calls = 0
+_calls_lock = threading.Lock()
+
+
+def _count_call() -> None:
+    global _calls
+    with _calls_lock:
+        _calls += 1
+
+
+def recorded_call_count() -> int:
+    """Requests seen by the record/replay transports and the stand-in server so far."""
+    with _calls_lock:
+        return _calls
+
+
+##############################
+# TRANSPORTS
+##############################
+def _request_parts(request: httpx.Request) -> Tuple[str, str, bytes]:
+    return request.method, request.url.path, request.content
+
+
+def _replay(store: FixtureStore, latency: LatencyModel, method: str, path: str,
+            body: bytes) -> Tuple[Fixture, float]:
+    """The fixture for a request (or a 404 error body) and the delay to apply."""
+    _count_call()
+    fixture = store.get(store.make_key(method, path, body))
+    if fixture is None:
+        error = {"error": {"message": f"No recorded response for {method} {path}",
+                           "type": FIXTURE_NOT_FOUND}}
+        return Fixture(404, "application/json", json.dumps(error).encode("utf-8"), 0.0), 0.0
+    return fixture, latency.sample(fixture.latency)
+
+
+def _fixture_response(fixture: Fixture, request: httpx.Request) -> httpx.Response:
+    return httpx.Response(fixture.status, headers={"content-type": fixture.content_type},
+                          content=fixture.body, request=request)
+
+
+def _record(store: FixtureStore, request: httpx.Request, response: httpx.Response, latency: float) -> None:
+    _count_call()
+    # Errors and rate limits are not recorded, so a replay never repeats a transient failure
+    if response.status_code < 400:
+        method, path, body = _request_parts(request)
+        store.put(method, path, body, Fixture(response.status_code,
+                                              response.headers.get("content-type", "application/json"),
+                                              response.content, latency))
+
+
+class RecordingTransport(httpx.BaseTransport):
+    """Sends requests through ``transport`` and saves each successful response."""
+
+    def __init__(self, transport: httpx.BaseTransport, store: FixtureStore):
+        self.transport = transport
+        self.store = store
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        response = self.transport.handle_request(request)
+        response.read()
+        _record(self.store, request, response, time.perf_counter() - start)
+        return response
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncRecordingTransport(httpx.AsyncBaseTransport):
+    """Async version of ``RecordingTransport``."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, store: FixtureStore):
+        self.transport = transport
+        self.store = store
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        response = await self.transport.handle_async_request(request)
+        await response.aread()
+        _record(self.store, request, response, time.perf_counter() - start)
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class ReplayTransport(httpx.BaseTransport):
+    """
+    Serves recorded responses after a delay from ``latency``. A request without a
+    fixture gets a 404, which the SDK raises as ``NotFoundError`` without retrying.
+    """
+
+    def __init__(self, store: FixtureStore, latency: Optional[LatencyModel] = None):
+        self.store = store
+        self.latency = latency or LatencyModel()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        fixture, delay = _replay(self.store, self.latency, *_request_parts(request))
+        time.sleep(delay)
+        return _fixture_response(fixture, request)
+
+
+class AsyncReplayTransport(httpx.AsyncBaseTransport):
+    """Async version of ``ReplayTransport``; the delay does not block the event loop."""
+
+    def __init__(self, store: FixtureStore, latency: Optional[LatencyModel] = None):
+        self.store = store
+        self.latency = latency or LatencyModel()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        fixture, delay = _replay(self.store, self.latency, *_request_parts(request))
+        await asyncio.sleep(delay)
+        return _fixture_response(fixture, request)
+
+
+def _replay_latency() -> LatencyModel:
+    secrets = _openai_secrets()
+    return LatencyModel(_setting(secrets, "replay_latency", DEFAULT_REPLAY_LATENCY, cast=str),
+                        seed=_setting(secrets, "replay_seed", None))
+
+
+def wrap_transport(transport: httpx.BaseTransport) -> httpx.BaseTransport:
+    """Wraps a client's transport according to the configured mode."""
+    mode = transport_mode()
+    if mode == RECORD:
+        return RecordingTransport(transport, get_fixture_store())
+    if mode == REPLAY:
+        return ReplayTransport(get_fixture_store(), _replay_latency())
+    return transport
+
+
+def wrap_async_transport(transport: httpx.AsyncBaseTransport) -> httpx.AsyncBaseTransport:
+    """Async version of ``wrap_transport``."""
+    mode = transport_mode()
+    if mode == RECORD:
+        return AsyncRecordingTransport(transport, get_fixture_store())
+    if mode == REPLAY:
+        return AsyncReplayTransport(get_fixture_store(), _replay_latency())
+    return transport
+
+
+##############################
+# STAND-IN SERVER
+##############################
+def serve_fixtures(store: FixtureStore, latency: Optional[LatencyModel] = None,
+                   host: str = "127.0.0.1", port: int = 0):
+    """
+    Starts a local chat-completions server backed by ``store`` on a daemon thread
+    and returns it. Its API base URL is ``server.base_url``; stop it with
+    ``server.shutdown()`` and ``server.server_close()``.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    latency = latency or LatencyModel()
+
+    class FixtureHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            fixture, delay = _replay(store, latency, "POST", urlsplit(self.path).path, body)
+            time.sleep(delay)
+            self.send_response(fixture.status)
+            self.send_header("Content-Type", fixture.content_type)
+            self.send_header("Content-Length", str(len(fixture.body)))
+            self.end_headers()
+            self.wfile.write(fixture.body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), FixtureHandler)
+    server.daemon_threads = True
+    server.base_url = f"http://{host}:{server.server_address[1]}/v1"
+    threading.Thread(target=server.serve_forever, name="llm-fixture-server", daemon=True).start()
+    return server
@@ -0,0 +1,240 @@
+"""
+Model routing for the extraction prompts.
+
+All extraction prompts used to go to the same reasoning model, including the
+short boolean-flag sections (qualifiers, cytogenetics check, gene flags) that a
+fast model answers just as well. The router sends the sections listed in
+``FAST_ROUTES`` to a fast, cheap model first and escalates to the prompt's
+usual model only when:
+
+- the fast reply fails its JSON Schema (utils/structured_output.py), with no
+  re-asks on the fast model;
+- the fast model reports a confidence below ``routing_min_confidence``. Fast
+  prompts get one extra instruction at the end, asking for a ``_confidence``
+  key, which is stripped from the result;
+- the reply conflicts with another section of the same report
+  (``find_conflicts``), e.g. "no cytogenetic data" next to a reported del(7q).
+
+Prompts without a schema, and sections not in ``FAST_ROUTES``, always use the
+usual model. Each route keeps its own call count, escalation reasons and
+latency percentiles (``routing_snapshot()``, shown on the LLM metrics page).
+
+Settings (``[openai]`` secrets or ``OPENAI_*`` environment variables):
+``model_routing`` (on/off, default on), ``fast_model`` (default gpt-4o-mini)
+and ``routing_min_confidence`` (default 0.7).
+"""
+
+import copy
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from utils.llm_cache import cached_json_completion_async
+from utils.llm_metrics import LATENCY_BUCKETS, RECENT_CALLS, Histogram, _percentile, current_call
+from utils.structured_output import StructuredOutputError
+
+##############################
+# ROUTING CONFIG
+##############################
+FAST = "fast"
+STRONG = "strong"
+ESCALATED = "escalated"
+ROUTES = (FAST, ESCALATED, STRONG)
+
+DEFAULT_FAST_MODEL = "gpt-4o-mini"
+DEFAULT_MIN_CONFIDENCE = 0.7
+
+# Simple boolean-flag sections, by their metrics name
+# (``<group>.<prompt>`` from the dedicated parsers, section names from the unified parser)
+FAST_ROUTES = frozenset({
+    "aml_parser.first_prompt_3", "aml.qualifiers",
+    "aml_parser.cytogenetics_check_prompt", "aml.cytogenetics_check",
+    "aml_parser.eln2024_prompt", "aml.eln2024_genes",
+    "treatment_parser.qualifiers_prompt", "treatment.qualifiers",
+    "treatment_parser.morphology_prompt", "treatment.morphology",
+    "parse_for_ipssm.residual_prompt",
+})
+
+CONFIDENCE_KEY = "_confidence"
+CONFIDENCE_INSTRUCTION = (
+    f'Also include a "{CONFIDENCE_KEY}" key: a number from 0 to 1 giving your confidence '
+    "that every value above is correct for this report."
+)
+
+
+##############################
+# CROSS-SECTION CONFLICTS
+##############################
+def _flag(results: dict, section: str, key: str) -> Optional[bool]:
+    value = results.get(section)
+    return value.get(key) if isinstance(value, dict) else None
+
+
+def _any_flag(value: Any) -> bool:
+    return isinstance(value, dict) and any(v is True for v in value.values())
+
+
+def _eln2024_npm1_conflict(merged: dict) -> bool:
+    eln, defining = _flag(merged, "ELN2024_risk_genes", "NPM1"), _flag(
+        merged, "AML_defining_recurrent_genetic_abnormalities", "NPM1")
+    return eln is not None and defining is not None and bool(eln) != bool(defining)
+
+
+# (keys whose section is blamed, predicate on the merged results of one report)
+CONFLICT_RULES: List[Tuple[Tuple[str, ...], Callable[[dict], bool]]] = [
+    # "No cytogenetic data" next to reported cytogenetic abnormalities
+    (("no_cytogenetics_data",),
+     lambda m: m.get("no_cytogenetics_data") is True and _any_flag(m.get("MDS_related_cytogenetics"))),
+    # NPM1 mutated in one gene section but not the other
+    (("ELN2024_risk_genes",), _eln2024_npm1_conflict),
+    # TP53 mutated although the TP53 section found no mention of TP53
+    (("ELN2024_risk_genes",),
+     lambda m: _flag(m, "ELN2024_risk_genes", "TP53") is True
+     and _flag(m, "Biallelic_TP53_mutation", "tp53_mentioned") is False),
+]
+
+
+def find_conflicts(results: Dict[str, dict], candidates: Iterable[str]) -> Set[str]:
+    """Names in ``candidates`` whose result conflicts with another section in ``results``."""
+    merged = {}
+    for result in results.values():
+        merged.update(result)
+    blamed = set()
+    for keys, conflicts in CONFLICT_RULES:
+        if conflicts(merged):
+            blamed.update(keys)
+    return {name for name in candidates if blamed & set(results.get(name) or {})}
+
+
+##############################
+# ROUTER
+##############################
+class RouteStats:
+    """Call count, escalation reasons and latency of one route."""
+
+    def __init__(self):
+        self.calls = 0
+        self.cache_hits = 0
+        self.reasons: Counter = Counter()
+        self.wall = Histogram(LATENCY_BUCKETS)
+        self.recent = deque(maxlen=RECENT_CALLS)
+
+
+class ModelRouter:
+    """Sends the simple sections to a fast model and escalates doubtful replies."""
+
+    def __init__(self, enabled: bool = True, fast_model: str = DEFAULT_FAST_MODEL,
+                 min_confidence: float = DEFAULT_MIN_CONFIDENCE, fast_routes: Iterable[str] = FAST_ROUTES):
+        self.enabled = enabled
+        self.fast_model = fast_model
+        self.min_confidence = min_confidence
+        self.fast_routes = frozenset(fast_routes)
+        self._lock = threading.Lock()
+        self._stats: Dict[str, RouteStats] = {}
+        self.since = time.time()
+
+    def routes_fast(self, name: str, model: str, schema: Optional[dict]) -> bool:
+        return self.enabled and schema is not None and model != self.fast_model and name in self.fast_routes
+
+    @staticmethod
+    def fast_prompt(prompt: str) -> str:
+        return f"{prompt.rstrip()}\n{CONFIDENCE_INSTRUCTION}\n"
+
+    @staticmethod
+    def fast_schema(schema: dict) -> dict:
+        schema = copy.deepcopy(schema)
+        schema.setdefault("properties", {})[CONFIDENCE_KEY] = {"type": "number", "minimum": 0, "maximum": 1}
+        schema["required"] = list(schema.get("required", [])) + [CONFIDENCE_KEY]
+        return schema
+
+    async def complete(self, client, name: str, model: str, system_message: str, prompt: str,
+                       schema: dict) -> Tuple[dict, str]:
+        """Runs one prompt on the fast model, escalating to ``model`` if needed. Returns (result, route)."""
+        started = time.perf_counter()
+        try:
+            result = await cached_json_completion_async(
+                client, self.fast_model, system_message, self.fast_prompt(prompt),
+                schema=self.fast_schema(schema), max_reasks=0,
+            )
+        except StructuredOutputError as e:
+            print(f"↗️ {name}: fast model reply failed validation ({e.error}); escalating to {model}.")
+            reason = "validation"
+        else:
+            confidence = result.pop(CONFIDENCE_KEY)
+            if confidence >= self.min_confidence:
+                self.record(FAST, time.perf_counter() - started)
+                return result, FAST
+            print(f"↗️ {name}: fast model confidence {confidence:.2f}; escalating to {model}.")
+            reason = "low_confidence"
+
+        result = await cached_json_completion_async(client, model, system_message, prompt, schema=schema)
+        self.record(ESCALATED, time.perf_counter() - started, reason)
+        return result, ESCALATED
+
+    def record(self, route: str, seconds: float, reason: Optional[str] = None) -> None:
+        """Adds one call to ``route``; calls served entirely from the cache are not timed."""
+        call = current_call()
+        cache_hit = call is not None and call.cache_hit
+        with self._lock:
+            stats = self._stats.setdefault(route, RouteStats())
+            stats.calls += 1
+            if reason:
+                stats.reasons[reason] += 1
+            if cache_hit:
+                stats.cache_hits += 1
+                return
+            stats.wall.observe(seconds)
+            stats.recent.append(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-ready statistics per route."""
+        with self._lock:
+            routes = {}
+            for route in ROUTES:
+                stats = self._stats.get(route)
+                if stats is None:
+                    continue
+                recent = list(stats.recent)
+                routes[route] = {
+                    "calls": stats.calls,
+                    "cache_hits": stats.cache_hits,
+                    "escalation_reasons": dict(stats.reasons),
+                    "wall_p50": _percentile(recent, 50),
+                    "wall_p95": _percentile(recent, 95),
+                    "wall_mean": stats.wall.total / stats.wall.count if stats.wall.count else None,
+                }
+        return {"since": self.since, "enabled": self.enabled, "fast_model": self.fast_model,
+                "min_confidence": self.min_confidence, "routes": routes}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self.since = time.time()
+
+
+##############################
+# SHARED INSTANCE
+##############################
+_router_instance: Optional[ModelRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_model_router() -> ModelRouter:
+    """Returns the process-wide model router, configured from secrets/env on first use."""
+    global _router_instance
+    if _router_instance is None:
+        with _router_lock:
+            if _router_instance is None:
+                from utils.llm_client import _on_off, _openai_secrets, _setting
+                secrets = _openai_secrets()
+                _router_instance = ModelRouter(
+                    enabled=_setting(secrets, "model_routing", True, cast=_on_off),
+                    fast_model=_setting(secrets, "fast_model", DEFAULT_FAST_MODEL, cast=str),
+                    min_confidence=_setting(secrets, "routing_min_confidence", DEFAULT_MIN_CONFIDENCE, cast=float),
+                )
+    return _router_instance
+
+
+def routing_snapshot() -> Dict[str, Any]:
+    return get_model_router().snapshot()
@@ -1,9 +1,13 @@
 import re
 import datetime
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
 from fpdf import FPDF
 from classifiers.aml_risk_classifier import eln2024_non_intensive_risk, eln2022_intensive_risk
-from parsers.final_review_parser import generate_final_overview
+from classifiers.mds_risk_classifier import calculate_ipssm, calculate_ipssr
+from parsers.final_review_parser import OVERVIEW_ERROR_TEXT, build_overview_data, request_final_overview
 from utils.aml_treatment_recommendations import get_consensus_treatment_recommendation, determine_treatment_eligibility
 
 ##################################
@@ -49,15 +53,8 @@ def clean_text(text: str) -> str:
     text = re.sub(r'_(.*?)_', r'\1', text)            # italic alternate
     text = re.sub(r'`{1,3}', '', text)                # inline code
     
-    # Final check - replace any remaining non-Latin1 characters
-    latin1_safe = ''
-    for char in text:
-        if ord(char) < 256:  # Latin-1 range
-            latin1_safe += char
-        else:
-            latin1_safe += '?'  # Replace with question mark
-            
-    return latin1_safe.strip()
+    # Final check - replace any remaining non-Latin1 characters with '?'
+    return text.encode("latin-1", "replace").decode("latin-1").strip()
 
 def write_line_with_keywords(pdf: FPDF, line: str, line_height: float = 8):
     """
@@ -268,11 +265,12 @@ def add_classification_section(pdf: FPDF, classification_data: dict):
         pdf.multi_cell(0, line_height, f"{i}. {clean_text(step)}", align="L")
     pdf.ln(6)
 
-def add_risk_section(pdf: FPDF, risk_data: dict, parsed_data: dict):
+def add_risk_section(pdf: FPDF, risk_data: dict, parsed_data: dict, eln24_risk: tuple = None):
     """
     Adds two risk sections:
       - ELN 2022 Risk Classification using risk_data.
-      - Revised ELN24 (Non-Intensive) Risk Classification computed from parsed_data.
+      - Revised ELN24 (Non-Intensive) Risk Classification computed from parsed_data,
+        unless already computed and passed as eln24_risk.
     """
     line_height = 8
     # ELN 2022 Risk Section
@@ -291,8 +289,9 @@ def add_risk_section(pdf: FPDF, risk_data: dict, parsed_data: dict):
     # Revised ELN24 Risk Section
     add_section_title(pdf, "Revised ELN24 (Non-Intensive) Risk Classification")
     # Compute revised ELN24 risk from parsed_data.
-    eln24_genes = parsed_data.get("ELN2024_risk_genes", {})
-    risk_eln24, median_os_eln24, derivation_eln24 = eln2024_non_intensive_risk(eln24_genes)
+    if eln24_risk is None:
+        eln24_risk = eln2024_non_intensive_risk(parsed_data.get("ELN2024_risk_genes", {}))
+    risk_eln24, median_os_eln24, derivation_eln24 = eln24_risk
     pdf.set_font("Arial", "", 10)
     write_line_with_subheadings(pdf, f"Risk Category: {risk_eln24}", line_height)
     pdf.ln(2)
@@ -356,7 +355,7 @@ def _generate_mds_confirmation_derivation_steps(mds_confirmation: dict) -> list:
     
     return steps
 
-def add_treatment_recommendations_section(pdf: FPDF, aml_result: dict, eln_risk: str):
+def add_treatment_recommendations_section(pdf: FPDF, aml_result: dict, eln_risk: str, state=None):
     """
     Add AML treatment recommendations section to the PDF based on Coats algorithm.
     
@@ -364,7 +363,9 @@ def add_treatment_recommendations_section(pdf: FPDF, aml_result: dict, eln_risk:
         pdf (FPDF): PDF object
         aml_result (dict): AML classification result with parsed data
         eln_risk (str): ELN 2022 risk classification
+        state (Mapping): Report state; defaults to st.session_state
     """
+    state = st.session_state if state is None else state
     parsed_data = aml_result.get("parsed_data", {})
     
     # Try to get patient age from parsed data or use a default
@@ -377,7 +378,7 @@ def add_treatment_recommendations_section(pdf: FPDF, aml_result: dict, eln_risk:
     
     # If age not available, use the one from session state (treatment tab) or default to 65
     if patient_age is None:
-        patient_age = st.session_state.get("treatment_age", 65)
+        patient_age = state.get("treatment_age", 65)
     
     # Get treatment recommendation
     try:
@@ -470,71 +471,72 @@ def add_treatment_recommendations_section(pdf: FPDF, aml_result: dict, eln_risk:
         pdf.ln(4)
 
 
-def add_ipss_risk_section(pdf: FPDF, mds_result: dict):
+def _format_ipssm_result(ipssm_result: dict) -> dict:
+    """Reshapes calculate_ipssm output into the structure the interactive UI stores."""
+    return {
+        scenario: {
+            'riskScore': ipssm_result[scenario]['risk_score'],
+            'riskCat': ipssm_result[scenario]['risk_cat'],
+            'contributions': ipssm_result[scenario].get('contributions', {})
+        }
+        for scenario in ('means', 'worst', 'best')
+    }
+
+def get_report_ipss_results(mds_result: dict, state=None) -> dict:
+    """
+    IPSS-M / IPSS-R results for the report. Uses the results of the Risk tab stored in the
+    session state; otherwise calculates them from the MDS data, once per parsed data.
+
+    Returns a dict with 'ipssm', 'ipssr', 'patient_data' (set when calculated here) and
+    'notes' (calculation errors to print in the report).
+    """
+    state = st.session_state if state is None else state
+    if state.get('ipssm_result') is not None and state.get('ipssr_result') is not None:
+        return {"ipssm": state['ipssm_result'], "ipssr": state['ipssr_result'],
+                "patient_data": None, "notes": []}
+
+    patient_data = (mds_result or {}).get("parsed_data")
+    if not patient_data:
+        return {"ipssm": None, "ipssr": None, "patient_data": None, "notes": []}
+
+    def calculate():
+        results = {"ipssm": None, "ipssr": None, "patient_data": patient_data, "notes": []}
+        # Calculate IPSS-M with contributions
+        try:
+            results["ipssm"] = _format_ipssm_result(calculate_ipssm(patient_data, include_contributions=True))
+        except Exception as e:
+            results["notes"].append(f"Note: Could not calculate IPSS-M. Error: {safe_text(str(e))}")
+        # Calculate IPSS-R with components
+        try:
+            results["ipssr"] = calculate_ipssr(patient_data, return_components=True)
+        except Exception as e:
+            results["notes"].append(f"Note: Could not calculate IPSS-R. Error: {safe_text(str(e))}")
+        return results
+
+    return _memoized("ipss", patient_data, calculate, state)
+
+def add_ipss_risk_section(pdf: FPDF, mds_result: dict, ipss_results: dict = None, state=None):
     """
     Adds IPSS-M and IPSS-R risk classification sections to the PDF.
     Uses the IPSS calculation results stored in the session state.
     If results aren't available, tries to calculate them from the MDS data.
+    ``ipss_results`` (from get_report_ipss_results) skips the lookup when already done.
     """
+    state = st.session_state if state is None else state
     line_height = 8
     
     # First, log what data is available to help with debugging
     pdf.set_font("Arial", "", 8)
-    has_ipssm = 'ipssm_result' in st.session_state
-    has_ipssr = 'ipssr_result' in st.session_state
+    has_ipssm = 'ipssm_result' in state
+    has_ipssr = 'ipssr_result' in state
     
-    # Try to get IPSS data from session state, or calculate it if needed
-    ipssm_result = None
-    ipssr_result = None
-    
-    # Approach 1: Get from session state
-    if 'ipssm_result' in st.session_state and 'ipssr_result' in st.session_state:
-        ipssm_result = st.session_state['ipssm_result']
-        ipssr_result = st.session_state['ipssr_result']
-    
-    # Approach 2: Try to calculate if we have the necessary data
-    patient_data = None
-    if (ipssm_result is None or ipssr_result is None) and mds_result and "parsed_data" in mds_result:
-        try:
-            from classifiers.mds_risk_classifier import calculate_ipssm, calculate_ipssr
-            
-            # Get patient data from the MDS result
-            patient_data = mds_result["parsed_data"]
-            if patient_data:
-                # Calculate IPSS-M with contributions
-                try:
-                    ipssm_result = calculate_ipssm(patient_data, include_contributions=True)
-                    
-                    # Format for consistent structure with the interactive UI
-                    ipssm_result = {
-                        'means': {
-                            'riskScore': ipssm_result['means']['risk_score'],
-                            'riskCat': ipssm_result['means']['risk_cat'],
-                            'contributions': ipssm_result['means'].get('contributions', {})
-                        },
-                        'worst': {
-                            'riskScore': ipssm_result['worst']['risk_score'],
-                            'riskCat': ipssm_result['worst']['risk_cat'],
-                            'contributions': ipssm_result['worst'].get('contributions', {})
-                        },
-                        'best': {
-                            'riskScore': ipssm_result['best']['risk_score'],
-                            'riskCat': ipssm_result['best']['risk_cat'],
-                            'contributions': ipssm_result['best'].get('contributions', {})
-                        }
-                    }
-                except Exception as e:
-                    ipssm_result = None
-                    pdf.cell(0, line_height, f"Note: Could not calculate IPSS-M. Error: {safe_text(str(e))}", ln=1)
-                
-                # Calculate IPSS-R with components
-                try:
-                    ipssr_result = calculate_ipssr(patient_data, return_components=True)
-                except Exception as e:
-                    ipssr_result = None
-                    pdf.cell(0, line_height, f"Note: Could not calculate IPSS-R. Error: {safe_text(str(e))}", ln=1)
-        except Exception as e:
-            pdf.cell(0, line_height, f"Note: Could not import IPSS calculation modules. Error: {safe_text(str(e))}", ln=1)
+    if ipss_results is None:
+        ipss_results = get_report_ipss_results(mds_result, state)
+    ipssm_result = ipss_results["ipssm"]
+    ipssr_result = ipss_results["ipssr"]
+    patient_data = ipss_results["patient_data"]
+    for note in ipss_results["notes"]:
+        pdf.cell(0, line_height, note, ln=1)
     
     # If we now have IPSS results, display them
     if ipssm_result and ipssr_result:
@@ -545,7 +547,7 @@ def add_ipss_risk_section(pdf: FPDF, mds_result: dict):
         used_default = False
         if patient_data and patient_data.get('used_default_tp53_vaf', False):
             used_default = True
-        elif 'ipss_patient_data' in st.session_state and st.session_state['ipss_patient_data'].get('used_default_tp53_vaf', False):
+        elif 'ipss_patient_data' in state and state['ipss_patient_data'].get('used_default_tp53_vaf', False):
             used_default = True
             
         if used_default:
@@ -688,13 +690,14 @@ def add_ipss_risk_section(pdf: FPDF, mds_result: dict):
         pdf.set_font("Arial", "I", 8)
         pdf.cell(0, line_height, f"Debug: ipssm_result in session state: {has_ipssm}, ipssr_result in session state: {has_ipssr}", ln=1)
 
-def add_diagnostic_section(pdf: FPDF, diag_type: str):
+def add_diagnostic_section(pdf: FPDF, diag_type: str, state=None):
+    state = st.session_state if state is None else state
     manual_key = diag_type.lower() + "_manual_result"
     ai_key = diag_type.lower() + "_ai_result"
-    if manual_key in st.session_state:
-        data = st.session_state[manual_key]
-    elif ai_key in st.session_state:
-        data = st.session_state[ai_key]
+    if manual_key in state:
+        data = state[manual_key]
+    elif ai_key in state:
+        data = state[ai_key]
     else:
         return
 
@@ -709,8 +712,8 @@ def add_diagnostic_section(pdf: FPDF, diag_type: str):
         who_is_mds = "MDS" in who_classification if who_classification else False
         icc_is_mds = "MDS" in icc_classification if icc_classification else False
         
-        if (who_is_mds or icc_is_mds) and "mds_confirmation" in st.session_state:
-            mds_confirmation = st.session_state["mds_confirmation"]
+        if (who_is_mds or icc_is_mds) and "mds_confirmation" in state:
+            mds_confirmation = state["mds_confirmation"]
             if mds_confirmation.get("submitted", False):
                 # Append MDS confirmation information to derivations
                 confirmation_info = _generate_mds_confirmation_derivation_steps(mds_confirmation)
@@ -756,19 +759,49 @@ def add_diagnostic_section(pdf: FPDF, diag_type: str):
         ("Additional Comments", diag_type.lower() + "_additional_comments")
     ]
     for section_name, key in review_sections:
-        if key in st.session_state:
+        if key in state:
             add_section_title(pdf, section_name)
-            output_review_text(pdf, st.session_state[key], section_name)
+            output_review_text(pdf, state[key], section_name)
             pdf.ln(4)
 
-def create_base_pdf(user_comments: str = None) -> bytes:
-    pdf = PDF()
-    pdf.add_page()
-    pdf.set_auto_page_break(auto=True, margin=15)
+##################################
+# REPORT BUILDER
+##################################
+# The clinical overview is the only network call in the report. It runs here while
+# the deterministic sections are computed, so those never wait on it.
+_overview_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="pdf-overview")
+
+def _payload_hash(payload) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def _memoized(kind: str, payload, compute, state=None):
+    """
+    Returns compute(), cached in the report state under (kind, hash of payload), so
+    pressing the PDF button again for the same results does no repeated work.
+    """
+    state = st.session_state if state is None else state
+    cache = state.setdefault("report_cache", {})
+    key = (kind, _payload_hash(payload))
+    if key not in cache:
+        cache[key] = compute()
+    return cache[key]
+
+def get_report_aml_risks(aml_result: dict, state=None) -> dict:
+    """ELN 2022 (intensive) and ELN 2024 (non-intensive) risk for the report, once per parsed data."""
+    parsed_data = aml_result["parsed_data"]
+    return _memoized("eln", parsed_data, lambda: {
+        "eln2022": eln2022_intensive_risk(parsed_data),
+        "eln2024": eln2024_non_intensive_risk(parsed_data.get("ELN2024_risk_genes", {})),
+    }, state)
+
+def _report_results(state):
+    aml_result = state.get("aml_manual_result") or state.get("aml_ai_result")
+    mds_result = state.get("mds_manual_result") or state.get("mds_ai_result")
+    return aml_result, mds_result
 
-    # Generate and add clinical overview at the top of the report
-    aml_result = st.session_state.get("aml_manual_result") or st.session_state.get("aml_ai_result")
-    mds_result = st.session_state.get("mds_manual_result") or st.session_state.get("mds_ai_result")
+def create_base_pdf(user_comments: str = None) -> bytes:
+    """Builds the report for the current session, generating (or reusing) the clinical overview."""
+    aml_result, mds_result = _report_results(st.session_state)
     
     # Determine which parsed data to use for the overview
     parsed_data_for_overview = None
@@ -781,12 +814,54 @@ def create_base_pdf(user_comments: str = None) -> bytes:
         parsed_data_for_overview = mds_result["parsed_data"]
         original_report_text = mds_result.get("free_text_input", "")
     
-    # Generate clinical overview if we have parsed data
+    aml_risks = get_report_aml_risks(aml_result) if aml_result else None
+
+    # Start the clinical overview first; it is memoized per overview input, which covers
+    # the parsed data, classifications, risk results and AI reviews.
+    clinical_overview = None
+    overview_future = None
+    overview_cache = st.session_state.setdefault("report_overview_cache", {})
     if parsed_data_for_overview:
+        overview_data = build_overview_data(
+            parsed_data_for_overview,
+            original_report_text,
+            eln_risk=aml_risks["eln2022"] if aml_risks else None
+        )
+        overview_key = _payload_hash(overview_data)
+        clinical_overview = overview_cache.get(overview_key)
+        if clinical_overview is None:
+            overview_future = _overview_executor.submit(request_final_overview, overview_data)
+
+    # Deterministic sections, computed while the overview is generated
+    if mds_result:
+        get_report_ipss_results(mds_result)
+
+    if overview_future is not None:
         with st.spinner("Generating clinical overview..."):
-            clinical_overview = generate_final_overview(parsed_data_for_overview, original_report_text)
-        
-        # Add Clinical Overview section at the top
+            try:
+                clinical_overview = overview_future.result()
+                overview_cache[overview_key] = clinical_overview
+            except Exception as e:
+                st.error(f"❌ Error generating comprehensive overview: {str(e)}")
+                clinical_overview = OVERVIEW_ERROR_TEXT
+
+    return render_report_pdf(st.session_state, clinical_overview, user_comments)
+
+def render_report_pdf(state, clinical_overview: str = None, user_comments: str = None) -> bytes:
+    """
+    Renders the report PDF from a report state: any mapping with the session state keys the
+    report reads (aml_ai_result / aml_manual_result, mds_*_result, the AI review keys,
+    mds_confirmation, ipssm_result / ipssr_result, treatment_age). Uses no Streamlit APIs
+    when given a plain dict, so it also runs in worker processes (see scripts/batch_reports.py).
+    """
+    aml_result, mds_result = _report_results(state)
+
+    pdf = PDF()
+    pdf.add_page()
+    pdf.set_auto_page_break(auto=True, margin=15)
+
+    # Add clinical overview at the top of the report
+    if clinical_overview is not None:
         add_section_title(pdf, "Overview")
         pdf.set_font("Arial", "", 11)
         pdf.multi_cell(0, 6, clinical_overview, align="L")
@@ -794,15 +869,15 @@ def create_base_pdf(user_comments: str = None) -> bytes:
 
     # Add AML diagnostics.
     if aml_result:
-        add_diagnostic_section(pdf, "AML")
-        # Compute ELN2022 risk classification on the fly
-        risk_eln2022, median_os_eln2022, derivation_eln2022 = eln2022_intensive_risk(aml_result["parsed_data"])
+        aml_risks = get_report_aml_risks(aml_result, state)
+        add_diagnostic_section(pdf, "AML", state)
+        risk_eln2022, median_os_eln2022, derivation_eln2022 = aml_risks["eln2022"]
         risk_data = {
             "eln_class": risk_eln2022,
             "eln_median_os": median_os_eln2022,
             "eln_derivation": derivation_eln2022
         }
-        add_risk_section(pdf, risk_data, aml_result["parsed_data"])
+        add_risk_section(pdf, risk_data, aml_result["parsed_data"], eln24_risk=aml_risks["eln2024"])
         
         # Add treatment recommendations section if AML is diagnosed
         who_classification = aml_result.get("who_class", "")
@@ -817,27 +892,27 @@ def create_base_pdf(user_comments: str = None) -> bytes:
         
         # Only add treatment recommendations if AML is actually diagnosed
         if aml_diagnosed:
-            add_treatment_recommendations_section(pdf, aml_result, risk_eln2022)
+            add_treatment_recommendations_section(pdf, aml_result, risk_eln2022, state)
 
     # Append MDS diagnostics if available.
     if mds_result:
         add_section_title(pdf, "MDS Diagnostics")
-        add_diagnostic_section(pdf, "MDS")
+        add_diagnostic_section(pdf, "MDS", state)
         # Add IPSS risk assessment if MDS is present and IPSS results are available
-        add_ipss_risk_section(pdf, mds_result)
+        add_ipss_risk_section(pdf, mds_result, state=state)
     
     if user_comments:
         add_section_title(pdf, "User Comments")
         output_review_text(pdf, user_comments, "User Comments")
         pdf.ln(4)
     
-    aml_data = st.session_state.get("aml_ai_result") or st.session_state.get("aml_manual_result")
-    if "aml_manual_result" in st.session_state or (aml_data and aml_data.get("free_text_input")):
+    aml_data = state.get("aml_ai_result") or state.get("aml_manual_result")
+    if "aml_manual_result" in state or (aml_data and aml_data.get("free_text_input")):
         pdf.add_page()
 
-    if "aml_manual_result" in st.session_state:
+    if "aml_manual_result" in state:
         add_user_input_section_title(pdf, "Manual User Positive Inputs")
-        output_positive_findings(pdf, st.session_state["aml_manual_result"])
+        output_positive_findings(pdf, state["aml_manual_result"])
         pdf.ln(4)
 
     if aml_data and aml_data.get("free_text_input"):
@@ -845,21 +920,6 @@ def create_base_pdf(user_comments: str = None) -> bytes:
         output_review_text(pdf, aml_data["free_text_input"], "Molecular Details")
         pdf.ln(4)
 
-    try:
-        return pdf.output(dest="S").encode("latin1")
-    except UnicodeEncodeError:
-        # If we still have encoding issues, use a more aggressive approach
-        # Create a fresh PDF with maximum sanitization
-        st.warning("Warning: Some special characters in your report were replaced with '?' due to encoding limitations.")
-        
-        # Use stringIO to capture and sanitize the PDF output
-        import io
-        output_buffer = io.StringIO()
-        for char in pdf.output(dest="S"):
-            if ord(char) < 256:  # Latin-1 range
-                output_buffer.write(char)
-            else:
-                output_buffer.write('?')
-        
-        # Now encode the sanitized output
-        return output_buffer.getvalue().encode("latin1")
+    # All text went through the sanitising PDF methods, so this only replaces characters
+    # that were drawn by fpdf directly.
+    return pdf.output(dest="S").encode("latin-1", "replace")
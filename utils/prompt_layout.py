@@ -0,0 +1,63 @@
+"""
+Prompt layout shared by the report extraction parsers.
+
+Every parser sends several prompts per report, and each prompt used to wrap the
+full report text in its own instruction preamble. The report was therefore sent
+in a different position each time, and nothing after the first few words was
+shared between the prompts of one report.
+
+All extraction prompts are now laid out the same way:
+
+    system: EXTRACTION_SYSTEM_MESSAGE            (identical for every parser)
+    user:   report block                         (identical for every prompt of a report)
+            TASK: section instructions and JSON schema
+
+so the system message plus report form one long common prefix. OpenAI caches
+prompt prefixes automatically (for prompts of 1024 tokens or more), so every
+prompt after the first for the same report is billed and processed mostly as
+cached input. ``shared_prefix_length`` measures how much of a set of prompts
+is shared; scripts/benchmark_prompt_cache.py reports the cached and uncached
+input tokens per report.
+"""
+
+import textwrap
+from typing import Iterable
+
+EXTRACTION_SYSTEM_MESSAGE = (
+    "You are a knowledgeable haematologist who extracts structured data from "
+    "free-text haematological reports and returns valid JSON.\n"
+    "Each message contains one report followed by a TASK describing the fields to extract.\n"
+    "- Use only information stated in the report.\n"
+    "- For boolean fields use true/false; for numerical fields give the number.\n"
+    "- If a field is not found or unclear, use false for booleans and null for other values, "
+    "unless the TASK says otherwise.\n"
+    "- Return valid JSON only with exactly the keys requested by the TASK and no extra text."
+)
+
+REPORT_HEADER = "Here is the free-text haematological report to parse:"
+TASK_HEADER = "TASK:"
+
+
+def report_block(report_text: str) -> str:
+    """The leading report block; identical for every prompt built from the same report."""
+    return f"{REPORT_HEADER}\n\n[START OF REPORT]\n\n{report_text.strip()}\n\n[END OF REPORT]\n\n"
+
+
+def report_first_prompt(report_text: str, instructions: str) -> str:
+    """
+    Builds an extraction prompt with the report first and the section-specific
+    instructions and schema last.
+    """
+    return f"{report_block(report_text)}{TASK_HEADER}\n{textwrap.dedent(instructions).strip()}\n"
+
+
+def shared_prefix_length(texts: Iterable[str]) -> int:
+    """Length in characters of the prefix common to all ``texts``."""
+    texts = list(texts)
+    if not texts:
+        return 0
+    shortest, longest = min(texts), max(texts)
+    for i, (a, b) in enumerate(zip(shortest, longest)):
+        if a != b:
+            return i
+    return len(shortest)
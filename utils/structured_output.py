@@ -0,0 +1,137 @@
+"""
+JSON Schemas for the extraction prompts, and the re-ask used when a reply does
+not match its schema.
+
+Each parser already describes its output as a ``required_json_structure`` of
+default values. ``section_schemas()`` turns that structure into one JSON Schema
+per prompt, covering only the keys that prompt is asked for:
+
+- booleans must be ``true``/``false`` (or null), numbers must be numbers (or
+  null), strings must be strings (or null) and nested sections must be objects;
+- the prompt's top-level keys are required, nested keys are not (the merge step
+  fills missing ones with their defaults);
+- ``None`` defaults accept any value unless the parser gives an override.
+
+``cached_json_completion`` validates each reply against its prompt's schema. A
+malformed or mismatched reply is re-asked, as a follow-up turn that quotes the
+validation error, up to ``schema_reasks`` times (``[openai]`` secrets or
+``OPENAI_SCHEMA_REASKS``, default 2). Only that prompt is repeated; the other
+sections of the report are unaffected. If the reply still does not validate,
+``StructuredOutputError`` is raised.
+"""
+
+import json
+from typing import Any, Dict, Iterable, Optional, Sequence
+
+##############################
+# SCHEMA CONFIG
+##############################
+DEFAULT_SCHEMA_REASKS = 2
+
+NUMBER_OR_NULL = {"type": ["number", "null"]}
+PERCENTAGE_OR_NULL = {"type": ["number", "null"], "minimum": 0, "maximum": 100}
+BOOLEAN_OR_NULL = {"type": ["boolean", "null"]}
+DYSPLASTIC_LINEAGES_OR_NULL = {"type": ["integer", "null"], "minimum": 0, "maximum": 3}
+
+
+class StructuredOutputError(ValueError):
+    """Raised when a reply still does not match its schema after the allowed re-asks."""
+
+    def __init__(self, name: str, error: str, raw: str):
+        super().__init__(f"Response for '{name}' did not match the expected JSON structure: {error}")
+        self.name = name
+        self.error = error
+        self.raw = raw
+
+
+##############################
+# SCHEMA GENERATION
+##############################
+def json_schema_for(example: Any) -> dict:
+    """Schema for a value, derived from its default in a required JSON structure."""
+    if isinstance(example, bool):
+        return dict(BOOLEAN_OR_NULL)
+    if isinstance(example, (int, float)):
+        return dict(NUMBER_OR_NULL)
+    if isinstance(example, str):
+        return {"type": ["string", "null"]}
+    if isinstance(example, dict):
+        return {
+            "type": "object",
+            "properties": {key: json_schema_for(value) for key, value in example.items()},
+        }
+    if isinstance(example, list):
+        return {"type": ["array", "null"]}
+    return {}
+
+
+def section_schema(structure: dict, fields: Iterable[str], required: bool = True,
+                   overrides: Optional[Dict[str, dict]] = None) -> dict:
+    """
+    Schema for one prompt's reply: an object with ``fields`` taken from ``structure``.
+    ``overrides`` replaces the generated schema of individual fields.
+    """
+    overrides = overrides or {}
+    fields = list(fields)
+    schema = {
+        "type": "object",
+        "properties": {
+            field: overrides[field] if field in overrides else json_schema_for(structure.get(field))
+            for field in fields
+        },
+    }
+    if required:
+        schema["required"] = fields
+    return schema
+
+
+def section_schemas(structure: dict, prompt_fields: Dict[str, Sequence[str]],
+                    overrides: Optional[Dict[str, dict]] = None) -> Dict[str, dict]:
+    """{prompt name: schema} for a parser, given the top-level fields each prompt returns."""
+    return {
+        name: section_schema(structure, fields, overrides=overrides)
+        for name, fields in prompt_fields.items()
+    }
+
+
+##############################
+# VALIDATION & RE-ASK
+##############################
+def schema_reasks() -> int:
+    """How many times a prompt is re-asked after a reply that does not match its schema."""
+    from utils.llm_client import _openai_secrets, _setting
+    return max(0, _setting(_openai_secrets(), "schema_reasks", DEFAULT_SCHEMA_REASKS))
+
+
+def schema_error(parsed: Any, schema: dict) -> Optional[str]:
+    """A readable description of the most relevant schema violation, or None if valid."""
+    from jsonschema import Draft202012Validator
+    from jsonschema.exceptions import best_match
+
+    error = best_match(Draft202012Validator(schema).iter_errors(parsed))
+    if error is None:
+        return None
+    location = "/".join(str(part) for part in error.absolute_path)
+    return f"{location}: {error.message}" if location else error.message
+
+
+def parse_reply(raw: str, schema: dict) -> dict:
+    """Parses a raw reply and validates it against ``schema``; raises ValueError with the reason."""
+    try:
+        parsed = json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"the reply is not valid JSON ({e.msg} at line {e.lineno} column {e.colno})") from e
+    error = schema_error(parsed, schema)
+    if error is not None:
+        raise ValueError(error)
+    return parsed
+
+
+def reask_message(error: str, schema: dict) -> str:
+    """The follow-up turn sent after a reply that failed validation."""
+    return (
+        f"Your previous reply could not be used: {error}.\n"
+        "Answer the same TASK again for the same report. Return valid JSON only, "
+        "with no extra text, matching this JSON Schema:\n"
+        f"{json.dumps(schema, indent=2)}"
+    )
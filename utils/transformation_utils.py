@@ -139,4 +139,77 @@ def transform_main_parser_to_treatment_format(main_parser_data: dict) -> dict:
     treatment_data["number_of_dysplastic_lineages"] = main_parser_data.get("number_of_dysplastic_lineages")
     treatment_data["no_cytogenetics_data"] = main_parser_data.get("no_cytogenetics_data", False)
     
-    return treatment_data 
\ No newline at end of file
+    return treatment_data 
+
+def transform_unified_to_treatment_format(main_parser_data: dict,
+                                          eln_data: dict = None,
+                                          treatment_qualifiers: dict = None) -> dict:
+    """
+    Build the treatment parser format from a single shared extraction instead of
+    the five dedicated treatment prompts.
+
+    Starts from transform_main_parser_to_treatment_format and then refines it with
+    the ELN marker extraction (CD33, FLT3, t(16;16) and MDS-related genes) and the
+    treatment-history qualifiers, which the main parser does not capture.
+    
+    Args:
+        main_parser_data (dict): Merged data from the main AML parser prompts
+        eln_data (dict): Data from the ELN marker prompt (optional)
+        treatment_qualifiers (dict): "qualifiers" from the treatment history prompt (optional)
+        
+    Returns:
+        dict: Data in treatment parser format
+    """
+    treatment_data = transform_main_parser_to_treatment_format(main_parser_data)
+
+    # Treatment history comes from its own prompt; only copy the keys the format defines.
+    if treatment_qualifiers:
+        for key in treatment_data["qualifiers"]:
+            if key in treatment_qualifiers and treatment_qualifiers[key] is not None:
+                treatment_data["qualifiers"][key] = bool(treatment_qualifiers[key])
+
+    if not eln_data:
+        return treatment_data
+
+    # CD33 - the ELN prompt reports false when CD33 is not mentioned, so only a
+    # percentage or an explicit positive result is treated as known.
+    cd33_percentage = eln_data.get("cd33_percentage")
+    treatment_data["cd33_percentage"] = cd33_percentage
+    if eln_data.get("cd33_positive"):
+        treatment_data["cd33_positive"] = True
+    elif isinstance(cd33_percentage, (int, float)):
+        treatment_data["cd33_positive"] = cd33_percentage >= 20
+
+    # Recurrent abnormalities also covered by the ELN markers
+    genetics = treatment_data["AML_defining_recurrent_genetic_abnormalities"]
+    eln_genetics_mappings = {
+        "t_8_21": ["RUNX1_RUNX1T1", "t_8_21"],
+        "inv_16": ["CBFB_MYH11", "inv_16"],
+        "t_16_16": ["CBFB_MYH11", "t_16_16"],
+        "npm1_mutation": ["NPM1_mutation"],
+        "flt3_itd": ["FLT3_ITD"],
+        "flt3_tkd": ["FLT3_TKD"],
+    }
+    for eln_field, treatment_fields in eln_genetics_mappings.items():
+        if eln_data.get(eln_field):
+            for treatment_field in treatment_fields:
+                genetics[treatment_field] = True
+    if genetics["FLT3_ITD"] or genetics["FLT3_TKD"]:
+        treatment_data["MDS_related_mutation"]["FLT3"] = True
+
+    # MDS-related mutations reported by the ELN prompt
+    eln_mutation_mappings = {
+        "asxl1_mutation": "ASXL1",
+        "bcor_mutation": "BCOR",
+        "ezh2_mutation": "EZH2",
+        "runx1_mutation": "RUNX1",
+        "srsf2_mutation": "SRSF2",
+        "stag2_mutation": "STAG2",
+        "u2af1_mutation": "U2AF1",
+        "zrsr2_mutation": "ZRSR2",
+    }
+    for eln_field, gene in eln_mutation_mappings.items():
+        if eln_data.get(eln_field):
+            treatment_data["MDS_related_mutation"][gene] = True
+
+    return treatment_data
@@ -0,0 +1,248 @@
+"""
+On-disk cache for per-trial clinical trial match results.
+
+Each LLM relevance assessment is stored under (patient fingerprint, trial id)
+together with a content hash of the trial record it was computed from:
+
+- the patient fingerprint is a hash of the whitespace-normalised output of
+  ``format_patient_data_for_matching`` (plus the matching model / prompt version)
+- the trial hash covers the whole scraped trial record
+
+A lookup only hits when the stored trial hash still matches, so when the
+scraper changes a trial only that trial's entries go stale. Re-opening a
+patient is served entirely from disk, and a changed patient profile only
+re-scores the trials it is matched against.
+
+The database sits next to the LLM response cache and follows the same
+``cache_dir`` and ``disk_cache`` settings (see utils.llm_cache).
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+from utils.llm_cache import DEFAULT_CACHE_DIR, cache_path
+
+##############################
+# CACHE CONFIG
+##############################
+DEFAULT_CACHE_PATH = os.path.join(DEFAULT_CACHE_DIR, "trial_match_cache.sqlite3")
+DEFAULT_TTL_SECONDS = 30 * 24 * 60 * 60  # thirty days
+DEFAULT_MAX_ENTRIES = 20000
+
+# Keys the matcher adds to a trial record; never part of the trial's content hash.
+MATCH_RESULT_FIELDS = (
+    "relevance_score",
+    "explanation",
+    "matching_factors",
+    "exclusion_factors",
+    "recommendation",
+)
+
+
+def patient_fingerprint(patient_data: str, model: str = "", prompt_version: str = "") -> str:
+    """
+    Hashes the formatted patient description. Runs of whitespace and blank lines
+    are collapsed, so cosmetic differences in the formatted text do not miss the cache.
+    """
+    lines = (re.sub(r"\s+", " ", line).strip() for line in (patient_data or "").splitlines())
+    normalised = "\n".join(line for line in lines if line)
+    payload = json.dumps({"model": model, "prompt_version": prompt_version, "patient": normalised},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def trial_id(trial: Dict) -> str:
+    """Stable identifier for a trial: its link when scraped, else its title."""
+    return str(trial.get("link") or trial.get("title") or "")
+
+
+def trial_content_hash(trial: Dict) -> str:
+    """Content hash of a trial record, ignoring any match results merged into it."""
+    record = {k: v for k, v in trial.items() if k not in MATCH_RESULT_FIELDS}
+    payload = json.dumps(record, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TrialMatchCache:
+    """
+    SQLite cache of match results keyed on (patient fingerprint, trial id).
+
+    Only the LLM's assessment fields are stored; callers merge them back into
+    the current trial record, so display data always reflects the latest scrape.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS trial_matches (
+                patient_hash TEXT NOT NULL,
+                trial_id TEXT NOT NULL,
+                trial_hash TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_accessed REAL NOT NULL,
+                PRIMARY KEY (patient_hash, trial_id)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_trial_matches_trial ON trial_matches (trial_id)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_trial_matches_last_accessed ON trial_matches (last_accessed)"
+        )
+        self._conn.commit()
+
+    def get_many(self, patient_hash: str, trials: Iterable[Dict]) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns {trial id: cached result} for the trials whose stored entry is fresh
+        and was computed from the same trial content. Stale rows are deleted.
+        """
+        trials = list(trials)
+        if not trials:
+            return {}
+        wanted = {trial_id(t): trial_content_hash(t) for t in trials}
+        now = time.time()
+        found: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            ids = list(wanted)
+            rows = []
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows += self._conn.execute(
+                    "SELECT trial_id, trial_hash, result, created_at FROM trial_matches "
+                    f"WHERE patient_hash = ? AND trial_id IN ({','.join('?' * len(chunk))})",
+                    (patient_hash, *chunk),
+                ).fetchall()
+
+            expired = []
+            for tid, thash, result, created_at in rows:
+                too_old = self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+                if thash != wanted[tid] or too_old:
+                    expired.append((patient_hash, tid))
+                    self.stale += 1
+                else:
+                    found[tid] = json.loads(result)
+            if expired:
+                self._conn.executemany(
+                    "DELETE FROM trial_matches WHERE patient_hash = ? AND trial_id = ?", expired
+                )
+            if found:
+                self._conn.executemany(
+                    "UPDATE trial_matches SET last_accessed = ? WHERE patient_hash = ? AND trial_id = ?",
+                    [(now, patient_hash, tid) for tid in found],
+                )
+            self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(wanted) - len(found)
+        return found
+
+    def set_many(self, patient_hash: str, matched_trials: Iterable[Dict]) -> None:
+        """Stores the match result fields of each matched trial under its current content hash."""
+        now = time.time()
+        rows = []
+        for trial in matched_trials:
+            result = {k: trial[k] for k in MATCH_RESULT_FIELDS if k in trial}
+            rows.append((patient_hash, trial_id(trial), trial_content_hash(trial),
+                         json.dumps(result, ensure_ascii=False), now, now))
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO trial_matches "
+                "(patient_hash, trial_id, trial_hash, result, created_at, last_accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._evict_locked()
+            self._conn.commit()
+
+    def invalidate_changed_trials(self, trials: Iterable[Dict]) -> int:
+        """
+        Drops every entry computed from an older version of one of ``trials``
+        (e.g. right after a scrape). Returns the number of rows removed.
+        """
+        current = [(trial_id(t), trial_content_hash(t)) for t in trials]
+        with self._lock:
+            removed = 0
+            for tid, thash in current:
+                cursor = self._conn.execute(
+                    "DELETE FROM trial_matches WHERE trial_id = ? AND trial_hash != ?", (tid, thash)
+                )
+                removed += max(cursor.rowcount, 0)
+            self._conn.commit()
+        return removed
+
+    def _evict_locked(self) -> None:
+        if self.ttl_seconds is not None:
+            self._conn.execute(
+                "DELETE FROM trial_matches WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            )
+        if self.max_entries is None:
+            return
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM trial_matches").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM trial_matches WHERE rowid IN ("
+                "SELECT rowid FROM trial_matches ORDER BY last_accessed ASC LIMIT ?)",
+                (overflow,),
+            )
+
+    def clear(self) -> None:
+        """Removes every cached match result and resets the counters."""
+        with self._lock:
+            self._conn.execute("DELETE FROM trial_matches")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+            self.stale = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns hit/miss/stale counters and the current number of stored entries."""
+        with self._lock:
+            (size,) = self._conn.execute("SELECT COUNT(*) FROM trial_matches").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "entries": size,
+        }
+
+
+##############################
+# SHARED INSTANCE
+##############################
+_cache_instance: Optional[TrialMatchCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_trial_match_cache() -> TrialMatchCache:
+    """Returns the process-wide trial match cache, creating it on first use."""
+    global _cache_instance
+    if _cache_instance is None:
+        with _cache_lock:
+            if _cache_instance is None:
+                _cache_instance = TrialMatchCache(path=cache_path("trial_match_cache.sqlite3"))
+    return _cache_instance
@@ -0,0 +1,382 @@
+"""
+SQLite-backed clinical trial catalog.
+
+One store is shared by the scraper, the eligibility extractor and the trial
+matcher, in place of reading and rewriting clinical_trials.json:
+
+- each trial is one row keyed on its link, holding the full scraped record as
+  JSON next to indexed columns for status, recruitment dates, cancer types and
+  locations (the last two normalised into their own tables)
+- an FTS5 table covers the title and "who can enter" text
+- the structured eligibility and its extraction metadata are updated per row
+
+Loads and filters become indexed queries, and saving one trial is one upsert.
+``version()`` changes on every write, so callers can cache query results
+until the catalog changes.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+##############################
+# STORE CONFIG
+##############################
+DEFAULT_STORE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "trials-aggregator", "clinical_trials.sqlite3"
+)
+
+# Fields kept in their own columns rather than in the scraped record JSON.
+STRUCTURED_FIELD = "structured_eligibility_v2"
+METADATA_FIELD = "eligibility_extraction_v2_metadata"
+
+
+def _split_list(value: Optional[str]) -> List[str]:
+    """Splits a comma-separated scraped field ("Leeds, London") into clean entries."""
+    return [part.strip() for part in str(value or "").split(",") if part.strip()]
+
+
+def _iso_date(value: Optional[str]) -> Optional[str]:
+    return str(value)[:10] if value else None
+
+
+def _fts_query(text: str) -> str:
+    """Quotes each term, so user text can't inject FTS5 syntax; terms are ANDed."""
+    terms = [term.replace('"', '""') for term in str(text).split() if term.strip()]
+    return " ".join(f'"{term}"' for term in terms)
+
+
+class TrialStore:
+    """
+    Trial catalog with indexed lookups, full-text search over eligibility text
+    and per-row upserts. Safe to share between threads.
+    """
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS trials (
+                link TEXT PRIMARY KEY,
+                title TEXT NOT NULL,
+                status TEXT,
+                status_key TEXT,
+                recruitment_start TEXT,
+                recruitment_end TEXT,
+                record TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                eligibility_hash TEXT NOT NULL,
+                structured_eligibility TEXT,
+                extraction_metadata TEXT,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_trials_status ON trials (status_key);
+            CREATE INDEX IF NOT EXISTS idx_trials_recruitment ON trials (recruitment_start, recruitment_end);
+
+            CREATE TABLE IF NOT EXISTS trial_cancer_types (
+                link TEXT NOT NULL REFERENCES trials (link) ON DELETE CASCADE,
+                cancer_type TEXT NOT NULL COLLATE NOCASE
+            );
+            CREATE INDEX IF NOT EXISTS idx_trial_cancer_types ON trial_cancer_types (cancer_type);
+            CREATE INDEX IF NOT EXISTS idx_trial_cancer_types_link ON trial_cancer_types (link);
+
+            CREATE TABLE IF NOT EXISTS trial_locations (
+                link TEXT NOT NULL REFERENCES trials (link) ON DELETE CASCADE,
+                location TEXT NOT NULL COLLATE NOCASE
+            );
+            CREATE INDEX IF NOT EXISTS idx_trial_locations ON trial_locations (location);
+            CREATE INDEX IF NOT EXISTS idx_trial_locations_link ON trial_locations (link);
+
+            CREATE VIRTUAL TABLE IF NOT EXISTS trial_eligibility_fts USING fts5(
+                link UNINDEXED, title, who_can_enter
+            );
+
+            CREATE TABLE IF NOT EXISTS store_meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO store_meta (key, value) VALUES ('version', 0);
+            """
+        )
+        self._conn.commit()
+
+    ##############################
+    # WRITES
+    ##############################
+    @staticmethod
+    def content_hash(trial: Dict) -> str:
+        """Hash of the scraped record, excluding the extracted eligibility fields."""
+        record = {k: v for k, v in trial.items() if k not in (STRUCTURED_FIELD, METADATA_FIELD)}
+        payload = json.dumps(record, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def upsert_trials(self, trials: Iterable[Dict]) -> Dict[str, int]:
+        """
+        Inserts or updates scraped trials by link. Rows whose record is unchanged
+        are left alone. A stored structured eligibility is kept while the
+        "who can enter" text is unchanged, unless the incoming record carries its own.
+
+        Returns:
+            {"inserted": n, "updated": n, "unchanged": n}
+        """
+        counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+        now = time.time()
+        with self._lock:
+            for trial in trials:
+                link = trial.get("link") or trial.get("title")
+                if not link:
+                    continue
+                record = {k: v for k, v in trial.items() if k not in (STRUCTURED_FIELD, METADATA_FIELD)}
+                digest = self.content_hash(trial)
+                row = self._conn.execute(
+                    "SELECT content_hash FROM trials WHERE link = ?", (link,)
+                ).fetchone()
+                structured = trial.get(STRUCTURED_FIELD)
+                metadata = trial.get(METADATA_FIELD)
+
+                if row is not None and row[0] == digest and structured is None:
+                    counts["unchanged"] += 1
+                    continue
+
+                self._conn.execute(
+                    """
+                    INSERT INTO trials (link, title, status, status_key, recruitment_start, recruitment_end,
+                                        record, content_hash, eligibility_hash, structured_eligibility,
+                                        extraction_metadata, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (link) DO UPDATE SET
+                        title = excluded.title,
+                        status = excluded.status,
+                        status_key = excluded.status_key,
+                        recruitment_start = excluded.recruitment_start,
+                        recruitment_end = excluded.recruitment_end,
+                        record = excluded.record,
+                        content_hash = excluded.content_hash,
+                        structured_eligibility = CASE
+                            WHEN excluded.structured_eligibility IS NOT NULL THEN excluded.structured_eligibility
+                            WHEN trials.eligibility_hash = excluded.eligibility_hash THEN trials.structured_eligibility
+                        END,
+                        extraction_metadata = CASE
+                            WHEN excluded.extraction_metadata IS NOT NULL THEN excluded.extraction_metadata
+                            WHEN trials.eligibility_hash = excluded.eligibility_hash THEN trials.extraction_metadata
+                        END,
+                        eligibility_hash = excluded.eligibility_hash,
+                        updated_at = excluded.updated_at
+                    """,
+                    (
+                        link,
+                        trial.get("title", ""),
+                        trial.get("status"),
+                        str(trial.get("status", "")).strip().lower(),
+                        _iso_date(trial.get("recruitment_start_iso")),
+                        _iso_date(trial.get("recruitment_end_iso")),
+                        json.dumps(record, ensure_ascii=False),
+                        digest,
+                        hashlib.sha256(str(trial.get("who_can_enter") or "").encode("utf-8")).hexdigest(),
+                        json.dumps(structured, ensure_ascii=False) if structured is not None else None,
+                        json.dumps(metadata, ensure_ascii=False) if metadata is not None else None,
+                        now,
+                    ),
+                )
+                if row is not None and row[0] == digest:
+                    counts["unchanged"] += 1
+                    continue
+
+                self._conn.execute("DELETE FROM trial_cancer_types WHERE link = ?", (link,))
+                self._conn.executemany(
+                    "INSERT INTO trial_cancer_types (link, cancer_type) VALUES (?, ?)",
+                    [(link, c) for c in _split_list(trial.get("cancer_types"))],
+                )
+                self._conn.execute("DELETE FROM trial_locations WHERE link = ?", (link,))
+                self._conn.executemany(
+                    "INSERT INTO trial_locations (link, location) VALUES (?, ?)",
+                    [(link, loc) for loc in _split_list(trial.get("locations"))],
+                )
+                self._conn.execute("DELETE FROM trial_eligibility_fts WHERE link = ?", (link,))
+                self._conn.execute(
+                    "INSERT INTO trial_eligibility_fts (link, title, who_can_enter) VALUES (?, ?, ?)",
+                    (link, trial.get("title", ""), trial.get("who_can_enter") or ""),
+                )
+                counts["inserted" if row is None else "updated"] += 1
+            self._bump_version_locked()
+            self._conn.commit()
+        return counts
+
+    def update_structured_eligibility(self, link: str, structured: Dict, metadata: Dict) -> None:
+        """Stores the extracted eligibility of one trial (a single-row update)."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE trials SET structured_eligibility = ?, extraction_metadata = ?, updated_at = ? "
+                "WHERE link = ?",
+                (json.dumps(structured, ensure_ascii=False), json.dumps(metadata, ensure_ascii=False),
+                 time.time(), link),
+            )
+            self._bump_version_locked()
+            self._conn.commit()
+
+    def delete_trials(self, links: Iterable[str]) -> int:
+        """Removes trials (e.g. ones no longer listed by the scraper). Returns the number deleted."""
+        links = list(links)
+        removed = 0
+        with self._lock:
+            for link in links:
+                self._conn.execute("DELETE FROM trial_eligibility_fts WHERE link = ?", (link,))
+                cursor = self._conn.execute("DELETE FROM trials WHERE link = ?", (link,))
+                removed += max(cursor.rowcount, 0)
+            if removed:
+                self._bump_version_locked()
+            self._conn.commit()
+        return removed
+
+    def _bump_version_locked(self) -> None:
+        self._conn.execute("UPDATE store_meta SET value = value + 1 WHERE key = 'version'")
+
+    ##############################
+    # READS
+    ##############################
+    def version(self) -> int:
+        """Monotonic counter bumped on every write, for invalidating cached query results."""
+        with self._lock:
+            (value,) = self._conn.execute("SELECT value FROM store_meta WHERE key = 'version'").fetchone()
+        return value
+
+    def count(self) -> int:
+        with self._lock:
+            (value,) = self._conn.execute("SELECT COUNT(*) FROM trials").fetchone()
+        return value
+
+    def get(self, link: str) -> Optional[Dict]:
+        """Returns one trial in the clinical_trials.json record format, or None."""
+        trials = self.query_trials(status=None, links=[link])
+        return trials[0] if trials else None
+
+    def query_trials(self, status: Optional[str] = "Open", cancer_type: Optional[str] = None,
+                     location: Optional[str] = None, recruiting_on: Optional[str] = None,
+                     text: Optional[str] = None, links: Optional[Iterable[str]] = None,
+                     limit: Optional[int] = None) -> List[Dict]:
+        """
+        Indexed trial lookup. All filters are optional and combined with AND.
+
+        Args:
+            status: Trial status, case-insensitive (default "Open"; None for any status).
+            cancer_type: Exact cancer type as listed, e.g. "Acute myeloid leukaemia (AML)".
+            location: Exact site name, e.g. "Leeds".
+            recruiting_on: ISO date (YYYY-MM-DD); trials recruiting on that day.
+            text: Full-text search over the title and "who can enter" text.
+            links: Restrict to these trial links.
+            limit: Maximum number of trials (full-text results come best match first).
+
+        Returns:
+            Trials in the clinical_trials.json record format, including the
+            structured eligibility fields when they have been extracted.
+        """
+        clauses, params, joins = [], [], []
+        order = "t.rowid"
+        if status is not None:
+            clauses.append("t.status_key = ?")
+            params.append(status.strip().lower())
+        if cancer_type:
+            clauses.append("t.link IN (SELECT link FROM trial_cancer_types WHERE cancer_type = ?)")
+            params.append(cancer_type)
+        if location:
+            clauses.append("t.link IN (SELECT link FROM trial_locations WHERE location = ?)")
+            params.append(location)
+        if recruiting_on:
+            clauses.append("(t.recruitment_start IS NULL OR t.recruitment_start <= ?)")
+            clauses.append("(t.recruitment_end IS NULL OR t.recruitment_end >= ?)")
+            params += [recruiting_on, recruiting_on]
+        if links is not None:
+            links = list(links)
+            if not links:
+                return []
+            clauses.append(f"t.link IN ({','.join('?' * len(links))})")
+            params += links
+        if text:
+            query = _fts_query(text)
+            if not query:
+                return []
+            joins.append("JOIN trial_eligibility_fts f ON f.link = t.link")
+            clauses.append("trial_eligibility_fts MATCH ?")
+            params.append(query)
+            order = "f.rank"
+
+        sql = (
+            "SELECT t.record, t.structured_eligibility, t.extraction_metadata FROM trials t "
+            + " ".join(joins)
+            + (" WHERE " + " AND ".join(clauses) if clauses else "")
+            + f" ORDER BY {order}"
+        )
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._row_to_trial(*row) for row in rows]
+
+    @staticmethod
+    def _row_to_trial(record: str, structured: Optional[str], metadata: Optional[str]) -> Dict[str, Any]:
+        trial = json.loads(record)
+        if structured is not None:
+            trial[STRUCTURED_FIELD] = json.loads(structured)
+        if metadata is not None:
+            trial[METADATA_FIELD] = json.loads(metadata)
+        return trial
+
+    ##############################
+    # JSON COMPATIBILITY
+    ##############################
+    def import_json(self, path: str) -> Dict[str, int]:
+        """Upserts every trial from a clinical_trials.json style file."""
+        with open(path, "r", encoding="utf-8") as f:
+            return self.upsert_trials(json.load(f))
+
+    def export_json(self, path: str) -> int:
+        """Writes the whole catalog back out in the clinical_trials.json format."""
+        trials = self.query_trials(status=None)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(trials, f, indent=2, ensure_ascii=False)
+        return len(trials)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+##############################
+# SHARED INSTANCE
+##############################
+_store_instances: Dict[str, TrialStore] = {}
+_store_lock = threading.Lock()
+
+
+def get_trial_store(path: str = DEFAULT_STORE_PATH) -> TrialStore:
+    """Returns the process-wide store for ``path``, opening it on first use."""
+    with _store_lock:
+        if path not in _store_instances:
+            _store_instances[path] = TrialStore(path)
+        return _store_instances[path]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Import/export the SQLite trial store")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("json_file", help="clinical_trials.json style file")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH)
+    args = parser.parse_args()
+
+    trial_store = TrialStore(args.store)
+    if args.command == "import":
+        print(f"📥 Imported {args.json_file}: {trial_store.import_json(args.json_file)}")
+    else:
+        print(f"📤 Exported {trial_store.export_json(args.json_file)} trials to {args.json_file}")